@@ -0,0 +1,197 @@
+from pathlib import Path
+from dataclasses import dataclass
+from contextlib import contextmanager
+from typing import ClassVar, List, Optional
+import asyncio
+import logging
+import os
+import tempfile
+import threading
+import zlib
+
+logger = logging.getLogger("server.services.files.atomicwrite")
+
+
+_umask_lock = threading.Lock()
+
+
+def _current_umask() -> int:
+    """The process umask, read without changing it where the platform allows."""
+    try:
+        # Linux: no window in which other threads create files with umask 0
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError):
+        pass
+    with _umask_lock:
+        mask = os.umask(0o077)
+        os.umask(mask)
+    return mask
+
+
+class WriteConflict(Exception):
+    """The target changed between the start of a write and its commit."""
+
+
+def file_identity(path) -> Optional[tuple]:
+    """(device, inode, mtime_ns, size) of `path`, or None when it does not exist.
+
+    Every atomic replace creates a new inode, so any commit by another
+    writer changes the identity.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+@dataclass
+class PathLocks:
+    """Striped in-process lock table keyed by path.
+
+    A fixed array of locks is indexed by a hash of the normalized path, so
+    unrelated paths almost never contend and the table never grows. A
+    writer holds the lock for its path while it checks that the target is
+    still the version it started from and renames its data into place.
+    That makes the check-then-replace atomic, so of two overlapping
+    writers the second gets a `WriteConflict` instead of silently
+    overwriting the first.
+    """
+    STRIPES: ClassVar[int] = int(os.getenv("QUITTO_WRITE_LOCK_STRIPES", "64"))
+    _locks: ClassVar[List[threading.Lock]] = []
+
+    @staticmethod
+    def for_path(path) -> threading.Lock:
+        if not PathLocks._locks:
+            PathLocks._locks = [threading.Lock() for _ in range(max(1, PathLocks.STRIPES))]
+        key = os.path.abspath(os.fspath(path)).encode("utf-8", "surrogateescape")
+        return PathLocks._locks[zlib.crc32(key) % len(PathLocks._locks)]
+
+    @staticmethod
+    @contextmanager
+    def locked(path):
+        with PathLocks.for_path(path):
+            yield
+
+
+class AtomicFile:
+    """Write a file via a temp sibling and `os.replace`.
+
+    Data goes to a hidden temp file in the destination directory; `commit()`
+    (optionally fsyncs and) renames it over the target while holding the
+    target's stripe lock. Readers never block and only ever see the old or
+    the new content. Use as a context manager: leaving the block normally
+    commits, an exception aborts and removes the temp file.
+
+    The target's `file_identity` is recorded when the write starts. If
+    another writer replaced the file in the meantime, `commit()` raises
+    `WriteConflict` (HTTP 409 in the endpoints) and discards this write.
+    Pass `check=False` where the last writer should simply win.
+
+    fsync policy (`QUITTO_FSYNC`): "off" (default), "file" (flush data before
+    the rename) or "full" (also fsync the directory so the rename is durable).
+    """
+    FSYNC: ClassVar[str] = os.getenv("QUITTO_FSYNC", "off").lower()
+    UPLOAD_CHUNK: ClassVar[int] = 1024 * 1024
+    _UMASK: ClassVar[Optional[int]] = None          # read on first use, not at import
+
+    def __init__(self, target, fsync: Optional[str] = None, mode: Optional[int] = None, check: bool = True):
+        self.target = Path(target)
+        self.check = check
+        self.expected = file_identity(self.target) if check else None
+        self.fsync = (fsync or AtomicFile.FSYNC).lower()
+        self.mode = mode
+        self.target.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=f".{self.target.name}.", suffix=".part", dir=str(self.target.parent))
+        self.tmp_path = Path(tmp)
+        self.file = os.fdopen(fd, "wb")
+        self.size = 0
+        self.done = False
+
+    def write(self, chunk: bytes) -> int:
+        n = self.file.write(chunk)
+        self.size += n
+        return n
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def _target_mode(self) -> int:
+        if self.mode is not None:
+            return self.mode
+        try:
+            # keep the permissions of the file being replaced
+            return os.stat(self.target).st_mode & 0o7777
+        except FileNotFoundError:
+            if AtomicFile._UMASK is None:
+                AtomicFile._UMASK = _current_umask()
+            return 0o666 & ~AtomicFile._UMASK
+
+    def commit(self) -> Path:
+        try:
+            self.file.flush()
+            if self.fsync in ("file", "full"):
+                os.fsync(self.file.fileno())
+            self.file.close()
+            with PathLocks.for_path(self.target):
+                if self.check and file_identity(self.target) != self.expected:
+                    raise WriteConflict(f"{self.target} was modified by another writer")
+                os.chmod(self.tmp_path, self._target_mode())
+                os.replace(self.tmp_path, self.target)
+            if self.fsync == "full":
+                dir_fd = os.open(self.target.parent, os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+            self.done = True
+            return self.target
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self) -> None:
+        try:
+            self.file.close()
+        except Exception:
+            pass
+        try:
+            self.tmp_path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self) -> "AtomicFile":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            if not self.done:
+                self.commit()
+        elif not self.done:
+            self.abort()
+
+    @staticmethod
+    def write_bytes(target, content: bytes, fsync: Optional[str] = None) -> int:
+        with AtomicFile(target, fsync=fsync) as f:
+            f.write(content)
+        return len(content)
+
+    @staticmethod
+    async def save_upload(upload, target, fsync: Optional[str] = None) -> int:
+        """Stream a FastAPI `UploadFile` into `target` atomically. Returns bytes written."""
+        f = AtomicFile(target, fsync=fsync)
+        try:
+            while True:
+                chunk = await upload.read(AtomicFile.UPLOAD_CHUNK)
+                if not chunk:
+                    break
+                f.write(chunk)
+        except BaseException:
+            f.abort()
+            raise
+        # flush, fsync and the rename can block for a long time on slow disks
+        await asyncio.to_thread(f.commit)
+        return f.size
@@ -0,0 +1,281 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import ClassVar, Dict, List, Optional
+from data import data
+from models.Job import Job, JobCancelled
+from Services.Jobs.JobManager import JobManager
+from .FilesTools import FilesTools
+from .FileOps import FileOps
+from .Trash import Trash
+import logging
+import os
+import shutil
+import threading
+
+logger = logging.getLogger("server.services.files.batchops")
+
+@dataclass
+class BatchOps:
+    """Ordered bulk file operations (delete, rename, mkdir, move, copy).
+
+    Operations are resolved to absolute paths up front, then grouped into
+    waves: an operation waits for every earlier operation whose paths overlap
+    its own (same path or ancestor/descendant), and everything within a wave
+    runs in parallel on the job scheduler's subtask pool.
+
+    Deleted and overwritten items go to the trash, like single deletes,
+    unless the step sets `permanent`. With `atomic`, each step records an
+    undo action and deletes/overwrites are staged by renaming into a hidden
+    sibling directory (same device, so O(1)); on the first failure all
+    completed steps are undone in reverse order, otherwise the staged items
+    are moved to the trash (or deleted, with `permanent`).
+    """
+    OPS: ClassVar[frozenset] = frozenset({"delete", "rename", "mkdir", "move", "copy"})
+    MAX_OPERATIONS: ClassVar[int] = 5000
+    STAGING_PREFIX: ClassVar[str] = ".quitto-batch-"
+    MAX_WAIT: ClassVar[float] = 30.0
+
+    @staticmethod
+    def _resolve(base: Optional[str], path: str) -> Path:
+        if base:
+            root = FilesTools.resolve_base_root(data.GLOBAL_PATHS.get(base))
+            if not root:
+                raise ValueError(f"base not found: {base}")
+            rel = FilesTools.normalize_rel_path(path or "")
+            return root / rel if rel else root
+        if not path or not os.path.isabs(path):
+            raise ValueError("absolute path required when no base is given")
+        return Path(path)
+
+    @staticmethod
+    def plan(operations: List[dict]) -> List[dict]:
+        """Validate and resolve operations into JSON-serializable steps. Raises ValueError."""
+        if not isinstance(operations, list) or not operations:
+            raise ValueError("'operations' must be a non-empty list")
+        if len(operations) > BatchOps.MAX_OPERATIONS:
+            raise ValueError(f"too many operations: {len(operations)} > {BatchOps.MAX_OPERATIONS}")
+
+        steps = []
+        for i, op in enumerate(operations):
+            if not isinstance(op, dict) or op.get("op") not in BatchOps.OPS:
+                raise ValueError(f"operation {i}: 'op' must be one of {sorted(BatchOps.OPS)}")
+            kind = op["op"]
+            base = op.get("base")
+            step = {"index": i, "op": kind, "src": None, "dst": None, "overwrite": bool(op.get("overwrite")),
+                    "permanent": bool(op.get("permanent"))}
+            try:
+                if kind == "delete":
+                    step["src"] = str(BatchOps._resolve(base, op.get("path")))
+                elif kind == "rename":
+                    new_name = op.get("new_name") or ""
+                    if not new_name or "/" in new_name or new_name in (".", ".."):
+                        raise ValueError("invalid 'new_name'")
+                    src = BatchOps._resolve(base, op.get("path"))
+                    step["src"], step["dst"] = str(src), str(src.parent / new_name)
+                elif kind == "mkdir":
+                    name = op.get("name") or ""
+                    parent = BatchOps._resolve(base, op.get("path") or "") if (base or op.get("path")) else None
+                    if parent is None or not name or "/" in name:
+                        raise ValueError("mkdir needs 'path' (or base) and a plain 'name'")
+                    step["dst"] = str(parent / name)
+                else:
+                    src = BatchOps._resolve(base, op.get("path"))
+                    dest_base = op.get("dest_base", base)
+                    dst = BatchOps._resolve(dest_base, op.get("dest") or "")
+                    # an existing directory (or one created by an earlier step) means "into"
+                    step["src"], step["dst"] = str(src), str(dst)
+            except ValueError as E:
+                raise ValueError(f"operation {i}: {E}")
+            steps.append(step)
+        return steps
+
+    @staticmethod
+    def _ancestors(key: str) -> List[str]:
+        """Strict ancestors of a normalized path key ("" stands for "/")."""
+        return [key[:i] for i, ch in enumerate(key) if ch == "/"]
+
+    @staticmethod
+    def waves(steps: List[dict]) -> List[List[dict]]:
+        """Group steps so that overlapping steps keep their relative order.
+
+        Earlier steps are indexed by path: `touched` holds the highest wave
+        that used a path itself, `below` the highest wave that used it or
+        anything under it, so each step only looks up its own ancestors.
+        """
+        touched: Dict[str, int] = {}
+        below: Dict[str, int] = {}
+        level = []
+        for step in steps:
+            keys = [p.rstrip("/") for p in (step["src"], step["dst"]) if p]
+            lvl = 0
+            for key in keys:
+                lvl = max(lvl, below.get(key, -1) + 1,
+                          *(touched.get(a, -1) + 1 for a in BatchOps._ancestors(key)))
+            for key in keys:
+                touched[key] = max(touched.get(key, -1), lvl)
+                for a in BatchOps._ancestors(key) + [key]:
+                    below[a] = max(below.get(a, -1), lvl)
+            level.append(lvl)
+        grouped: List[List[dict]] = [[] for _ in range(max(level) + 1 if level else 0)]
+        for step, lvl in zip(steps, level):
+            grouped[lvl].append(step)
+        return grouped
+
+    @staticmethod
+    def _stage(path: Path, job_id: str, step: dict, staged: list, lock: threading.Lock) -> Path:
+        """Move `path` into a hidden staging dir next to it; returns the staged location.
+
+        `staged` collects (staged location, original path, permanent) for the final disposal.
+        """
+        staging = path.parent / f"{BatchOps.STAGING_PREFIX}{job_id}"
+        staging.mkdir(exist_ok=True)
+        target = staging / f"{step['index']}-{path.name}"
+        os.rename(path, target)
+        with lock:
+            staged.append((target, path, bool(step.get("permanent"))))
+        return target
+
+    @staticmethod
+    def _remove(path: Path) -> None:
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+
+    @staticmethod
+    def _discard(path: Path, step: dict, original: Optional[Path] = None) -> Optional[str]:
+        """Trash (or, with `permanent`, delete) a deleted or overwritten item; returns the trash id."""
+        entry = Trash.discard(path, original=original, permanent=bool(step.get("permanent")))
+        return entry["id"] if entry else None
+
+    @staticmethod
+    def _execute(step: dict, atomic: bool, job_id: str, staged: list, lock: threading.Lock):
+        """Run one step; returns (result, undo callable or None)."""
+        kind = step["op"]
+        src = Path(step["src"]) if step["src"] else None
+        dst = Path(step["dst"]) if step["dst"] else None
+
+        if kind == "delete":
+            if not src.exists() and not src.is_symlink():
+                raise FileNotFoundError("path not found")
+            if atomic:
+                moved = BatchOps._stage(src, job_id, step, staged, lock)
+                return {"deleted": str(src)}, lambda: os.rename(moved, src)
+            return {"deleted": str(src), "trash_id": BatchOps._discard(src, step)}, None
+
+        if kind == "mkdir":
+            dst.mkdir(parents=False, exist_ok=False)
+            return {"created": str(dst)}, lambda: dst.rmdir()
+
+        if src is not None and not src.exists() and not src.is_symlink():
+            raise FileNotFoundError("path not found")
+
+        if kind in ("move", "copy"):
+            if dst.is_dir() and not dst.is_symlink():
+                dst = dst / src.name
+            src_real, dst_real = src.resolve(), dst.resolve()
+            if src_real == dst_real or (src.is_dir() and src_real in dst_real.parents):
+                raise ValueError("destination is inside the source")
+            dst.parent.mkdir(parents=True, exist_ok=True)
+
+        undo_overwrite = None
+        if dst.exists() or dst.is_symlink():
+            if kind == "rename" or not step["overwrite"]:
+                raise FileExistsError("target already exists")
+            if atomic:
+                old = BatchOps._stage(dst, job_id, step, staged, lock)
+                undo_overwrite = lambda: os.rename(old, dst)
+            else:
+                BatchOps._discard(dst, step)
+
+        if kind == "rename":
+            os.rename(src, dst)
+            undo = lambda: os.rename(dst, src)
+        elif kind == "move":
+            FileOps.move(src, dst)
+            undo = lambda: FileOps.move(dst, src)
+        else:
+            FileOps.copy(src, dst)
+            undo = lambda: BatchOps._remove(dst)
+
+        def undo_all():
+            undo()
+            if undo_overwrite:
+                undo_overwrite()
+        return {"path": str(src), "dest": str(dst)}, undo_all
+
+    @staticmethod
+    def run(job: Job):
+        """Job handler for kind `batch`."""
+        steps = job.params["steps"]
+        atomic = bool(job.params.get("atomic"))
+        staged: list = []
+        undo_log: list = []
+        lock = threading.Lock()
+        results: List[Optional[dict]] = [None] * len(steps)
+        failed = False
+
+        def run_step(step):
+            try:
+                res, undo = BatchOps._execute(step, atomic, job.id, staged, lock)
+                with lock:
+                    if undo:
+                        undo_log.append(undo)
+                results[step["index"]] = {"index": step["index"], "op": step["op"], "ok": True, "result": res}
+            except Exception as E:
+                results[step["index"]] = {"index": step["index"], "op": step["op"], "ok": False, "error": str(E)}
+            with lock:
+                job.items_done += 1
+
+        cancelled = False
+        for wave in BatchOps.waves(steps):
+            if job.cancel_requested:
+                cancelled = True
+                break
+            JobManager.map(run_step, wave)
+            if atomic and any(r is not None and not r["ok"] for r in results):
+                failed = True
+                break
+
+        rolled_back = False
+        if atomic and (failed or cancelled):
+            for undo in reversed(undo_log):
+                try:
+                    undo()
+                except Exception as E:
+                    logger.error("[ERROR] Batch %s rollback step failed: %s", job.id, E)
+            rolled_back = True
+        if not rolled_back:
+            for moved, original, permanent in staged:
+                try:
+                    BatchOps._discard(moved, {"permanent": permanent}, original=original)
+                except Exception as E:
+                    logger.error("[ERROR] Batch %s could not dispose of %s: %s", job.id, moved, E)
+        for staging in dict.fromkeys(moved.parent for moved, _, _ in staged):
+            if rolled_back and any(staging.iterdir()):
+                logger.error("[ERROR] Batch %s left items in %s after rollback", job.id, staging)
+                continue
+            if any(staging.iterdir()):
+                logger.error("[ERROR] Batch %s left items in %s", job.id, staging)
+                continue
+            staging.rmdir()
+
+        for step in steps:
+            if results[step["index"]] is None:
+                results[step["index"]] = {"index": step["index"], "op": step["op"], "ok": False, "error": "not executed"}
+        if cancelled:
+            raise JobCancelled()
+
+        if not rolled_back:
+            FilesTools.notify_change(*(p for step in steps for p in (step.get("src"), step.get("dst"))))
+        return {
+            "atomic": atomic,
+            "ok": all(r["ok"] for r in results),
+            "rolled_back": rolled_back,
+            "succeeded": sum(1 for r in results if r["ok"]),
+            "failed": sum(1 for r in results if not r["ok"]),
+            "results": results,
+        }
+
+
+JobManager.register("batch", BatchOps.run)
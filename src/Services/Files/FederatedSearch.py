@@ -0,0 +1,210 @@
+from pathlib import Path
+from dataclasses import dataclass
+from datetime import datetime
+from typing import ClassVar, Dict, Iterable, List, Optional
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.NameFilter import NameFilter
+from Services.Net.NodeClient import NodeClient
+from .FilesTools import FilesTools
+from .ShadowIndex import ShadowIndex
+from .Trash import Trash
+import asyncio
+import heapq
+import logging
+import os
+import time
+
+logger = logging.getLogger("server.services.files.federatedsearch")
+
+
+@dataclass
+class FederatedSearch:
+    """Scatter-gather search over every node that holds a base.
+
+    The local disk and each machine listed for the base are searched in
+    parallel; every node returns its own sorted top-k, and the lists are
+    merged with a k-way heap merge in the requested order, deduplicated by
+    (node, path). Nodes that fail or miss the deadline are reported in
+    `nodes` and never fail the whole search: they are answered from their
+    `ShadowIndex` copy (flagging `stale`) or, without one, flip `partial`.
+    With an `ext` filter, machines whose `NameFilter` has no file with that
+    extension are not asked at all (reported as `skipped`).
+    """
+    TIMEOUT: ClassVar[float] = float(os.getenv("QUITTO_FEDERATED_TIMEOUT", "8"))
+    LOCAL_NODE: ClassVar[str] = "local"
+
+    # ── Local walk ────────────────────────────────────────────────
+
+    @staticmethod
+    def sort_key(sort: str):
+        if sort == "size":
+            return (lambda x: x.get("size_bytes") or 0), True
+        if sort == "date":
+            return (lambda x: x.get("modified_ts") or 0), True
+        return (lambda x: str(x.get("name", "")).lower()), False
+
+    @staticmethod
+    def local(root: Path, query: str = "", ext: Optional[str] = None, category: Optional[str] = None,
+              min_size: Optional[int] = None, max_size: Optional[int] = None, sort: str = "name",
+              limit: int = 50, content: Optional[str] = None) -> List[dict]:
+        """Walk `root` and return the top `limit` matches by `sort`.
+
+        The whole tree is walked; a heap of `limit` entries keeps the best ones,
+        so memory stays bounded without cutting the walk short.
+        """
+        def matches() -> Iterable[dict]:
+            for p in Trash.walk(root):
+                if not p.is_file():
+                    continue
+                # Filtro por nome
+                if query and query.lower() not in p.name.lower():
+                    continue
+                # Filtro por extensão
+                if ext and p.suffix.lower() != ext.lower():
+                    continue
+                # Filtro por categoria
+                file_cat = FilesTools.get_file_category(p.suffix)
+                if category and file_cat != category.lower():
+                    continue
+                try:
+                    stat = p.stat()
+                except (PermissionError, OSError):
+                    continue
+                # Filtro por tamanho
+                if min_size and stat.st_size < min_size:
+                    continue
+                if max_size and stat.st_size > max_size:
+                    continue
+                # Busca por conteúdo (apenas em arquivos texto < 1MB)
+                if content:
+                    if stat.st_size > 1024 * 1024:
+                        continue
+                    try:
+                        text = p.read_text(encoding="utf-8", errors="ignore")
+                        if content.lower() not in text.lower():
+                            continue
+                    except Exception:
+                        continue
+                yield {
+                    "name": p.name,
+                    "path": str(p.relative_to(root)),
+                    "ext": p.suffix,
+                    "category": file_cat,
+                    "size_bytes": stat.st_size,
+                    "size_human": FilesTools.format_size(stat.st_size),
+                    "modified": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S"),
+                    "modified_ts": stat.st_mtime
+                }
+
+        key, reverse = FederatedSearch.sort_key(sort)
+        # nsmallest/nlargest keep the order (and tie order) of a full sort
+        top = heapq.nlargest if reverse else heapq.nsmallest
+        return top(max(0, int(limit)), matches(), key=key)
+
+    # ── Merge ─────────────────────────────────────────────────────
+
+    @staticmethod
+    def merge(per_node: Dict[str, List[dict]], sort: str, limit: int) -> List[dict]:
+        """k-way merge of per-node lists already sorted by `sort`, deduplicated by (node, path)."""
+        key, reverse = FederatedSearch.sort_key(sort)
+
+        def tagged(node: str, matches: List[dict]) -> Iterable[dict]:
+            for m in matches:
+                yield {**m, "node": node}
+
+        streams = [tagged(node, matches) for node, matches in per_node.items()]
+        out, seen = [], set()
+        for m in heapq.merge(*streams, key=key, reverse=reverse):
+            ident = (m["node"], m.get("path"))
+            if ident in seen:
+                continue
+            seen.add(ident)
+            out.append(m)
+            if len(out) >= limit:
+                break
+        return out
+
+    # ── Scatter-gather ────────────────────────────────────────────
+
+    @staticmethod
+    async def _gather(base: str, root: Optional[Path], machines: list, params: dict, timeout: float, filtered: bool = True) -> Dict[str, dict]:
+        route = f"/files/search/{base}"
+        # remote nodes search only their own disk, otherwise they would federate again
+        remote_params = {**params, "local": True}
+        local_args = {k: params.get(k) for k in ("query", "ext", "category", "min_size", "max_size", "sort", "limit", "content")}
+        keys = (NameFilter.ext_key(params["ext"]),) if params.get("ext") and filtered else ()
+
+        async def timed(node: str, name: str, work):
+            t0 = time.perf_counter()
+            info = {"node": node, "name": name, "ok": False, "timed_out": False, "error": None, "count": 0}
+            try:
+                res = await asyncio.wait_for(work, timeout)
+                if isinstance(res, dict):
+                    if "error" in res:
+                        raise RuntimeError(res.get("details") or res["error"])
+                    res = res.get("matches") or []
+                info["ok"] = True
+                info["count"] = len(res)
+                info["matches"] = res
+            except asyncio.TimeoutError:
+                info["timed_out"] = True
+                info["error"] = f"no answer within {timeout:g}s"
+            except Exception as E:
+                info["error"] = f"{type(E).__name__}: {E}"
+            info["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+            return info
+
+        jobs = []
+        if root is not None:
+            jobs.append(timed(FederatedSearch.LOCAL_NODE, "local", asyncio.to_thread(FederatedSearch.local, root, **local_args)))
+        for m in machines:
+            node = HealthRegistry.key(m)
+            if not HealthRegistry.is_available(m):
+                jobs.append(asyncio.sleep(0, {"node": node, "name": m.name, "ok": False, "timed_out": False,
+                                              "error": "circuit open", "count": 0, "ms": 0.0}))
+                continue
+            if keys and not NameFilter.candidates(base, keys, [m]):
+                # its name filter has no file with this extension
+                jobs.append(asyncio.sleep(0, {"node": node, "name": m.name, "ok": True, "timed_out": False, "error": None,
+                                              "skipped": "name filter", "count": 0, "matches": [], "ms": 0.0}))
+                continue
+            jobs.append(timed(node, m.name, asyncio.to_thread(FilesTools.remote_json, m, route, remote_params, timeout)))
+        results = await asyncio.gather(*jobs)
+        return {r["node"]: r for r in results}
+
+    @staticmethod
+    def search(base: str, root: Optional[Path], params: dict, timeout: Optional[float] = None) -> dict:
+        """Search `base` on this node (when `root` is given) and on every machine holding it."""
+        timeout = timeout or FederatedSearch.TIMEOUT
+        machines = FilesTools.base_machines(base)
+        t0 = time.perf_counter()
+        nodes = NodeClient.run(FederatedSearch._gather(base, root, machines, params, timeout), timeout + 5)
+        skipped = [m for m in machines if nodes.get(HealthRegistry.key(m), {}).get("skipped")]
+        if skipped and not any(r.get("matches") for r in nodes.values()):
+            # a name filter misses files created outside Quitto until its rebuild: confirm the miss
+            retried = NodeClient.run(FederatedSearch._gather(base, None, skipped, params, timeout, filtered=False), timeout + 5)
+            NameFilter.note_fallback(base, found=any(r.get("matches") for r in retried.values()))
+            nodes.update(retried)
+        sort = params.get("sort") or "name"
+        limit = int(params.get("limit") or 50)
+        per_node = {n: r.pop("matches", []) for n, r in nodes.items() if r["ok"]}
+        for n, r in nodes.items():
+            if r["ok"] or n == FederatedSearch.LOCAL_NODE:
+                continue
+            # unreachable machine: answer from its offline copy, flagged stale
+            shadow = ShadowIndex.search(base, machine=n, **{**params, "sort": sort, "limit": limit})
+            if shadow is not None:
+                per_node[n] = shadow["matches"]
+                r["stale"] = True
+                r["snapshot_at"] = min(c["synced_at"] for c in shadow["snapshots"])
+                r["count"] = len(shadow["matches"])
+        merged = FederatedSearch.merge(per_node, sort, limit)
+        return {
+            "federated": True,
+            "partial": any(not r["ok"] and not r.get("stale") for r in nodes.values()),
+            "stale": any(r.get("stale") for r in nodes.values()),
+            "count": len(merged),
+            "matches": merged,
+            "nodes": list(nodes.values()),
+            "ms": round((time.perf_counter() - t0) * 1000, 2),
+        }
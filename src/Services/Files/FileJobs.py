@@ -0,0 +1,149 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import ClassVar
+from models.Job import Job
+from Services.Jobs.JobManager import JobManager
+from .FileOps import FileOps
+from .FilesTools import FilesTools
+from .Trash import Trash
+import hashlib
+import logging
+import os
+import tarfile
+import zipfile
+
+logger = logging.getLogger("server.services.files.filejobs")
+
+@dataclass
+class FileJobs:
+    """Job handlers for long filesystem operations.
+
+    Every handler takes only JSON-serializable `job.params` (absolute paths),
+    so persisted jobs can be replayed after a restart.
+    """
+    HASH_CHUNK: ClassVar[int] = 4 * 1024 * 1024
+    ARCHIVE_FORMATS: ClassVar[dict] = {"zip": ".zip", "tar": ".tar", "tar.gz": ".tar.gz", "tar.xz": ".tar.xz"}
+
+    @staticmethod
+    def _overwrites(job: Job) -> bool:
+        dst = Path(job.params["dst"])
+        return bool(job.params.get("overwrite")) and (dst.exists() or dst.is_symlink())
+
+    @staticmethod
+    def _retire(job: Job):
+        """Where a replaced destination goes: the trash, unless the job asked for `permanent`."""
+        dst = Path(job.params["dst"])
+        return lambda old: Trash.discard(old, original=dst, permanent=bool(job.params.get("permanent")))
+
+    @staticmethod
+    def copy(job: Job):
+        src, dst = Path(job.params["src"]), Path(job.params["dst"])
+        if FileJobs._overwrites(job):
+            FileOps.replace("copy", src, dst, job.add_bytes, FileJobs._retire(job))
+        else:
+            FileOps.copy(src, dst, job.add_bytes)
+        job.items_done = job.items_total
+        FilesTools.notify_change(job.params["dst"])
+        return {"dest": job.params["dst"], "strategy": "copy"}
+
+    @staticmethod
+    def move(job: Job):
+        src, dst = Path(job.params["src"]), Path(job.params["dst"])
+        if FileJobs._overwrites(job):
+            strategy = FileOps.replace("move", src, dst, job.add_bytes, FileJobs._retire(job))
+        else:
+            strategy = FileOps.move(src, dst, job.add_bytes)
+        job.items_done = job.items_total
+        FilesTools.notify_change(job.params["src"], job.params["dst"])
+        return {"dest": job.params["dst"], "strategy": strategy}
+
+    @staticmethod
+    def rmtree(job: Job):
+        """Bottom-up delete with a cancellation point per entry.
+
+        The tree is listed first so `items_total` is known and the job reports
+        a real percentage; deleting then reuses that listing.
+        """
+        target = Path(job.params["path"])
+        if target.is_symlink() or not target.is_dir():
+            job.items_total = 1
+            target.unlink()
+            job.add_items()
+            return {"deleted": str(target), "items": 1}
+        tree = []
+        for entry in os.walk(target, topdown=False):
+            tree.append(entry)
+            job.items_total += len(entry[1]) + len(entry[2])
+            job.check_cancelled()
+        job.items_total += 1
+        for root, dirs, files in tree:
+            for name in files:
+                os.unlink(os.path.join(root, name))
+                job.add_items()
+            for name in dirs:
+                p = os.path.join(root, name)
+                if os.path.islink(p):
+                    os.unlink(p)
+                else:
+                    os.rmdir(p)
+                job.add_items()
+        os.rmdir(target)
+        job.add_items()
+        FilesTools.notify_change(target)
+        return {"deleted": str(target), "items": job.items_done}
+
+    @staticmethod
+    def archive(job: Job):
+        src = Path(job.params["src"])
+        dst = Path(job.params["dst"])
+        fmt = job.params.get("format", "zip")
+        tmp = dst.with_name(dst.name + ".part")
+        files = [src] if src.is_file() else sorted(p for p in Trash.walk(src) if p.is_file() and not p.is_symlink())
+        job.items_total = len(files)
+        arc_root = src.parent
+        try:
+            if fmt == "zip":
+                with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_DEFLATED, allowZip64=True) as zf:
+                    for p in files:
+                        zf.write(p, str(p.relative_to(arc_root)))
+                        job.bytes_done += p.stat().st_size
+                        job.add_items()
+            else:
+                mode = {"tar": "w", "tar.gz": "w:gz", "tar.xz": "w:xz"}[fmt]
+                with tarfile.open(tmp, mode) as tf:
+                    for p in files:
+                        tf.add(p, arcname=str(p.relative_to(arc_root)), recursive=False)
+                        job.bytes_done += p.stat().st_size
+                        job.add_items()
+            os.replace(tmp, dst)
+            FilesTools.notify_change(dst)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        return {"archive": str(dst), "size": dst.stat().st_size, "files": len(files)}
+
+    @staticmethod
+    def hash(job: Job):
+        path = Path(job.params["path"])
+        algo = job.params.get("algo", "sha256")
+        return {"path": str(path), "algo": algo, "digest": FileJobs.hash_file(path, algo, job.add_bytes)}
+
+    @staticmethod
+    def hash_file(path: Path, algo: str = "sha256", progress=None) -> str:
+        h = hashlib.new(algo)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(FileJobs.HASH_CHUNK)
+                if not chunk:
+                    break
+                h.update(chunk)
+                if progress:
+                    progress(len(chunk))
+        return h.hexdigest()
+
+
+JobManager.register("copy", FileJobs.copy)
+JobManager.register("move", FileJobs.move)
+JobManager.register("rmtree", FileJobs.rmtree)
+JobManager.register("archive", FileJobs.archive)
+JobManager.register("hash", FileJobs.hash)
@@ -0,0 +1,202 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Callable, ClassVar, Optional
+from .AtomicWrite import AtomicFile
+import errno
+import logging
+import os
+import shutil
+import uuid
+
+logger = logging.getLogger("server.services.files.fileops")
+
+# progress(bytes) is called after every copied chunk
+Progress = Optional[Callable[[int], None]]
+
+
+@dataclass
+class FileOps:
+    """Server-side copy and move.
+
+    File data is copied in the kernel with `os.copy_file_range`, falling back
+    to `os.sendfile` and finally to a userspace loop when the filesystem pair
+    does not support it. Mode, timestamps and (when permitted) ownership are
+    preserved. `move` is a plain rename on the same device and degrades to
+    copy + delete across devices. `replace` overwrites an existing
+    destination only once the new data is completely in place.
+    """
+    CHUNK: ClassVar[int] = 8 * 1024 * 1024
+    # Fallback-worthy errors: unsupported syscall or filesystem pair
+    _FALLBACK_ERRNOS: ClassVar[frozenset] = frozenset({errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSUP})
+
+    @staticmethod
+    def tree_size(path: Path) -> tuple:
+        """Return (bytes, files) under `path` without following symlinks."""
+        if path.is_symlink() or path.is_file():
+            return (path.lstat().st_size if not path.is_symlink() else 0), 1
+        total = files = 0
+        for root, _, names in os.walk(path):
+            for name in names:
+                p = os.path.join(root, name)
+                try:
+                    st = os.lstat(p)
+                except OSError:
+                    continue
+                files += 1
+                if not os.path.islink(p):
+                    total += st.st_size
+        return total, files
+
+    @staticmethod
+    def _copy_data(src_fd: int, dst_fd: int, size: int, progress: Progress) -> None:
+        done = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                while done < size:
+                    n = os.copy_file_range(src_fd, dst_fd, min(FileOps.CHUNK, size - done))
+                    if n == 0:
+                        break
+                    done += n
+                    if progress:
+                        progress(n)
+                return
+            except OSError as E:
+                if E.errno not in FileOps._FALLBACK_ERRNOS or done:
+                    raise
+        if hasattr(os, "sendfile"):
+            try:
+                while done < size:
+                    n = os.sendfile(dst_fd, src_fd, done, min(FileOps.CHUNK, size - done))
+                    if n == 0:
+                        break
+                    done += n
+                    if progress:
+                        progress(n)
+                return
+            except OSError as E:
+                if E.errno not in FileOps._FALLBACK_ERRNOS or done:
+                    raise
+        while True:
+            buf = os.read(src_fd, 1024 * 1024)
+            if not buf:
+                break
+            view = memoryview(buf)
+            while view:
+                # os.write may write less than asked (signals, pipes, quota edges)
+                view = view[os.write(dst_fd, view):]
+            if progress:
+                progress(len(buf))
+
+    @staticmethod
+    def _copy_metadata(src: Path, dst: Path) -> None:
+        shutil.copystat(src, dst, follow_symlinks=False)
+        try:
+            st = os.lstat(src)
+            os.chown(dst, st.st_uid, st.st_gid, follow_symlinks=False)
+        except (PermissionError, NotImplementedError, OSError):
+            pass
+
+    @staticmethod
+    def copy_file(src: Path, dst: Path, progress: Progress = None) -> None:
+        if src.is_symlink():
+            os.symlink(os.readlink(src), dst)
+            return
+        size = src.stat().st_size
+        # data and metadata land on a temp sibling that is renamed into place
+        out = AtomicFile(dst)
+        try:
+            with open(src, "rb") as fsrc:
+                out.file.flush()
+                FileOps._copy_data(fsrc.fileno(), out.fileno(), size, progress)
+            FileOps._copy_metadata(src, out.tmp_path)
+            out.mode = os.stat(out.tmp_path).st_mode & 0o7777
+            out.commit()
+        except BaseException:
+            out.abort()
+            raise
+
+    @staticmethod
+    def copy(src: Path, dst: Path, progress: Progress = None) -> None:
+        """Copy a file or a whole tree from `src` to `dst` (which must not exist)."""
+        if src.is_dir() and not src.is_symlink():
+            dst.mkdir(parents=False)
+            for item in sorted(src.iterdir()):
+                FileOps.copy(item, dst / item.name, progress)
+            FileOps._copy_metadata(src, dst)
+        else:
+            FileOps.copy_file(src, dst, progress)
+
+    @staticmethod
+    def move(src: Path, dst: Path, progress: Progress = None) -> str:
+        """Move `src` to `dst`. Returns "rename" or "copy" depending on the strategy used."""
+        try:
+            os.rename(src, dst)
+            return "rename"
+        except OSError as E:
+            if E.errno != errno.EXDEV:
+                raise
+        logger.debug("Cross-device move %s -> %s, copying", src, dst)
+        try:
+            FileOps.copy(src, dst, progress)
+        except Exception:
+            # do not leave a partial destination behind
+            if dst.is_dir() and not dst.is_symlink():
+                shutil.rmtree(dst, ignore_errors=True)
+            elif dst.exists() or dst.is_symlink():
+                dst.unlink()
+            raise
+        if src.is_dir() and not src.is_symlink():
+            shutil.rmtree(src)
+        else:
+            src.unlink()
+        return "copy"
+
+    @staticmethod
+    def remove(path: Path) -> None:
+        """Permanently delete a file, symlink or tree."""
+        if path.is_dir() and not path.is_symlink():
+            shutil.rmtree(path)
+        else:
+            path.unlink()
+
+    @staticmethod
+    def replace(op: str, src: Path, dst: Path, progress: Progress = None, retire: Optional[Callable[[Path], None]] = None) -> str:
+        """Copy or move `src` over an existing `dst`. Returns the strategy used.
+
+        The data is first copied (or moved) to a hidden sibling of `dst`; a
+        failure there leaves `dst` untouched. The old `dst` is then renamed
+        aside, the new one renamed into place, and only then is the old one
+        handed to `retire` (default: permanent delete).
+        """
+        tag = uuid.uuid4().hex[:8]
+        staging = dst.with_name(f".{dst.name}.{tag}.part")
+        aside = dst.with_name(f".{dst.name}.{tag}.old")
+        try:
+            if op == "copy":
+                FileOps.copy(src, staging, progress)
+                strategy = "copy"
+            else:
+                strategy = FileOps.move(src, staging, progress)
+        except BaseException:
+            if staging.exists() or staging.is_symlink():
+                FileOps.remove(staging)
+            raise
+        try:
+            os.rename(dst, aside)
+            try:
+                os.rename(staging, dst)
+            except BaseException:
+                os.rename(aside, dst)
+                raise
+        except BaseException:
+            # put things back the way they were
+            if op == "copy":
+                FileOps.remove(staging)
+            else:
+                FileOps.move(staging, src)
+            raise
+        try:
+            (retire or FileOps.remove)(aside)
+        except Exception as E:
+            logger.error("[ERROR] Could not dispose of replaced %s (left at %s): %s", dst, aside, E)
+        return strategy
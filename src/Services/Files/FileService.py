@@ -1,9 +1,24 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Query, Request
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, UploadFile, File, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import FileResponse, StreamingResponse, JSONResponse, Response
 from pathlib import Path
 from models.Machine import Machine
 from data import data
 from .FilesTools import FilesTools
+from .ThumbnailService import ThumbnailService
+from .TailService import TailService
+from .FileSniffer import FileSniffer
+from .FileOps import FileOps
+from .AtomicWrite import AtomicFile, WriteConflict
+from .Trash import Trash
+from .FileJobs import FileJobs
+from .BatchOps import BatchOps
+from .FederatedSearch import FederatedSearch
+from .RemoteFile import RemoteFile
+from .ListingPrefetcher import ListingPrefetcher
+from .ShadowIndex import ShadowIndex
+from Services.Jobs.JobManager import JobManager
+import asyncio
+import json
 import os
 import shutil
 import psutil
@@ -17,7 +32,12 @@ import logging
 # Logger specific to this service: server.services.files.fileservice
 logger = logging.getLogger("server.services.files.fileservice")
 
-import requests
+from Services.Net.NodeClient import NodeClient
+from Services.Net.ResponseCache import ResponseCache
+from Services.Net.SingleFlight import SingleFlight
+from Services.Net.ReplicaSelector import ReplicaSelector
+from Services.Net.NameFilter import NameFilter
+import httpx
 
 routerFile = APIRouter(prefix="/files", tags=["Files"])
 
@@ -41,7 +61,7 @@ def read_file_with_path(path) -> dict:
 def resolve_base_root(entry):
     return FilesTools.resolve_base_root(entry)
 
-def _read_file_path(file_path: Path,machine_id) -> dict:
+def _read_file_path(file_path: Path,machine_id=None) -> dict:
     try:
         # Resolve machine by id via in-memory cache first (data.MACHINES),
         # then fall back to repository lookup.
@@ -74,6 +94,125 @@ def search_file_in_base(base: str, filename: str, limit: int = 1):
 def read_file_from_base(base: str, path: str) -> dict:
     return FilesTools.read_file_from_base(base, path)
 
+def _open_tail_target(path: str):
+    """Validate a tail target and return (Path, encoding); binaries are refused."""
+    file = Path(path)
+    if not file.exists():
+        raise HTTPException(status_code=404, detail="file not found")
+    if not file.is_file():
+        raise HTTPException(status_code=400, detail="path is not a file")
+    try:
+        verdict = FileSniffer.sniff(file)
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="permission denied")
+    if verdict.get("kind") == "binary":
+        raise HTTPException(status_code=415, detail="binary file cannot be tailed")
+    return file, verdict.get("encoding") or "utf-8"
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+# Copies/moves above these thresholds run as background jobs
+BACKGROUND_BYTES = 64 * 1024 * 1024
+BACKGROUND_FILES = 1000
+
+def _resolve_op_path(base: Optional[str], path: str) -> Path:
+    """Resolve `path` inside `base` when given, otherwise treat it as an absolute OS path."""
+    if base:
+        root = resolve_base_root(data.GLOBAL_PATHS.get(base))
+        if not root:
+            raise HTTPException(status_code=404, detail=f"base not found: {base}")
+        rel = normalize_rel_path(path)
+        return root / rel if rel else root
+    if not path or not os.path.isabs(path):
+        raise HTTPException(status_code=400, detail="absolute path required when no base is given")
+    return Path(path)
+
+def _display_path(p: Path, base: Optional[str]) -> str:
+    if base:
+        root = resolve_base_root(data.GLOBAL_PATHS.get(base))
+        try:
+            return str(p.relative_to(root))
+        except Exception:
+            pass
+    return str(p)
+
+def _transfer(op: str, base: Optional[str], path: str, dest_base: Optional[str], dest: str, overwrite: bool, background: Optional[bool], permanent: bool = False):
+    """Shared implementation of /files/copy and /files/move.
+
+    A destination replaced with `overwrite` goes to the trash unless `permanent` is set.
+    """
+    dest_base = dest_base if dest_base is not None else base
+    src = _resolve_op_path(base, path)
+    if not src.exists() and not src.is_symlink():
+        raise HTTPException(status_code=404, detail="path not found")
+    dst = _resolve_op_path(dest_base, dest)
+    if dst.is_dir() and not dst.is_symlink():
+        dst = dst / src.name
+
+    src_real, dst_real = src.resolve(), dst.resolve()
+    if src_real == dst_real or (src.is_dir() and src_real in dst_real.parents):
+        raise HTTPException(status_code=400, detail="destination is inside the source")
+    # an existing destination is only replaced once the new data is in place (FileOps.replace)
+    replacing = dst.exists() or dst.is_symlink()
+    if replacing and not overwrite:
+        raise HTTPException(status_code=409, detail="target already exists")
+    dst.parent.mkdir(parents=True, exist_ok=True)
+
+    same_device = os.lstat(src).st_dev == os.stat(dst.parent).st_dev
+    if op == "move" and same_device:
+        # a same-device move is a rename: instant, never worth a job
+        size, files, background = 0, 0, False
+    else:
+        size, files = FileOps.tree_size(src)
+        if background is None:
+            background = size > BACKGROUND_BYTES or files > BACKGROUND_FILES
+
+    info = {"path": _display_path(src, base), "dest": _display_path(dst, dest_base), "bytes": size, "files": files}
+
+    if background:
+        job = JobManager.submit(op, params={"src": str(src), "dst": str(dst), "overwrite": replacing, "permanent": permanent, **info}, bytes_total=size, items_total=files)
+        return _job_accepted(f"{op} started", job)
+
+    try:
+        if replacing:
+            strategy = FileOps.replace(op, src, dst, retire=lambda old: Trash.discard(old, original=dst, permanent=permanent))
+        elif op == "copy":
+            FileOps.copy(src, dst)
+            strategy = "copy"
+        else:
+            strategy = FileOps.move(src, dst)
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="permission denied")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"error during {op}: {str(e)}")
+    FilesTools.notify_change(src if op == "move" else None, dst)
+    return {"message": "copied" if op == "copy" else "moved", **info, "strategy": strategy}
+
+def _job_accepted(message: str, job) -> JSONResponse:
+    return JSONResponse(status_code=202, content={"message": message, "job": job.to_dict()})
+
+def _delete_target(target: Path, shown: str, permanent: bool = False):
+    """Move to the filesystem's trash (O(1) rename); with `permanent`, or when no
+    trash is usable, unlink files inline and remove trees with an `rmtree` job."""
+    try:
+        if not permanent:
+            entry = Trash.move_to_trash(target)
+            if entry:
+                FilesTools.notify_change(target)
+                return {"message": "moved to trash", "path": shown, "trash_id": entry["id"]}
+            logger.warning("No usable trash for %s, deleting permanently", target)
+        if target.is_dir() and not target.is_symlink():
+            job = JobManager.submit("rmtree", params={"path": str(target)})
+            return _job_accepted("directory delete started", job)
+        target.unlink()
+        FilesTools.notify_change(target)
+        return {"message": "file deleted", "path": shown}
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="permission denied")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"error deleting: {str(e)}")
+
 class FileService:
     """Service para operações com arquivos nas bases"""
     
@@ -83,7 +222,7 @@ class FileService:
         # Prefer remote machine when base is reported by a machine
         try:
             if FilesTools.base_has_remote(base):
-                forwarded = FilesTools.forward_to_machines(f"/files/list/{base}")
+                forwarded = FilesTools.forward_to_machines(f"/files/list/{base}", base=base)
                 if forwarded is not None:
                     return forwarded
         except Exception:
@@ -93,12 +232,12 @@ class FileService:
         root = resolve_base_root(entry)
         if not root:
             # Try forwarding to machines if the base isn't local
-            forwarded = FilesTools.forward_to_machines(f"/files/list/{base}")
+            forwarded = FilesTools.forward_to_machines(f"/files/list/{base}", base=base)
             if forwarded is not None:
                 return forwarded
             return {"error": "base not found", "available": list(data.GLOBAL_PATHS.keys())}
 
-        files = [str(p.relative_to(root)) for p in root.rglob("*.md")]
+        files = [str(p.relative_to(root)) for p in Trash.walk(root) if p.suffix == ".md"]
         return {"base": base, "count": len(files), "files": files}
     
 
@@ -108,7 +247,7 @@ class FileService:
         # Prefer remote machine when base is reported by a machine
         try:
             if FilesTools.base_has_remote(base):
-                forwarded = FilesTools.forward_to_machines(f"/files/read/{base}", params={"path": path})
+                forwarded = FilesTools.forward_to_machines(f"/files/read/{base}", params={"path": path}, base=base)
                 if forwarded is not None:
                     return forwarded
         except Exception:
@@ -117,7 +256,7 @@ class FileService:
         candidate, err = _get_file_path_for(base, path)
         if err:
             # If local resolution failed, try forwarding to machines
-            forwarded = FilesTools.forward_to_machines(f"/files/read/{base}", params={"path": path})
+            forwarded = FilesTools.forward_to_machines(f"/files/read/{base}", params={"path": path}, base=base)
             if forwarded is not None:
                 return forwarded
             return {"error": err}
@@ -152,23 +291,23 @@ class FileService:
                 if machine and getattr(machine, 'url_connect', None):
                     params = { 'base': base, 'filename': filename, 'limit': limit }
                     try:
-                        r = requests.get(machine.url_connect.rstrip('/') + '/files/find', params=params, timeout=8)
-                        if r.ok:
-                            return r.json()
-                        return {"error": f"remote HTTP {r.status_code}", "details": r.text[:512]}
-                    except requests.RequestException as e:
+                        return FilesTools.remote_json(machine, '/files/find', params)
+                    except httpx.HTTPError as e:
                         logger.error("Error forwarding find to remote machine: %s", e)
                         return {"error": "remote request failed", "details": str(e)}
             except Exception as E:
                 logger.error('Error resolving machine for find_in_base: %s', E)
 
+        # only machines whose name filter may hold the file are asked (see NameFilter)
+        name_keys = (NameFilter.name_key(Path(filename).name),)
+
         # Case 1: base is a registered key in data.GLOBAL_PATHS
         if base in data.GLOBAL_PATHS:
             # Prefer remote machine when base is reported remotely
             try:
                 if FilesTools.base_has_remote(base) and not (machine_id or mac):
                     params = { 'base': base, 'filename': filename, 'limit': limit }
-                    forwarded = FilesTools.forward_to_machines(f"/files/find", params=params)
+                    forwarded = FilesTools.forward_to_machines(f"/files/find", params=params, base=base, keys=name_keys)
                     if forwarded is not None:
                         return forwarded
             except Exception:
@@ -190,7 +329,7 @@ class FileService:
                         add_match(candidate, base)
                 else:
                     # search by name
-                    for p in root.rglob("*"):
+                    for p in Trash.walk(root):
                         if not p.is_file():
                             continue
                         if p.name == filename:
@@ -198,7 +337,13 @@ class FileService:
                             if len(matches) >= limit:
                                 return {"query": {"base": base, "filename": filename}, "count": len(matches), "matches": matches}
 
-            return {"query": {"base": base, "filename": filename}, "count": len(matches), "matches": matches}
+            result = {"query": {"base": base, "filename": filename}, "count": len(matches), "matches": matches}
+            # remote holders did not answer: fall back to their offline copies
+            if len(matches) < limit and FilesTools.base_machines(base) and ShadowIndex.has(base):
+                shadow = ShadowIndex.lookup(filename, base=base, limit=limit - len(matches))
+                matches.extend(shadow["matches"])
+                result.update(count=len(matches), stale=True, snapshots=shadow["snapshots"])
+            return result
 
         # Case 2: base looks like a path — validate it's listed in data.GLOBAL_PATHS
         try:
@@ -239,7 +384,7 @@ class FileService:
             if cand.exists() and cand.is_file():
                 add_match(cand, resolved_base_key)
         else:
-            for p in root.rglob("*"):
+            for p in Trash.walk(root):
                 if not p.is_file():
                     continue
                 if p.name == filename:
@@ -274,6 +419,7 @@ class FileService:
 
 
     @routerFile.get("/search/{base}")
+    @SingleFlight.coalesce("search", "/files/search/{base}")
     def search_files(
         base: str,
         query: str = "",
@@ -284,9 +430,33 @@ class FileService:
         sort: str = Query("name", description="Ordenar por: name, size, date"),
         limit: int = Query(50, description="Limite de resultados"),
         content: Optional[str] = Query(None, description="Buscar dentro do conteúdo dos arquivos"),
-        machine_id: Optional[int] = None, mac: Optional[str] = None
+        machine_id: Optional[int] = None, mac: Optional[str] = None,
+        federated: bool = Query(False, description="Buscar em paralelo nesta máquina e em todas que têm a base, mesclando os resultados"),
+        local: bool = Query(False, description="Buscar apenas no disco desta máquina (sem encaminhar)")
     ):
-        """Busca avançada de arquivos na base"""
+        """Busca avançada de arquivos na base.
+
+        Com `federated=true` a busca roda ao mesmo tempo no disco local e em cada máquina
+        que tem a base; os top-`limit` de cada nó são mesclados na ordem de `sort`, sem
+        duplicatas por (nó, caminho). `nodes` traz o tempo e o erro de cada nó e `partial`
+        indica se algum deles falhou.
+        """
+        if federated and not (machine_id or mac or local):
+            if not query and not ext and not category and not content:
+                return {"error": "query, ext, category ou content é obrigatório"}
+            params = {'query': query, 'ext': ext, 'category': category, 'min_size': min_size,
+                      'max_size': max_size, 'sort': sort, 'limit': limit, 'content': content}
+            root = resolve_base_root(data.GLOBAL_PATHS.get(base))
+            if root is None and not FilesTools.base_machines(base):
+                return {"error": "base not found"}
+            return {
+                "base": base,
+                "query": query,
+                "filters": {"ext": ext, "category": category, "min_size": min_size, "max_size": max_size},
+                "sort": sort,
+                **FederatedSearch.search(base, root, params),
+            }
+
         # Remote forwarding if machine specified
         if machine_id or mac:
             try:
@@ -304,11 +474,8 @@ class FileService:
                     if content:
                         params['content'] = content
                     try:
-                        r = requests.get(machine.url_connect.rstrip('/') + f'/files/search/{base}', params=params, timeout=8)
-                        if r.ok:
-                            return r.json()
-                        return {"error": f"remote HTTP {r.status_code}", "details": r.text[:512]}
-                    except requests.RequestException as e:
+                        return FilesTools.remote_json(machine, f'/files/search/{base}', params)
+                    except httpx.HTTPError as e:
                         logger.error("Error forwarding search to remote machine: %s", e)
                         return {"error": "remote request failed", "details": str(e)}
             except Exception as E:
@@ -316,7 +483,7 @@ class FileService:
 
         # Prefer remote when base reported by machine
         try:
-            if FilesTools.base_has_remote(base) and not (machine_id or mac):
+            if FilesTools.base_has_remote(base) and not (machine_id or mac or local):
                 params = {
                     'query': query,
                     'ext': ext,
@@ -328,7 +495,8 @@ class FileService:
                 }
                 if content:
                     params['content'] = content
-                forwarded = FilesTools.forward_to_machines(f"/files/search/{base}", params=params)
+                forwarded = FilesTools.forward_to_machines(f"/files/search/{base}", params=params, base=base,
+                                                           keys=(NameFilter.ext_key(ext),) if ext else ())
                 if forwarded is not None:
                     return forwarded
         except Exception:
@@ -338,75 +506,27 @@ class FileService:
         
         root = resolve_base_root(entry)
         if not root or not root.exists():
+            # machines holding the base are unreachable: answer from the offline copy
+            shadow = ShadowIndex.search(base, query=query, ext=ext, category=category, min_size=min_size,
+                                        max_size=max_size, sort=sort, limit=limit) if (query or ext or category) else None
+            if shadow is not None:
+                return {
+                    "base": base,
+                    "query": query,
+                    "filters": {"ext": ext, "category": category, "min_size": min_size, "max_size": max_size},
+                    "sort": sort,
+                    "count": len(shadow["matches"]),
+                    "matches": shadow["matches"],
+                    "stale": True,
+                    "snapshots": shadow["snapshots"],
+                }
             return {"error": "base not found"}
         
         if not query and not ext and not category and not content:
             return {"error": "query, ext, category ou content é obrigatório"}
         
-        results = []
-        
-        for p in root.rglob("*"):
-            if not p.is_file():
-                continue
-            
-            # Filtro por nome
-            if query and query.lower() not in p.name.lower():
-                continue
-            
-            # Filtro por extensão
-            if ext and p.suffix.lower() != ext.lower():
-                continue
-            
-            # Filtro por categoria
-            file_cat = get_file_category(p.suffix)
-            if category and file_cat != category.lower():
-                continue
-            
-            try:
-                stat = p.stat()
-            except (PermissionError, OSError):
-                continue
-            
-            # Filtro por tamanho
-            if min_size and stat.st_size < min_size:
-                continue
-            if max_size and stat.st_size > max_size:
-                continue
-            
-            # Busca por conteúdo (apenas em arquivos texto < 1MB)
-            if content:
-                if stat.st_size > 1024 * 1024:
-                    continue
-                try:
-                    text = p.read_text(encoding="utf-8", errors="ignore")
-                    if content.lower() not in text.lower():
-                        continue
-                except:
-                    continue
-            
-            results.append({
-                "name": p.name,
-                "path": str(p.relative_to(root)),
-                "ext": p.suffix,
-                "category": file_cat,
-                "size_bytes": stat.st_size,
-                "size_human": format_size(stat.st_size),
-                "modified": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S"),
-                "modified_ts": stat.st_mtime
-            })
-            
-            if len(results) >= limit * 2:
-                break
-        
-        # Ordenação
-        if sort == "size":
-            results.sort(key=lambda x: x["size_bytes"], reverse=True)
-        elif sort == "date":
-            results.sort(key=lambda x: x["modified_ts"], reverse=True)
-        else:
-            results.sort(key=lambda x: x["name"].lower())
-        
-        results = results[:limit]
+        results = FederatedSearch.local(root, query=query, ext=ext, category=category, min_size=min_size,
+                                        max_size=max_size, sort=sort, limit=limit, content=content)
         
         return {
             "base": base,
@@ -440,23 +560,20 @@ class FileService:
         
         try:
             dest = Path(path)
-            if not os.path.exists(dest):
-                dest.parent.mkdir(parents=True, exist_ok=True)
-
-            content = await file.read()
-
-            with dest.open("wb") as buffer:
-                buffer.write(content)
+            size = await AtomicFile.save_upload(file, dest)
+            FilesTools.notify_change(dest)
 
             return {
                 "filename": file.filename,
                 "content_type": file.content_type,
                 "path": str(dest),
-                "size": len(content),
-                "size_human": format_size(len(content))
+                "size": size,
+                "size_human": format_size(size)
             }
         except PermissionError:
             raise HTTPException(status_code=403, detail="Permissão negada para escrever no caminho especificado")
+        except WriteConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
         except OSError as e:
             raise HTTPException(status_code=500, detail=f"Erro ao salvar arquivo: {str(e)}")
         except Exception as e:
@@ -473,11 +590,8 @@ class FileService:
         dest = root / path / file.filename if path else root / file.filename
         
         try:
-            dest.parent.mkdir(parents=True, exist_ok=True)
-            content = await file.read()
-            
-            with dest.open("wb") as buffer:
-                buffer.write(content)
+            size = await AtomicFile.save_upload(file, dest)
+            FilesTools.notify_change(dest)
             
             return {
                 "status": "ok",
@@ -485,11 +599,13 @@ class FileService:
                 "content_type": file.content_type,
                 "path": str(dest.relative_to(root)),
                 "full_path": str(dest),
-                "size": len(content),
-                "size_human": format_size(len(content))
+                "size": size,
+                "size_human": format_size(size)
             }
         except PermissionError:
             raise HTTPException(status_code=403, detail="Permissão negada")
+        except WriteConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Erro: {str(e)}")
     
@@ -542,12 +658,14 @@ class FileService:
             raise HTTPException(status_code=500, detail=f"Erro ao obter informações do filesystem: {str(e)}")
     
     @routerFile.get("/browse/{base}")
-    def browse_directory(base: str, path: str = "", machine_id: Optional[int] = None, mac: Optional[str] = None):
+    @SingleFlight.coalesce("browse", "/files/browse/{base}", ignore=("request",))
+    def browse_directory(request: Request, base: str, path: str = "", machine_id: Optional[int] = None, mac: Optional[str] = None):
         """Navega por diretórios de uma base com detalhes completos.
 
         Se `machine_id` ou `mac` for fornecido, tenta encaminhar a requisição
         para a `Machine` remota usando `machine.url_connect`. Caso contrário,
-        executa a navegação localmente.
+        executa a navegação localmente. Em respostas remotas, as primeiras
+        subpastas são carregadas antecipadamente no cache (`ListingPrefetcher`).
         """
         logger.debug("browse_directory called: base=%s path=%s machine_id=%s mac=%s", base, path, machine_id, mac)
         # Remote forwarding if machine specified
@@ -555,13 +673,11 @@ class FileService:
             try:
                 machine = FilesTools.resolve_machine(machine_id=machine_id, mac=mac)
                 if machine and getattr(machine, 'url_connect', None):
-                    url = machine.url_connect.rstrip('/') + f"/files/browse/{base}?path={requests.utils.requote_uri(path)}"
                     try:
-                        r = requests.get(url, timeout=8)
-                        if r.ok:
-                            return r.json()
-                        return {"error": f"remote HTTP {r.status_code}", "details": r.text[:512]}
-                    except requests.RequestException as e:
+                        res = FilesTools.remote_json(machine, f"/files/browse/{base}", {"path": path})
+                        ListingPrefetcher.schedule(ListingPrefetcher.session_key(request), base, res, machine)
+                        return res
+                    except httpx.HTTPError as e:
                         logger.error("Error forwarding browse to remote machine: %s", e)
                         return {"error": "remote request failed", "details": str(e)}
             except Exception as E:
@@ -570,8 +686,9 @@ class FileService:
         # Prefer remote when base reported by machine
         try:
             if FilesTools.base_has_remote(base) and not (machine_id or mac):
-                forwarded = FilesTools.forward_to_machines(f"/files/browse/{base}", params={"path": path})
+                forwarded = FilesTools.forward_to_machines(f"/files/browse/{base}", params={"path": path}, base=base)
                 if forwarded is not None:
+                    ListingPrefetcher.schedule(ListingPrefetcher.session_key(request), base, forwarded)
                     return forwarded
         except Exception:
             pass
@@ -597,6 +714,8 @@ class FileService:
 
         try:
             for item in sorted(target.iterdir()):
+                if Trash.hidden(item):
+                    continue
                 try:
                     stat = item.stat()
                     is_dir = item.is_dir()
@@ -640,34 +759,55 @@ class FileService:
         }
     
     @routerFile.get("/download/{base}")
-    def download_file(path: str, machine:Machine):
-        try:
-            url: str = f"{machine.url_connect}/download/?path={path}"
-            response = requests.get(url, stream=True)
-            response.raise_for_status()
-            return FileResponse(
-                content=response.content,
-                filename=Path(path).name,
-                media_type=response.headers.get("content-type", "application/octet-stream")
-            )   
-        except requests.exceptions.Timeout:
-            raise HTTPException(status_code=504, detail="Timeout ao acessar o servidor de arquivos")
-
-        except requests.exceptions.ConnectionError:
-            raise HTTPException(status_code=502, detail="Servidor de arquivos indisponível")
-
-        except requests.exceptions.HTTPError:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail="Erro ao baixar arquivo do servidor remoto"
-            )
+    async def download_file(path: str, machine: Machine, request: Request):
+        """Download de um arquivo de outra máquina, repassado em partes (sem carregar o arquivo na memória)"""
+        return await RemoteFile.relay(machine, path, request.headers.get("range"),
+                                      disposition=f'attachment; filename="{Path(path).name}"')
 
+    @routerFile.get("/thumb/{base}")
+    async def thumbnail(base: str, path: str, size: int = Query(128, description="Lado máximo em pixels (64, 128, 256, 512)")):
+        """Miniatura WebP/JPEG de uma imagem da base, servida do cache em disco"""
+        if not ThumbnailService.available():
+            raise HTTPException(status_code=501, detail="thumbnails require Pillow")
+
+        entry = data.GLOBAL_PATHS.get(base)
+        root = resolve_base_root(entry)
+        if not root:
+            raise HTTPException(status_code=404, detail="base not found")
+
+        target = root / path
+        # stat calls and the cache lookup touch the disk (possibly a network mount): keep them off the event loop
+        if not await asyncio.to_thread(target.is_file):
+            raise HTTPException(status_code=404, detail="file not found")
+        if not ThumbnailService.is_image(target):
+            raise HTTPException(status_code=415, detail="not an image")
+
+        try:
+            thumb = await asyncio.wrap_future(await asyncio.to_thread(ThumbnailService.submit, target, size))
         except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
-    
+            logger.error("Thumbnail failed for %s: %s", target, e)
+            raise HTTPException(status_code=500, detail="thumbnail generation failed")
+
+        media_type = "image/webp" if thumb.suffix == ".webp" else "image/jpeg"
+        return FileResponse(path=str(thumb), media_type=media_type, headers={"Cache-Control": "private, max-age=86400"})
+
+    @routerFile.post("/thumb-prewarm/{base}")
+    def thumbnail_prewarm(base: str, path: str = "", size: int = Query(128)):
+        """Enfileira miniaturas das imagens de um diretório (chamado ao navegar)"""
+        entry = data.GLOBAL_PATHS.get(base)
+        root = resolve_base_root(entry)
+        if not root:
+            raise HTTPException(status_code=404, detail="base not found")
+
+        target = root / path if path else root
+        if not target.is_dir():
+            raise HTTPException(status_code=400, detail="path is not a directory")
+
+        return {"base": base, "path": path or "/", "queued": ThumbnailService.prewarm(target, size)}
+
     @routerFile.delete("/delete/{base}")
-    def delete_item(base: str, path: str):
-        """Deleta arquivo ou diretório"""
+    def delete_item(base: str, path: str, permanent: bool = False):
+        """Move arquivo ou diretório para a lixeira (`permanent=true` apaga de vez)"""
         entry = data.GLOBAL_PATHS.get(base)
         root = resolve_base_root(entry)
         if not root:
@@ -677,18 +817,51 @@ class FileService:
         if not target.exists():
             raise HTTPException(status_code=404, detail="path not found")
         
+        return _delete_target(target, str(path), permanent)
+    
+    @routerFile.get("/trash")
+    def list_trash(base: Optional[str] = None, path: str = ""):
+        """Lista itens na lixeira (opcionalmente só os que vieram de uma base/pasta)"""
+        prefix = str(_resolve_op_path(base, path)) if (base or path) else None
+        entries = Trash.list(prefix)
+        for e in entries:
+            e["deleted_at_iso"] = datetime.fromtimestamp(e["deleted_at"]).isoformat()
+        return {"count": len(entries), "retention_days": Trash.RETENTION / 86400, "items": entries}
+
+    @routerFile.post("/trash/restore")
+    def restore_trash(id: str, dest_base: Optional[str] = None, dest: Optional[str] = None):
+        """Restaura um item da lixeira para o local original (ou para `dest`)"""
+        entry = Trash.find(id)
+        if not entry:
+            raise HTTPException(status_code=404, detail="trash item not found")
+        target = _resolve_op_path(dest_base, dest) if dest else None
         try:
-            if target.is_dir():
-                shutil.rmtree(target)
-                return {"message": "directory deleted", "path": str(path)}
-            else:
-                target.unlink()
-                return {"message": "file deleted", "path": str(path)}
+            restored = Trash.restore(entry, target)
+        except FileExistsError:
+            raise HTTPException(status_code=409, detail="target already exists")
         except PermissionError:
             raise HTTPException(status_code=403, detail="permission denied")
         except Exception as e:
-            raise HTTPException(status_code=500, detail=f"error deleting: {str(e)}")
-    
+            raise HTTPException(status_code=500, detail=f"error restoring: {str(e)}")
+        FilesTools.notify_change(restored)
+        return {"message": "restored", "id": id, "path": str(restored)}
+
+    @routerFile.delete("/trash/{id}")
+    def purge_trash_item(id: str):
+        """Apaga definitivamente um item da lixeira (em segundo plano)"""
+        entry = Trash.find(id)
+        if not entry:
+            raise HTTPException(status_code=404, detail="trash item not found")
+        Trash.mark_purge([entry])
+        return JSONResponse(status_code=202, content={"message": "purge scheduled", "id": id})
+
+    @routerFile.delete("/trash")
+    def empty_trash(base: Optional[str] = None, path: str = ""):
+        """Esvazia a lixeira (ou só os itens de uma base/pasta) em segundo plano"""
+        prefix = str(_resolve_op_path(base, path)) if (base or path) else None
+        count = Trash.mark_purge(Trash.list(prefix))
+        return JSONResponse(status_code=202, content={"message": "purge scheduled", "count": count})
+
     @routerFile.post("/create-folder/{base}")
     def create_folder(base: str, path: str = "", name: str = ""):
         """Cria nova pasta"""
@@ -704,6 +877,7 @@ class FileService:
         
         try:
             target.mkdir(parents=True, exist_ok=False)
+            FilesTools.notify_change(target)
             return {
                 "message": "folder created",
                 "path": str(target.relative_to(root)),
@@ -732,6 +906,7 @@ class FileService:
         
         try:
             target.rename(new_path)
+            FilesTools.notify_change(target, new_path)
             return {
                 "message": "renamed",
                 "old_path": str(path),
@@ -745,11 +920,180 @@ class FileService:
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"error renaming: {str(e)}")
 
+    @routerFile.post("/copy")
+    def copy_item(path: str, dest: str, base: Optional[str] = None, dest_base: Optional[str] = None, overwrite: bool = False, background: Optional[bool] = None, permanent: bool = False):
+        """Copia arquivo ou pasta no servidor (cópia no kernel, preserva metadados).
+
+        Sem `base`, `path`/`dest` são caminhos absolutos. Cópias grandes viram
+        tarefas em segundo plano (HTTP 202 + `job.id`, ver `/jobs/{id}`). Com
+        `overwrite`, o destino substituído vai para a lixeira (ou é apagado de vez com `permanent`).
+        """
+        return _transfer("copy", base, path, dest_base, dest, overwrite, background, permanent)
+
+    @routerFile.post("/move")
+    def move_item(path: str, dest: str, base: Optional[str] = None, dest_base: Optional[str] = None, overwrite: bool = False, background: Optional[bool] = None, permanent: bool = False):
+        """Move arquivo ou pasta; entre dispositivos faz cópia + remoção.
+
+        Com `overwrite`, o destino substituído vai para a lixeira (ou é apagado de vez com `permanent`).
+        """
+        return _transfer("move", base, path, dest_base, dest, overwrite, background, permanent)
+
+    @routerFile.post("/archive")
+    def archive_item(path: str, base: Optional[str] = None, format: str = Query("zip", description="zip, tar, tar.gz, tar.xz"), dest: Optional[str] = None):
+        """Compacta arquivo ou pasta em segundo plano (resultado em `/jobs/{id}`)"""
+        if format not in FileJobs.ARCHIVE_FORMATS:
+            raise HTTPException(status_code=400, detail=f"unsupported format: {format}")
+        src = _resolve_op_path(base, path)
+        if not src.exists():
+            raise HTTPException(status_code=404, detail="path not found")
+        dst = _resolve_op_path(base, dest) if dest else src.with_name(src.name + FileJobs.ARCHIVE_FORMATS[format])
+        if dst.exists():
+            raise HTTPException(status_code=409, detail="target already exists")
+        size, files = FileOps.tree_size(src)
+        job = JobManager.submit("archive", params={"src": str(src), "dst": str(dst), "format": format}, bytes_total=size, items_total=files)
+        return _job_accepted("archive started", job)
+
+    @routerFile.post("/hash")
+    def hash_item(path: str, base: Optional[str] = None, algo: str = Query("sha256", description="sha256, sha1, md5, blake2b")):
+        """Hash de um arquivo; arquivos grandes são calculados em segundo plano"""
+        if algo not in ("sha256", "sha1", "md5", "blake2b", "sha512"):
+            raise HTTPException(status_code=400, detail=f"unsupported algorithm: {algo}")
+        target = _resolve_op_path(base, path)
+        if not target.is_file():
+            raise HTTPException(status_code=404, detail="file not found")
+        size = target.stat().st_size
+        if size > BACKGROUND_BYTES:
+            job = JobManager.submit("hash", params={"path": str(target), "algo": algo}, bytes_total=size)
+            return _job_accepted("hash started", job)
+        try:
+            return {"path": _display_path(target, base), "algo": algo, "digest": FileJobs.hash_file(target, algo)}
+        except PermissionError:
+            raise HTTPException(status_code=403, detail="permission denied")
+
+    @routerFile.post("/batch")
+    def batch_operations(payload: dict):
+        """Executa várias operações (delete, rename, mkdir, move, copy) numa única tarefa.
+
+        Corpo: `{"operations": [{"op": "rename", "base": "...", "path": "...", "new_name": "..."}, ...],
+        "atomic": false, "wait": 10}`. Operações sobre caminhos independentes rodam em
+        paralelo; com `atomic` qualquer falha desfaz as anteriores. Itens apagados ou
+        sobrescritos vão para a lixeira, a não ser que a operação traga `"permanent": true`. Retorna o resultado por
+        operação, ou HTTP 202 + `job.id` se não terminar dentro de `wait` segundos (no máximo 30).
+        """
+        try:
+            steps = BatchOps.plan(payload.get("operations"))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        try:
+            wait = float(payload.get("wait", 10))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="'wait' must be a number")
+        if not wait >= 0:
+            raise HTTPException(status_code=400, detail="'wait' must be >= 0")
+        # the wait holds a threadpool worker; past MAX_WAIT poll the job instead
+        wait = min(wait, BatchOps.MAX_WAIT)
+        job = JobManager.submit("batch", params={"steps": steps, "atomic": bool(payload.get("atomic"))}, items_total=len(steps))
+        if not JobManager.wait(job, wait):
+            return _job_accepted("batch started", job)
+        if job.status != "done":
+            raise HTTPException(status_code=500, detail=job.error or f"batch {job.status}")
+        return {"job_id": job.id, **job.result}
+
+    @routerFile.get("/cache")
+    def response_cache_stats():
+        """Estatísticas do cache de respostas de outras máquinas (e do carregamento antecipado de pastas)"""
+        return {**ResponseCache.stats(), "prefetch": ListingPrefetcher.stats()}
+
+    @routerFile.get("/coalescing")
+    def coalescing_stats():
+        """Quantas requisições idênticas e simultâneas foram atendidas por uma única execução"""
+        return SingleFlight.stats()
+
+    @routerFile.get("/where")
+    def where_is(name: str = Query(..., description="Nome do arquivo ou caminho relativo à base"), base: Optional[str] = None, limit: int = 50):
+        """Em quais máquinas/bases está um arquivo, consultando as cópias offline dos índices remotos.
+
+        Responde na hora mesmo com as máquinas dormindo; os resultados vêm marcados
+        como `stale`, com o horário de cada cópia (`snapshot_at`).
+        """
+        res = ShadowIndex.lookup(name, base=base, limit=limit)
+        return {"query": {"name": name, "base": base}, "count": len(res["matches"]), "stale": True, **res}
+
+    @routerFile.get("/shadow")
+    def shadow_index_status():
+        """Cópias offline dos índices de arquivos das outras máquinas: bases, quantidade de arquivos e idade"""
+        return ShadowIndex.status()
+
+    @routerFile.post("/shadow/sync")
+    def shadow_index_sync(machine_id: Optional[int] = None):
+        """Atualiza agora as cópias offline (de uma máquina, ou de todas as que estiverem acessíveis)"""
+        if machine_id is not None:
+            machine = FilesTools.resolve_machine(machine_id=machine_id)
+            if not machine or not getattr(machine, 'url_connect', None):
+                raise HTTPException(status_code=404, detail="machine not found")
+            return {str(machine.id): ShadowIndex.sync_machine(machine)}
+        return ShadowIndex.sync_all(force=True)
+
+    @routerFile.get("/namefilter/{base}")
+    def name_filter(base: str, request: Request, since: Optional[str] = None):
+        """Filtro de Bloom com os nomes e extensões dos arquivos desta máquina em uma base.
+
+        As outras máquinas o usam para não perguntar por arquivos que não estão aqui.
+        Com `since` igual à versão atual (`version`), responde só `{"unchanged": true}`.
+        Exige o token de nó quando `QUITTO_NODE_TOKEN` está definido.
+        """
+        if not NodeClient.token_ok(request.headers):
+            raise HTTPException(status_code=401, detail="invalid node token")
+        pub = NameFilter.local(base)
+        if pub is None:
+            raise HTTPException(status_code=404, detail="base not found")
+        if since is not None and since == pub.version():
+            return {"unchanged": True, "version": pub.version()}
+        return {"base": base, "version": pub.version(), "epoch": pub.epoch, "generation": pub.generation, "built_at": pub.built_at,
+                "fpr_target": NameFilter.FPR, "filter": pub.bloom.to_dict()}
+
+    @routerFile.get("/namefilters")
+    def name_filter_stats():
+        """Filtros de nomes: os publicados por esta máquina e os recebidos das outras (tamanho, hashes, taxa de falso positivo estimada) e quantas consultas foram evitadas"""
+        return NameFilter.stats()
+
+    @routerFile.get("/replicas")
+    def replica_stats():
+        """Latência (EWMA e p95), taxa de erro e pedidos redundantes (hedge) por máquina e rota"""
+        return ReplicaSelector.stats()
+
+    @routerFile.post("/cache/invalidate")
+    async def invalidate_response_cache(request: Request):
+        """Recebe de outro nó a lista de caminhos alterados e descarta as respostas em cache afetadas.
+
+        Corpo: `{"changes": [{"base": "docs", "path": "a/b.txt"}, ...]}` (`base` nulo = caminho
+        absoluto) ou `{"all": true}`. Exige o token de nó quando `QUITTO_NODE_TOKEN` está definido.
+        """
+        if not NodeClient.token_ok(request.headers):
+            raise HTTPException(status_code=401, detail="invalid node token")
+        try:
+            body = await request.json()
+        except Exception:
+            raise HTTPException(status_code=400, detail="invalid JSON body")
+        if not isinstance(body, dict):
+            raise HTTPException(status_code=400, detail="body must be an object")
+        if body.get("all"):
+            return {"removed": ResponseCache.invalidate()}
+        changes = body.get("changes")
+        if not isinstance(changes, list):
+            raise HTTPException(status_code=400, detail="'changes' must be a list")
+        removed = 0
+        for change in changes:
+            if isinstance(change, dict):
+                removed += ResponseCache.invalidate(change.get("base"), str(change.get("path") or ""))
+        return {"removed": removed}
+
     # ═══════════════════════════════════════════════════════════════
     # Navegação Direta por Path (sem base)
     # ═══════════════════════════════════════════════════════════════
 
     @routerFile.get("/browse-path")
+    @SingleFlight.coalesce("browse", "/files/browse-path")
     def browse_path_direct(path: str = Query("/", description="Caminho absoluto no OS"), machine_id: Optional[int] = None, mac: Optional[str] = None):
         """Navega por qualquer diretório do OS dado um caminho absoluto.
 
@@ -780,13 +1124,11 @@ class FileService:
         # If a remote machine is known and exposes `url_connect`, forward the request.
         if target_machine and getattr(target_machine, 'url_connect', None):
             try:
-                base = str(target_machine.url_connect).rstrip('/')
-                url = f"{base}/files/browse-path?path={requests.utils.requote_uri(path)}"
-                r = requests.get(url, timeout=8)
-                if r.ok:
-                    return r.json()
-                raise HTTPException(status_code=502, detail=f"remote HTTP {r.status_code}")
-            except requests.RequestException as e:
+                res = FilesTools.remote_json(target_machine, "/files/browse-path", {"path": path})
+                if "remote_status" in res:
+                    raise HTTPException(status_code=502, detail=res["error"])
+                return res
+            except httpx.HTTPError as e:
                 logger.error("Error forwarding browse_path_direct to remote: %s", e)
                 raise HTTPException(status_code=502, detail="remote request failed")
 
@@ -805,6 +1147,8 @@ class FileService:
 
         try:
             for item in sorted(target.iterdir()):
+                if Trash.hidden(item):
+                    continue
                 try:
                     stat = item.stat()
                     is_dir = item.is_dir()
@@ -867,15 +1211,103 @@ class FileService:
             return {
                 "path": result["path"],
                 "name": file.name,
-                "size_bytes": result["size_bytes"],
-                "size_human": format_size(result["size_bytes"]),
-                "content": file.read_text(encoding="utf-8", errors="replace")
+                "size_bytes": result["size"],
+                "size_human": format_size(result["size"]),
+                "binary": bool(result.get("binary")),
+                "mime": result.get("mime"),
+                "encoding": result.get("encoding"),
+                "content": result.get("text")
             }
         except PermissionError:
             raise HTTPException(status_code=403, detail="permission denied")
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
+    @routerFile.get("/tail")
+    async def tail_file(request: Request, path: str = Query(..., description="Caminho absoluto do log"), lines: int = Query(100, description="Linhas iniciais"), follow: bool = Query(True)):
+        """Últimas N linhas de um arquivo e, com `follow`, novos dados via SSE (text/event-stream)"""
+        file, encoding = await asyncio.to_thread(_open_tail_target, path)
+        head, offset = await asyncio.to_thread(TailService.tail_lines, file, lines)
+
+        async def events():
+            yield _sse("lines", {"path": str(file), "text": head.decode(encoding, errors="replace"), "offset": offset})
+            if not follow:
+                return
+            async for text in TailService.follow(file, offset, encoding, is_closed=request.is_disconnected):
+                if text is None:
+                    yield ": ping\n\n"
+                elif text:
+                    yield _sse("append", {"text": text})
+
+        return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @routerFile.websocket("/tail-ws")
+    async def tail_file_ws(websocket: WebSocket, path: str, lines: int = 100, follow: bool = True):
+        """Mesmo que `/files/tail`, mas entregando os lotes por WebSocket"""
+        await websocket.accept()
+        try:
+            file, encoding = await asyncio.to_thread(_open_tail_target, path)
+        except HTTPException as e:
+            await websocket.send_json({"event": "error", "detail": e.detail})
+            await websocket.close(code=1008)
+            return
+
+        async def pump(offset: int):
+            async for text in TailService.follow(file, offset, encoding):
+                if text is None:
+                    await websocket.send_json({"event": "ping"})
+                elif text:
+                    await websocket.send_json({"event": "append", "text": text})
+
+        async def until_closed():
+            # the client never sends anything; reading is how its close frame is noticed
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+
+        try:
+            head, offset = await asyncio.to_thread(TailService.tail_lines, file, lines)
+            await websocket.send_json({"event": "lines", "path": str(file), "text": head.decode(encoding, errors="replace"), "offset": offset})
+            if not follow:
+                await websocket.close()
+                return
+            # race the follow loop against the client going away, so an idle log does not keep
+            # the watcher and the open file alive until the next heartbeat fails to send
+            tasks = {asyncio.ensure_future(pump(offset)), asyncio.ensure_future(until_closed())}
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for t in tasks:
+                    t.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+            for t in done:
+                t.result()
+        except WebSocketDisconnect:
+            return
+
+    @routerFile.get("/raw-path")
+    async def raw_file(request: Request, path: str = Query(..., description="Caminho absoluto do arquivo"), machine_id: Optional[int] = None, mac: Optional[str] = None):
+        """Bytes do arquivo sem conversão, com suporte a `Range` (HTTP 206) para leitura em partes.
+
+        Com `machine_id`/`mac` o arquivo é lido da outra máquina e repassado em blocos,
+        sem ser carregado inteiro na memória.
+        """
+        if machine_id or mac:
+            machine = FilesTools.resolve_machine(machine_id=machine_id, mac=mac)
+            if not machine or not getattr(machine, 'url_connect', None):
+                raise HTTPException(status_code=404, detail="machine not found")
+            return await RemoteFile.relay(machine, path, request.headers.get("range"))
+
+        file = Path(path)
+        if not file.exists():
+            raise HTTPException(status_code=404, detail="file not found")
+        if not file.is_file():
+            raise HTTPException(status_code=400, detail="path is not a file")
+        if not os.access(file, os.R_OK):
+            raise HTTPException(status_code=403, detail="permission denied")
+        mime = mimetypes.guess_type(str(file))[0] or 'application/octet-stream'
+        # FileResponse answers Range requests itself (206 + Content-Range)
+        return FileResponse(path=str(file), media_type=mime)
+
     @routerFile.get("/download-path")
     def download_file_direct(path: str):
         """Download de arquivo por caminho absoluto"""
@@ -889,23 +1321,13 @@ class FileService:
         return FileResponse(path=str(file), filename=file.name, media_type=mime)
 
     @routerFile.delete("/delete-path")
-    def delete_item_direct(path: str):
-        """Deleta arquivo ou diretório por caminho absoluto"""
+    def delete_item_direct(path: str, permanent: bool = False):
+        """Move para a lixeira (ou apaga com `permanent=true`) por caminho absoluto"""
         target = Path(path)
         if not target.exists():
             raise HTTPException(status_code=404, detail="path not found")
         
-        try:
-            if target.is_dir():
-                shutil.rmtree(target)
-                return {"message": "directory deleted", "path": str(target)}
-            else:
-                target.unlink()
-                return {"message": "file deleted", "path": str(target)}
-        except PermissionError:
-            raise HTTPException(status_code=403, detail="permission denied")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
+        return _delete_target(target, str(target), permanent)
 
     @routerFile.post("/create-folder-path")
     def create_folder_direct(path: str, name: str):
@@ -917,6 +1339,7 @@ class FileService:
         
         try:
             target.mkdir(parents=True, exist_ok=False)
+            FilesTools.notify_change(target)
             return {"message": "folder created", "path": str(target), "name": name}
         except FileExistsError:
             raise HTTPException(status_code=409, detail="folder already exists")
@@ -936,6 +1359,7 @@ class FileService:
         
         try:
             target.rename(new_path)
+            FilesTools.notify_change(target, new_path)
             return {"message": "renamed", "old_path": str(target), "new_path": str(new_path), "new_name": new_name}
         except FileExistsError:
             raise HTTPException(status_code=409, detail="target already exists")
@@ -956,22 +1380,24 @@ class FileService:
         dest = dest_dir / file.filename
         
         try:
-            content = await file.read()
-            with dest.open("wb") as buffer:
-                buffer.write(content)
+            size = await AtomicFile.save_upload(file, dest)
+            FilesTools.notify_change(dest)
             return {
                 "status": "ok",
                 "filename": file.filename,
                 "path": str(dest),
-                "size": len(content),
-                "size_human": format_size(len(content))
+                "size": size,
+                "size_human": format_size(size)
             }
         except PermissionError:
             raise HTTPException(status_code=403, detail="permission denied")
+        except WriteConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
         
     @routerFile.get("/search-path")
+    @SingleFlight.coalesce("search", "/files/search-path")
     def search_path_direct(
         path: str = Query(..., description="Caminho absoluto raiz da busca"),
         query: str = "",
@@ -1003,11 +1429,11 @@ class FileService:
                     if content:
                         params['content'] = content
                     try:
-                        r = requests.get(machine.url_connect.rstrip('/') + '/files/search-path', params=params, timeout=8)
-                        if r.ok:
-                            return r.json()
-                        raise HTTPException(status_code=502, detail=f"remote HTTP {r.status_code}")
-                    except requests.RequestException as e:
+                        res = FilesTools.remote_json(machine, '/files/search-path', params)
+                        if "remote_status" in res:
+                            raise HTTPException(status_code=502, detail=res["error"])
+                        return res
+                    except httpx.HTTPError as e:
                         logger.error("Error forwarding search_path to remote: %s", e)
                         raise HTTPException(status_code=502, detail="remote request failed")
             except Exception as E:
@@ -1022,7 +1448,7 @@ class FileService:
         
         results = []
         
-        for p in root.rglob("*"):
+        for p in Trash.walk(root):
             if not p.is_file():
                 continue
             if query and query.lower() not in p.name.lower():
@@ -0,0 +1,137 @@
+from pathlib import Path
+from dataclasses import dataclass
+from collections import OrderedDict
+from typing import ClassVar, Optional
+import codecs
+import mimetypes
+import threading
+import logging
+import os
+
+logger = logging.getLogger("server.services.files.filesniffer")
+
+@dataclass
+class FileSniffer:
+    """Classify files as text or binary before they are decoded.
+
+    The verdict is derived from the first `SNIFF_BYTES` of the file and cached
+    per (device, inode) together with the mtime/size it was computed for, so
+    repeated reads of an unchanged file skip the sniff entirely.
+    """
+    SNIFF_BYTES: ClassVar[int] = 8192
+    CACHE_MAX: ClassVar[int] = 4096
+
+    # Ordered so that UTF-32 is checked before its UTF-16 prefix
+    BOMS: ClassVar[tuple] = (
+        (codecs.BOM_UTF32_LE, "utf-32"),
+        (codecs.BOM_UTF32_BE, "utf-32"),
+        (codecs.BOM_UTF8, "utf-8-sig"),
+        (codecs.BOM_UTF16_LE, "utf-16"),
+        (codecs.BOM_UTF16_BE, "utf-16"),
+    )
+
+    # Magic numbers of common binary formats that would otherwise pass as text
+    MAGIC: ClassVar[tuple] = (
+        (b"\x89PNG\r\n\x1a\n", "image/png"),
+        (b"\xff\xd8\xff", "image/jpeg"),
+        (b"GIF8", "image/gif"),
+        (b"%PDF-", "application/pdf"),
+        (b"PK\x03\x04", "application/zip"),
+        (b"\x1f\x8b", "application/gzip"),
+        (b"\x7fELF", "application/x-executable"),
+        (b"\x1a\x45\xdf\xa3", "video/x-matroska"),
+        (b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+        (b"Rar!\x1a\x07", "application/vnd.rar"),
+        (b"SQLite format 3\x00", "application/vnd.sqlite3"),
+    )
+
+    # Control bytes that legitimately appear in text files
+    TEXT_CONTROL: ClassVar[frozenset] = frozenset(b"\t\n\r\f\b\x1b")
+
+    _cache: ClassVar["OrderedDict[tuple, tuple]"] = OrderedDict()
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+
+    @staticmethod
+    def sniff_bytes(head: bytes) -> dict:
+        """Return a verdict dict `{"kind": "text"|"binary", "encoding", "reason"}` for `head`."""
+        if not head:
+            return {"kind": "text", "encoding": "utf-8", "reason": "empty"}
+
+        for bom, enc in FileSniffer.BOMS:
+            if head.startswith(bom):
+                return {"kind": "text", "encoding": enc, "reason": "bom"}
+
+        for magic, mime in FileSniffer.MAGIC:
+            if head.startswith(magic):
+                return {"kind": "binary", "encoding": None, "reason": "magic", "mime": mime}
+
+        if b"\x00" in head:
+            # UTF-16 without BOM: ASCII-range text leaves every other byte NUL
+            even_nul = head[0::2].count(0)
+            odd_nul = head[1::2].count(0)
+            half = max(len(head) // 2, 1)
+            if odd_nul / half > 0.4 and even_nul / half < 0.05:
+                return {"kind": "text", "encoding": "utf-16-le", "reason": "utf16-heuristic"}
+            if even_nul / half > 0.4 and odd_nul / half < 0.05:
+                return {"kind": "text", "encoding": "utf-16-be", "reason": "utf16-heuristic"}
+            return {"kind": "binary", "encoding": None, "reason": "nul-bytes"}
+
+        control = sum(1 for b in head if b < 0x20 and b not in FileSniffer.TEXT_CONTROL)
+        if control / len(head) > 0.1:
+            return {"kind": "binary", "encoding": None, "reason": "control-bytes"}
+
+        # Incremental decode tolerates a multibyte sequence cut at the sniff boundary
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+            return {"kind": "text", "encoding": "utf-8", "reason": "utf-8"}
+        except UnicodeDecodeError:
+            pass
+
+        # Latin-1 decodes anything; only accept it when high bytes look like accented text
+        high = sum(1 for b in head if b >= 0x80)
+        c1 = sum(1 for b in head if 0x80 <= b < 0xa0)
+        if high / len(head) < 0.3 and c1 <= high // 4:
+            return {"kind": "text", "encoding": "latin-1", "reason": "latin-1-heuristic"}
+        return {"kind": "binary", "encoding": None, "reason": "undecodable"}
+
+    @staticmethod
+    def sniff(path, st: Optional[os.stat_result] = None) -> dict:
+        """Sniff `path`, reusing the cached verdict while inode, mtime and size are unchanged."""
+        p = Path(path)
+        st = st or p.stat()
+        key = (st.st_dev, st.st_ino)
+        stamp = (st.st_mtime_ns, st.st_size)
+
+        with FileSniffer._lock:
+            hit = FileSniffer._cache.get(key)
+            if hit and hit[0] == stamp:
+                FileSniffer._cache.move_to_end(key)
+                return hit[1]
+
+        with open(p, "rb") as f:
+            head = f.read(FileSniffer.SNIFF_BYTES)
+        verdict = FileSniffer.sniff_bytes(head)
+
+        with FileSniffer._lock:
+            FileSniffer._cache[key] = (stamp, verdict)
+            FileSniffer._cache.move_to_end(key)
+            while len(FileSniffer._cache) > FileSniffer.CACHE_MAX:
+                FileSniffer._cache.popitem(last=False)
+        logger.debug("Sniffed %s: %s", p, verdict)
+        return verdict
+
+    @staticmethod
+    def binary_summary(path, st: os.stat_result, verdict: dict) -> dict:
+        """Metadata-only answer returned instead of decoding a binary file."""
+        p = Path(path)
+        from .FilesTools import FilesTools
+        return {
+            "path": str(p),
+            "binary": True,
+            "size": st.st_size,
+            "size_human": FilesTools.format_size(st.st_size),
+            "mime": verdict.get("mime") or mimetypes.guess_type(str(p))[0] or "application/octet-stream",
+            "category": FilesTools.get_file_category(p.suffix),
+            "reason": verdict.get("reason"),
+            "text": None,
+        }
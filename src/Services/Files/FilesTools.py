@@ -1,18 +1,39 @@
 from pathlib import Path
 import os
 from data import data
-from typing import Optional
+from typing import Optional, List
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import asyncio
 import logging
 from dataclasses import dataclass
 import json
 from Repository.User.UserRepository import UserRepository
 from Repository.Machines.MachineRepository import MachineRepository
 from models.Machine import Machine
-import requests
+from .FileSniffer import FileSniffer
+from .Trash import Trash
+from .RemoteFile import RemoteFile, RemoteReadUnsupported
+from Services.Net.NodeClient import NodeClient
+from Services.Net.NodeCodec import NodeCodec
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.ResponseCache import ResponseCache
+from Services.Net.ReplicaSelector import ReplicaSelector
+from Services.Net.WakeOnDemand import WakeOnDemand
+from Services.Net.NameFilter import NameFilter
+import httpx
+from fastapi import HTTPException
 
 logger = logging.getLogger("server.services.files.filestools")
 
+# Shared pool for batch reads; sized for disk-bound work, not CPU
+BATCH_READ_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="batch-read")
+
+# How long a faster answer waits for the caller's preferred machine in a fan-out
+FORWARD_PREFER_GRACE = 0.25
+
 @dataclass
 class FilesTools:
 	"""Collection of filesystem helper functions used by FileService.
@@ -53,11 +74,13 @@ class FilesTools:
 			return f"{round(size_bytes/(1024**3), 2)} GB"
 
 	@staticmethod
-	def read_file_with_path(path, machine: Optional[Machine] = None) -> dict:
+	def read_file_with_path(path, machine: Optional[Machine] = None, offset: int = 0, length: Optional[int] = None) -> dict:
 		"""
 		Read a file by absolute path. If `machine` is provided and has a
-		`url_connect`, attempt to request the remote machine's MCP endpoint
-		`/mcp/tools/read_file_with_path` with JSON payload `{'path': path}`.
+		`url_connect`, the file is streamed from the remote `/files/raw-path`
+		endpoint in chunks (at most `RemoteFile.READ_MAX` bytes per call; use
+		`offset`/`length` to page through larger files). Machines without that
+		endpoint are asked through `/mcp/tools/read_file_with_path` instead.
 
 		Falls back to reading the local filesystem if remote fetch fails or
 		`machine` is not provided.
@@ -70,33 +93,195 @@ class FilesTools:
 
 		# Try remote fetch if machine provided
 		if machine and getattr(machine, 'url_connect', None):
+			try:
+				return RemoteFile.read_text(machine, str(p), offset, length)
+			except RemoteReadUnsupported:
+				pass
+			except HTTPException as E:
+				return {"error": "file not found" if E.status_code == 404 else str(E.detail), "path": str(p)}
+			except Exception as E:
+				logger.debug("Remote streamed read failed for %s: %s", getattr(machine, 'url_connect', None), E)
 			try:
 				base = str(machine.url_connect).rstrip('/')
 				url = f"{base}/mcp/tools/read_file_with_path"
-				resp = requests.post(url, json={"path": str(p)}, timeout=8)
+				resp = NodeClient.post(url, json={"path": str(p)}, timeout=8, machine=machine)
 				try:
 					j = resp.json()
 				except Exception:
 					j = None
-				if resp.ok and j and "content" in j:
+				if resp.is_success and j and "content" in j:
 					return j.get("content")
-				if resp.ok and j:
+				if resp.is_success and j:
 					return j
 				return {"error": f"remote returned status {resp.status_code}", "text": resp.text}
 			except Exception as E:
 				logger.debug("Remote fetch failed for %s: %s", getattr(machine, 'url_connect', None), E)
 
+		if offset or length is not None:
+			return FilesTools.read_file_range(p, offset, length)
+
 		# Local read fallback
 		try:
 			if not p.exists() or not p.is_file():
 				return {"error": "file not found", "path": str(p)}
-			with open(p, 'r', encoding='utf-8', errors='replace') as f:
+			st = p.stat()
+			# Sniff before decoding so binaries are summarized instead of read as text
+			verdict = FileSniffer.sniff(p, st)
+			if verdict.get("kind") == "binary":
+				return FileSniffer.binary_summary(p, st, verdict)
+			with open(p, 'r', encoding=verdict.get("encoding") or 'utf-8', errors='replace') as f:
 				text = f.read()
-			return {"path": str(p), "text": text, "size": p.stat().st_size}
+			return {"path": str(p), "text": text, "size": st.st_size, "encoding": verdict.get("encoding")}
 		except Exception as E:
 			logger.error(f"[ERROR] Failed to read file {p}: {E}")
 			return {"error": str(E)}
 	
+	@staticmethod
+	def read_file_range(path, offset: int = 0, length: Optional[int] = None) -> dict:
+		"""Read `length` bytes of a local text file starting at `offset`.
+
+		Binary files are summarized like in `read_file_with_path`. The returned
+		dict carries `offset`, `length` (bytes actually read) and `truncated`
+		when the slice stops before the end of the file.
+		"""
+		try:
+			p = Path(path) if not isinstance(path, Path) else path
+			if not p.exists() or not p.is_file():
+				return {"error": "file not found", "path": str(p)}
+			st = p.stat()
+			verdict = FileSniffer.sniff(p, st)
+			if verdict.get("kind") == "binary":
+				return FileSniffer.binary_summary(p, st, verdict)
+			offset = min(max(0, int(offset or 0)), st.st_size)
+			end = st.st_size if length is None else min(st.st_size, offset + max(0, int(length)))
+			with open(p, 'rb') as f:
+				f.seek(offset)
+				raw = f.read(end - offset)
+			return {
+				"path": str(p),
+				"text": raw.decode(verdict.get("encoding") or 'utf-8', errors='replace'),
+				"size": st.st_size,
+				"encoding": verdict.get("encoding"),
+				"offset": offset,
+				"length": len(raw),
+				"truncated": end < st.st_size,
+			}
+		except PermissionError:
+			return {"error": "permission denied"}
+		except Exception as E:
+			logger.error(f"[ERROR] Failed to read file range {path}: {E}")
+			return {"error": str(E)}
+
+	@staticmethod
+	def _parse_range(rng):
+		"""Accept `{"offset": int, "length": int}`, `[start, end]` or None. Returns (offset, length).
+
+		Negative offsets, lengths or ends raise ValueError.
+		"""
+		if rng is None:
+			return 0, None
+		if isinstance(rng, dict):
+			offset, length = int(rng.get("offset") or 0), rng.get("length")
+			length = int(length) if length is not None else None
+		elif isinstance(rng, (list, tuple)) and len(rng) == 2:
+			offset, end = int(rng[0] or 0), rng[1]
+			if end is not None and int(end) < 0:
+				raise ValueError("invalid range, end must be >= 0")
+			length = max(0, int(end) - offset) if end is not None else None
+		else:
+			raise ValueError("invalid range, expected {offset, length} or [start, end]")
+		if offset < 0 or (length is not None and length < 0):
+			raise ValueError("invalid range, offset and length must be >= 0")
+		return offset, length
+
+	@staticmethod
+	def read_files_batch(items: List[dict], max_total_bytes: int = 8 * 1024 * 1024) -> dict:
+		"""Read many `{base, path, range}` items in one call.
+
+		Paths are resolved and stat'ed in parallel, the byte budget is then
+		granted in request order (so results are deterministic), and the
+		granted slices are read in parallel. Every item gets its own result
+		or error; one failing item never fails the batch.
+		"""
+		roots: dict = {}
+		roots_lock = threading.Lock()
+
+		def resolve(item):
+			if not isinstance(item, dict):
+				raise ValueError("item must be an object")
+			base = item.get("base")
+			rel = FilesTools.normalize_rel_path(item.get("path") or "")
+			if not (base and rel):
+				raise ValueError("missing 'base' and/or 'path'")
+			offset, length = FilesTools._parse_range(item.get("range"))
+			# resolve each base root once per batch
+			with roots_lock:
+				if base not in roots:
+					roots[base] = FilesTools.resolve_base_root(data.GLOBAL_PATHS.get(base)) if base in data.GLOBAL_PATHS else None
+				root = roots[base]
+			if root is not None:
+				candidate = root / rel
+				if not candidate.is_file():
+					raise FileNotFoundError("file not found")
+			else:
+				candidate, err = FilesTools._get_file_path_for(base, rel)
+				if err:
+					raise FileNotFoundError(err)
+			st = candidate.stat()
+			# binaries are answered with metadata only and cost nothing from the budget
+			if FileSniffer.sniff(candidate, st).get("kind") == "binary":
+				return candidate, 0, 0
+			offset = min(offset, st.st_size)
+			want = st.st_size - offset if length is None else min(length, st.st_size - offset)
+			return candidate, offset, want
+
+		resolved = list(BATCH_READ_POOL.map(lambda it: FilesTools._safe_call(resolve, it), items))
+
+		remaining = max(0, int(max_total_bytes))
+		plan = []
+		for res in resolved:
+			if "error" in res:
+				plan.append(res)
+				continue
+			candidate, offset, want = res["value"]
+			grant = max(0, min(want, remaining))
+			if want > 0 and grant == 0:
+				plan.append({"error": "byte budget exhausted"})
+				continue
+			remaining -= grant
+			plan.append({"value": (candidate, offset, grant)})
+
+		def read(entry):
+			if "error" in entry:
+				return entry
+			candidate, offset, grant = entry["value"]
+			return FilesTools.read_file_range(candidate, offset, grant)
+
+		contents = list(BATCH_READ_POOL.map(read, plan))
+
+		results = []
+		for idx, (item, content) in enumerate(zip(items, contents)):
+			meta = {"index": idx, "base": item.get("base") if isinstance(item, dict) else None, "path": item.get("path") if isinstance(item, dict) else None}
+			if "error" in content:
+				results.append({**meta, "ok": False, "error": content["error"]})
+			else:
+				results.append({**meta, "ok": True, "content": content})
+
+		return {
+			"count": len(results),
+			"ok": sum(1 for r in results if r["ok"]),
+			"bytes_read": sum(r["content"].get("length", 0) for r in results if r["ok"]),
+			"max_total_bytes": max_total_bytes,
+			"results": results,
+		}
+
+	@staticmethod
+	def _safe_call(fn, *args) -> dict:
+		try:
+			return {"value": fn(*args)}
+		except Exception as E:
+			return {"error": str(E)}
+
 	@staticmethod
 	def resolve_base_root(entry):
 		if entry is None:
@@ -118,31 +303,36 @@ class FilesTools:
 			return p if p.exists() else None
 		return None
 
+	@staticmethod
+	def base_machines(base: str) -> list:
+		"""Machines (with a `url_connect`) listed as entries of `base` in `data.GLOBAL_PATHS`.
+
+		Entries may be `Machine` instances or machine ids; duplicates are dropped.
+		"""
+		entries = data.GLOBAL_PATHS.get(base) or []
+		if not isinstance(entries, (list, tuple)):
+			entries = [entries]
+		out = []
+		for e in entries:
+			m = e if isinstance(e, Machine) else None
+			if isinstance(e, int):
+				m = next((mm for mm in getattr(data, 'MACHINES', []) or [] if mm and getattr(mm, 'id', None) == e), None)
+			if m is not None and getattr(m, 'url_connect', None) and m not in out:
+				out.append(m)
+		return out
+
 	@staticmethod
 	def base_has_remote(base: str) -> bool:
-		"""Return True if `base` in `data.GLOBAL_PATHS` references any Machine with a reachable `url_connect`."""
+		"""Return True if `base` in `data.GLOBAL_PATHS` references any Machine with a `url_connect`
+		whose circuit breaker currently lets calls through (or that auto-wake can bring up)."""
 		try:
-			entries = data.GLOBAL_PATHS.get(base) or []
-			if not isinstance(entries, list):
-				entries = [entries]
-			for e in entries:
-				# direct Machine instance
-				if isinstance(e, Machine):
-					if getattr(e, 'url_connect', None):
-						return True
-				# machine id
-				if isinstance(e, int):
-					for m in getattr(data, 'MACHINES', []) or []:
-						if m and getattr(m, 'id', None) == e and getattr(m, 'url_connect', None):
-							return True
-			# no remote found
-			return False
+			return any(HealthRegistry.is_available(m) or WakeOnDemand.wakeable(m) for m in FilesTools.base_machines(base))
 		except Exception:
 			return False
 
 	@staticmethod
-	def _read_file_path(file_path: Path) -> dict:
-		return FilesTools.read_file_with_path(file_path)
+	def _read_file_path(file_path: Path, machine: Optional[Machine] = None) -> dict:
+		return FilesTools.read_file_with_path(file_path, machine)
 
 	@staticmethod
 	def _get_file_path_for(base: str, rel_path: str):
@@ -244,7 +434,7 @@ class FilesTools:
 
 			# fallback: search by name anywhere under root
 			try:
-				for p in root.rglob("*"):
+				for p in Trash.walk(root):
 					if not p.is_file():
 						continue
 					if p.name == filename:
@@ -421,29 +611,178 @@ class FilesTools:
 
 
 	@staticmethod
-	def forward_to_machines(path: str, params: dict = None, timeout: int = 6):
-		"""Attempt to forward an HTTP GET to all known machines using their `url_connect`.
+	async def _get_json(m: Machine, path: str, params: dict, timeout: float):
+		url = str(m.url_connect).rstrip('/') + path
+		r = await NodeClient.aget(url, params=params, timeout=timeout, machine=m, headers=NodeCodec.request_headers())
+		if not r.is_success:
+			raise httpx.HTTPStatusError(f"HTTP {r.status_code}", request=r.request, response=r)
+		try:
+			return NodeCodec.response_json(r)
+		except Exception:
+			return {"ok": True, "raw": r.text}
+
+	@staticmethod
+	async def _fan_out(path: str, params: dict, timeout: float, machines: list, prefer: Optional[Machine]):
+		return await ReplicaSelector.call(machines, path, lambda m: FilesTools._get_json(m, path, params, timeout), prefer=prefer)
+
+	@staticmethod
+	async def _race(path: str, params: dict, timeout: float, machines: list, accept=None, prefer: Optional[Machine] = None):
+		"""Ask every machine at once; the first answer passing `accept` wins and the rest are cancelled.
 
-		Returns the first parsed JSON response on success, or None if no machine responded.
+		An accepted answer from another machine waits up to FORWARD_PREFER_GRACE
+		seconds for `prefer`'s. Without an accepted answer the last successful
+		one is returned (None if all failed).
+		"""
+		loop = asyncio.get_running_loop()
+		ranked = ReplicaSelector.rank(machines, path, prefer)
+		# an unavailable `prefer` is not waited for
+		prefer = next((m for m in ranked if m == prefer), None) if prefer is not None else None
+		tasks = {asyncio.ensure_future(ReplicaSelector._timed(m, path, lambda m: FilesTools._get_json(m, path, params, timeout))): m
+				 for m in ranked}
+		order = {t: i for i, t in enumerate(tasks)}
+		pending = set(tasks)
+		winner = last = None
+		grace_until = None
+		try:
+			while pending:
+				wait = None if grace_until is None else max(0.0, grace_until - loop.time())
+				done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+				if not done:
+					break  # the preferred machine missed its grace window
+				# answers landing together are taken in launch (rank) order
+				for t in sorted(done, key=order.get):
+					m = tasks[t]
+					if t.exception() is not None:
+						logger.debug("forward_to_machines failed for %s: %s", getattr(m, 'url_connect', None), t.exception())
+						if m is prefer and winner is not None:
+							return winner
+						continue
+					res = t.result()
+					if accept is not None and not accept(res):
+						last = res
+						if m is prefer and winner is not None:
+							return winner
+						continue
+					if prefer is None or m is prefer:
+						return res
+					if winner is None:
+						winner = res
+						grace_until = loop.time() + FORWARD_PREFER_GRACE
+			return winner if winner is not None else last
+		finally:
+			for t in pending:
+				t.cancel()
+			# reap losers so failures are not reported as never-retrieved
+			await asyncio.gather(*tasks, return_exceptions=True)
+
+	@staticmethod
+	def forward_to_machines(path: str, params: dict = None, timeout: int = 6, prefer: Optional[Machine] = None, machines: Optional[list] = None, cache: bool = True, base: Optional[str] = None, keys: tuple = ()):
+		"""Forward an HTTP GET to the best replica among the known machines.
+
+		With `base`, only the machines listing it in `data.GLOBAL_PATHS` are
+		candidates. `ReplicaSelector` sends the call to the replica with the
+		best latency/error record for this route (`prefer` first when given),
+		hedges to the next one after the route's p95 and fails over on errors.
+		When no machine lists the base (or none is given), every machine is
+		asked at once and the first answer wins; `prefer`'s answer is taken
+		over one arriving less than FORWARD_PREFER_GRACE seconds earlier.
+		With `keys` (see `NameFilter`), machines whose published name filter
+		for `base` rules out any key are asked only when the others found
+		nothing, since a filter misses files created outside Quitto until its
+		next rebuild.
+		Returns None if no machine responded.
+		GET routes listed in `ResponseCache.ROUTE_TTLS` are served from the
+		response cache unless `cache=False`.
 		"""
 		params = params or {}
-		for m in getattr(data, 'MACHINES', []) or []:
+		if cache and machines is None:
+			key = HealthRegistry.key(prefer) if prefer is not None else "*"
+			return ResponseCache.get_or_fetch(key, path, params, lambda: FilesTools.forward_to_machines(path, params, timeout, prefer, cache=False, base=base, keys=keys))
+		# nobody is known to hold the data: ask everyone at once instead of one replica after another
+		spread = False
+		if machines is None:
+			listed = FilesTools.base_machines(base) if base else None
+			spread = not listed
+			machines = listed or getattr(data, 'MACHINES', []) or []
+		candidates = [m for m in machines if m and getattr(m, 'url_connect', None)]
+		skipped = []
+		if keys:
+			likely = NameFilter.candidates(base, keys, candidates)
+			skipped = [m for m in candidates if m not in likely]
+			candidates = likely
+		found = (lambda r: not FilesTools._no_match(r)) if keys else (lambda r: True)
+		result = FilesTools._forward_once(path, params, timeout, candidates, prefer, race=found if spread else None) if candidates else None
+		if skipped and FilesTools._no_match(result):
+			# confirm the miss with the filtered-out machines, all at once, before answering "not found"
+			second = FilesTools._forward_once(path, params, timeout, skipped, prefer, race=found)
+			NameFilter.note_fallback(base, found=not FilesTools._no_match(second))
+			if second is not None:
+				result = second
+		return result
+
+	@staticmethod
+	def _forward_once(path: str, params: dict, timeout: int, candidates: list, prefer: Optional[Machine], race=None):
+		try:
+			# a sleeping replica may be woken first (see WakeOnDemand)
+			wake = WakeOnDemand.DEADLINE if WakeOnDemand.ENABLED else 0
+			work = FilesTools._race(path, params, timeout, candidates, race, prefer) if race else FilesTools._fan_out(path, params, timeout, candidates, prefer)
+			return NodeClient.run(work, timeout * 2 + 2 + wake)
+		except Exception as E:
+			logger.debug("forward_to_machines failed for %s: %s", path, E)
+			return None
+
+	@staticmethod
+	def _no_match(result) -> bool:
+		"""Whether a forwarded find/search answer is missing or holds no match."""
+		if not isinstance(result, dict) or "error" in result:
+			return True
+		return not result.get("matches")
+
+
+	@staticmethod
+	def remote_json(machine: Machine, route: str, params: dict = None, timeout: int = 8):
+		"""GET `route` on one machine through the response cache.
+
+		Returns the JSON body, or `{"error", "remote_status", "details"}` for a
+		non-2xx answer (never cached). Transport errors, including an open
+		circuit, propagate as `httpx.HTTPError`.
+		"""
+		def fetch():
+			t0 = time.perf_counter()
 			try:
-				url_connect = getattr(m, 'url_connect', None)
-				if not url_connect:
-					continue
-				url = str(url_connect).rstrip('/') + path
-				r = requests.get(url, params=params, timeout=timeout)
-				if r.ok:
-					try:
-						return r.json()
-					except Exception:
-						return {"ok": True, "raw": r.text}
-			except requests.RequestException as E:
-				logger.debug("forward_to_machines failed for %s: %s", getattr(m, 'url_connect', None), E)
-				continue
-		return None
+				r = NodeClient.get(str(machine.url_connect).rstrip('/') + route, params=params, timeout=timeout, machine=machine,
+								   headers=NodeCodec.request_headers())
+			except httpx.HTTPError:
+				ReplicaSelector.record(machine, route, (time.perf_counter() - t0) * 1000, False)
+				raise
+			ReplicaSelector.record(machine, route, (time.perf_counter() - t0) * 1000, r.is_success)
+			if r.is_success:
+				return NodeCodec.response_json(r)
+			return {"error": f"remote HTTP {r.status_code}", "remote_status": r.status_code, "details": r.text[:512]}
+		return ResponseCache.get_or_fetch(HealthRegistry.key(machine), route, params, fetch)
 
+	@staticmethod
+	def notify_change(*targets) -> None:
+		"""Push cache invalidations to peers for local paths that were just modified.
+
+		Each absolute path is announced as-is and, for every local base that
+		contains it, as a (base, relative path) pair. Files created under a
+		local base are also added to its name filter.
+		"""
+		for target in targets:
+			if target is None:
+				continue
+			target = Path(target)
+			ResponseCache.notify_peers(None, str(target))
+			for base, entries in list(data.GLOBAL_PATHS.items()):
+				try:
+					root = FilesTools.resolve_base_root(entries)
+				except Exception:
+					continue
+				if root and (target == root or root in target.parents):
+					ResponseCache.notify_peers(base, str(target.relative_to(root)))
+			# new names must reach this node's published name filters
+			NameFilter.note_local(target)
 
 	@staticmethod
 	def resolve_machine(machine_id: Optional[int] = None, mac: Optional[str] = None) -> Optional[Machine]:
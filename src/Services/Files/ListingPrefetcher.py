@@ -0,0 +1,130 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import ClassVar, Dict, List, Optional
+from models.Machine import Machine
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.ResponseCache import ResponseCache
+from .FilesTools import FilesTools
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("server.services.files.listingprefetcher")
+
+
+@dataclass
+class ListingPrefetcher:
+    """Speculatively loads the listings a user is likely to open next.
+
+    After a remote `browse_directory` answer, the first DIRS subdirectories
+    are fetched in the background. The same call the next click would make
+    is used, so each result lands under the same `ResponseCache` key and
+    that click is served from memory. A click that arrives while the
+    prefetch is still running joins it through `SingleFlight`.
+
+    Each session has a token bucket of BUDGET prefetches that refills over
+    WINDOW seconds, so quick navigation cannot flood a slow link. Listings
+    that are already fresh in the cache are skipped and cost no token.
+    """
+    DIRS: ClassVar[int] = int(os.getenv("QUITTO_PREFETCH_DIRS", "3"))
+    BUDGET: ClassVar[float] = float(os.getenv("QUITTO_PREFETCH_BUDGET", "30"))
+    WINDOW: ClassVar[float] = float(os.getenv("QUITTO_PREFETCH_WINDOW", "60"))
+    MAX_SESSIONS: ClassVar[int] = 1024
+
+    _pool: ClassVar[ThreadPoolExecutor] = ThreadPoolExecutor(max_workers=2, thread_name_prefix="listing-prefetch")
+    _buckets: ClassVar[Dict[str, List[float]]] = {}      # session -> [tokens, last refill]
+    _pending: ClassVar[set] = set()
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+    _stats: ClassVar[Dict[str, int]] = {"scheduled": 0, "fetched": 0, "already_cached": 0, "over_budget": 0, "errors": 0}
+
+    @staticmethod
+    def session_key(request) -> str:
+        """Logged-in user when there is one, else the client address."""
+        try:
+            user_id = request.session.get("user_id")
+        except (AssertionError, AttributeError):
+            user_id = None
+        if user_id is not None:
+            return f"user:{user_id}"
+        return f"addr:{request.client.host if request.client else '?'}"
+
+    @staticmethod
+    def _take(session: str) -> bool:
+        """Spend one token of `session`'s budget. The caller holds `_lock`."""
+        now = time.monotonic()
+        bucket = ListingPrefetcher._buckets.get(session)
+        if bucket is None:
+            if len(ListingPrefetcher._buckets) >= ListingPrefetcher.MAX_SESSIONS:
+                # forget the session idle for longest
+                oldest = min(ListingPrefetcher._buckets, key=lambda k: ListingPrefetcher._buckets[k][1])
+                del ListingPrefetcher._buckets[oldest]
+            bucket = ListingPrefetcher._buckets[session] = [ListingPrefetcher.BUDGET, now]
+        rate = ListingPrefetcher.BUDGET / ListingPrefetcher.WINDOW if ListingPrefetcher.WINDOW > 0 else float("inf")
+        bucket[0] = min(ListingPrefetcher.BUDGET, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+    @staticmethod
+    def schedule(session: str, base: str, listing: dict, machine: Optional[Machine] = None) -> int:
+        """Queue prefetches for the first subdirectories of `listing`; returns how many were queued."""
+        if ListingPrefetcher.DIRS <= 0 or not isinstance(listing, dict) or "error" in listing:
+            return 0
+        if machine is not None and not HealthRegistry.is_available(machine):
+            return 0
+        subdirs = [i.get("path") for i in listing.get("items") or [] if isinstance(i, dict) and i.get("type") == "dir" and i.get("path")]
+        route = f"/files/browse/{base}"
+        cache_machine = HealthRegistry.key(machine) if machine is not None else "*"
+        queued = 0
+        for sub in subdirs[:ListingPrefetcher.DIRS]:
+            params = {"path": sub}
+            job = (cache_machine, route, sub)
+            if ResponseCache.is_fresh(cache_machine, route, params):
+                with ListingPrefetcher._lock:
+                    ListingPrefetcher._stats["already_cached"] += 1
+                continue
+            with ListingPrefetcher._lock:
+                if job in ListingPrefetcher._pending:
+                    continue
+                if not ListingPrefetcher._take(session):
+                    ListingPrefetcher._stats["over_budget"] += 1
+                    break
+                ListingPrefetcher._pending.add(job)
+                ListingPrefetcher._stats["scheduled"] += 1
+            ListingPrefetcher._pool.submit(ListingPrefetcher._fetch, job, base, route, params, machine)
+            queued += 1
+        return queued
+
+    @staticmethod
+    def _fetch(job: tuple, base: str, route: str, params: dict, machine: Optional[Machine]) -> None:
+        try:
+            # exactly what browse_directory calls for that click, so the cache key matches
+            if machine is not None:
+                value = FilesTools.remote_json(machine, route, params)
+            else:
+                value = FilesTools.forward_to_machines(route, params=params, base=base)
+            ok = ResponseCache.cacheable(value)
+            with ListingPrefetcher._lock:
+                ListingPrefetcher._stats["fetched" if ok else "errors"] += 1
+        except Exception as E:
+            logger.debug("Prefetch of %s %s failed: %s", route, params.get("path"), E)
+            with ListingPrefetcher._lock:
+                ListingPrefetcher._stats["errors"] += 1
+        finally:
+            with ListingPrefetcher._lock:
+                ListingPrefetcher._pending.discard(job)
+
+    @staticmethod
+    def stats() -> dict:
+        with ListingPrefetcher._lock:
+            return {
+                **ListingPrefetcher._stats,
+                "pending": len(ListingPrefetcher._pending),
+                "sessions": len(ListingPrefetcher._buckets),
+                "dirs": ListingPrefetcher.DIRS,
+                "budget": ListingPrefetcher.BUDGET,
+                "window_seconds": ListingPrefetcher.WINDOW,
+            }
@@ -0,0 +1,198 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import ClassVar, Iterator, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from models.Machine import Machine
+from Services.Net.NodeClient import NodeClient
+from .FileSniffer import FileSniffer
+import httpx
+import logging
+import mimetypes
+import os
+import re
+
+logger = logging.getLogger("server.services.files.remotefile")
+
+
+class RemoteReadUnsupported(Exception):
+    """The remote node has no `/files/raw-path` endpoint (older version)."""
+
+
+@dataclass
+class RemoteFile:
+    """Incremental reads of files that live on another machine.
+
+    Remote nodes serve raw bytes from `/files/raw-path` with HTTP Range
+    support. Callers here stream the bytes in CHUNK-sized pieces, so
+    memory use stays bounded: `iter_range` yields the chunks, `relay`
+    passes a remote body straight through to our own client, and
+    `read_text` decodes at most READ_MAX bytes per call. A longer file is
+    read in slices by calling again with `offset`.
+    """
+    ROUTE: ClassVar[str] = "/files/raw-path"
+    CHUNK: ClassVar[int] = int(float(os.getenv("QUITTO_REMOTE_CHUNK_KB", "256")) * 1024)
+    READ_MAX: ClassVar[int] = int(float(os.getenv("QUITTO_REMOTE_READ_MAX_MB", "8")) * 1024 * 1024)
+    # passed through from the remote answer when relaying
+    RELAY_HEADERS: ClassVar[tuple] = ("content-type", "content-length", "content-encoding", "content-range", "accept-ranges", "last-modified", "etag")
+
+    @staticmethod
+    def url(machine: Machine) -> str:
+        return str(machine.url_connect).rstrip("/") + RemoteFile.ROUTE
+
+    @staticmethod
+    def range_header(offset: int = 0, length: Optional[int] = None) -> Optional[str]:
+        if length is None:
+            return f"bytes={offset}-" if offset else None
+        if length <= 0:
+            raise ValueError("length must be positive")
+        return f"bytes={offset}-{offset + length - 1}"
+
+    @staticmethod
+    def total_size(r: httpx.Response) -> Optional[int]:
+        """Full file size from `Content-Range` (206) or `Content-Length` (200)."""
+        cr = r.headers.get("content-range")
+        if cr:
+            m = re.match(r"bytes\s+(?:\d+-\d+|\*)/(\d+)", cr)
+            return int(m.group(1)) if m else None
+        cl = r.headers.get("content-length")
+        return int(cl) if cl and cl.isdigit() else None
+
+    @staticmethod
+    def _check(r: httpx.Response, path: str) -> None:
+        if r.status_code in (200, 206):
+            return
+        try:
+            detail = r.json().get("detail") if r.headers.get("content-type", "").startswith("application/json") else None
+        except Exception:
+            detail = None
+        if r.status_code in (404, 405) and detail in ("Not Found", "Method Not Allowed"):
+            raise RemoteReadUnsupported(f"{r.url} not available")
+        if r.status_code == 416:
+            raise HTTPException(status_code=416, detail="range not satisfiable")
+        raise HTTPException(status_code=r.status_code if r.status_code < 500 else 502, detail=detail or f"remote HTTP {r.status_code} reading {path}")
+
+    @staticmethod
+    def _body(r: httpx.Response, offset: int, length: Optional[int]) -> Iterator[bytes]:
+        """The requested slice of a 200/206 body.
+
+        A server that ignores Range (206 never comes) answers 200 with the
+        whole file from byte 0: the first `offset` bytes are skipped there.
+        Reading stops once `length` bytes were produced.
+        """
+        skip = offset if r.status_code == 200 else 0
+        left = length
+        for chunk in r.iter_bytes(RemoteFile.CHUNK):
+            if skip:
+                if len(chunk) <= skip:
+                    skip -= len(chunk)
+                    continue
+                chunk, skip = chunk[skip:], 0
+            if left is not None:
+                chunk = chunk[:left]
+                left -= len(chunk)
+            if chunk:
+                yield chunk
+            if left == 0:
+                break
+
+    @staticmethod
+    def iter_range(machine: Machine, path: str, offset: int = 0, length: Optional[int] = None) -> Iterator[bytes]:
+        """Yield the bytes of `path` on `machine` in CHUNK-sized pieces."""
+        rng = RemoteFile.range_header(offset, length)
+        headers = {"Range": rng} if rng else {}
+        with NodeClient.stream("GET", RemoteFile.url(machine), params={"path": str(path)}, headers=headers, machine=machine) as r:
+            if r.status_code not in (200, 206):
+                r.read()
+            RemoteFile._check(r, path)
+            yield from RemoteFile._body(r, offset, length)
+
+    @staticmethod
+    def _read(machine: Machine, path: str, offset: int, length: int) -> Tuple[bytes, Optional[int]]:
+        """Up to `length` bytes from `offset`, plus the file's total size."""
+        with NodeClient.stream("GET", RemoteFile.url(machine), params={"path": str(path)},
+                               headers={"Range": RemoteFile.range_header(offset, length)}, machine=machine) as r:
+            if r.status_code == 416:
+                return b"", RemoteFile.total_size(r)
+            if r.status_code not in (200, 206):
+                r.read()
+            RemoteFile._check(r, path)
+            return b"".join(RemoteFile._body(r, offset, length)), RemoteFile.total_size(r)
+
+    @staticmethod
+    def read_text(machine: Machine, path: str, offset: int = 0, length: Optional[int] = None) -> dict:
+        """Read (at most READ_MAX bytes of) a remote file as text, like `FilesTools.read_file_range`.
+
+        Binary files are summarized from their first bytes instead of being
+        transferred. Raises `RemoteReadUnsupported` for nodes without the raw
+        endpoint and `httpx.HTTPError` on transport failures.
+        """
+        from .FilesTools import FilesTools
+        offset = max(0, int(offset or 0))
+        want = RemoteFile.READ_MAX if length is None else max(0, min(int(length), RemoteFile.READ_MAX))
+        head, size = RemoteFile._read(machine, path, 0, FileSniffer.SNIFF_BYTES)
+        verdict = FileSniffer.sniff_bytes(head)
+        if verdict.get("kind") == "binary":
+            return {
+                "path": str(path),
+                "binary": True,
+                "size": size,
+                "size_human": FilesTools.format_size(size or 0),
+                "mime": verdict.get("mime") or mimetypes.guess_type(str(path))[0] or "application/octet-stream",
+                "category": FilesTools.get_file_category(Path(str(path)).suffix),
+                "reason": verdict.get("reason"),
+                "text": None,
+            }
+        if size is not None:
+            offset = min(offset, size)
+        if want == 0 or (size is not None and offset >= size):
+            raw = b""
+        elif offset == 0 and size is not None and size <= len(head) and want >= size:
+            raw = head  # the sniff already fetched the whole file
+        else:
+            raw, size = RemoteFile._read(machine, path, offset, want)
+        end = offset + len(raw)
+        return {
+            "path": str(path),
+            "text": raw.decode(verdict.get("encoding") or "utf-8", errors="replace"),
+            "size": size,
+            "encoding": verdict.get("encoding"),
+            "offset": offset,
+            "length": len(raw),
+            "truncated": size is not None and end < size,
+            "machine": {"id": getattr(machine, "id", None), "name": getattr(machine, "name", None)},
+        }
+
+    @staticmethod
+    async def relay(machine: Machine, path: str, range_header: Optional[str] = None, disposition: Optional[str] = None) -> StreamingResponse:
+        """Stream `path` from `machine` to our client chunk by chunk, forwarding Range."""
+        headers = {"Range": range_header} if range_header else {}
+        cm = NodeClient.astream("GET", RemoteFile.url(machine), params={"path": str(path)}, headers=headers, machine=machine)
+        try:
+            r = await cm.__aenter__()
+        except httpx.TimeoutException:
+            raise HTTPException(status_code=504, detail="Timeout ao acessar o servidor de arquivos")
+        except httpx.TransportError:
+            raise HTTPException(status_code=502, detail="Servidor de arquivos indisponível")
+        try:
+            if r.status_code not in (200, 206, 416):
+                await r.aread()
+                RemoteFile._check(r, path)
+        except BaseException as E:
+            await cm.__aexit__(type(E), E, E.__traceback__)
+            if isinstance(E, RemoteReadUnsupported):
+                raise HTTPException(status_code=501, detail="remote machine does not support streamed reads")
+            raise
+
+        async def body():
+            try:
+                # raw bytes: Content-Length/Content-Encoding are forwarded unchanged
+                async for chunk in r.aiter_raw(RemoteFile.CHUNK):
+                    yield chunk
+            finally:
+                await cm.__aexit__(None, None, None)
+
+        out_headers = {k: r.headers[k] for k in RemoteFile.RELAY_HEADERS if k in r.headers}
+        if disposition:
+            out_headers["content-disposition"] = disposition
+        return StreamingResponse(body(), status_code=r.status_code, headers=out_headers)
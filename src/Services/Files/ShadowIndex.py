@@ -0,0 +1,289 @@
+from pathlib import Path
+from dataclasses import dataclass, field
+from datetime import datetime
+from types import MappingProxyType
+from typing import ClassVar, Dict, List, Mapping, Optional, Tuple
+from data import data
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.NodeClient import NodeClient
+from Services.Net.NodeCodec import NodeCodec
+from .AtomicWrite import AtomicFile
+from .FilesTools import FilesTools
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger("server.services.files.shadowindex")
+
+
+@dataclass(frozen=True)
+class ShadowBase:
+    """Read-only copy of one remote machine's file list for one base."""
+    machine: str                          # HealthRegistry key
+    name: Optional[str]
+    base: str
+    files: Mapping[str, Tuple[int, int]] = field(default_factory=lambda: MappingProxyType({}))   # rel path -> (size, mtime)
+    synced_at: float = 0.0
+
+    def status(self) -> dict:
+        return {
+            "machine": self.machine,
+            "name": self.name,
+            "base": self.base,
+            "files": len(self.files),
+            "synced_at": self.synced_at,
+            "age_seconds": round(time.time() - self.synced_at, 1),
+        }
+
+
+@dataclass
+class ShadowIndex:
+    """Offline copy of the file metadata of every remote base.
+
+    A background thread pulls `/sync/manifest/{base}` (relative path, size
+    and mtime of every file) from each reachable machine, for the bases the
+    machine last reported in `GlobalPathsRefresher`, every INTERVAL seconds.
+    Each copy replaces the previous one as a whole and is saved under DIR,
+    so it survives restarts of this node. Search, find and
+    `/files/where` use these copies when a machine is asleep or
+    unreachable. Those answers come back marked `stale`, with the time
+    each snapshot was taken.
+    """
+    INTERVAL: ClassVar[float] = float(os.getenv("QUITTO_SHADOW_INTERVAL", "900"))
+    TIMEOUT: ClassVar[float] = float(os.getenv("QUITTO_SHADOW_TIMEOUT", "30"))
+    DIR: ClassVar[Path] = Path(os.getenv("QUITTO_SHADOW_DIR", str(Path.home() / ".cache" / "quitto_server" / "shadow")))
+    ROUTE: ClassVar[str] = "/sync/manifest/{base}"
+
+    _bases: ClassVar[Dict[Tuple[str, str], ShadowBase]] = {}
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+    _sync_lock: ClassVar[threading.Lock] = threading.Lock()
+    _save_lock: ClassVar[threading.Lock] = threading.Lock()   # orders snapshots and their writes
+    _wake: ClassVar[threading.Event] = threading.Event()
+    _thread: ClassVar[Optional[threading.Thread]] = None
+    _errors: ClassVar[Dict[str, str]] = {}
+
+    @staticmethod
+    def start() -> None:
+        """Load the saved copies and start the sync thread (idempotent)."""
+        with ShadowIndex._lock:
+            t = ShadowIndex._thread
+            if t is not None and t.is_alive():
+                return
+            ShadowIndex._load()
+            ShadowIndex._thread = threading.Thread(target=ShadowIndex._loop, name="shadow-index", daemon=True)
+            ShadowIndex._thread.start()
+
+    @staticmethod
+    def trigger() -> None:
+        ShadowIndex._wake.set()
+
+    @staticmethod
+    def _loop() -> None:
+        while True:
+            # first pass waits for one global-paths round so machine bases are known
+            ShadowIndex._wake.wait(ShadowIndex.INTERVAL * random.uniform(0.1, 0.2) if not ShadowIndex._bases else ShadowIndex.INTERVAL * random.uniform(0.8, 1.2))
+            forced = ShadowIndex._wake.is_set()
+            ShadowIndex._wake.clear()
+            try:
+                ShadowIndex.sync_all(force=forced)
+            except Exception as E:
+                logger.error("[ERROR] Shadow index sync failed: %s", E)
+
+    # ── Persistence ───────────────────────────────────────────────
+
+    @staticmethod
+    def _file(machine_key: str) -> Path:
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in machine_key)
+        return ShadowIndex.DIR / f"{safe}.json"
+
+    @staticmethod
+    def _save(machine_key: str) -> None:
+        """Persist every base of one machine.
+
+        Only the snapshot is taken under `_lock`: copies are immutable, so
+        encoding and writing a large manifest never blocks searches.
+        """
+        with ShadowIndex._save_lock:
+            with ShadowIndex._lock:
+                bases = {b: s for (k, b), s in ShadowIndex._bases.items() if k == machine_key}
+            ShadowIndex._write(machine_key, bases)
+
+    @staticmethod
+    def _write(machine_key: str, bases: Dict[str, ShadowBase]) -> None:
+        doc = {
+            "machine": machine_key,
+            "name": next((s.name for s in bases.values()), None),
+            "bases": {b: {"synced_at": s.synced_at, "files": {p: list(v) for p, v in s.files.items()}} for b, s in bases.items()},
+        }
+        try:
+            with AtomicFile(ShadowIndex._file(machine_key), check=False) as f:
+                f.write(json.dumps(doc, separators=(",", ":")).encode("utf-8"))
+        except OSError as E:
+            logger.error("[ERROR] Could not save shadow index of machine %s: %s", machine_key, E)
+
+    @staticmethod
+    def _load() -> None:
+        if not ShadowIndex.DIR.is_dir():
+            return
+        for p in ShadowIndex.DIR.glob("*.json"):
+            try:
+                with open(p, "r", encoding="utf-8") as f:
+                    doc = json.load(f)
+                for base, b in (doc.get("bases") or {}).items():
+                    files = MappingProxyType({rel: (int(v[0]), int(v[1])) for rel, v in b["files"].items()})
+                    ShadowIndex._bases[(doc["machine"], base)] = ShadowBase(doc["machine"], doc.get("name"), base, files, float(b["synced_at"]))
+            except Exception as E:
+                logger.error("[ERROR] Ignoring unreadable shadow index %s: %s", p, E)
+
+    # ── Sync ──────────────────────────────────────────────────────
+
+    @staticmethod
+    def _machine_bases(machine) -> Tuple[str, ...]:
+        from Services.Net.GlobalPathsRefresher import GlobalPathsRefresher
+        res = GlobalPathsRefresher.snapshot().machines.get(HealthRegistry.key(machine))
+        return res.bases if res is not None else ()
+
+    @staticmethod
+    def sync_machine(machine) -> dict:
+        """Pull the manifests of every base `machine` holds; returns {base: files or error}."""
+        key = HealthRegistry.key(machine)
+        url = str(machine.url_connect).rstrip("/")
+        reported = ShadowIndex._machine_bases(machine)
+        out = {}
+        for base in reported:
+            try:
+                r = NodeClient.get(url + ShadowIndex.ROUTE.format(base=base), timeout=ShadowIndex.TIMEOUT, machine=machine,
+                                   headers=NodeCodec.request_headers())
+                if not r.is_success:
+                    raise RuntimeError(f"HTTP {r.status_code}")
+                body = NodeCodec.response_json(r)
+                files = MappingProxyType({rel: (int(v[0]), int(v[1])) for rel, v in (body.get("files") or {}).items()})
+            except Exception as E:
+                out[base] = f"{type(E).__name__}: {E}"
+                ShadowIndex._errors[f"{key}/{base}"] = out[base]
+                continue
+            ShadowIndex._errors.pop(f"{key}/{base}", None)
+            with ShadowIndex._lock:
+                ShadowIndex._bases[(key, base)] = ShadowBase(key, machine.name, base, files, time.time())
+            out[base] = len(files)
+        with ShadowIndex._lock:
+            if reported:
+                # bases the machine no longer reports
+                for k in [k for k in ShadowIndex._bases if k[0] == key and k[1] not in reported]:
+                    del ShadowIndex._bases[k]
+        ShadowIndex._save(key)
+        return out
+
+    @staticmethod
+    def sync_all(force: bool = False) -> dict:
+        """Sync every reachable machine whose copies are older than INTERVAL (all of them with `force`)."""
+        with ShadowIndex._sync_lock:
+            results = {}
+            now = time.time()
+            for m in list(getattr(data, "MACHINES", []) or []):
+                if m is None or not getattr(m, "url_connect", None) or not HealthRegistry.is_available(m):
+                    continue
+                key = HealthRegistry.key(m)
+                with ShadowIndex._lock:
+                    oldest = min((s.synced_at for (k, _), s in ShadowIndex._bases.items() if k == key), default=0.0)
+                if not force and now - oldest < ShadowIndex.INTERVAL:
+                    continue
+                results[key] = ShadowIndex.sync_machine(m)
+            return results
+
+    # ── Queries ───────────────────────────────────────────────────
+
+    @staticmethod
+    def _machine_ref(s: ShadowBase) -> dict:
+        """`{"id", "key", "name"}` of the machine a copy came from; `key` is its `HealthRegistry` key."""
+        mid = next((m.id for m in getattr(data, "MACHINES", []) or [] if m is not None and HealthRegistry.key(m) == s.machine), None)
+        return {"id": mid, "key": s.machine, "name": s.name}
+
+    @staticmethod
+    def _copies(base: Optional[str] = None, machine: Optional[str] = None) -> List[ShadowBase]:
+        with ShadowIndex._lock:
+            return [s for (k, b), s in ShadowIndex._bases.items() if (base is None or b == base) and (machine is None or k == machine)]
+
+    @staticmethod
+    def has(base: str, machine: Optional[str] = None) -> bool:
+        return bool(ShadowIndex._copies(base, machine))
+
+    @staticmethod
+    def search(base: str, query: str = "", ext: Optional[str] = None, category: Optional[str] = None,
+               min_size: Optional[int] = None, max_size: Optional[int] = None, sort: str = "name",
+               limit: int = 50, machine: Optional[str] = None, **_ignored) -> Optional[dict]:
+        """Search the saved copies of `base` like `FederatedSearch.local`; None when there are none.
+
+        Content search is not possible offline, so `content` (via `**_ignored`) is ignored.
+        """
+        from .FederatedSearch import FederatedSearch
+        copies = ShadowIndex._copies(base, machine)
+        if not copies:
+            return None
+        results = []
+        for s in copies:
+            for rel, (size, mtime) in s.files.items():
+                name = rel.rsplit("/", 1)[-1]
+                if query and query.lower() not in name.lower():
+                    continue
+                suffix = Path(name).suffix
+                if ext and suffix.lower() != ext.lower():
+                    continue
+                file_cat = FilesTools.get_file_category(suffix)
+                if category and file_cat != category.lower():
+                    continue
+                if min_size and size < min_size:
+                    continue
+                if max_size and size > max_size:
+                    continue
+                results.append({
+                    "name": name,
+                    "path": rel,
+                    "ext": suffix,
+                    "category": file_cat,
+                    "size_bytes": size,
+                    "size_human": FilesTools.format_size(size),
+                    "modified": datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M:%S"),
+                    "modified_ts": mtime,
+                    "machine": ShadowIndex._machine_ref(s),
+                    "stale": True,
+                    "snapshot_at": s.synced_at,
+                })
+        key, reverse = FederatedSearch.sort_key(sort)
+        results.sort(key=key, reverse=reverse)
+        return {"matches": results[:limit], "snapshots": [s.status() for s in copies]}
+
+    @staticmethod
+    def lookup(filename: str, base: Optional[str] = None, limit: int = 50) -> dict:
+        """Where is `filename`? Exact name (or relative path) matches in every saved copy."""
+        wanted = filename.strip("/")
+        by_path = "/" in wanted
+        copies = ShadowIndex._copies(base)
+        matches = []
+        for s in copies:
+            for rel, (size, mtime) in s.files.items():
+                if (rel == wanted) if by_path else (rel.rsplit("/", 1)[-1] == wanted):
+                    matches.append({
+                        "path": rel,
+                        "base": s.base,
+                        "size_bytes": size,
+                        "modified": datetime.fromtimestamp(mtime).isoformat(),
+                        "machine": ShadowIndex._machine_ref(s),
+                        "stale": True,
+                        "snapshot_at": s.synced_at,
+                    })
+                    if len(matches) >= limit:
+                        return {"matches": matches, "snapshots": [c.status() for c in copies]}
+        return {"matches": matches, "snapshots": [c.status() for c in copies]}
+
+    @staticmethod
+    def status() -> dict:
+        return {
+            "interval": ShadowIndex.INTERVAL,
+            "dir": str(ShadowIndex.DIR),
+            "copies": [s.status() for s in ShadowIndex._copies()],
+            "errors": dict(ShadowIndex._errors),
+        }
@@ -0,0 +1,221 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import AsyncIterator, ClassVar, Optional, Tuple
+import asyncio
+import codecs
+import ctypes
+import ctypes.util
+import logging
+import os
+import sys
+
+logger = logging.getLogger("server.services.files.tailservice")
+
+# inotify constants (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVE_SELF = 0x00000800
+IN_DELETE_SELF = 0x00000400
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+class _Inotify:
+    """Minimal ctypes inotify watcher signalling an asyncio.Event on file changes."""
+
+    _libc = None
+
+    @classmethod
+    def supported(cls) -> bool:
+        if not sys.platform.startswith("linux"):
+            return False
+        if cls._libc is None:
+            try:
+                cls._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                cls._libc.inotify_init1
+            except Exception:
+                cls._libc = False
+        return bool(cls._libc)
+
+    def __init__(self, path: Path, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF
+        if self._libc.inotify_add_watch(self.fd, os.fsencode(str(path)), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, "inotify_add_watch failed")
+        loop.add_reader(self.fd, self._on_readable)
+
+    def _on_readable(self):
+        try:
+            while os.read(self.fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        except OSError:
+            pass
+        self.event.set()
+
+    async def wait(self, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.event.clear()
+
+    def close(self):
+        try:
+            self.loop.remove_reader(self.fd)
+        finally:
+            os.close(self.fd)
+
+
+@dataclass
+class TailService:
+    """`tail -n` / `tail -f` for log files.
+
+    The initial lines come from a backward block scan, so only the end of the
+    file is read no matter how large it is. Following uses inotify when
+    available and falls back to polling `os.stat`. Appended data is batched
+    for `BATCH_SECONDS` (or until `BATCH_BYTES`) so a busy log produces one
+    frame per batch instead of one per line.
+    """
+    BLOCK_SIZE: ClassVar[int] = 8192
+    MAX_LINES: ClassVar[int] = 5000
+    BATCH_SECONDS: ClassVar[float] = 0.25
+    BATCH_BYTES: ClassVar[int] = 256 * 1024
+    POLL_SECONDS: ClassVar[float] = 1.0
+    # Emitted while idle so proxies keep the stream open and disconnects are noticed
+    HEARTBEAT_SECONDS: ClassVar[float] = 15.0
+
+    @staticmethod
+    def tail_lines(path: Path, n: int) -> Tuple[bytes, int]:
+        """Return the raw bytes of the last `n` lines and the file offset they end at."""
+        n = max(0, min(int(n), TailService.MAX_LINES))
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            if n == 0 or end == 0:
+                return b"", end
+            pos = end
+            chunks = []
+            newlines = 0
+            # a trailing newline terminates the last line; it does not start a new one
+            f.seek(end - 1)
+            skip_trailing = f.read(1) == b"\n"
+            while pos > 0 and newlines <= n:
+                step = min(TailService.BLOCK_SIZE, pos)
+                pos -= step
+                f.seek(pos)
+                block = f.read(step)
+                chunks.append(block)
+                newlines += block.count(b"\n")
+            buf = b"".join(reversed(chunks))
+            lines = buf.split(b"\n")
+            if skip_trailing:
+                lines = lines[:-1]
+            tail = b"\n".join(lines[-n:])
+            if skip_trailing:
+                tail += b"\n"
+            return tail, end
+
+    @staticmethod
+    def _open(path: Path, offset: int = 0):
+        """Open `path` at `offset`; returns the file and its inode."""
+        f = open(path, "rb")
+        try:
+            f.seek(offset)
+            return f, os.fstat(f.fileno()).st_ino
+        except BaseException:
+            f.close()
+            raise
+
+    @staticmethod
+    def _stat(path: Path) -> Optional[os.stat_result]:
+        try:
+            return os.stat(path)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    async def follow(path: Path, offset: int, encoding: str = "utf-8", is_closed=None) -> AsyncIterator[Optional[str]]:
+        """Yield decoded batches of data appended after `offset`.
+
+        Yields None as a heartbeat when nothing changed for `HEARTBEAT_SECONDS`.
+        Truncation (copytruncate) restarts from 0 and rotation (new inode) reopens the path.
+        File access runs in worker threads so a slow disk never stalls the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        watcher = None
+        if _Inotify.supported():
+            try:
+                watcher = _Inotify(path, loop)
+            except OSError as E:
+                logger.debug("inotify unavailable for %s, polling instead: %s", path, E)
+
+        decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        try:
+            f, inode = await asyncio.to_thread(TailService._open, path, offset)
+        except BaseException:
+            if watcher is not None:
+                watcher.close()
+            raise
+        idle = 0.0
+        try:
+            while True:
+                if is_closed is not None and await is_closed():
+                    return
+                wait = TailService.POLL_SECONDS if watcher is None else TailService.HEARTBEAT_SECONDS
+                started = loop.time()
+                if watcher is not None:
+                    await watcher.wait(wait)
+                else:
+                    await asyncio.sleep(wait)
+
+                st = await asyncio.to_thread(TailService._stat, path)
+                if st is not None and st.st_ino != inode:
+                    # rotated: drain the old file in batches, then switch to the new one
+                    while True:
+                        rest = await asyncio.to_thread(f.read, TailService.BATCH_BYTES)
+                        if not rest:
+                            break
+                        yield decoder.decode(rest)
+                    f.close()
+                    f, inode = await asyncio.to_thread(TailService._open, path)
+                    if watcher is not None:
+                        watcher.close()
+                        try:
+                            watcher = _Inotify(path, loop)
+                        except OSError:
+                            watcher = None
+                    continue
+                if st is not None and st.st_size < f.tell():
+                    f.seek(0)
+
+                # batch: keep reading while data arrives within the batch window
+                chunk = await asyncio.to_thread(f.read, TailService.BATCH_BYTES)
+                if chunk:
+                    idle = 0.0
+                    deadline = loop.time() + TailService.BATCH_SECONDS
+                    parts = [chunk]
+                    size = len(chunk)
+                    while size < TailService.BATCH_BYTES and loop.time() < deadline:
+                        await asyncio.sleep(0.05)
+                        more = await asyncio.to_thread(f.read, TailService.BATCH_BYTES - size)
+                        if more:
+                            parts.append(more)
+                            size += len(more)
+                    yield decoder.decode(b"".join(parts))
+                else:
+                    idle += loop.time() - started
+                    if idle >= TailService.HEARTBEAT_SECONDS:
+                        idle = 0.0
+                        yield None
+        finally:
+            f.close()
+            if watcher is not None:
+                watcher.close()
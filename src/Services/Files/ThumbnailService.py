@@ -0,0 +1,215 @@
+from pathlib import Path
+from dataclasses import dataclass
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import ClassVar, Optional
+import hashlib
+import threading
+import logging
+import os
+
+try:
+    from PIL import Image, ImageOps, features
+except Exception:
+    Image = None
+
+logger = logging.getLogger("server.services.files.thumbnailservice")
+
+
+def _render_thumbnail(src: str, dest: str, size: int, fmt: str) -> int:
+    """Render `src` into `dest` (runs inside a pool worker process). Returns bytes written."""
+    tmp = dest + ".part"
+    try:
+        with Image.open(src) as im:
+            im = ImageOps.exif_transpose(im)
+            im.thumbnail((size, size))
+            if fmt == "JPEG" and im.mode not in ("RGB", "L"):
+                im = im.convert("RGB")
+            im.save(tmp, fmt, quality=80)
+        os.replace(tmp, dest)
+    except BaseException:
+        # a truncated or corrupt image must not leave a partial file in the cache
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return os.path.getsize(dest)
+
+
+@dataclass
+class ThumbnailService:
+    """Thumbnail generation with a content-addressed on-disk cache.
+
+    Cache entries are named after a hash of (device, inode, mtime, file size,
+    thumbnail size, format) so a modified source simply misses and the stale
+    entry ages out. The cache directory is bounded by `QUOTA_BYTES` and evicted
+    least-recently-used first (hits refresh the entry's atime).
+    """
+    CACHE_DIR: ClassVar[Path] = Path(os.getenv("QUITTO_THUMB_CACHE", str(Path.home() / ".cache" / "quitto_server" / "thumbs")))
+    QUOTA_BYTES: ClassVar[int] = int(os.getenv("QUITTO_THUMB_QUOTA_MB", "512")) * 1024 * 1024
+    SIZES: ClassVar[tuple] = (64, 128, 256, 512)
+    EXTENSIONS: ClassVar[frozenset] = frozenset({".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".tiff"})
+    PREWARM_MAX: ClassVar[int] = 200
+
+    _pool: ClassVar[Optional[ProcessPoolExecutor]] = None
+    _pending: ClassVar[dict] = {}
+    _used_bytes: ClassVar[Optional[int]] = None
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+
+    @staticmethod
+    def available() -> bool:
+        return Image is not None
+
+    @staticmethod
+    def normalize_size(size: int) -> int:
+        """Snap a requested size to the nearest supported bucket so the cache stays bounded."""
+        return min(ThumbnailService.SIZES, key=lambda s: abs(s - int(size or 0)))
+
+    @staticmethod
+    def default_format() -> str:
+        try:
+            return "WEBP" if features.check("webp") else "JPEG"
+        except Exception:
+            return "JPEG"
+
+    @staticmethod
+    def is_image(path: Path) -> bool:
+        return path.suffix.lower() in ThumbnailService.EXTENSIONS
+
+    @staticmethod
+    def cache_path(src: Path, size: int, fmt: str, st: Optional[os.stat_result] = None) -> Path:
+        st = st or src.stat()
+        key = f"{st.st_dev}:{st.st_ino}:{st.st_mtime_ns}:{st.st_size}:{size}:{fmt}"
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        ext = ".webp" if fmt == "WEBP" else ".jpg"
+        return ThumbnailService.CACHE_DIR / digest[:2] / (digest + ext)
+
+    @staticmethod
+    def _get_pool() -> ProcessPoolExecutor:
+        with ThumbnailService._lock:
+            if ThumbnailService._pool is None:
+                workers = max(1, min(4, (os.cpu_count() or 2) - 1))
+                ThumbnailService._pool = ProcessPoolExecutor(max_workers=workers)
+            return ThumbnailService._pool
+
+    @staticmethod
+    def submit(src: Path, size: int, fmt: Optional[str] = None) -> Future:
+        """Return a future resolving to the cached thumbnail path, rendering it if needed.
+
+        Concurrent requests for the same thumbnail share one render.
+        """
+        if not ThumbnailService.available():
+            raise RuntimeError("Pillow is not installed")
+        fmt = fmt or ThumbnailService.default_format()
+        size = ThumbnailService.normalize_size(size)
+        dest = ThumbnailService.cache_path(src, size, fmt)
+
+        if dest.exists():
+            try:
+                os.utime(dest)
+            except OSError:
+                pass
+            done: Future = Future()
+            done.set_result(dest)
+            return done
+
+        result: Future = Future()
+        # lookup and insert under one lock hold, so two misses cannot both render
+        with ThumbnailService._lock:
+            pending = ThumbnailService._pending.setdefault(dest, result)
+        if pending is not result:
+            return pending
+
+        def _on_done(fut: Future):
+            with ThumbnailService._lock:
+                ThumbnailService._pending.pop(dest, None)
+            try:
+                written = fut.result()
+            except Exception as E:
+                logger.debug("Thumbnail render failed for %s: %s", src, E)
+                result.set_exception(E)
+                return
+            ThumbnailService._account(written)
+            result.set_result(dest)
+
+        try:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            ThumbnailService._get_pool().submit(_render_thumbnail, str(src), str(dest), size, fmt).add_done_callback(_on_done)
+        except BaseException as E:
+            # never leave a pending future that nothing will complete
+            with ThumbnailService._lock:
+                ThumbnailService._pending.pop(dest, None)
+            result.set_exception(E)
+        return result
+
+    @staticmethod
+    def prewarm(directory: Path, size: int = 128, fmt: Optional[str] = None) -> int:
+        """Queue thumbnails for the images directly inside `directory`. Returns how many were queued."""
+        if not ThumbnailService.available():
+            return 0
+        queued = 0
+        try:
+            for item in sorted(directory.iterdir()):
+                if queued >= ThumbnailService.PREWARM_MAX:
+                    break
+                try:
+                    if item.is_file() and ThumbnailService.is_image(item):
+                        ThumbnailService.submit(item, size, fmt)
+                        queued += 1
+                except (PermissionError, OSError):
+                    continue
+        except (PermissionError, OSError) as E:
+            logger.debug("Thumbnail prewarm failed for %s: %s", directory, E)
+        return queued
+
+    @staticmethod
+    def _scan_usage() -> int:
+        total = 0
+        if ThumbnailService.CACHE_DIR.exists():
+            for p in ThumbnailService.CACHE_DIR.rglob("*"):
+                try:
+                    if p.is_file():
+                        total += p.stat().st_size
+                except OSError:
+                    continue
+        return total
+
+    @staticmethod
+    def _account(written: int) -> None:
+        with ThumbnailService._lock:
+            if ThumbnailService._used_bytes is None:
+                ThumbnailService._used_bytes = ThumbnailService._scan_usage()
+            else:
+                ThumbnailService._used_bytes += written
+            over = ThumbnailService._used_bytes > ThumbnailService.QUOTA_BYTES
+        if over:
+            ThumbnailService.evict()
+
+    @staticmethod
+    def evict() -> int:
+        """Delete least-recently-used entries until the cache is at 90% of its quota."""
+        entries = []
+        for p in ThumbnailService.CACHE_DIR.rglob("*"):
+            try:
+                if p.is_file():
+                    st = p.stat()
+                    entries.append((st.st_atime, st.st_size, p))
+            except OSError:
+                continue
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        target = int(ThumbnailService.QUOTA_BYTES * 0.9)
+        removed = 0
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+                total -= size
+                removed += 1
+            except OSError:
+                continue
+        with ThumbnailService._lock:
+            ThumbnailService._used_bytes = total
+        logger.debug("Thumbnail cache evicted %d entries, %d bytes in use", removed, total)
+        return removed
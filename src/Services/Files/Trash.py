@@ -0,0 +1,350 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import ClassVar, Dict, Iterator, List, Optional
+from .FileOps import FileOps
+import errno
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger("server.services.files.trash")
+
+
+@dataclass
+class Trash:
+    """Soft-delete into a per-filesystem trash directory.
+
+    Deleting renames the item into `<trash>/items/<id>` (plus a small JSON
+    record in `<trash>/info/<id>.json`). The trash is always on the same
+    device as the item -- the topmost writable directory of that filesystem,
+    usually its mount point -- so the rename is O(1) regardless of tree size.
+
+    A daemon thread purges entries past the retention period, entries marked
+    for purge, and the oldest entries once a trash exceeds its size cap,
+    unlinking at a throttled rate so purges do not starve foreground I/O.
+    """
+    DIRNAME: ClassVar[str] = ".quitto-trash"
+    RETENTION: ClassVar[float] = float(os.getenv("QUITTO_TRASH_RETENTION_DAYS", "7")) * 86400
+    MAX_BYTES: ClassVar[int] = int(float(os.getenv("QUITTO_TRASH_MAX_GB", "0")) * 1024 ** 3)   # 0 = no cap
+    PURGE_RATE: ClassVar[int] = int(float(os.getenv("QUITTO_TRASH_PURGE_MBPS", "64")) * 1024 * 1024)
+    PURGE_INTERVAL: ClassVar[float] = 300.0
+    # every unlink is charged at least this much against PURGE_RATE
+    MIN_UNLINK_COST: ClassVar[int] = 64 * 1024
+    REGISTRY: ClassVar[Path] = Path(os.getenv("QUITTO_TRASH_REGISTRY", str(Path.home() / ".local" / "state" / "quitto_server" / "trash.json")))
+
+    _roots: ClassVar[Dict[int, Path]] = {}      # st_dev -> trash dir
+    _lock: ClassVar[threading.RLock] = threading.RLock()
+    _wake: ClassVar[threading.Event] = threading.Event()
+    _purger: ClassVar[Optional[threading.Thread]] = None
+
+    # ── Locating the trash ────────────────────────────────────────
+
+    @staticmethod
+    def hidden(path: Path) -> bool:
+        """Whether `path` is a trash directory, which listings must not show."""
+        return path.name == Trash.DIRNAME
+
+    @staticmethod
+    def walk(root: Path) -> Iterator[Path]:
+        """Every entry below `root`, like `root.rglob("*")`, without entering trash directories.
+
+        A base rooted at a mount point holds that filesystem's trash, so
+        deleted files would otherwise still be found by searches, manifests
+        and name filters.
+        """
+        for dirpath, dirs, files in os.walk(root):
+            dirs[:] = [d for d in dirs if d != Trash.DIRNAME]
+            parent = Path(dirpath)
+            for name in dirs:
+                yield parent / name
+            for name in files:
+                yield parent / name
+
+    @staticmethod
+    def _usable(trash: Path) -> bool:
+        try:
+            (trash / "items").mkdir(parents=True, exist_ok=True)
+            (trash / "info").mkdir(exist_ok=True)
+            return os.access(trash / "items", os.W_OK) and os.access(trash / "info", os.W_OK)
+        except OSError:
+            return False
+
+    @staticmethod
+    def trash_for(path: Path) -> Optional[Path]:
+        """Trash directory on the same device as `path` (created on demand)."""
+        dev = os.lstat(path).st_dev
+        with Trash._lock:
+            known = Trash._roots.get(dev)
+            if known is not None and (known / "items").is_dir():
+                return known
+            # candidates from the mount point down to the item's parent
+            chain = [p for p in [path.parent, *path.parent.parents]]
+            same_dev = []
+            for p in chain:
+                try:
+                    if os.stat(p).st_dev != dev:
+                        break
+                except OSError:
+                    break
+                same_dev.append(p)
+            for candidate in reversed(same_dev):
+                trash = candidate / Trash.DIRNAME
+                if trash == path or trash in path.parents:
+                    return None
+                if Trash._usable(trash):
+                    Trash._roots[dev] = trash
+                    Trash._save_registry()
+                    return trash
+        return None
+
+    @staticmethod
+    def _save_registry() -> None:
+        try:
+            Trash.REGISTRY.parent.mkdir(parents=True, exist_ok=True)
+            tmp = Trash.REGISTRY.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(sorted({str(p) for p in Trash._roots.values()}), f)
+            os.replace(tmp, Trash.REGISTRY)
+        except Exception as E:
+            logger.debug("Could not persist trash registry: %s", E)
+
+    @staticmethod
+    def _load_registry() -> None:
+        try:
+            with open(Trash.REGISTRY, "r", encoding="utf-8") as f:
+                paths = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        with Trash._lock:
+            for p in paths:
+                trash = Path(p)
+                try:
+                    Trash._roots.setdefault(os.stat(trash).st_dev, trash)
+                except OSError:
+                    continue
+
+    @staticmethod
+    def roots() -> List[Path]:
+        with Trash._lock:
+            return [p for p in Trash._roots.values() if (p / "items").is_dir()]
+
+    # ── Entries ───────────────────────────────────────────────────
+
+    @staticmethod
+    def move_to_trash(target: Path, original: Optional[Path] = None) -> Optional[dict]:
+        """Rename `target` into its filesystem's trash. Returns the entry, or None when no trash is usable.
+
+        `original` is the path recorded for restore when it differs from `target`
+        (a destination renamed aside before being replaced).
+        """
+        trash = Trash.trash_for(target)
+        if trash is None:
+            return None
+        original = Path(original) if original else target
+        entry = {
+            "id": uuid.uuid4().hex[:12],
+            "name": original.name,
+            "original_path": str(original),
+            "is_dir": target.is_dir() and not target.is_symlink(),
+            "deleted_at": time.time(),
+            "size": None,
+            "purge": False,
+        }
+        # the info file goes first, so an item in items/ always has one
+        Trash._write_info(trash, entry)
+        try:
+            os.rename(target, trash / "items" / entry["id"])
+        except OSError as E:
+            (trash / "info" / f"{entry['id']}.json").unlink(missing_ok=True)
+            if E.errno != errno.EXDEV:
+                raise
+            # same st_dev but another mount (bind mount, btrfs subvolume): no O(1) trash here
+            logger.warning("Trash %s cannot take %s (cross-device rename)", trash, target)
+            return None
+        Trash.start()
+        return entry
+
+    @staticmethod
+    def discard(target: Path, original: Optional[Path] = None, permanent: bool = False) -> Optional[dict]:
+        """Move `target` to the trash; delete it for good with `permanent` or when no trash is usable."""
+        if not permanent:
+            entry = Trash.move_to_trash(target, original)
+            if entry:
+                return entry
+            logger.warning("No usable trash for %s, deleting permanently", original or target)
+        FileOps.remove(target)
+        return None
+
+    @staticmethod
+    def _write_info(trash: Path, entry: dict) -> None:
+        tmp = trash / "info" / f".{entry['id']}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, trash / "info" / f"{entry['id']}.json")
+
+    @staticmethod
+    def _entries(trash: Path) -> List[dict]:
+        out = []
+        for p in (trash / "info").glob("*.json"):
+            try:
+                with open(p, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            entry["trash"] = str(trash)
+            out.append(entry)
+        return out
+
+    @staticmethod
+    def list(prefix: Optional[str] = None) -> List[dict]:
+        """All entries (newest first), optionally limited to originals under `prefix`."""
+        Trash.start()
+        entries = [e for t in Trash.roots() for e in Trash._entries(t)]
+        if prefix:
+            p = prefix.rstrip("/")
+            entries = [e for e in entries if e["original_path"] == p or e["original_path"].startswith(p + "/")]
+        for e in entries:
+            e["expires_at"] = e["deleted_at"] + Trash.RETENTION
+        return sorted(entries, key=lambda e: e["deleted_at"], reverse=True)
+
+    @staticmethod
+    def find(entry_id: str) -> Optional[dict]:
+        if not entry_id or "/" in entry_id or entry_id.startswith("."):
+            return None
+        Trash.start()
+        for trash in Trash.roots():
+            info = trash / "info" / f"{entry_id}.json"
+            if info.exists():
+                with open(info, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                entry["trash"] = str(trash)
+                return entry
+        return None
+
+    @staticmethod
+    def restore(entry: dict, dest: Optional[Path] = None) -> Path:
+        """Rename an entry back to its original location (or `dest`). Raises FileExistsError."""
+        trash = Path(entry["trash"])
+        target = Path(dest) if dest else Path(entry["original_path"])
+        if target.exists() or target.is_symlink():
+            raise FileExistsError(str(target))
+        target.parent.mkdir(parents=True, exist_ok=True)
+        # a plain rename unless `dest` is on another device
+        FileOps.move(trash / "items" / entry["id"], target)
+        (trash / "info" / f"{entry['id']}.json").unlink(missing_ok=True)
+        return target
+
+    @staticmethod
+    def mark_purge(entries: List[dict]) -> int:
+        """Flag entries for the purger and wake it; actual deletion happens in the background."""
+        for entry in entries:
+            record = {k: v for k, v in entry.items() if k not in ("trash", "expires_at")}
+            record["purge"] = True
+            Trash._write_info(Path(entry["trash"]), record)
+        Trash.start()
+        Trash._wake.set()
+        return len(entries)
+
+    # ── Background purge ──────────────────────────────────────────
+
+    @staticmethod
+    def start() -> None:
+        """Start the purger thread (idempotent)."""
+        with Trash._lock:
+            if Trash._purger is not None and Trash._purger.is_alive():
+                return
+            Trash._load_registry()
+            Trash._purger = threading.Thread(target=Trash._purge_loop, name="trash-purger", daemon=True)
+            Trash._purger.start()
+
+    @staticmethod
+    def _purge_loop() -> None:
+        while True:
+            try:
+                Trash.purge_once()
+            except Exception as E:
+                logger.error("[ERROR] Trash purge failed: %s", E)
+            Trash._wake.wait(Trash.PURGE_INTERVAL)
+            Trash._wake.clear()
+
+    @staticmethod
+    def _item_size(path: Path) -> int:
+        if path.is_symlink() or not path.is_dir():
+            return path.lstat().st_size
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    @staticmethod
+    def purge_once() -> int:
+        """One purge pass over every trash. Returns the number of entries removed."""
+        removed = 0
+        now = time.time()
+        for trash in Trash.roots():
+            entries = sorted(Trash._entries(trash), key=lambda e: e["deleted_at"])
+            doomed = [e for e in entries if e.get("purge") or now - e["deleted_at"] > Trash.RETENTION]
+            if Trash.MAX_BYTES:
+                keep = [e for e in entries if e not in doomed]
+                for e in keep:
+                    if e.get("size") is None:
+                        try:
+                            e["size"] = Trash._item_size(trash / "items" / e["id"])
+                            Trash._write_info(trash, {k: v for k, v in e.items() if k not in ("trash", "expires_at")})
+                        except OSError:
+                            e["size"] = 0
+                total = sum(e["size"] for e in keep)
+                for e in keep:  # oldest first
+                    if total <= Trash.MAX_BYTES:
+                        break
+                    doomed.append(e)
+                    total -= e["size"]
+            for e in doomed:
+                Trash._purge_entry(trash, e["id"])
+                removed += 1
+        if removed:
+            logger.info("Trash purge removed %d entries", removed)
+        return removed
+
+    @staticmethod
+    def _purge_entry(trash: Path, entry_id: str) -> None:
+        item = trash / "items" / entry_id
+        budget_start = time.monotonic()
+        spent = 0
+
+        def throttle(cost: int):
+            nonlocal spent
+            spent += max(cost, Trash.MIN_UNLINK_COST)
+            ahead = spent / Trash.PURGE_RATE - (time.monotonic() - budget_start)
+            if ahead > 0:
+                time.sleep(ahead)
+
+        if item.is_symlink() or item.is_file():
+            size = item.lstat().st_size
+            item.unlink()
+            throttle(size)
+        elif item.is_dir():
+            for root, dirs, files in os.walk(item, topdown=False):
+                for name in files:
+                    p = os.path.join(root, name)
+                    try:
+                        size = os.lstat(p).st_size
+                        os.unlink(p)
+                    except FileNotFoundError:
+                        continue
+                    throttle(size)
+                for name in dirs:
+                    p = os.path.join(root, name)
+                    if os.path.islink(p):
+                        os.unlink(p)
+                    else:
+                        os.rmdir(p)
+            os.rmdir(item)
+        (trash / "info" / f"{entry_id}.json").unlink(missing_ok=True)
@@ -0,0 +1,198 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, ClassVar, Dict, List, Optional
+from models.Job import Job, JobCancelled
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger("server.services.jobs.jobmanager")
+
+@dataclass
+class JobManager:
+    """In-process job scheduler for long filesystem operations.
+
+    Jobs are plain data (`kind` + JSON `params`) executed by a handler
+    registered for their kind, so the queue can be persisted and replayed:
+    on restart, jobs that were still queued are queued again and jobs that
+    were running are marked `interrupted`. A fixed number of worker threads
+    drain a FIFO queue. Cancellation is cooperative: handlers report progress
+    through `job.add_bytes` / `job.add_items`, which raise once cancel is
+    requested.
+    """
+    WORKERS: ClassVar[int] = int(os.getenv("QUITTO_JOB_WORKERS", "2"))
+    # Parallelism available to a single job for independent sub-steps (see `map`)
+    SUBTASK_WORKERS: ClassVar[int] = int(os.getenv("QUITTO_JOB_SUBTASKS", "8"))
+    KEEP_FINISHED: ClassVar[int] = 24 * 3600
+    STATE_FILE: ClassVar[Path] = Path(os.getenv("QUITTO_JOBS_FILE", str(Path.home() / ".local" / "state" / "quitto_server" / "jobs.json")))
+
+    _handlers: ClassVar[Dict[str, Callable[[Job], object]]] = {}
+    _jobs: ClassVar[Dict[str, Job]] = {}
+    _queue: ClassVar["queue.Queue[str]"] = queue.Queue()
+    _lock: ClassVar[threading.RLock] = threading.RLock()
+    _workers: ClassVar[List[threading.Thread]] = []
+    _subtasks: ClassVar[Optional[ThreadPoolExecutor]] = None
+
+    @staticmethod
+    def register(kind: str, handler: Callable[[Job], object]) -> None:
+        JobManager._handlers[kind] = handler
+
+    @staticmethod
+    def start() -> None:
+        """Load persisted jobs and start the worker threads (idempotent)."""
+        with JobManager._lock:
+            if JobManager._workers:
+                return
+            JobManager._load()
+            for i in range(max(1, JobManager.WORKERS)):
+                t = threading.Thread(target=JobManager._worker, name=f"job-worker-{i}", daemon=True)
+                t.start()
+                JobManager._workers.append(t)
+
+    @staticmethod
+    def submit(kind: str, params: Optional[dict] = None, bytes_total: int = 0, items_total: int = 0) -> Job:
+        if kind not in JobManager._handlers:
+            raise ValueError(f"no handler registered for job kind '{kind}'")
+        JobManager.start()
+        job = Job(kind=kind, params=params or {}, bytes_total=bytes_total, items_total=items_total)
+        with JobManager._lock:
+            JobManager._prune()
+            JobManager._jobs[job.id] = job
+            JobManager._persist()
+        JobManager._queue.put(job.id)
+        logger.info("Job %s (%s) queued", job.id, kind)
+        return job
+
+    @staticmethod
+    def cancel(job_id: str) -> Optional[Job]:
+        with JobManager._lock:
+            job = JobManager._jobs.get(job_id)
+            if job is None or job.is_finished():
+                return job
+            job.cancel_requested = True
+            if job.status == "queued":
+                # never started: finish it right away, the worker will skip it
+                job.status = "cancelled"
+                job.finished_at = time.time()
+            JobManager._persist()
+        return job
+
+    @staticmethod
+    def _worker() -> None:
+        while True:
+            job_id = JobManager._queue.get()
+            try:
+                with JobManager._lock:
+                    job = JobManager._jobs.get(job_id)
+                    if job is None or job.status != "queued":
+                        continue
+                    job.status = "running"
+                    job.started_at = time.time()
+                    JobManager._persist()
+                JobManager._run(job)
+            finally:
+                JobManager._queue.task_done()
+
+    @staticmethod
+    def _run(job: Job) -> None:
+        handler = JobManager._handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise RuntimeError(f"no handler for job kind '{job.kind}'")
+            job.result = handler(job)
+            job.status = "done"
+        except JobCancelled:
+            logger.info("Job %s (%s) cancelled", job.id, job.kind)
+            job.status = "cancelled"
+        except Exception as E:
+            logger.error("[ERROR] Job %s (%s) failed: %s", job.id, job.kind, E)
+            job.error = str(E)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            with JobManager._lock:
+                JobManager._persist()
+
+    @staticmethod
+    def map(fn: Callable, items: list) -> list:
+        """Run `fn` over `items` on the scheduler's bounded subtask pool, preserving order."""
+        with JobManager._lock:
+            if JobManager._subtasks is None:
+                JobManager._subtasks = ThreadPoolExecutor(max_workers=JobManager.SUBTASK_WORKERS, thread_name_prefix="job-subtask")
+        return list(JobManager._subtasks.map(fn, items))
+
+    @staticmethod
+    def wait(job: Job, timeout: float) -> bool:
+        """Block up to `timeout` seconds for `job` to finish. Returns True if it did."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        while not job.is_finished():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    @staticmethod
+    def get(job_id: str) -> Optional[Job]:
+        return JobManager._jobs.get(job_id)
+
+    @staticmethod
+    def list(kind: Optional[str] = None, status: Optional[str] = None) -> List[Job]:
+        jobs = list(JobManager._jobs.values())
+        if kind:
+            jobs = [j for j in jobs if j.kind == kind]
+        if status:
+            jobs = [j for j in jobs if j.status == status]
+        return sorted(jobs, key=lambda j: j.created_at, reverse=True)
+
+    @staticmethod
+    def _prune() -> None:
+        cutoff = time.time() - JobManager.KEEP_FINISHED
+        for job_id in [k for k, j in JobManager._jobs.items() if j.is_finished() and (j.finished_at or 0) < cutoff]:
+            JobManager._jobs.pop(job_id, None)
+
+    @staticmethod
+    def _persist() -> None:
+        """Write the job table atomically; called on every state transition."""
+        try:
+            JobManager.STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            tmp = JobManager.STATE_FILE.with_suffix(".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump([j.to_dict() for j in JobManager._jobs.values()], f, default=str)
+            os.replace(tmp, JobManager.STATE_FILE)
+        except Exception as E:
+            logger.debug("Could not persist job state: %s", E)
+
+    @staticmethod
+    def _load() -> None:
+        if not JobManager.STATE_FILE.exists():
+            return
+        try:
+            with open(JobManager.STATE_FILE, "r", encoding="utf-8") as f:
+                rows = json.load(f)
+        except Exception as E:
+            logger.error("[ERROR] Could not read job state %s: %s", JobManager.STATE_FILE, E)
+            return
+        requeued = 0
+        for row in rows:
+            try:
+                job = Job.from_dict(row)
+            except Exception:
+                continue
+            if job.status == "running":
+                job.status = "interrupted"
+                job.finished_at = time.time()
+            elif job.status == "queued":
+                if job.kind in JobManager._handlers and not job.cancel_requested:
+                    JobManager._queue.put(job.id)
+                    requeued += 1
+                else:
+                    job.status = "interrupted"
+                    job.finished_at = time.time()
+            JobManager._jobs[job.id] = job
+        JobManager._prune()
+        JobManager._persist()
+        logger.info("Loaded %d persisted jobs (%d requeued)", len(JobManager._jobs), requeued)
@@ -0,0 +1,52 @@
+from fastapi import APIRouter, HTTPException
+from typing import Optional
+from .JobManager import JobManager
+import logging
+
+# Logger specific to this service: server.services.jobs.jobservice
+logger = logging.getLogger("server.services.jobs.jobservice")
+
+# ═══════════════════════════════════════════════════════════════
+# JobService - Acompanhamento de tarefas em segundo plano
+# ═══════════════════════════════════════════════════════════════
+
+routerJobs = APIRouter(prefix="/jobs", tags=["Jobs"])
+
+class JobService:
+    @routerJobs.get("/")
+    def list_jobs(kind: Optional[str] = None, status: Optional[str] = None):
+        """Lista tarefas recentes (mais novas primeiro)"""
+        jobs = JobManager.list(kind, status)
+        return {"count": len(jobs), "jobs": [j.to_dict() for j in jobs]}
+
+    @routerJobs.get("/{job_id}")
+    def get_job(job_id: str):
+        """Status completo de uma tarefa (parâmetros, resultado, erro)"""
+        job = JobManager.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="job not found")
+        return job.to_dict()
+
+    @routerJobs.get("/{job_id}/progress")
+    def get_job_progress(job_id: str):
+        """Somente o progresso, para polling leve"""
+        job = JobManager.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="job not found")
+        return {
+            "id": job.id,
+            "status": job.status,
+            "progress": job.progress(),
+            "bytes_done": job.bytes_done,
+            "bytes_total": job.bytes_total,
+            "items_done": job.items_done,
+            "items_total": job.items_total,
+        }
+
+    @routerJobs.post("/{job_id}/cancel")
+    def cancel_job(job_id: str):
+        """Cancela uma tarefa na fila ou em execução (cancelamento cooperativo)"""
+        job = JobManager.cancel(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="job not found")
+        return {"id": job.id, "status": job.status, "cancel_requested": job.cancel_requested}
@@ -5,6 +5,7 @@ from models.Machine import Machine
 from models.Agent import Agent
 from Services.MCP.MemoryService import MemoryService
 from Services.Files.FilesTools import FilesTools 
+from Services.Files.AtomicWrite import AtomicFile, WriteConflict
 from Repository.Machines.MachineRepository import MachineRepository
 import logging
 
@@ -18,6 +19,10 @@ logger = logging.getLogger("server.services.mcp.mcpservice")
 
 routerMCP = APIRouter(prefix="/mcp", tags=["MCP"])
 
+# Limits for the batch read tool
+MAX_BATCH_ITEMS = 200
+MAX_BATCH_BYTES = 16 * 1024 * 1024
+
 class MCPService:
     @routerMCP.post("/initialize")
     def mcp_initialize():
@@ -69,6 +74,11 @@ class MCPService:
                         return jsonrpc_error(req_id, -32602, "Invalid params, expected object")
                     result = MCPService.mcp_read_file(params)
                     return {"jsonrpc": "2.0", "id": req_id, "result": result}
+                if method in ("tools.read_files", "read_files"):
+                    if not isinstance(params, dict):
+                        return jsonrpc_error(req_id, -32602, "Invalid params, expected object")
+                    result = MCPService.mcp_read_files(params)
+                    return {"jsonrpc": "2.0", "id": req_id, "result": result}
                 if method in ("save_in_IA_mem", "memory.save"):
                     if not isinstance(params, dict):
                         # allow raw string in params
@@ -218,6 +228,33 @@ class MCPService:
         
         return {"content":content}
     
+    @routerMCP.post("/tools/read_files")
+    def mcp_read_files(payload: dict):
+        """Batch read: `{"items": [{"base", "path", "range"}], "max_bytes": int}` in one round trip."""
+        if not isinstance(payload,dict):
+            raise HTTPException(status_code=422,detail="[ERROR] Invalid payload type for read_files: expected dict, got {}".format(type(payload).__name__))
+
+        items = payload.get("items")
+        if not isinstance(items, list) or not items:
+            raise HTTPException(status_code=422, detail="Missing required parameter: 'items' (non-empty list of {base, path, range})")
+        if len(items) > MAX_BATCH_ITEMS:
+            raise HTTPException(status_code=413, detail=f"Too many items: {len(items)} > {MAX_BATCH_ITEMS}")
+
+        for idx, item in enumerate(items):
+            try:
+                FilesTools._parse_range(item.get("range") if isinstance(item, dict) else None)
+            except (TypeError, ValueError) as E:
+                raise HTTPException(status_code=400, detail=f"items[{idx}].range: {E}")
+
+        try:
+            max_bytes = int(payload.get("max_bytes") or MAX_BATCH_BYTES)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=422, detail="'max_bytes' must be an integer")
+        if max_bytes < 0:
+            raise HTTPException(status_code=400, detail="'max_bytes' must be >= 0")
+
+        return FilesTools.read_files_batch(items, min(max_bytes, MAX_BATCH_BYTES))
+
     @routerMCP.post("/tools/read_file_with_path")
     def mcp_read_file_with_path(payload: dict):
         if not isinstance(payload,dict):
@@ -241,7 +278,14 @@ class MCPService:
             except Exception:
                 machine = None
 
-        content:dict = FilesTools.read_file_with_path(path, machine)
+        # optional slice, to page through large (remote) files with bounded memory
+        try:
+            offset = int(payload.get("offset") or 0)
+            length = int(payload["length"]) if payload.get("length") is not None else None
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=422, detail="'offset' and 'length' must be integers")
+
+        content:dict = FilesTools.read_file_with_path(path, machine, offset, length)
         if "error" in content:
             raise HTTPException(status_code=404,detail="file not found in selected base")
         
@@ -280,19 +324,25 @@ class MCPService:
                 raise HTTPException(status_code=400, detail="invalid base entry")
 
         try:
-            contents = await file.read()
-            if not contents:
+            first = await file.read(AtomicFile.UPLOAD_CHUNK)
+            if not first:
                 raise HTTPException(status_code=400, detail="empty upload")
 
             final_path = base_path / file.filename
-            final_path.parent.mkdir(parents=True, exist_ok=True)
-
-            with open(final_path, "wb") as f:
-                f.write(contents)
+            with AtomicFile(final_path) as f:
+                f.write(first)
+                while True:
+                    chunk = await file.read(AtomicFile.UPLOAD_CHUNK)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            FilesTools.notify_change(final_path)
 
             return {"saved": str(final_path)}
         except HTTPException:
             raise
+        except WriteConflict as E:
+            raise HTTPException(status_code=409, detail=str(E))
         except Exception as E:
             raise HTTPException(status_code=500, detail=str(E))
 
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, HTTPException, Request, WebSocket
 from fastapi.responses import HTMLResponse
 import os
 import sys
@@ -6,6 +6,10 @@ from pathlib import Path
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from models.Machine import Machine
 from Repository.Machines.MachineRepository import MachineRepository
+from Services.Net.NodeClient import NodeClient
+from Services.Net.NodeChannel import NodeChannel
+from Services.Net.WakeOnDemand import WakeOnDemand
+from Services.Net.MachineHealth import HealthRegistry
 from typing import Optional
 import logging
 
@@ -102,17 +106,32 @@ class MachineService:
                 "vendor": m.vendor,
                 "is_randomized": m.is_randomized,
                 "url_connect": getattr(m, 'url_connect', None),
+                "health": HealthRegistry.snapshot(m),
             }
             for m in machines
         ]
 
+    @routerMachine.get("/pools")
+    def connection_pools(request: Request):
+        """Estatísticas dos pools HTTP keep-alive usados para falar com outras máquinas"""
+        if not request.session.get("authenticated"):
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        return NodeClient.stats()
+
+    @routerMachine.websocket("/channel")
+    async def node_channel(websocket: WebSocket):
+        """Canal WebSocket persistente usado por outros nós Quitto (requisições multiplexadas, heartbeats)"""
+        await NodeChannel.serve(websocket)
+
     @routerMachine.post("/wake_on_lan")
-    def wake_on_lan(id_machine:int) -> dict:
+    def wake_on_lan(id_machine:int, wait: bool = False) -> dict:
         """
         Sends a Wake-on-LAN (WOL) packet to the machine identified by the given ID.
 
         Args:
             id_machine (int): The unique identifier of the machine to wake.
+            wait (bool): Keep sending packets and probing until the machine answers or
+                QUITTO_WAKE_DEADLINE passes; concurrent callers share one wake.
 
         Returns:
             dict: A dictionary containing the result of the WOL operation.
@@ -133,6 +152,12 @@ class MachineService:
         if machine is None:
             raise HTTPException(status_code=404, detail="Machine not found")
 
+        if wait:
+            if not getattr(machine, 'url_connect', None):
+                raise HTTPException(status_code=400, detail="Machine has no url_connect to probe")
+            awake = WakeOnDemand.ensure_awake(machine)
+            return {"ok": awake, "id": machine.id, "address": machine.address, "awake": awake, "wake": WakeOnDemand.stats()["machines"].get(HealthRegistry.key(machine))}
+
         # Use Machine.wake_on_lan() helper (returns bool)
         try:
             ok = machine.wake_on_lan()
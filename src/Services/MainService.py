@@ -102,6 +102,7 @@ class MainService:
                     "GET /api/info/datetime",
                     "GET /api/info/all",
                     "GET /api/global_paths",
+                    "GET /api/global_paths/status",
                     "GET /api/health"
                 ],
                 "main": [
@@ -147,6 +148,7 @@ class MainService:
                     "GET /api/info/datetime",
                     "GET /api/info/all",
                     "GET /api/global_paths",
+                    "GET /api/global_paths/status",
                     "GET /api/health"
                 ],
                 "main": [
@@ -0,0 +1,250 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import MappingProxyType
+from typing import ClassVar, Dict, Mapping, Optional, Tuple
+from .MachineHealth import HealthRegistry
+from .NodeClient import NodeClient
+from .NodeCodec import NodeCodec
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger("server.services.net.globalpathsrefresher")
+
+
+@dataclass(frozen=True)
+class MachineRefresh:
+    """Outcome of the last global-paths query to one machine."""
+    key: str
+    name: Optional[str] = None
+    url: Optional[str] = None
+    ok: bool = False
+    skipped: Optional[str] = None          # e.g. "circuit open"
+    bases: Tuple[str, ...] = ()
+    ms: Optional[float] = None
+    error: Optional[str] = None
+    attempted_at: Optional[float] = None
+    last_success_at: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "key": self.key,
+            "name": self.name,
+            "url": self.url,
+            "ok": self.ok,
+            "skipped": self.skipped,
+            "bases": list(self.bases),
+            "ms": round(self.ms, 2) if self.ms is not None else None,
+            "error": self.error,
+            "attempted_at": self.attempted_at,
+            "last_success_at": self.last_success_at,
+        }
+
+
+@dataclass(frozen=True)
+class GlobalPathsSnapshot:
+    """Immutable merged view of local and remote bases.
+
+    `mapping` is read-only (base -> tuple of `Path`/`Machine` entries); a new
+    snapshot replaces the old one as a whole, so readers never see a half
+    merged map.
+    """
+    mapping: Mapping[str, tuple] = field(default_factory=lambda: MappingProxyType({}))
+    machines: Mapping[str, MachineRefresh] = field(default_factory=lambda: MappingProxyType({}))
+    built_at: float = 0.0
+    duration_ms: float = 0.0
+    generation: int = 0
+
+    def age(self) -> Optional[float]:
+        return time.time() - self.built_at if self.built_at else None
+
+    def as_lists(self) -> Dict[str, list]:
+        """Mutable copy in the historical `GLOBAL_PATHS` shape (base -> list)."""
+        return {k: list(v) for k, v in self.mapping.items()}
+
+    def status(self) -> dict:
+        age = self.age()
+        return {
+            "generation": self.generation,
+            "built_at": self.built_at or None,
+            "age_seconds": round(age, 2) if age is not None else None,
+            "duration_ms": round(self.duration_ms, 2),
+            "bases": len(self.mapping),
+            "machines": {k: m.to_dict() for k, m in self.machines.items()},
+        }
+
+
+@dataclass
+class GlobalPathsRefresher:
+    """Keeps the merged global-path map up to date in the background.
+
+    Every INTERVAL seconds (+/- JITTER as a fraction, so nodes started together
+    do not query each other in lockstep) all known machines are asked for
+    their local bases concurrently and a new `GlobalPathsSnapshot` is
+    published; `data.GLOBAL_PATHS` is swapped to it in one assignment. API
+    handlers read the snapshot and never wait on the network. A machine that
+    fails keeps the bases of its last successful answer, flagged in its
+    status, until it answers again. On-demand refreshes (`refresh(min_age=...)`)
+    reuse a snapshot younger than MIN_REFRESH seconds, so a client polling
+    `?refresh=true` cannot turn every request into a fan-out to all machines.
+    """
+    INTERVAL: ClassVar[float] = float(os.getenv("QUITTO_GLOBAL_PATHS_INTERVAL", "60"))
+    JITTER: ClassVar[float] = float(os.getenv("QUITTO_GLOBAL_PATHS_JITTER", "0.2"))
+    TIMEOUT: ClassVar[float] = float(os.getenv("QUITTO_GLOBAL_PATHS_TIMEOUT", "5"))
+    MIN_REFRESH: ClassVar[float] = float(os.getenv("QUITTO_GLOBAL_PATHS_MIN_REFRESH", "10"))
+    ROUTE: ClassVar[str] = "/api/global_paths/local"
+
+    _snapshot: ClassVar[GlobalPathsSnapshot] = GlobalPathsSnapshot()
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+    _refresh_lock: ClassVar[threading.Lock] = threading.Lock()
+    _wake: ClassVar[threading.Event] = threading.Event()
+    _thread: ClassVar[Optional[threading.Thread]] = None
+
+    @staticmethod
+    def snapshot() -> GlobalPathsSnapshot:
+        """Current snapshot; builds the first one synchronously if none exists yet."""
+        snap = GlobalPathsRefresher._snapshot
+        if snap.generation == 0:
+            snap = GlobalPathsRefresher.refresh()
+            GlobalPathsRefresher.start()
+        return snap
+
+    @staticmethod
+    def start() -> None:
+        """Start the refresher thread (idempotent)."""
+        with GlobalPathsRefresher._lock:
+            t = GlobalPathsRefresher._thread
+            if t is not None and t.is_alive():
+                return
+            GlobalPathsRefresher._thread = threading.Thread(target=GlobalPathsRefresher._loop, name="global-paths-refresher", daemon=True)
+            GlobalPathsRefresher._thread.start()
+
+    @staticmethod
+    def trigger() -> None:
+        """Ask the background thread to refresh now instead of at the next tick."""
+        GlobalPathsRefresher._wake.set()
+
+    @staticmethod
+    def _next_delay() -> float:
+        jitter = GlobalPathsRefresher.INTERVAL * max(0.0, min(GlobalPathsRefresher.JITTER, 1.0))
+        return max(1.0, GlobalPathsRefresher.INTERVAL + random.uniform(-jitter, jitter))
+
+    @staticmethod
+    def _loop() -> None:
+        while True:
+            if GlobalPathsRefresher._snapshot.generation:
+                GlobalPathsRefresher._wake.wait(GlobalPathsRefresher._next_delay())
+                GlobalPathsRefresher._wake.clear()
+            try:
+                GlobalPathsRefresher.refresh()
+            except Exception as E:
+                logger.error("[ERROR] Global paths refresh failed: %s", E)
+                time.sleep(GlobalPathsRefresher._next_delay())
+
+    # ── Building a snapshot ───────────────────────────────────────
+
+    @staticmethod
+    def local_source() -> Dict[str, list]:
+        """Bases configured on this node (MachineService.MACHINE_BASES, else `data.BASES`)."""
+        from data import data
+        try:
+            import Services.MachineService.MachineService as ms_mod
+            if hasattr(ms_mod, 'MACHINE_BASES'):
+                source = dict(getattr(ms_mod, 'MACHINE_BASES') or {})
+            elif hasattr(ms_mod, 'MachineService') and hasattr(ms_mod.MachineService, 'MACHINE_BASES'):
+                source = dict(ms_mod.MachineService.MACHINE_BASES or {})
+            else:
+                source = dict(data.BASES or {})
+        except Exception:
+            source = dict(data.BASES or {})
+        return {k: (v if isinstance(v, list) else [v]) for k, v in source.items()}
+
+    @staticmethod
+    def local_bases() -> Dict[str, list]:
+        """Bases served from this node's own disk, as {base: [path, ...]}."""
+        out = {}
+        for base, entries in GlobalPathsRefresher.local_source().items():
+            paths = [str(e) for e in entries if isinstance(e, (Path, str))]
+            if paths:
+                out[base] = paths
+        return out
+
+    @staticmethod
+    async def _query(m, previous: Optional[MachineRefresh]) -> MachineRefresh:
+        key = HealthRegistry.key(m)
+        url = str(m.url_connect).rstrip("/")
+        now = time.time()
+        last_ok = previous.last_success_at if previous else None
+        kept = previous.bases if previous else ()
+        if not HealthRegistry.is_available(m):
+            return MachineRefresh(key, m.name, url, ok=False, skipped="circuit open", bases=kept,
+                                  error=previous.error if previous else None, attempted_at=now, last_success_at=last_ok)
+        t0 = time.perf_counter()
+        try:
+            r = await NodeClient.aget(url + GlobalPathsRefresher.ROUTE, timeout=GlobalPathsRefresher.TIMEOUT, machine=m,
+                                      headers=NodeCodec.request_headers())
+            ms = (time.perf_counter() - t0) * 1000
+            if not r.is_success:
+                return MachineRefresh(key, m.name, url, ok=False, bases=kept, ms=ms, error=f"HTTP {r.status_code}",
+                                      attempted_at=now, last_success_at=last_ok)
+            body = NodeCodec.response_json(r)
+            if not isinstance(body, dict):
+                raise ValueError("unexpected response shape")
+            return MachineRefresh(key, m.name, url, ok=True, bases=tuple(sorted(body.keys())), ms=ms,
+                                  attempted_at=now, last_success_at=time.time())
+        except Exception as E:
+            return MachineRefresh(key, m.name, url, ok=False, bases=kept, ms=(time.perf_counter() - t0) * 1000,
+                                  error=f"{type(E).__name__}: {E}", attempted_at=now, last_success_at=last_ok)
+
+    @staticmethod
+    def refresh(min_age: Optional[float] = None) -> GlobalPathsSnapshot:
+        """Query every machine now and publish a new snapshot. Concurrent callers share one refresh.
+
+        With `min_age`, a snapshot younger than that many seconds is returned as is.
+        """
+        from data import data
+        generation = GlobalPathsRefresher._snapshot.generation
+        with GlobalPathsRefresher._refresh_lock:
+            current = GlobalPathsRefresher._snapshot
+            if current.generation != generation:
+                # another caller refreshed while we waited for the lock
+                return current
+            age = current.age()
+            if min_age is not None and age is not None and age < min_age:
+                return current
+            t0 = time.perf_counter()
+            try:
+                data.load_machines()
+            except Exception:
+                logger.debug("load_machines failed while refreshing global paths", exc_info=True)
+
+            merged = GlobalPathsRefresher.local_source()
+            previous = GlobalPathsRefresher._snapshot.machines
+            machines = [m for m in data.MACHINES if m is not None and getattr(m, "url_connect", None)]
+
+            async def query_all():
+                return await asyncio.gather(*(GlobalPathsRefresher._query(m, previous.get(HealthRegistry.key(m))) for m in machines))
+
+            results = NodeClient.run(query_all(), timeout=GlobalPathsRefresher.TIMEOUT + 5) if machines else []
+            for m, res in zip(machines, results):
+                for base in res.bases:
+                    entries = merged.setdefault(base, [])
+                    if m not in entries:
+                        entries.append(m)
+
+            snap = GlobalPathsSnapshot(
+                mapping=MappingProxyType({k: tuple(v) for k, v in merged.items()}),
+                machines=MappingProxyType({r.key: r for r in results}),
+                built_at=time.time(),
+                duration_ms=(time.perf_counter() - t0) * 1000,
+                generation=generation + 1,
+            )
+            GlobalPathsRefresher._snapshot = snap
+            data.GLOBAL_PATHS = snap.as_lists()
+            failed = [r.key for r in results if not r.ok]
+            if failed:
+                logger.debug("Global paths refresh: no answer from %s", ", ".join(failed))
+            return snap
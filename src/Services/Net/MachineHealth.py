@@ -0,0 +1,150 @@
+from dataclasses import dataclass, asdict
+from typing import ClassVar, Dict, Optional
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("server.services.net.machinehealth")
+
+
+@dataclass
+class MachineHealth:
+    key: str
+    name: Optional[str] = None
+    state: str = "closed"                # closed, open, half_open
+    consecutive_failures: int = 0
+    successes: int = 0
+    failures: int = 0
+    trips: int = 0                       # consecutive times the circuit opened without recovering
+    ewma_ms: Optional[float] = None
+    opened_at: Optional[float] = None
+    last_success_at: Optional[float] = None
+    last_failure_at: Optional[float] = None
+    last_error: Optional[str] = None
+    probe_in_flight: bool = False
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d["ewma_ms"] = round(self.ewma_ms, 2) if self.ewma_ms is not None else None
+        d["retry_at"] = (self.opened_at + HealthRegistry.cooldown(self)) if self.state == "open" else None
+        return d
+
+
+@dataclass
+class HealthRegistry:
+    """Per-machine health and circuit breakers, keyed by `Machine.id`.
+
+    Every forwarded call reports its outcome. After FAILURES consecutive
+    failures the circuit opens and calls to that machine fail immediately
+    instead of waiting for a connect timeout. Once the cooldown has passed a
+    single probe is let through (half-open): success closes the circuit,
+    failure reopens it with a doubled cooldown, up to MAX_COOLDOWN.
+    """
+    FAILURES: ClassVar[int] = int(os.getenv("QUITTO_BREAKER_FAILURES", "3"))
+    COOLDOWN: ClassVar[float] = float(os.getenv("QUITTO_BREAKER_COOLDOWN", "30"))
+    MAX_COOLDOWN: ClassVar[float] = float(os.getenv("QUITTO_BREAKER_MAX_COOLDOWN", "600"))
+    ALPHA: ClassVar[float] = 0.3
+
+    _machines: ClassVar[Dict[str, MachineHealth]] = {}
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+
+    @staticmethod
+    def key(machine) -> str:
+        mid = getattr(machine, "id", None)
+        return str(mid) if mid is not None else str(getattr(machine, "url_connect", "") or "")
+
+    @staticmethod
+    def _get(machine) -> MachineHealth:
+        k = HealthRegistry.key(machine)
+        h = HealthRegistry._machines.get(k)
+        if h is None:
+            h = HealthRegistry._machines[k] = MachineHealth(key=k, name=getattr(machine, "name", None))
+        return h
+
+    @staticmethod
+    def cooldown(h: MachineHealth) -> float:
+        return min(HealthRegistry.MAX_COOLDOWN, HealthRegistry.COOLDOWN * (2 ** max(0, h.trips - 1)))
+
+    @staticmethod
+    def allow(machine) -> bool:
+        """Whether a call to `machine` may go out now. Claims the half-open probe slot when due."""
+        with HealthRegistry._lock:
+            h = HealthRegistry._get(machine)
+            if h.state == "closed":
+                return True
+            if h.state == "open" and time.time() - (h.opened_at or 0) >= HealthRegistry.cooldown(h):
+                h.state = "half_open"
+            if h.state == "half_open" and not h.probe_in_flight:
+                h.probe_in_flight = True
+                return True
+            return False
+
+    @staticmethod
+    def is_available(machine) -> bool:
+        """Like `allow` but without claiming the probe; for routing decisions."""
+        with HealthRegistry._lock:
+            h = HealthRegistry._machines.get(HealthRegistry.key(machine))
+            if h is None or h.state == "closed":
+                return True
+            if h.state == "open":
+                return time.time() - (h.opened_at or 0) >= HealthRegistry.cooldown(h)
+            return not h.probe_in_flight
+
+    @staticmethod
+    def record_success(machine, ms: Optional[float] = None) -> None:
+        with HealthRegistry._lock:
+            h = HealthRegistry._get(machine)
+            if h.state != "closed":
+                logger.info("Machine %s (%s) is reachable again, closing circuit", h.name, h.key)
+            h.state = "closed"
+            h.consecutive_failures = 0
+            h.trips = 0
+            h.probe_in_flight = False
+            h.opened_at = None
+            h.successes += 1
+            h.last_success_at = time.time()
+            if ms is not None:
+                h.ewma_ms = ms if h.ewma_ms is None else h.ewma_ms + HealthRegistry.ALPHA * (ms - h.ewma_ms)
+
+    @staticmethod
+    def record_failure(machine, error: Optional[BaseException] = None) -> None:
+        with HealthRegistry._lock:
+            h = HealthRegistry._get(machine)
+            h.failures += 1
+            h.consecutive_failures += 1
+            h.last_failure_at = time.time()
+            h.last_error = f"{type(error).__name__}: {error}" if error is not None else None
+            if h.state == "half_open" or h.consecutive_failures >= HealthRegistry.FAILURES:
+                if h.state != "open":
+                    h.trips += 1
+                    logger.warning("Opening circuit for machine %s (%s) after %d failures, retry in %.0fs",
+                                   h.name, h.key, h.consecutive_failures, HealthRegistry.cooldown(h))
+                h.state = "open"
+                h.opened_at = time.time()
+            h.probe_in_flight = False
+
+    @staticmethod
+    def release(machine) -> None:
+        """Call was abandoned (cancelled) before an outcome: free the probe slot."""
+        with HealthRegistry._lock:
+            h = HealthRegistry._machines.get(HealthRegistry.key(machine))
+            if h is not None:
+                h.probe_in_flight = False
+
+    @staticmethod
+    def latency(machine) -> Optional[float]:
+        with HealthRegistry._lock:
+            h = HealthRegistry._machines.get(HealthRegistry.key(machine))
+            return h.ewma_ms if h else None
+
+    @staticmethod
+    def snapshot(machine) -> dict:
+        with HealthRegistry._lock:
+            h = HealthRegistry._machines.get(HealthRegistry.key(machine))
+            return h.to_dict() if h else MachineHealth(key=HealthRegistry.key(machine), name=getattr(machine, "name", None)).to_dict()
+
+    @staticmethod
+    def all() -> Dict[str, dict]:
+        with HealthRegistry._lock:
+            return {k: h.to_dict() for k, h in HealthRegistry._machines.items()}
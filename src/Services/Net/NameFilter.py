@@ -0,0 +1,310 @@
+from pathlib import Path
+from dataclasses import dataclass, field, replace
+from typing import ClassVar, Dict, Iterable, List, Optional, Tuple
+from .MachineHealth import HealthRegistry
+from .NodeClient import NodeClient
+from .NodeCodec import NodeCodec
+from Services.Files.Trash import Trash
+import base64
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger("server.services.net.namefilter")
+
+
+@dataclass
+class BloomFilter:
+    """Fixed-size Bloom filter over strings, identical on every node.
+
+    Positions come from BLAKE2b with double hashing, never from Python's
+    `hash()`, which is salted per process.
+    """
+    m: int                                   # bits
+    k: int                                   # hash functions
+    bits: bytearray = field(default_factory=bytearray)
+    n: int = 0                               # keys added
+
+    @staticmethod
+    def sized(capacity: int, fpr: float) -> "BloomFilter":
+        capacity = max(capacity, 1)
+        m = max(64, math.ceil(-capacity * math.log(fpr) / (math.log(2) ** 2)))
+        m = (m + 7) // 8 * 8
+        k = max(1, round(m / capacity * math.log(2)))
+        return BloomFilter(m=m, k=k, bits=bytearray(m // 8))
+
+    def _positions(self, key: str) -> Iterable[int]:
+        d = hashlib.blake2b(key.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        return ((h1 + i * h2) % self.m for i in range(self.k))
+
+    def add(self, key: str) -> None:
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.n += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def fill_ratio(self) -> float:
+        return sum(bin(b).count("1") for b in self.bits) / self.m if self.m else 0.0
+
+    def fpr_estimate(self) -> float:
+        """Current false-positive rate from the share of bits set (fill ** k)."""
+        return self.fill_ratio() ** self.k
+
+    def to_dict(self) -> dict:
+        return {"m": self.m, "k": self.k, "n": self.n, "bits": base64.b64encode(bytes(self.bits)).decode("ascii")}
+
+    @staticmethod
+    def from_dict(d: dict) -> "BloomFilter":
+        bits = bytearray(base64.b64decode(d["bits"]))
+        if len(bits) * 8 != int(d["m"]):
+            raise ValueError("bloom filter size mismatch")
+        return BloomFilter(m=int(d["m"]), k=int(d["k"]), bits=bits, n=int(d.get("n") or 0))
+
+
+@dataclass
+class PublishedFilter:
+    """A base's filter as published by a node (ours or a peer's copy)."""
+    bloom: Optional[BloomFilter]
+    generation: int = 0
+    built_at: float = 0.0
+    fetched_at: float = 0.0
+    error: Optional[str] = None
+    epoch: str = ""                          # random per publishing process
+
+    def version(self) -> str:
+        """Identifies the exact contents: generations restart at 1 when the node restarts, epochs do not repeat."""
+        return f"{self.epoch}.{self.generation}"
+
+    def status(self) -> dict:
+        b = self.bloom
+        return {
+            "version": self.version(),
+            "generation": self.generation,
+            "built_at": self.built_at or None,
+            "fetched_at": self.fetched_at or None,
+            "names": b.n if b else None,
+            "bits": b.m if b else None,
+            "hashes": b.k if b else None,
+            "bytes": len(b.bits) if b else None,
+            "fpr_estimate": round(b.fpr_estimate(), 6) if b else None,
+            "error": self.error,
+        }
+
+
+@dataclass
+class NameFilter:
+    """Per-base Bloom filters of file names, so lookups skip machines that cannot match.
+
+    Node side: for each local base a filter holds every file name
+    (`name_key`) and extension (`ext_key`). It is built on first use, and
+    files created through this node are added as they appear (see
+    `FilesTools.notify_change`). It is rebuilt every REBUILD seconds,
+    because Bloom filters cannot forget deleted names. Peers fetch it from
+    `/files/namefilter/{base}`. They pass the `version` they hold as
+    `since`, so an unchanged filter costs a tiny answer. The version
+    includes a random per-process epoch, so a restarted node never answers
+    "unchanged" for different contents.
+
+    Hub side: peers' filters are kept in memory and refreshed in the
+    background when older than TTL. `candidates` drops the machines whose
+    filter rules a key out. A machine without a filter (not fetched yet,
+    or an old node) is always kept. A false positive only costs an extra
+    request. Files created outside this server (another program, a
+    manual copy) reach the filter only at the next rebuild, so a filter can
+    also wrongly rule a machine out. Callers therefore treat it as an order,
+    not a verdict: when the kept machines find nothing, the skipped ones
+    are asked before answering (`note_fallback` counts how often that found
+    something).
+    """
+    FPR: ClassVar[float] = float(os.getenv("QUITTO_BLOOM_FPR", "0.01"))
+    TTL: ClassVar[float] = float(os.getenv("QUITTO_BLOOM_TTL", "120"))
+    REBUILD: ClassVar[float] = float(os.getenv("QUITTO_BLOOM_REBUILD", "3600"))
+    HEADROOM: ClassVar[float] = 1.25          # room for names added before the next rebuild
+    ROUTE: ClassVar[str] = "/files/namefilter/{base}"
+
+    _local: ClassVar[Dict[str, PublishedFilter]] = {}
+    _remote: ClassVar[Dict[Tuple[str, str], PublishedFilter]] = {}
+    _fetching: ClassVar[set] = set()
+    _rebuilding: ClassVar[set] = set()
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+    _stats: ClassVar[Dict[str, int]] = {"checks": 0, "skipped": 0, "kept": 0, "unknown": 0, "fallbacks": 0, "false_negatives": 0}
+    _EPOCH: ClassVar[str] = uuid.uuid4().hex[:12]
+
+    @staticmethod
+    def name_key(name: str) -> str:
+        return "n:" + name
+
+    @staticmethod
+    def ext_key(ext: str) -> str:
+        return "e:" + ext.lower()
+
+    @staticmethod
+    def _keys(path: Path) -> Tuple[str, ...]:
+        return (NameFilter.name_key(path.name), NameFilter.ext_key(path.suffix)) if path.suffix else (NameFilter.name_key(path.name),)
+
+    # ── Node side ─────────────────────────────────────────────────
+
+    @staticmethod
+    def _local_roots(base: str) -> List[Path]:
+        from .GlobalPathsRefresher import GlobalPathsRefresher
+        return [Path(p) for p in GlobalPathsRefresher.local_bases().get(base) or [] if Path(p).is_dir()]
+
+    @staticmethod
+    def build(base: str) -> Optional[PublishedFilter]:
+        """Walk the local roots of `base` and publish a fresh filter (None if the base is not local)."""
+        roots = NameFilter._local_roots(base)
+        if not roots:
+            return None
+        files = []
+        for root in roots:
+            for p in Trash.walk(root):
+                try:
+                    if p.is_file():
+                        files.append(p)
+                except OSError:
+                    continue
+        bloom = BloomFilter.sized(int(len(files) * NameFilter.HEADROOM) + 64, NameFilter.FPR)
+        for p in files:
+            for key in NameFilter._keys(p):
+                if key not in bloom:
+                    bloom.add(key)
+        with NameFilter._lock:
+            old = NameFilter._local.get(base)
+            pub = NameFilter._local[base] = PublishedFilter(bloom, (old.generation if old else 0) + 1, time.time(), epoch=NameFilter._EPOCH)
+        return pub
+
+    @staticmethod
+    def local(base: str) -> Optional[PublishedFilter]:
+        """This node's filter for `base`, built on first use and rebuilt in the background when old."""
+        with NameFilter._lock:
+            pub = NameFilter._local.get(base)
+            rebuild = pub is not None and time.time() - pub.built_at > NameFilter.REBUILD and base not in NameFilter._rebuilding
+            if rebuild:
+                NameFilter._rebuilding.add(base)
+        if pub is None:
+            return NameFilter.build(base)
+        if rebuild:
+            threading.Thread(target=NameFilter._rebuild, args=(base,), name="namefilter-rebuild", daemon=True).start()
+        return pub
+
+    @staticmethod
+    def _rebuild(base: str) -> None:
+        try:
+            NameFilter.build(base)
+        except Exception as E:
+            logger.error("[ERROR] Rebuilding name filter of base %s failed: %s", base, E)
+        finally:
+            with NameFilter._lock:
+                NameFilter._rebuilding.discard(base)
+
+    @staticmethod
+    def note_local(target: Path) -> None:
+        """Add a file (or the files under a directory) created on this node to its bases' filters."""
+        with NameFilter._lock:
+            bases = list(NameFilter._local)
+        for base in bases:
+            if not any(target == r or r in target.parents for r in NameFilter._local_roots(base)):
+                continue
+            try:
+                files = [target] if target.is_file() else [p for p in Trash.walk(target) if p.is_file()] if target.is_dir() else []
+            except OSError:
+                continue
+            with NameFilter._lock:
+                pub = NameFilter._local.get(base)
+                if pub is None:
+                    continue
+                added = False
+                for p in files:
+                    for key in NameFilter._keys(p):
+                        if key not in pub.bloom:
+                            pub.bloom.add(key)
+                            added = True
+                if added:
+                    pub.generation += 1
+
+    # ── Hub side ──────────────────────────────────────────────────
+
+    @staticmethod
+    async def _fetch(machine, base: str) -> None:
+        key = (HealthRegistry.key(machine), base)
+        try:
+            with NameFilter._lock:
+                old = NameFilter._remote.get(key)
+            url = str(machine.url_connect).rstrip("/") + NameFilter.ROUTE.format(base=base)
+            params = {"since": old.version()} if old and old.bloom else None
+            try:
+                r = await NodeClient.aget(url, params=params, timeout=NodeClient.READ_TIMEOUT, machine=machine, headers=NodeCodec.request_headers())
+                if not r.is_success:
+                    raise RuntimeError(f"HTTP {r.status_code}")
+                body = NodeCodec.response_json(r)
+                if body.get("unchanged") and old is not None:
+                    pub = replace(old, fetched_at=time.time(), error=None)
+                else:
+                    pub = PublishedFilter(BloomFilter.from_dict(body["filter"]), int(body["generation"]), float(body.get("built_at") or 0),
+                                          time.time(), epoch=str(body.get("epoch") or ""))
+            except Exception as E:
+                # keep the last filter we had; without one the machine is simply always asked
+                pub = replace(old or PublishedFilter(None), fetched_at=time.time(), error=f"{type(E).__name__}: {E}")
+            with NameFilter._lock:
+                NameFilter._remote[key] = pub
+        finally:
+            with NameFilter._lock:
+                NameFilter._fetching.discard(key)
+
+    @staticmethod
+    def _remote_filter(machine, base: str) -> Optional[BloomFilter]:
+        key = (HealthRegistry.key(machine), base)
+        with NameFilter._lock:
+            pub = NameFilter._remote.get(key)
+            due = (pub is None or time.time() - pub.fetched_at > NameFilter.TTL) and key not in NameFilter._fetching
+            if due and HealthRegistry.is_available(machine):
+                NameFilter._fetching.add(key)
+            else:
+                due = False
+        if due:
+            NodeClient.spawn(NameFilter._fetch(machine, base))
+        return pub.bloom if pub else None
+
+    @staticmethod
+    def candidates(base: Optional[str], keys: Iterable[str], machines: list, record: bool = True) -> list:
+        """`machines` whose filter for `base` may contain every key in `keys` (counted in stats with `record`)."""
+        keys = [k for k in keys if k]
+        if not base or not keys:
+            return list(machines)
+        out = []
+        for m in machines:
+            bloom = NameFilter._remote_filter(m, base)
+            verdict = "unknown" if bloom is None else "kept" if all(k in bloom for k in keys) else "skipped"
+            if record:
+                with NameFilter._lock:
+                    NameFilter._stats["checks"] += 1
+                    NameFilter._stats[verdict] += 1
+            if verdict != "skipped":
+                out.append(m)
+        return out
+
+    @staticmethod
+    def note_fallback(base: Optional[str], found: bool) -> None:
+        """Record that skipped machines were asked after a miss, and whether they held a match."""
+        with NameFilter._lock:
+            NameFilter._stats["fallbacks"] += 1
+            if found:
+                NameFilter._stats["false_negatives"] += 1
+        if found:
+            logger.debug("name filter of base %s ruled out a machine holding a match", base)
+
+    @staticmethod
+    def stats() -> dict:
+        with NameFilter._lock:
+            local = {b: p.status() for b, p in NameFilter._local.items()}
+            remote = {f"{k}/{b}": p.status() for (k, b), p in NameFilter._remote.items()}
+            lookups = dict(NameFilter._stats)
+        return {"fpr_target": NameFilter.FPR, "ttl": NameFilter.TTL, "local": local, "remote": remote, "lookups": lookups}
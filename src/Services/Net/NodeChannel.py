@@ -0,0 +1,450 @@
+from dataclasses import dataclass, field
+from typing import ClassVar, Dict, Optional
+from urllib.parse import urlsplit, parse_qsl
+from .MachineHealth import HealthRegistry
+from .NodeClient import NodeClient
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import httpx
+
+logger = logging.getLogger("server.services.net.nodechannel")
+
+try:
+    from websockets.asyncio.client import connect as ws_connect
+    from websockets.exceptions import InvalidStatus
+except ImportError:
+    ws_connect = None
+    InvalidStatus = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class ChannelUnavailable(Exception):
+    """The request was not sent over the channel; the caller should use plain HTTP."""
+
+
+class _FrameTooLarge(Exception):
+    """An inner response grew past MAX_FRAME while it was being produced."""
+
+
+@dataclass
+class _Channel:
+    """Client side of the WebSocket to one peer origin."""
+    origin: str
+    machine: object
+    ws: object = None
+    state: str = "connecting"                # connecting, open, backoff, unsupported
+    codec: str = "json"
+    window: Optional[asyncio.Semaphore] = None
+    send_lock: Optional[asyncio.Lock] = None
+    pending: Dict[int, asyncio.Future] = field(default_factory=dict)
+    ids: object = field(default_factory=lambda: itertools.count(1))
+    last_used: float = field(default_factory=time.monotonic)
+    last_pong: float = 0.0
+    rtt_ms: Optional[float] = None
+    opened_at: Optional[float] = None
+    retry_at: Optional[float] = None
+    requests: int = 0
+    fallbacks: int = 0
+    reconnects: int = 0
+    last_error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "machine": HealthRegistry.key(self.machine),
+            "state": self.state,
+            "codec": self.codec,
+            "in_flight": len(self.pending),
+            "rtt_ms": round(self.rtt_ms, 2) if self.rtt_ms is not None else None,
+            "opened_at": self.opened_at,
+            "retry_at": self.retry_at,
+            "requests": self.requests,
+            "fallbacks": self.fallbacks,
+            "reconnects": self.reconnects,
+            "last_error": self.last_error,
+        }
+
+
+@dataclass
+class NodeChannel:
+    """One persistent, multiplexed WebSocket per peer node.
+
+    Requests to another node travel as frames with an id over a single
+    authenticated connection (`/machine/channel`). This avoids the TLS
+    setup and tunnel latency of a new HTTP request. The receiving node runs
+    each request frame through its own ASGI app, so every HTTP route is
+    available unchanged, and it answers with a response frame carrying the
+    same id. Many requests can be in flight at once, in any order.
+
+    - Flow control: at most WINDOW requests in flight per channel, as
+      announced by the server in its hello frame.
+    - Frame size: frames above MAX_FRAME are refused. The server stops
+      an answer as soon as it outgrows a frame, and the client repeats
+      that request over plain HTTP, whatever its method.
+    - Heartbeats: every HEARTBEAT seconds. The RTT feeds `HealthRegistry`,
+      and a missed pong drops the connection.
+
+    Channels open lazily the first time a machine is called. Until a
+    channel is open, when it reconnects with backoff, when the peer is an
+    old node without the route, or when `websockets` is not installed,
+    `NodeClient` falls back to plain HTTP. A channel that has been idle
+    for IDLE_CLOSE seconds is closed.
+    """
+    ROUTE: ClassVar[str] = "/machine/channel"
+    ENABLED: ClassVar[bool] = os.getenv("QUITTO_NODE_CHANNEL", "on").lower() not in ("0", "off", "false")
+    WINDOW: ClassVar[int] = int(os.getenv("QUITTO_CHANNEL_WINDOW", "32"))
+    MAX_FRAME: ClassVar[int] = int(float(os.getenv("QUITTO_CHANNEL_MAX_FRAME_MB", "16")) * 1024 * 1024)
+    HEARTBEAT: ClassVar[float] = float(os.getenv("QUITTO_CHANNEL_HEARTBEAT", "15"))
+    IDLE_CLOSE: ClassVar[float] = float(os.getenv("QUITTO_CHANNEL_IDLE_CLOSE", "300"))
+    MAX_BACKOFF: ClassVar[float] = 60.0
+    UNSUPPORTED_RETRY: ClassVar[float] = 600.0
+    # request kwargs a frame can carry (`content` only as bytes/str); anything else (files, streams) goes over HTTP
+    FRAME_KWARGS: ClassVar[frozenset] = frozenset({"params", "headers", "json", "content"})
+
+    _channels: ClassVar[Dict[str, _Channel]] = {}
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+    _served: ClassVar[Dict[str, int]] = {"connections": 0, "open": 0, "requests": 0, "refused": 0}
+    _asgi: ClassVar[Dict[int, httpx.AsyncClient]] = {}
+
+    @staticmethod
+    def available() -> bool:
+        return NodeChannel.ENABLED and ws_connect is not None
+
+    @staticmethod
+    def ws_url(url: str) -> str:
+        parts = urlsplit(str(url))
+        scheme = "wss" if parts.scheme == "https" else "ws"
+        codec = "msgpack" if msgpack is not None else "json"
+        return f"{scheme}://{parts.netloc}{NodeChannel.ROUTE}?codec={codec}"
+
+    # ── Frames ────────────────────────────────────────────────────
+
+    @staticmethod
+    def pack(frame: dict, codec: str):
+        if codec == "msgpack":
+            return msgpack.packb(frame, use_bin_type=True)
+        if isinstance(frame.get("body"), (bytes, bytearray)):
+            frame = {**frame, "body": base64.b64encode(frame["body"]).decode("ascii"), "b64": True}
+        return json.dumps(frame)
+
+    @staticmethod
+    def unpack(message) -> dict:
+        if isinstance(message, (bytes, bytearray)):
+            return msgpack.unpackb(message, raw=False)
+        frame = json.loads(message)
+        if frame.pop("b64", False):
+            frame["body"] = base64.b64decode(frame["body"])
+        return frame
+
+    # ── Client side ───────────────────────────────────────────────
+
+    @staticmethod
+    def channel_for(machine, url: str) -> Optional[_Channel]:
+        """Open channel to `url`'s origin, or None (starting one in the background if needed)."""
+        if not NodeChannel.available() or machine is None:
+            return None
+        origin = NodeClient.origin(url)
+        with NodeChannel._lock:
+            ch = NodeChannel._channels.get(origin)
+            if ch is None:
+                ch = NodeChannel._channels[origin] = _Channel(origin=origin, machine=machine)
+                NodeClient.spawn(NodeChannel._run(ch))
+            ch.last_used = time.monotonic()
+            return ch if ch.state == "open" else None
+
+    @staticmethod
+    async def _run(ch: _Channel) -> None:
+        backoff = 1.0
+        try:
+            while time.monotonic() - ch.last_used < NodeChannel.IDLE_CLOSE:
+                ch.state = "connecting"
+                try:
+                    await NodeChannel._session(ch)
+                    backoff = 1.0
+                except Exception as E:
+                    ch.last_error = f"{type(E).__name__}: {E}"
+                    if InvalidStatus is not None and isinstance(E, InvalidStatus):
+                        # older node without the route: plain HTTP for a long while
+                        ch.state = "unsupported"
+                        ch.retry_at = time.time() + NodeChannel.UNSUPPORTED_RETRY
+                        await asyncio.sleep(NodeChannel.UNSUPPORTED_RETRY)
+                        continue
+                    logger.debug("Channel to %s dropped: %s", ch.origin, ch.last_error)
+                finally:
+                    ch.ws = None
+                    for fut in ch.pending.values():
+                        if not fut.done():
+                            fut.set_exception(httpx.RemoteProtocolError("node channel closed"))
+                    ch.pending.clear()
+                ch.state = "backoff"
+                ch.reconnects += 1
+                delay = backoff * random.uniform(0.8, 1.2)
+                ch.retry_at = time.time() + delay
+                await asyncio.sleep(delay)
+                backoff = min(backoff * 2, NodeChannel.MAX_BACKOFF)
+        finally:
+            with NodeChannel._lock:
+                if NodeChannel._channels.get(ch.origin) is ch:
+                    del NodeChannel._channels[ch.origin]
+
+    @staticmethod
+    async def _session(ch: _Channel) -> None:
+        async with ws_connect(NodeChannel.ws_url(ch.origin), additional_headers=NodeClient._headers(),
+                              open_timeout=NodeClient.CONNECT_TIMEOUT, ping_interval=None, compression=None,
+                              max_size=NodeChannel.MAX_FRAME + 65536) as ws:
+            hello = NodeChannel.unpack(await asyncio.wait_for(ws.recv(), NodeClient.CONNECT_TIMEOUT))
+            if hello.get("type") != "hello":
+                raise httpx.RemoteProtocolError("unexpected first frame on node channel")
+            ch.codec = hello.get("codec") or "json"
+            ch.window = asyncio.Semaphore(max(1, min(int(hello.get("window") or 1), NodeChannel.WINDOW)))
+            ch.send_lock = asyncio.Lock()
+            ch.ws = ws
+            ch.last_pong = time.monotonic()
+            ch.opened_at = time.time()
+            ch.retry_at = None
+            ch.state = "open"
+            logger.info("Node channel to %s open (%s)", ch.origin, ch.codec)
+            reader = asyncio.ensure_future(NodeChannel._read(ch, ws))
+            beat = asyncio.ensure_future(NodeChannel._heartbeat(ch))
+            try:
+                done, _ = await asyncio.wait({reader, beat}, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    t.result()
+            finally:
+                reader.cancel()
+                beat.cancel()
+                await asyncio.gather(reader, beat, return_exceptions=True)
+
+    @staticmethod
+    async def _read(ch: _Channel, ws) -> None:
+        async for message in ws:
+            frame = NodeChannel.unpack(message)
+            kind = frame.get("type")
+            if kind == "res":
+                fut = ch.pending.pop(frame.get("id"), None)
+                if fut is not None and not fut.done():
+                    fut.set_result(frame)
+            elif kind == "pong":
+                ch.last_pong = time.monotonic()
+                ch.rtt_ms = (time.monotonic() - float(frame.get("t") or 0)) * 1000
+                HealthRegistry.record_success(ch.machine, ch.rtt_ms)
+
+    @staticmethod
+    async def _heartbeat(ch: _Channel) -> None:
+        while True:
+            await asyncio.sleep(NodeChannel.HEARTBEAT)
+            if time.monotonic() - ch.last_pong > NodeChannel.HEARTBEAT * 2.5:
+                error = httpx.ReadTimeout("node channel heartbeat lost")
+                HealthRegistry.record_failure(ch.machine, error)
+                raise error
+            if time.monotonic() - ch.last_used >= NodeChannel.IDLE_CLOSE:
+                return
+            await NodeChannel._send(ch, {"type": "ping", "t": time.monotonic()})
+
+    @staticmethod
+    async def _send(ch: _Channel, frame: dict) -> None:
+        data = NodeChannel.pack(frame, ch.codec)
+        async with ch.send_lock:
+            await ch.ws.send(data)
+
+    @staticmethod
+    async def arequest(ch: _Channel, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """Send one request over `ch`; raises `ChannelUnavailable` when it should go over HTTP instead."""
+        loop = NodeClient._background_loop()
+        if asyncio.get_running_loop() is not loop:
+            return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(NodeChannel.arequest(ch, method, url, timeout, **kwargs), loop))
+        if set(kwargs) - NodeChannel.FRAME_KWARGS or ch.state != "open" or ch.ws is None:
+            raise ChannelUnavailable("request not eligible for the node channel")
+
+        parts = urlsplit(str(url))
+        params = dict(parse_qsl(parts.query))
+        params.update({k: str(v) for k, v in (kwargs.get("params") or {}).items() if v is not None})
+        headers = {str(k): str(v) for k, v in (kwargs.get("headers") or {}).items()}
+        body = kwargs.get("content")
+        if kwargs.get("json") is not None:
+            body = json.dumps(kwargs["json"]).encode()
+            headers.setdefault("content-type", "application/json")
+        if isinstance(body, str):
+            body = body.encode()
+        if body is not None and not isinstance(body, (bytes, bytearray)):
+            # generators, iterators and files are streamed over HTTP, untouched
+            raise ChannelUnavailable("streamed request body")
+        if body is not None and len(body) > NodeChannel.MAX_FRAME:
+            raise ChannelUnavailable("request body larger than a channel frame")
+
+        read_timeout = NodeClient.READ_TIMEOUT if timeout is None else timeout
+        request = httpx.Request(method, url, params=params or None)
+        try:
+            await asyncio.wait_for(ch.window.acquire(), read_timeout)
+        except asyncio.TimeoutError:
+            raise ChannelUnavailable("node channel window full")
+        rid = next(ch.ids)
+        fut = loop.create_future()
+        ch.pending[rid] = fut
+        try:
+            try:
+                await NodeChannel._send(ch, {"type": "req", "id": rid, "method": method, "path": parts.path or "/",
+                                             "params": params, "headers": headers, "body": body})
+            except Exception as E:
+                raise ChannelUnavailable(f"send failed: {E}")
+            ch.requests += 1
+            try:
+                frame = await asyncio.wait_for(fut, read_timeout)
+            except asyncio.TimeoutError:
+                NodeClient.spawn(NodeChannel._cancel(ch, rid))
+                raise httpx.ReadTimeout(f"no answer over node channel within {read_timeout:g}s", request=request)
+            except asyncio.CancelledError:
+                NodeClient.spawn(NodeChannel._cancel(ch, rid))
+                raise
+        finally:
+            ch.pending.pop(rid, None)
+            ch.window.release()
+
+        if frame.get("error"):
+            if frame["error"] == "too_large":
+                ch.fallbacks += 1
+                raise ChannelUnavailable("answer larger than a channel frame")
+            raise httpx.RemoteProtocolError(f"node channel: {frame['error']}", request=request)
+        return httpx.Response(frame.get("status") or 502, headers=frame.get("headers") or [],
+                              content=frame.get("body") or b"", request=request)
+
+    @staticmethod
+    async def _cancel(ch: _Channel, rid: int) -> None:
+        try:
+            if ch.ws is not None:
+                await NodeChannel._send(ch, {"type": "cancel", "id": rid})
+        except Exception:
+            pass
+
+    # ── Server side ───────────────────────────────────────────────
+
+    @staticmethod
+    def _bounded(app):
+        """Wrap `app` so a response body past MAX_FRAME aborts it with `_FrameTooLarge`.
+
+        httpx's ASGI transport collects the whole body before returning, so the
+        limit has to be enforced while the app is still sending.
+        """
+        async def bounded(scope, receive, send):
+            size = 0
+            over = False
+
+            async def send_bounded(message):
+                nonlocal size, over
+                if message["type"] == "http.response.body":
+                    size += len(message.get("body") or b"")
+                    if size > NodeChannel.MAX_FRAME:
+                        over = True
+                        raise _FrameTooLarge()
+                await send(message)
+
+            try:
+                await app(scope, receive, send_bounded)
+            except Exception:
+                # middlewares may wrap or swallow the abort; the flag is authoritative
+                if over:
+                    raise _FrameTooLarge()
+                raise
+            if over:
+                raise _FrameTooLarge()
+        return bounded
+
+    @staticmethod
+    def _asgi_client(app) -> httpx.AsyncClient:
+        c = NodeChannel._asgi.get(id(app))
+        if c is None:
+            c = NodeChannel._asgi[id(app)] = httpx.AsyncClient(transport=httpx.ASGITransport(app=NodeChannel._bounded(app)),
+                                                               base_url="http://node-channel", timeout=None)
+        return c
+
+    @staticmethod
+    async def serve(websocket) -> None:
+        """Accept a channel from a peer node and answer its request frames through our own app."""
+        if not NodeClient.token_ok(websocket.headers):
+            NodeChannel._served["refused"] += 1
+            await websocket.close(code=4401)
+            return
+        await websocket.accept()
+        codec = "msgpack" if msgpack is not None and websocket.query_params.get("codec") == "msgpack" else "json"
+        client = NodeChannel._asgi_client(websocket.scope["app"])
+        send_lock = asyncio.Lock()
+        window = asyncio.Semaphore(NodeChannel.WINDOW)
+        tasks: Dict[int, asyncio.Task] = {}
+        # inner requests were authenticated by the channel itself
+        token = {"X-Quitto-Node-Token": os.getenv("QUITTO_NODE_TOKEN")} if os.getenv("QUITTO_NODE_TOKEN") else {}
+
+        async def send(frame: dict):
+            data = NodeChannel.pack(frame, codec)
+            async with send_lock:
+                if isinstance(data, bytes):
+                    await websocket.send_bytes(data)
+                else:
+                    await websocket.send_text(data)
+
+        async def handle(frame: dict):
+            rid = frame.get("id")
+            async with window:
+                try:
+                    r = await client.request(frame.get("method") or "GET", frame.get("path") or "/", params=frame.get("params") or None,
+                                             headers={**(frame.get("headers") or {}), **token, "X-Quitto-Channel": "1"},
+                                             content=frame.get("body"))
+                    headers = [(k, v) for k, v in r.headers.multi_items() if k.lower() not in ("content-length", "transfer-encoding")]
+                    out = {"type": "res", "id": rid, "status": r.status_code, "headers": headers, "body": r.content}
+                except _FrameTooLarge:
+                    out = {"type": "res", "id": rid, "error": "too_large"}
+                except Exception as E:
+                    logger.error("[ERROR] Node channel request %s %s failed: %s", frame.get("method"), frame.get("path"), E)
+                    out = {"type": "res", "id": rid, "error": f"{type(E).__name__}: {E}"}
+            NodeChannel._served["requests"] += 1
+            await send(out)
+
+        NodeChannel._served["connections"] += 1
+        NodeChannel._served["open"] += 1
+        try:
+            await send({"type": "hello", "codec": codec, "window": NodeChannel.WINDOW, "max_frame": NodeChannel.MAX_FRAME})
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                frame = NodeChannel.unpack(message["bytes"] if message.get("bytes") is not None else message["text"])
+                kind = frame.get("type")
+                if kind == "req":
+                    t = asyncio.ensure_future(handle(frame))
+                    tasks[frame.get("id")] = t
+                    t.add_done_callback(lambda _, rid=frame.get("id"): tasks.pop(rid, None))
+                elif kind == "cancel":
+                    t = tasks.get(frame.get("id"))
+                    if t is not None:
+                        t.cancel()
+                elif kind == "ping":
+                    await send({"type": "pong", "t": frame.get("t")})
+        except Exception as E:
+            logger.debug("Node channel from %s closed: %s", websocket.client, E)
+        finally:
+            NodeChannel._served["open"] -= 1
+            for t in list(tasks.values()):
+                t.cancel()
+
+    @staticmethod
+    def stats() -> dict:
+        with NodeChannel._lock:
+            channels = {origin: ch.to_dict() for origin, ch in NodeChannel._channels.items()}
+        return {
+            "enabled": NodeChannel.ENABLED,
+            "available": NodeChannel.available(),
+            "window": NodeChannel.WINDOW,
+            "max_frame": NodeChannel.MAX_FRAME,
+            "heartbeat": NodeChannel.HEARTBEAT,
+            "channels": channels,
+            "served": dict(NodeChannel._served),
+        }
@@ -0,0 +1,442 @@
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from typing import ClassVar, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+import asyncio
+import hmac
+import logging
+import os
+import threading
+import time
+import weakref
+import httpx
+from .MachineHealth import HealthRegistry
+from .NodeCodec import NodeCodec
+
+logger = logging.getLogger("server.services.net.nodeclient")
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2 = True
+except ImportError:
+    HTTP2 = False
+
+
+class CircuitOpen(httpx.TransportError):
+    """Raised instead of calling a machine whose circuit breaker is open."""
+
+
+@dataclass
+class PoolStats:
+    requests: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    total_ms: float = 0.0
+    last_error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        done = self.requests - self.in_flight
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "avg_ms": round(self.total_ms / done, 2) if done > 0 else None,
+            "last_error": self.last_error,
+        }
+
+
+@dataclass
+class NodeClient:
+    """Shared HTTP client for node-to-node calls.
+
+    One keep-alive connection pool per remote origin (scheme://host:port), so
+    repeated forwards to the same machine reuse TCP/TLS connections instead of
+    opening a new one per call. HTTP/2 is negotiated when the `h2` package is
+    installed. Sync callers (the threadpool endpoints) use `get`/`post`/
+    `request`; coroutines use `aget`/`apost`/`arequest`, which get their own
+    pool per event loop. Every request carries the node token when
+    QUITTO_NODE_TOKEN is set. Calls made with `machine=` go through that
+    machine's circuit breaker (see `HealthRegistry`).
+    """
+    CONNECT_TIMEOUT: ClassVar[float] = float(os.getenv("QUITTO_HTTP_CONNECT_TIMEOUT", "3"))
+    READ_TIMEOUT: ClassVar[float] = float(os.getenv("QUITTO_HTTP_READ_TIMEOUT", "8"))
+    MAX_CONNECTIONS: ClassVar[int] = int(os.getenv("QUITTO_HTTP_MAX_CONNECTIONS", "20"))
+    MAX_KEEPALIVE: ClassVar[int] = int(os.getenv("QUITTO_HTTP_MAX_KEEPALIVE", "10"))
+    KEEPALIVE_EXPIRY: ClassVar[float] = float(os.getenv("QUITTO_HTTP_KEEPALIVE_EXPIRY", "30"))
+
+    _clients: ClassVar[Dict[str, httpx.Client]] = {}
+    # per event loop, then per origin; an entry goes away with its loop
+    _async_clients: ClassVar["weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, httpx.AsyncClient]]"] = weakref.WeakKeyDictionary()
+    _stats: ClassVar[Dict[str, PoolStats]] = {}
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+    _loop: ClassVar[Optional[asyncio.AbstractEventLoop]] = None
+
+    @staticmethod
+    def origin(url: str) -> str:
+        parts = urlsplit(str(url))
+        return f"{parts.scheme}://{parts.netloc}"
+
+    @staticmethod
+    def _timeout(timeout: Optional[float]) -> httpx.Timeout:
+        read = NodeClient.READ_TIMEOUT if timeout is None else timeout
+        return httpx.Timeout(read, connect=min(NodeClient.CONNECT_TIMEOUT, read) if read else NodeClient.CONNECT_TIMEOUT)
+
+    @staticmethod
+    def _headers() -> dict:
+        token = os.getenv("QUITTO_NODE_TOKEN")
+        return {"X-Quitto-Node-Token": token} if token else {}
+
+    @staticmethod
+    def _options() -> dict:
+        return {
+            "http2": HTTP2,
+            "timeout": NodeClient._timeout(None),
+            "limits": httpx.Limits(
+                max_connections=NodeClient.MAX_CONNECTIONS,
+                max_keepalive_connections=NodeClient.MAX_KEEPALIVE,
+                keepalive_expiry=NodeClient.KEEPALIVE_EXPIRY,
+            ),
+            "headers": NodeClient._headers(),
+        }
+
+    @staticmethod
+    def client(url: str) -> httpx.Client:
+        key = NodeClient.origin(url)
+        with NodeClient._lock:
+            c = NodeClient._clients.get(key)
+            if c is None or c.is_closed:
+                c = httpx.Client(**NodeClient._options())
+                NodeClient._clients[key] = c
+                NodeClient._stats.setdefault(key, PoolStats())
+            return c
+
+    @staticmethod
+    def async_client(url: str) -> httpx.AsyncClient:
+        key = NodeClient.origin(url)
+        loop = asyncio.get_running_loop()
+        with NodeClient._lock:
+            # a closed loop may still be referenced somewhere; its pools are unusable either way
+            for dead in [l for l in NodeClient._async_clients if l.is_closed()]:
+                del NodeClient._async_clients[dead]
+            pools = NodeClient._async_clients.setdefault(loop, {})
+            c = pools.get(key)
+            if c is None or c.is_closed:
+                c = pools[key] = httpx.AsyncClient(**NodeClient._options())
+                NodeClient._stats.setdefault(key, PoolStats())
+            return c
+
+    @staticmethod
+    def _params(kwargs: dict) -> dict:
+        # like requests, drop None-valued query params instead of sending "key="
+        params = kwargs.get("params")
+        if isinstance(params, dict):
+            kwargs["params"] = {k: v for k, v in params.items() if v is not None}
+        return kwargs
+
+    @staticmethod
+    def _begin(url: str) -> Tuple[PoolStats, float]:
+        key = NodeClient.origin(url)
+        with NodeClient._lock:
+            st = NodeClient._stats.setdefault(key, PoolStats())
+            st.requests += 1
+            st.in_flight += 1
+        return st, time.perf_counter()
+
+    @staticmethod
+    def _end(st: PoolStats, t0: float, error: Optional[Exception] = None) -> None:
+        with NodeClient._lock:
+            st.in_flight -= 1
+            st.total_ms += (time.perf_counter() - t0) * 1000
+            if error is not None:
+                st.errors += 1
+                st.last_error = f"{type(error).__name__}: {error}"
+
+    # ── Persistent channel ────────────────────────────────────────
+
+    @staticmethod
+    async def _achannel(method: str, url: str, timeout: Optional[float], machine, kwargs: dict) -> Optional[httpx.Response]:
+        """Send over the open WebSocket channel to `machine`, if any; None means use HTTP."""
+        from .NodeChannel import NodeChannel, ChannelUnavailable
+        ch = NodeChannel.channel_for(machine, url)
+        if ch is None:
+            return None
+        try:
+            return await NodeChannel.arequest(ch, method, url, timeout, **kwargs)
+        except ChannelUnavailable:
+            return None
+
+    @staticmethod
+    def _channel(method: str, url: str, timeout: Optional[float], machine, kwargs: dict) -> Optional[httpx.Response]:
+        try:
+            if asyncio.get_running_loop() is NodeClient._loop:
+                return None  # blocking here would stall the loop the channel runs on
+        except RuntimeError:
+            pass
+        from .NodeChannel import NodeChannel, ChannelUnavailable
+        ch = NodeChannel.channel_for(machine, url)
+        if ch is None:
+            return None
+        read = NodeClient.READ_TIMEOUT if timeout is None else timeout
+        try:
+            return NodeClient.run(NodeChannel.arequest(ch, method, url, timeout, **kwargs), read + 5)
+        except ChannelUnavailable:
+            return None
+
+    # ── Sync API ──────────────────────────────────────────────────
+
+    @staticmethod
+    def _check_circuit(machine, url: str) -> None:
+        if machine is not None and not HealthRegistry.allow(machine):
+            raise CircuitOpen(f"circuit open for machine {HealthRegistry.key(machine)}")
+
+    @staticmethod
+    def _outcome(machine, t0: float, r: Optional[httpx.Response] = None, error: Optional[BaseException] = None) -> None:
+        """Report a call to the health registry: transport errors and 5xx count as failures."""
+        if machine is None:
+            return
+        if error is not None:
+            if isinstance(error, httpx.HTTPError):
+                HealthRegistry.record_failure(machine, error)
+            else:
+                HealthRegistry.release(machine)
+        elif r is not None and r.status_code >= 500:
+            HealthRegistry.record_failure(machine, RuntimeError(f"HTTP {r.status_code}"))
+        else:
+            HealthRegistry.record_success(machine, (time.perf_counter() - t0) * 1000)
+
+    @staticmethod
+    def _asleep(machine, error: BaseException) -> bool:
+        """A connect failure (or open circuit) on a machine that auto-wake may bring up."""
+        from .WakeOnDemand import WakeOnDemand
+        return isinstance(error, (CircuitOpen, httpx.ConnectError, httpx.ConnectTimeout)) and WakeOnDemand.wakeable(machine)
+
+    @staticmethod
+    def request(method: str, url: str, timeout: Optional[float] = None, machine=None, **kwargs) -> httpx.Response:
+        """Pass `machine` to route the call through its circuit breaker and record the outcome.
+
+        Calls with `machine` use the node's WebSocket channel when one is open (see `NodeChannel`).
+        With auto-wake on, a machine that cannot be reached is woken and the call retried once
+        (see `WakeOnDemand`).
+        """
+        try:
+            return NodeClient._send(method, url, timeout, machine, **kwargs)
+        except httpx.HTTPError as E:
+            if machine is None or not NodeClient._asleep(machine, E):
+                raise
+            from .WakeOnDemand import WakeOnDemand
+            if not WakeOnDemand.ensure_awake(machine):
+                raise
+        return NodeClient._send(method, url, timeout, machine, **kwargs)
+
+    @staticmethod
+    def _send(method: str, url: str, timeout: Optional[float] = None, machine=None, **kwargs) -> httpx.Response:
+        NodeClient._check_circuit(machine, url)
+        st, t0 = NodeClient._begin(url)
+        try:
+            kwargs = NodeClient._params(kwargs)
+            r = NodeClient._channel(method, url, timeout, machine, kwargs) if machine is not None else None
+            if r is None:
+                r = NodeClient.client(url).request(method, url, timeout=NodeClient._timeout(timeout), **kwargs)
+        except httpx.HTTPError as E:
+            NodeClient._end(st, t0, E)
+            NodeClient._outcome(machine, t0, error=E)
+            raise
+        except BaseException as E:
+            # cancelled (e.g. lost a fan-out race): not an error of the machine
+            NodeClient._end(st, t0)
+            NodeClient._outcome(machine, t0, error=E)
+            raise
+        NodeClient._end(st, t0)
+        NodeClient._outcome(machine, t0, r)
+        return r
+
+    @staticmethod
+    def get(url: str, **kwargs) -> httpx.Response:
+        return NodeClient.request("GET", url, **kwargs)
+
+    @staticmethod
+    def post(url: str, **kwargs) -> httpx.Response:
+        return NodeClient.request("POST", url, **kwargs)
+
+    @staticmethod
+    @contextmanager
+    def stream(method: str, url: str, timeout: Optional[float] = None, machine=None, **kwargs):
+        """Like `request`, but yields the response before its body is read (use `iter_bytes`).
+
+        The machine's health outcome is recorded as soon as the headers arrive.
+        """
+        NodeClient._check_circuit(machine, url)
+        st, t0 = NodeClient._begin(url)
+        reported = False
+        try:
+            with NodeClient.client(url).stream(method, url, timeout=NodeClient._timeout(timeout), **NodeClient._params(kwargs)) as r:
+                NodeClient._outcome(machine, t0, r)
+                reported = True
+                yield r
+        except httpx.HTTPError as E:
+            NodeClient._end(st, t0, E)
+            if not reported:
+                NodeClient._outcome(machine, t0, error=E)
+            raise
+        except BaseException as E:
+            NodeClient._end(st, t0)
+            if not reported:
+                NodeClient._outcome(machine, t0, error=E)
+            raise
+        NodeClient._end(st, t0)
+
+    # ── Async API ─────────────────────────────────────────────────
+
+    @staticmethod
+    async def arequest(method: str, url: str, timeout: Optional[float] = None, machine=None, **kwargs) -> httpx.Response:
+        try:
+            return await NodeClient._asend(method, url, timeout, machine, **kwargs)
+        except httpx.HTTPError as E:
+            if machine is None or not NodeClient._asleep(machine, E):
+                raise
+            from .WakeOnDemand import WakeOnDemand
+            if not await WakeOnDemand.aensure_awake(machine):
+                raise
+        return await NodeClient._asend(method, url, timeout, machine, **kwargs)
+
+    @staticmethod
+    async def _asend(method: str, url: str, timeout: Optional[float] = None, machine=None, **kwargs) -> httpx.Response:
+        NodeClient._check_circuit(machine, url)
+        st, t0 = NodeClient._begin(url)
+        try:
+            kwargs = NodeClient._params(kwargs)
+            r = await NodeClient._achannel(method, url, timeout, machine, kwargs) if machine is not None else None
+            if r is None:
+                r = await NodeClient.async_client(url).request(method, url, timeout=NodeClient._timeout(timeout), **kwargs)
+        except httpx.HTTPError as E:
+            NodeClient._end(st, t0, E)
+            NodeClient._outcome(machine, t0, error=E)
+            raise
+        except BaseException as E:
+            NodeClient._end(st, t0)
+            NodeClient._outcome(machine, t0, error=E)
+            raise
+        NodeClient._end(st, t0)
+        NodeClient._outcome(machine, t0, r)
+        return r
+
+    @staticmethod
+    async def aget(url: str, **kwargs) -> httpx.Response:
+        return await NodeClient.arequest("GET", url, **kwargs)
+
+    @staticmethod
+    async def apost(url: str, **kwargs) -> httpx.Response:
+        return await NodeClient.arequest("POST", url, **kwargs)
+
+    @staticmethod
+    @asynccontextmanager
+    async def astream(method: str, url: str, timeout: Optional[float] = None, machine=None, **kwargs):
+        """Async counterpart of `stream` (use `aiter_bytes`)."""
+        NodeClient._check_circuit(machine, url)
+        st, t0 = NodeClient._begin(url)
+        reported = False
+        try:
+            async with NodeClient.async_client(url).stream(method, url, timeout=NodeClient._timeout(timeout), **NodeClient._params(kwargs)) as r:
+                NodeClient._outcome(machine, t0, r)
+                reported = True
+                yield r
+        except httpx.HTTPError as E:
+            NodeClient._end(st, t0, E)
+            if not reported:
+                NodeClient._outcome(machine, t0, error=E)
+            raise
+        except BaseException as E:
+            NodeClient._end(st, t0)
+            if not reported:
+                NodeClient._outcome(machine, t0, error=E)
+            raise
+        NodeClient._end(st, t0)
+
+    @staticmethod
+    def _background_loop() -> asyncio.AbstractEventLoop:
+        with NodeClient._lock:
+            if NodeClient._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="node-client-loop", daemon=True).start()
+                NodeClient._loop = loop
+            return NodeClient._loop
+
+    @staticmethod
+    def run(coro, timeout: Optional[float] = None):
+        """Run a coroutine on the shared client loop from sync code and wait for its result.
+
+        Lets threadpool endpoints use the async API (concurrent fan-out with
+        real cancellation) while keeping one long-lived async pool per origin.
+        """
+        fut = asyncio.run_coroutine_threadsafe(coro, NodeClient._background_loop())
+        try:
+            return fut.result(timeout)
+        except BaseException:
+            fut.cancel()
+            raise
+
+    @staticmethod
+    def spawn(coro):
+        """Schedule a coroutine on the shared client loop without waiting (fire-and-forget)."""
+        return asyncio.run_coroutine_threadsafe(coro, NodeClient._background_loop())
+
+    @staticmethod
+    def token_ok(headers) -> bool:
+        """True when QUITTO_NODE_TOKEN is unset or the request carries the matching header."""
+        expected = os.getenv("QUITTO_NODE_TOKEN")
+        if not expected:
+            return True
+        # constant-time, so the token cannot be guessed byte by byte from response times
+        return hmac.compare_digest((headers.get("X-Quitto-Node-Token") or "").encode(), expected.encode())
+
+    # ── Introspection ─────────────────────────────────────────────
+
+    @staticmethod
+    def _connections(c) -> Optional[dict]:
+        # httpcore internals; best effort only
+        pool = getattr(getattr(c, "_transport", None), "_pool", None)
+        conns = getattr(pool, "connections", None)
+        if conns is None:
+            return None
+        idle = sum(1 for x in conns if getattr(x, "is_idle", lambda: False)())
+        return {"open": len(conns), "idle": idle}
+
+    @staticmethod
+    def stats() -> dict:
+        from .NodeChannel import NodeChannel
+        from .WakeOnDemand import WakeOnDemand
+        with NodeClient._lock:
+            pools = {k: v.to_dict() for k, v in NodeClient._stats.items()}
+            for k, c in NodeClient._clients.items():
+                if not c.is_closed:
+                    pools[k]["sync_connections"] = NodeClient._connections(c)
+            for loop_pools in list(NodeClient._async_clients.values()):
+                for k, c in loop_pools.items():
+                    if not c.is_closed:
+                        pools[k]["async_connections"] = NodeClient._connections(c)
+        return {
+            "http2": HTTP2,
+            "codec": NodeCodec.stats(),
+            "channel": NodeChannel.stats(),
+            "wake": WakeOnDemand.stats(),
+            "limits": {
+                "connect_timeout": NodeClient.CONNECT_TIMEOUT,
+                "read_timeout": NodeClient.READ_TIMEOUT,
+                "max_connections": NodeClient.MAX_CONNECTIONS,
+                "max_keepalive": NodeClient.MAX_KEEPALIVE,
+                "keepalive_expiry": NodeClient.KEEPALIVE_EXPIRY,
+            },
+            "pools": pools,
+        }
+
+    @staticmethod
+    def close_all() -> None:
+        with NodeClient._lock:
+            clients = list(NodeClient._clients.values())
+            NodeClient._clients.clear()
+            NodeClient._async_clients.clear()
+        for c in clients:
+            try:
+                c.close()
+            except Exception:
+                pass
@@ -0,0 +1,248 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import ClassVar, Dict, List, Optional
+import calendar
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger("server.services.net.nodecodec")
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _format_size(size_bytes) -> str:
+    # mirrors FilesTools.format_size; `compact` only drops a "size_human" equal to
+    # this rendering, so decoding is exact even if the two ever drift apart
+    if size_bytes < 1024:
+        return f"{size_bytes} B"
+    elif size_bytes < 1024**2:
+        return f"{round(size_bytes/1024, 1)} KB"
+    elif size_bytes < 1024**3:
+        return f"{round(size_bytes/(1024**2), 2)} MB"
+    else:
+        return f"{round(size_bytes/(1024**3), 2)} GB"
+
+
+@dataclass
+class NodeCodec:
+    """Compact encoding for JSON responses exchanged between Quitto nodes.
+
+    A node that can decode it sends `X-Quitto-Accept: msgpack+zstd, msgpack`
+    (only the codecs it has installed). The receiving node answers JSON
+    routes with the first codec it also supports and names it in
+    `X-Quitto-Codec`. Browsers and old nodes never send the header and
+    keep getting plain JSON, and a response without `X-Quitto-Codec` is
+    always decoded as JSON.
+
+    Before packing, lists of uniform dicts (listing items, search matches)
+    become columns plus rows. Two derived fields are packed smaller:
+    - "modified" becomes an integer timestamp.
+    - "size_human" is dropped when it can be rebuilt from "size_bytes".
+    Decoding restores the exact original JSON document.
+    """
+    ACCEPT_HEADER: ClassVar[str] = "X-Quitto-Accept"
+    CODEC_HEADER: ClassVar[str] = "X-Quitto-Codec"
+    MEDIA_TYPE: ClassVar[str] = "application/x-quitto-msgpack"
+    ZSTD_LEVEL: ClassVar[int] = int(os.getenv("QUITTO_ZSTD_LEVEL", "3"))
+    ZSTD_MIN_BYTES: ClassVar[int] = 1024
+    ENABLED: ClassVar[bool] = os.getenv("QUITTO_NODE_CODEC", "on").lower() not in ("0", "off", "false", "json")
+    DATE_FORMAT: ClassVar[str] = "%Y-%m-%d %H:%M:%S"
+
+    # marker keys; a NUL prefix cannot clash with keys of real payloads
+    COLS: ClassVar[str] = "\x00c"
+    ROWS: ClassVar[str] = "\x00r"
+    DATE_ROWS: ClassVar[str] = "\x00d"
+    DERIVED_SIZE: ClassVar[str] = "\x00s"
+
+    _stats: ClassVar[Dict[str, int]] = {"encoded": 0, "decoded": 0, "json_bytes": 0, "wire_bytes": 0}
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+
+    @staticmethod
+    def supported() -> List[str]:
+        """Codecs this node can both produce and read, best first."""
+        if not NodeCodec.ENABLED or msgpack is None:
+            return []
+        return (["msgpack+zstd"] if zstandard is not None else []) + ["msgpack"]
+
+    @staticmethod
+    def request_headers() -> dict:
+        """Headers announcing the codecs we read; send them only on calls expecting a JSON API result."""
+        codecs = NodeCodec.supported()
+        return {NodeCodec.ACCEPT_HEADER: ", ".join(codecs)} if codecs else {}
+
+    @staticmethod
+    def negotiate(accept: Optional[str]) -> Optional[str]:
+        if not accept:
+            return None
+        offered = [c.strip().lower() for c in accept.split(",")]
+        for codec in NodeCodec.supported():
+            if codec in offered:
+                return codec
+        return None
+
+    # ── Compact form ──────────────────────────────────────────────
+
+    @staticmethod
+    def _to_ts(value):
+        if isinstance(value, str) and len(value) == 19:
+            try:
+                ts = calendar.timegm(datetime.strptime(value, NodeCodec.DATE_FORMAT).timetuple())
+            except ValueError:
+                return value
+            # only when it renders back to the very same string
+            if NodeCodec._from_ts(ts) == value:
+                return ts
+        return value
+
+    @staticmethod
+    def _from_ts(value):
+        if isinstance(value, int):
+            return datetime.fromtimestamp(value, timezone.utc).strftime(NodeCodec.DATE_FORMAT)
+        return value
+
+    @staticmethod
+    def compact(value):
+        """Turn lists of same-shaped dicts into columns + rows, recursively."""
+        if isinstance(value, dict):
+            return {k: NodeCodec.compact(v) for k, v in value.items()}
+        if isinstance(value, list):
+            if len(value) >= 2 and all(isinstance(x, dict) for x in value):
+                cols = list(value[0].keys())
+                if all(list(x.keys()) == cols for x in value):
+                    sized = "size_human" in cols and "size_bytes" in cols
+                    dated = "modified" in cols
+                    rows, derived, dates = [], [], []
+                    for i, x in enumerate(value):
+                        row = []
+                        for c in cols:
+                            v = x[c]
+                            if sized and c == "size_human" and isinstance(x["size_bytes"], (int, float)) and v == _format_size(x["size_bytes"]):
+                                v = None
+                                derived.append(i)
+                            elif dated and c == "modified":
+                                ts = NodeCodec._to_ts(v)
+                                if ts is not v:
+                                    v = ts
+                                    dates.append(i)
+                            row.append(NodeCodec.compact(v))
+                        rows.append(row)
+                    out = {NodeCodec.COLS: cols, NodeCodec.ROWS: rows}
+                    if dates:
+                        out[NodeCodec.DATE_ROWS] = dates
+                    if derived:
+                        out[NodeCodec.DERIVED_SIZE] = derived
+                    return out
+            return [NodeCodec.compact(x) for x in value]
+        return value
+
+    @staticmethod
+    def expand(value):
+        """Inverse of `compact`."""
+        if isinstance(value, dict):
+            if NodeCodec.COLS in value and NodeCodec.ROWS in value:
+                cols = value[NodeCodec.COLS]
+                dates = set(value.get(NodeCodec.DATE_ROWS) or ())
+                derived = set(value.get(NodeCodec.DERIVED_SIZE) or ())
+                out = []
+                for i, row in enumerate(value[NodeCodec.ROWS]):
+                    item = {}
+                    for c, v in zip(cols, row):
+                        item[c] = NodeCodec.expand(v)
+                    if i in dates:
+                        item["modified"] = NodeCodec._from_ts(item["modified"])
+                    if i in derived:
+                        item["size_human"] = _format_size(item["size_bytes"])
+                    out.append(item)
+                return out
+            return {k: NodeCodec.expand(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [NodeCodec.expand(x) for x in value]
+        return value
+
+    # ── Wire format ───────────────────────────────────────────────
+
+    @staticmethod
+    def encode(obj, codec: str) -> bytes:
+        packed = msgpack.packb(NodeCodec.compact(obj), use_bin_type=True)
+        if codec == "msgpack+zstd" and len(packed) >= NodeCodec.ZSTD_MIN_BYTES:
+            # zstd frames are self-identifying; `decode` checks the magic number
+            return zstandard.ZstdCompressor(level=NodeCodec.ZSTD_LEVEL).compress(packed)
+        return packed
+
+    @staticmethod
+    def decode(body: bytes, codec: str):
+        if codec not in ("msgpack", "msgpack+zstd") or msgpack is None:
+            raise ValueError(f"unsupported node codec: {codec}")
+        if codec == "msgpack+zstd" and body[:4] == b"\x28\xb5\x2f\xfd":
+            if zstandard is None:
+                raise ValueError("zstd payload but zstandard is not installed")
+            body = zstandard.ZstdDecompressor().decompress(body)
+        with NodeCodec._lock:
+            NodeCodec._stats["decoded"] += 1
+        return NodeCodec.expand(msgpack.unpackb(body, raw=False, strict_map_key=False))
+
+    @staticmethod
+    def response_json(r):
+        """Body of an httpx response from another node, whichever codec it used."""
+        codec = r.headers.get(NodeCodec.CODEC_HEADER)
+        if codec:
+            return NodeCodec.decode(r.content, codec.strip().lower())
+        return r.json()
+
+    # ── Server side ───────────────────────────────────────────────
+
+    @staticmethod
+    async def middleware(request, call_next):
+        """Re-encode JSON responses for nodes that asked for a compact codec."""
+        codec = NodeCodec.negotiate(request.headers.get(NodeCodec.ACCEPT_HEADER))
+        response = await call_next(request)
+        # API results only: errors stay JSON for callers reading `r.text`, and
+        # files (attachments, ranged raw reads) are passed through untouched
+        if (codec is None or not 200 <= response.status_code < 300
+                or not response.headers.get("content-type", "").startswith("application/json")
+                or "content-disposition" in response.headers or "accept-ranges" in response.headers):
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        try:
+            encoded = NodeCodec.encode(json.loads(body), codec)
+        except Exception as E:
+            logger.debug("Node codec %s failed, answering JSON: %s", codec, E)
+            return NodeCodec._rebuild(response, body, None)
+        with NodeCodec._lock:
+            NodeCodec._stats["encoded"] += 1
+            NodeCodec._stats["json_bytes"] += len(body)
+            NodeCodec._stats["wire_bytes"] += len(encoded)
+        return NodeCodec._rebuild(response, encoded, codec)
+
+    @staticmethod
+    def _rebuild(response, body: bytes, codec: Optional[str]):
+        from starlette.responses import Response
+
+        media_type = NodeCodec.MEDIA_TYPE if codec else response.headers.get("content-type")
+        out = Response(body, status_code=response.status_code, media_type=media_type)
+        # keep every other header, including repeated ones such as set-cookie
+        out.raw_headers.extend((k, v) for k, v in response.raw_headers if k.lower() not in (b"content-length", b"content-type"))
+        # add to, rather than replace, a Vary set by the route (e.g. Accept-Encoding)
+        out.headers.add_vary_header(NodeCodec.ACCEPT_HEADER)
+        if codec:
+            out.headers[NodeCodec.CODEC_HEADER] = codec
+        return out
+
+    @staticmethod
+    def stats() -> dict:
+        with NodeCodec._lock:
+            st = dict(NodeCodec._stats)
+        st["supported"] = NodeCodec.supported()
+        st["ratio"] = round(st["wire_bytes"] / st["json_bytes"], 4) if st["json_bytes"] else None
+        return st
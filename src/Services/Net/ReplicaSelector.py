@@ -0,0 +1,215 @@
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, ClassVar, Deque, Dict, List, Optional, Tuple
+from .MachineHealth import HealthRegistry
+from .WakeOnDemand import WakeOnDemand
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+
+logger = logging.getLogger("server.services.net.replicaselector")
+
+
+@dataclass
+class RouteStats:
+    """Latency and error history of one machine for one route."""
+    ewma_ms: Optional[float] = None
+    error_rate: float = 0.0
+    calls: int = 0
+    errors: int = 0
+    hedged: int = 0                      # times this replica was started as the hedge
+    hedge_wins: int = 0                  # ...and answered first
+    samples: Deque[float] = field(default_factory=lambda: deque(maxlen=ReplicaSelector.WINDOW))
+
+    def p95(self) -> Optional[float]:
+        if len(self.samples) < ReplicaSelector.MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+    def to_dict(self) -> dict:
+        p95 = self.p95()
+        return {
+            "ewma_ms": round(self.ewma_ms, 2) if self.ewma_ms is not None else None,
+            "p95_ms": round(p95, 2) if p95 is not None else None,
+            "error_rate": round(self.error_rate, 4),
+            "calls": self.calls,
+            "errors": self.errors,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+        }
+
+
+@dataclass
+class ReplicaSelector:
+    """Picks which machine answers a forwarded call when several hold the data.
+
+    For every (machine, route) pair it keeps an EWMA of latency, an EWMA of
+    the error rate and a window of recent latencies. Replicas are ranked by
+    `latency + error_rate * ERROR_PENALTY_MS`. A pair with no history yet
+    starts from the machine-wide latency in `HealthRegistry`, and a machine
+    with no history at all ranks first so that it gets measured.
+
+    `call` sends the request to the best replica only. If it has not
+    answered after that route's p95 latency, one hedged request goes to the
+    next replica and the first answer wins. When a replica fails, the next
+    one is tried at once.
+    """
+    ALPHA: ClassVar[float] = 0.3
+    WINDOW: ClassVar[int] = 64
+    MIN_SAMPLES: ClassVar[int] = 5
+    ERROR_PENALTY_MS: ClassVar[float] = float(os.getenv("QUITTO_REPLICA_ERROR_PENALTY_MS", "2000"))
+    HEDGE: ClassVar[bool] = os.getenv("QUITTO_REPLICA_HEDGE", "on").lower() not in ("0", "off", "false")
+    HEDGE_MIN_MS: ClassVar[float] = float(os.getenv("QUITTO_REPLICA_HEDGE_MIN_MS", "50"))
+    HEDGE_DEFAULT_MS: ClassVar[float] = float(os.getenv("QUITTO_REPLICA_HEDGE_DEFAULT_MS", "500"))
+
+    _routes: ClassVar[Dict[Tuple[str, str], RouteStats]] = {}
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+
+    @staticmethod
+    def route_key(route: str) -> str:
+        return route.rstrip("/") or "/"
+
+    @staticmethod
+    def _get(machine, route: str) -> RouteStats:
+        k = (HealthRegistry.key(machine), ReplicaSelector.route_key(route))
+        st = ReplicaSelector._routes.get(k)
+        if st is None:
+            st = ReplicaSelector._routes[k] = RouteStats()
+        return st
+
+    @staticmethod
+    def record(machine, route: str, ms: float, ok: bool) -> None:
+        a = ReplicaSelector.ALPHA
+        with ReplicaSelector._lock:
+            st = ReplicaSelector._get(machine, route)
+            st.calls += 1
+            st.error_rate += a * ((0.0 if ok else 1.0) - st.error_rate)
+            if not ok:
+                st.errors += 1
+                return
+            st.ewma_ms = ms if st.ewma_ms is None else st.ewma_ms + a * (ms - st.ewma_ms)
+            st.samples.append(ms)
+
+    # ── Ranking ───────────────────────────────────────────────────
+
+    @staticmethod
+    def score(machine, route: str) -> float:
+        """Expected cost in ms of sending `route` to `machine`; lower is better."""
+        with ReplicaSelector._lock:
+            st = ReplicaSelector._routes.get((HealthRegistry.key(machine), ReplicaSelector.route_key(route)))
+            latency = st.ewma_ms if st is not None else None
+            error_rate = st.error_rate if st is not None else 0.0
+        if latency is None:
+            latency = HealthRegistry.latency(machine)
+        if latency is None:
+            return 0.0
+        return latency + error_rate * ReplicaSelector.ERROR_PENALTY_MS
+
+    @staticmethod
+    def rank(machines: list, route: str, prefer=None) -> list:
+        """Available machines, best first; `prefer` (if available) always leads.
+
+        When none is available, a machine that auto-wake can bring up is returned instead.
+        """
+        available = [m for m in machines if HealthRegistry.is_available(m)]
+        if not available:
+            available = [m for m in machines if WakeOnDemand.wakeable(m)][:1]
+        ranked = sorted(available, key=lambda m: ReplicaSelector.score(m, route))
+        if prefer is not None and prefer in ranked:
+            ranked.remove(prefer)
+            ranked.insert(0, prefer)
+        return ranked
+
+    @staticmethod
+    def hedge_delay(machine, route: str) -> float:
+        """Seconds to wait for `machine` before hedging: its p95 for the route, else a guess."""
+        with ReplicaSelector._lock:
+            st = ReplicaSelector._routes.get((HealthRegistry.key(machine), ReplicaSelector.route_key(route)))
+            ms = st.p95() if st is not None else None
+            if ms is None and st is not None and st.ewma_ms is not None:
+                ms = st.ewma_ms * 2
+        if ms is None:
+            ms = ReplicaSelector.HEDGE_DEFAULT_MS
+        return max(ms, ReplicaSelector.HEDGE_MIN_MS) / 1000
+
+    # ── Dispatch ──────────────────────────────────────────────────
+
+    @staticmethod
+    async def _timed(machine, route: str, attempt: Callable[[Any], Awaitable[Any]]):
+        t0 = time.perf_counter()
+        try:
+            result = await attempt(machine)
+        except asyncio.CancelledError:
+            raise  # the loser of a hedge: no verdict on this replica
+        except Exception:
+            ReplicaSelector.record(machine, route, (time.perf_counter() - t0) * 1000, False)
+            raise
+        ReplicaSelector.record(machine, route, (time.perf_counter() - t0) * 1000, True)
+        return result
+
+    @staticmethod
+    async def call(machines: list, route: str, attempt: Callable[[Any], Awaitable[Any]], prefer=None, hedge: Optional[bool] = None):
+        """Run `attempt(machine)` on the best replica, hedging and failing over as described above.
+
+        Returns the first successful result; raises the last error when every
+        replica failed, or `LookupError` when none is available.
+        """
+        queue: List[Any] = ReplicaSelector.rank(machines, route, prefer)
+        if not queue:
+            raise LookupError(f"no available replica for {route}")
+        hedge = ReplicaSelector.HEDGE if hedge is None else hedge
+        tasks: Dict[asyncio.Future, Tuple[Any, bool]] = {}
+        hedged = False
+        last_error: Optional[BaseException] = None
+
+        def launch(as_hedge: bool = False):
+            m = queue.pop(0)
+            tasks[asyncio.ensure_future(ReplicaSelector._timed(m, route, attempt))] = (m, as_hedge)
+            return m
+
+        primary = launch()
+        try:
+            while tasks:
+                delay = ReplicaSelector.hedge_delay(primary, route) if hedge and not hedged and queue else None
+                done, _ = await asyncio.wait(set(tasks), timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    m = launch(as_hedge=True)
+                    hedged = True
+                    with ReplicaSelector._lock:
+                        ReplicaSelector._get(m, route).hedged += 1
+                    logger.debug("hedging %s to %s after %.0f ms", route, getattr(m, "name", None), delay * 1000)
+                    continue
+                for t in done:
+                    m, as_hedge = tasks.pop(t)
+                    if t.exception() is None:
+                        if as_hedge:
+                            with ReplicaSelector._lock:
+                                ReplicaSelector._get(m, route).hedge_wins += 1
+                        return t.result()
+                    last_error = t.exception()
+                    logger.debug("replica %s failed for %s: %s", getattr(m, "url_connect", None), route, last_error)
+                    if queue:
+                        primary = launch()
+            raise last_error
+        finally:
+            for t in tasks:
+                t.cancel()
+            # reap losers so failures are not reported as never-retrieved
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @staticmethod
+    def stats() -> dict:
+        with ReplicaSelector._lock:
+            routes: Dict[str, Dict[str, dict]] = {}
+            for (key, route), st in ReplicaSelector._routes.items():
+                routes.setdefault(route, {})[key] = st.to_dict()
+        return {
+            "hedge": ReplicaSelector.HEDGE,
+            "hedge_default_ms": ReplicaSelector.HEDGE_DEFAULT_MS,
+            "error_penalty_ms": ReplicaSelector.ERROR_PENALTY_MS,
+            "routes": routes,
+        }
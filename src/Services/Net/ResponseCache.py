@@ -0,0 +1,239 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, ClassVar, Dict, Optional, Tuple
+from data import data
+from .MachineHealth import HealthRegistry
+from .NodeClient import NodeClient
+from .SingleFlight import SingleFlight
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger("server.services.net.responsecache")
+
+
+@dataclass
+class CacheEntry:
+    value: object
+    stored_at: float
+    ttl: float
+    stale: float
+    size: int
+    base: Optional[str]
+    path: str
+
+
+@dataclass
+class ResponseCache:
+    """TTL cache for responses fetched from other machines.
+
+    Keyed by (machine, route, params). Each route family has a freshness TTL
+    plus a stale window: a stale hit is served immediately while one
+    background refresh fetches the new value (stale-while-revalidate). Memory
+    is capped (QUITTO_RESPONSE_CACHE_MB) with LRU eviction. Nodes push
+    invalidations to their peers after local mutations, so a listing changed
+    on the remote side does not survive until its TTL runs out.
+    """
+    # route prefix -> (fresh seconds, extra stale seconds); longest prefix wins
+    ROUTE_TTLS: ClassVar[Dict[str, Tuple[float, float]]] = {
+        "/files/browse": (10.0, 120.0),
+        "/files/browse-path": (10.0, 120.0),
+        "/files/list": (30.0, 300.0),
+        "/files/read": (15.0, 60.0),
+        "/files/search": (30.0, 120.0),
+        "/files/search-path": (30.0, 120.0),
+        "/files/find": (30.0, 120.0),
+    }
+    MAX_BYTES: ClassVar[int] = int(float(os.getenv("QUITTO_RESPONSE_CACHE_MB", "64")) * 1024 * 1024)
+
+    _entries: ClassVar["OrderedDict[tuple, CacheEntry]"] = OrderedDict()
+    _bytes: ClassVar[int] = 0
+    _refreshing: ClassVar[set] = set()
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+    _refresh_pool: ClassVar[ThreadPoolExecutor] = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+    _stats: ClassVar[Dict[str, int]] = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0, "refreshes": 0}
+    # peer notifications are coalesced for NOTIFY_DELAY seconds and sent in one request per peer
+    NOTIFY_DELAY: ClassVar[float] = 0.2
+    NOTIFY_MAX: ClassVar[int] = 256
+    _pending: ClassVar[list] = []
+    _flush_scheduled: ClassVar[bool] = False
+
+    @staticmethod
+    def ttl_for(route: str) -> Optional[Tuple[float, float]]:
+        best = None
+        for prefix, ttl in ResponseCache.ROUTE_TTLS.items():
+            if (route == prefix or route.startswith(prefix + "/")) and (best is None or len(prefix) > len(best[0])):
+                best = (prefix, ttl)
+        return best[1] if best else None
+
+    @staticmethod
+    def key(machine: str, route: str, params: Optional[dict]) -> tuple:
+        items = tuple(sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None))
+        return (str(machine), route, items)
+
+    @staticmethod
+    def _scope(route: str, params: Optional[dict]) -> Tuple[Optional[str], str]:
+        """(base, path) an entry describes, used to match invalidations."""
+        params = params or {}
+        base = params.get("base")
+        parts = route.strip("/").split("/")
+        if base is None and len(parts) >= 3 and parts[0] == "files":
+            base = parts[2]
+        path = str(params.get("path") or "").strip("/")
+        return base, path
+
+    @staticmethod
+    def cacheable(value) -> bool:
+        return value is not None and not (isinstance(value, dict) and "error" in value)
+
+    @staticmethod
+    def _store(key: tuple, route: str, params: Optional[dict], value, ttl: Tuple[float, float]) -> None:
+        try:
+            size = len(json.dumps(value, default=str))
+        except (TypeError, ValueError):
+            return
+        if size > ResponseCache.MAX_BYTES // 4:
+            return
+        base, path = ResponseCache._scope(route, params)
+        with ResponseCache._lock:
+            old = ResponseCache._entries.pop(key, None)
+            if old is not None:
+                ResponseCache._bytes -= old.size
+            ResponseCache._entries[key] = CacheEntry(value, time.monotonic(), ttl[0], ttl[1], size, base, path)
+            ResponseCache._bytes += size
+            while ResponseCache._bytes > ResponseCache.MAX_BYTES and ResponseCache._entries:
+                _, evicted = ResponseCache._entries.popitem(last=False)
+                ResponseCache._bytes -= evicted.size
+                ResponseCache._stats["evictions"] += 1
+
+    @staticmethod
+    def _refresh(key: tuple, route: str, params: Optional[dict], fetch: Callable[[], object], ttl) -> None:
+        try:
+            value = fetch()
+            if ResponseCache.cacheable(value):
+                ResponseCache._store(key, route, params, value, ttl)
+        except Exception as E:
+            logger.debug("Background refresh of %s failed: %s", route, E)
+        finally:
+            with ResponseCache._lock:
+                ResponseCache._refreshing.discard(key)
+
+    @staticmethod
+    def get_or_fetch(machine: str, route: str, params: Optional[dict], fetch: Callable[[], object]):
+        """Serve `route` from the cache, calling `fetch()` on a miss (or in the background when stale).
+
+        Identical misses in flight at the same time share one `fetch()` (see `SingleFlight`).
+        """
+        ttl = ResponseCache.ttl_for(route)
+        key = ResponseCache.key(machine, route, params)
+        if ttl is None:
+            return SingleFlight.do("forward", key, fetch)
+        with ResponseCache._lock:
+            entry = ResponseCache._entries.get(key)
+            if entry is not None:
+                age = time.monotonic() - entry.stored_at
+                if age <= entry.ttl:
+                    ResponseCache._entries.move_to_end(key)
+                    ResponseCache._stats["hits"] += 1
+                    return entry.value
+                if age <= entry.ttl + entry.stale:
+                    ResponseCache._entries.move_to_end(key)
+                    ResponseCache._stats["stale_hits"] += 1
+                    if key not in ResponseCache._refreshing:
+                        ResponseCache._refreshing.add(key)
+                        ResponseCache._stats["refreshes"] += 1
+                        ResponseCache._refresh_pool.submit(ResponseCache._refresh, key, route, params, fetch, ttl)
+                    return entry.value
+            ResponseCache._stats["misses"] += 1
+        # concurrent misses for the same key wait for one fetch
+        value = SingleFlight.do("forward", key, fetch)
+        if ResponseCache.cacheable(value):
+            ResponseCache._store(key, route, params, value, ttl)
+        return value
+
+    @staticmethod
+    def is_fresh(machine: str, route: str, params: Optional[dict]) -> bool:
+        """Whether a fresh (not yet stale) entry exists, without touching LRU order or stats."""
+        with ResponseCache._lock:
+            entry = ResponseCache._entries.get(ResponseCache.key(machine, route, params))
+            return entry is not None and time.monotonic() - entry.stored_at <= entry.ttl
+
+    @staticmethod
+    def _affected(entry_path: str, changed: str) -> bool:
+        if not entry_path or not changed or entry_path == changed:
+            return True
+        # ancestors (listings/searches that include it) and descendants (moved/deleted with it)
+        return changed.startswith(entry_path + "/") or entry_path.startswith(changed + "/")
+
+    @staticmethod
+    def invalidate(base: Optional[str] = None, path: Optional[str] = None, machine: Optional[str] = None) -> int:
+        """Drop entries affected by a change to `path` (within `base`, or absolute when no base).
+
+        An entry is affected when its path is the changed path, an ancestor of
+        it or below it; base-wide results (search/find/list) always are. With
+        neither `base` nor `path`, the whole cache (or `machine`'s share) is dropped.
+        """
+        changed = str(path or "").strip("/")
+        removed = 0
+        with ResponseCache._lock:
+            for key in list(ResponseCache._entries):
+                entry = ResponseCache._entries[key]
+                if machine is not None and key[0] != str(machine):
+                    continue
+                if entry.base != base and not (base is None and path is None):
+                    continue
+                if path is not None and not ResponseCache._affected(entry.path, changed):
+                    continue
+                ResponseCache._bytes -= entry.size
+                del ResponseCache._entries[key]
+                removed += 1
+            ResponseCache._stats["invalidations"] += removed
+        return removed
+
+    @staticmethod
+    def stats() -> dict:
+        with ResponseCache._lock:
+            return {
+                **ResponseCache._stats,
+                "entries": len(ResponseCache._entries),
+                "bytes": ResponseCache._bytes,
+                "max_bytes": ResponseCache.MAX_BYTES,
+                "refreshing": len(ResponseCache._refreshing),
+            }
+
+    # ── Pushed invalidations ──────────────────────────────────────
+
+    @staticmethod
+    def notify_peers(base: Optional[str], path: str) -> None:
+        """Queue a change notification for every known peer (sent shortly, in batches)."""
+        with ResponseCache._lock:
+            ResponseCache._pending.append({"base": base, "path": path})
+            if ResponseCache._flush_scheduled:
+                return
+            ResponseCache._flush_scheduled = True
+        NodeClient.spawn(ResponseCache._flush())
+
+    @staticmethod
+    async def _flush() -> None:
+        await asyncio.sleep(ResponseCache.NOTIFY_DELAY)
+        with ResponseCache._lock:
+            changes, ResponseCache._pending = ResponseCache._pending, []
+            ResponseCache._flush_scheduled = False
+        if not changes:
+            return
+        # too many distinct changes: ask peers to drop everything instead
+        body = {"changes": changes} if len(changes) <= ResponseCache.NOTIFY_MAX else {"all": True}
+        peers = [m for m in getattr(data, "MACHINES", []) or [] if m and getattr(m, "url_connect", None) and HealthRegistry.is_available(m)]
+
+        async def send(m):
+            url = str(m.url_connect).rstrip("/") + "/files/cache/invalidate"
+            try:
+                await NodeClient.apost(url, json=body, timeout=3, machine=m)
+            except Exception as E:
+                logger.debug("Could not push cache invalidation to %s: %s", m.url_connect, E)
+
+        await asyncio.gather(*(send(m) for m in peers))
@@ -0,0 +1,100 @@
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, ClassVar, Dict, Optional, Tuple
+import logging
+import threading
+
+logger = logging.getLogger("server.services.net.singleflight")
+
+
+@dataclass
+class _Flight:
+    done: threading.Event = field(default_factory=threading.Event)
+    result: Any = None
+    error: Optional[BaseException] = None
+    waiters: int = 0
+
+
+@dataclass
+class SingleFlight:
+    """Coalesces identical concurrent calls into one execution.
+
+    The first caller for a key (the leader) runs the work. Callers that
+    arrive with the same key while it is running block until it finishes
+    and get the same result, or the same exception. Nothing is kept after
+    the call finishes, so this is not a cache: a request that arrives
+    later starts a new flight. Counters are kept per group.
+    """
+    _flights: ClassVar[Dict[tuple, _Flight]] = {}
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+    _stats: ClassVar[Dict[str, Dict[str, int]]] = {}
+
+    @staticmethod
+    def key(route: str, params: Optional[dict] = None) -> tuple:
+        """Normalized key: route without trailing slash, params sorted, None values dropped."""
+        items = tuple(sorted((str(k), str(v)) for k, v in (params or {}).items() if v is not None))
+        return (route.rstrip("/") or "/", items)
+
+    @staticmethod
+    def _count(group: str, name: str) -> None:
+        st = SingleFlight._stats.setdefault(group, {"calls": 0, "executed": 0, "coalesced": 0, "errors": 0})
+        st[name] += 1
+
+    @staticmethod
+    def do(group: str, key: tuple, fn: Callable[[], Any]) -> Any:
+        """Run `fn()` once for all concurrent callers sharing `(group, key)`."""
+        full = (group, key)
+        with SingleFlight._lock:
+            SingleFlight._count(group, "calls")
+            flight = SingleFlight._flights.get(full)
+            leader = flight is None
+            if leader:
+                flight = SingleFlight._flights[full] = _Flight()
+                SingleFlight._count(group, "executed")
+            else:
+                flight.waiters += 1
+                SingleFlight._count(group, "coalesced")
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except BaseException as E:
+            flight.error = E
+            with SingleFlight._lock:
+                SingleFlight._count(group, "errors")
+            raise
+        finally:
+            with SingleFlight._lock:
+                SingleFlight._flights.pop(full, None)
+            flight.done.set()
+            if flight.waiters:
+                logger.debug("single-flight %s %s served %d waiting callers", group, key[0], flight.waiters)
+
+    @staticmethod
+    def coalesce(group: str, route: Optional[str] = None, ignore: Tuple[str, ...] = ()):
+        """Decorator for sync endpoints: identical concurrent calls (same kwargs) share one run.
+
+        Arguments named in `ignore` (e.g. the `request`) are left out of the key.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                params = {k: v for k, v in kwargs.items() if k not in ignore}
+                return SingleFlight.do(group, SingleFlight.key(route or fn.__name__, params), lambda: fn(*args, **kwargs))
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def stats() -> dict:
+        with SingleFlight._lock:
+            groups = {g: dict(st) for g, st in SingleFlight._stats.items()}
+            in_flight = len(SingleFlight._flights)
+        for st in groups.values():
+            st["coalesced_ratio"] = round(st["coalesced"] / st["calls"], 4) if st["calls"] else 0.0
+        return {"in_flight": in_flight, "groups": groups}
@@ -0,0 +1,216 @@
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import ClassVar, Dict, Optional
+from .MachineHealth import HealthRegistry
+import asyncio
+import logging
+import os
+import threading
+import time
+import httpx
+
+logger = logging.getLogger("server.services.net.wakeondemand")
+
+
+@dataclass
+class WakeState:
+    key: str
+    name: Optional[str] = None
+    state: str = "idle"                  # idle, waking, awake, failed
+    wakes: int = 0
+    successes: int = 0
+    failures: int = 0
+    waiters: int = 0
+    last_wake_ms: Optional[float] = None
+    cooldown_until: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "key": self.key,
+            "name": self.name,
+            "state": self.state,
+            "wakes": self.wakes,
+            "successes": self.successes,
+            "failures": self.failures,
+            "waiters": self.waiters,
+            "last_wake_ms": round(self.last_wake_ms, 1) if self.last_wake_ms is not None else None,
+            "cooldown_until": self.cooldown_until,
+        }
+
+
+@dataclass
+class WakeOnDemand:
+    """Wakes a sleeping machine when a request needs it (opt-in: QUITTO_AUTO_WAKE=on).
+
+    When a call to a machine fails to connect, or is refused because its
+    circuit is open after connect failures, `NodeClient` asks for the machine
+    to be woken:
+    1. A magic packet is sent, and repeated every RESEND seconds.
+    2. A reachability probe runs every PROBE_INTERVAL seconds until the
+       node answers or DEADLINE passes.
+    Concurrent requests for the same machine wait on that one wake instead
+    of each sending packets. When the node answers, its circuit is closed
+    and the waiting calls are retried. A wake that misses the deadline puts
+    the machine in a COOLDOWN during which calls fail fast again.
+
+    Sync callers (threadpool endpoints) block their worker thread while they
+    wait, for up to DEADLINE + 5 seconds. At most MAX_BLOCKING of them wait
+    at once; beyond that a caller still starts the wake but fails right away,
+    so sleeping machines cannot take over the whole threadpool.
+    """
+    # With auto-wake on, each blocked sync caller holds a threadpool worker for up to
+    # QUITTO_WAKE_DEADLINE + 5 s (95 s by default); QUITTO_WAKE_MAX_BLOCKING caps how many.
+    ENABLED: ClassVar[bool] = os.getenv("QUITTO_AUTO_WAKE", "off").lower() in ("1", "on", "true")
+    DEADLINE: ClassVar[float] = float(os.getenv("QUITTO_WAKE_DEADLINE", "90"))
+    COOLDOWN: ClassVar[float] = float(os.getenv("QUITTO_WAKE_COOLDOWN", "300"))
+    PROBE_INTERVAL: ClassVar[float] = 2.0
+    PROBE_TIMEOUT: ClassVar[float] = 2.0
+    RESEND: ClassVar[float] = 15.0
+    MAX_BLOCKING: ClassVar[int] = int(os.getenv("QUITTO_WAKE_MAX_BLOCKING", "8"))
+    PROBE_ROUTE: ClassVar[str] = "/api/global_paths/local"
+
+    _states: ClassVar[Dict[str, WakeState]] = {}
+    _flights: ClassVar[Dict[str, Future]] = {}
+    _lock: ClassVar[threading.Lock] = threading.Lock()
+    _blocking: ClassVar[int] = 0
+
+    @staticmethod
+    def _get(machine) -> WakeState:
+        k = HealthRegistry.key(machine)
+        st = WakeOnDemand._states.get(k)
+        if st is None:
+            st = WakeOnDemand._states[k] = WakeState(key=k, name=getattr(machine, "name", None))
+        return st
+
+    @staticmethod
+    def wakeable(machine) -> bool:
+        """Whether a failed call to `machine` should wake it rather than fail."""
+        if not WakeOnDemand.ENABLED or machine is None or not getattr(machine, "url_connect", None):
+            return False
+        if not callable(getattr(machine, "wake_on_lan", None)) or not machine.is_valid():
+            return False
+        # a machine that answers with errors is awake: only connect failures mean "asleep"
+        last_error = HealthRegistry.snapshot(machine).get("last_error")
+        if last_error and not last_error.startswith(("ConnectError", "ConnectTimeout")):
+            return False
+        with WakeOnDemand._lock:
+            st = WakeOnDemand._states.get(HealthRegistry.key(machine))
+            return st is None or st.cooldown_until is None or time.time() >= st.cooldown_until
+
+    @staticmethod
+    def _flight(machine) -> Future:
+        """The wake in progress for `machine`, starting one if needed."""
+        from .NodeClient import NodeClient
+        k = HealthRegistry.key(machine)
+        with WakeOnDemand._lock:
+            fut = WakeOnDemand._flights.get(k)
+            if fut is None:
+                fut = WakeOnDemand._flights[k] = NodeClient.spawn(WakeOnDemand._wake(machine))
+            WakeOnDemand._get(machine).waiters += 1
+        return fut
+
+    @staticmethod
+    def _left(machine) -> None:
+        with WakeOnDemand._lock:
+            WakeOnDemand._get(machine).waiters -= 1
+
+    @staticmethod
+    def ensure_awake(machine) -> bool:
+        """Block until `machine` answers (True) or the wake deadline passes (False).
+
+        Returns False at once, with the wake still running, when MAX_BLOCKING callers already wait.
+        """
+        fut = WakeOnDemand._flight(machine)
+        with WakeOnDemand._lock:
+            blocking = WakeOnDemand._blocking < WakeOnDemand.MAX_BLOCKING
+            if blocking:
+                WakeOnDemand._blocking += 1
+        try:
+            if not blocking:
+                return False
+            return bool(fut.result(WakeOnDemand.DEADLINE + 5))
+        except Exception:
+            return False
+        finally:
+            if blocking:
+                with WakeOnDemand._lock:
+                    WakeOnDemand._blocking -= 1
+            WakeOnDemand._left(machine)
+
+    @staticmethod
+    async def aensure_awake(machine) -> bool:
+        """Async `ensure_awake`; cancelling a waiter does not cancel the wake itself."""
+        fut = WakeOnDemand._flight(machine)
+        try:
+            return bool(await asyncio.shield(asyncio.wrap_future(fut)))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return False
+        finally:
+            WakeOnDemand._left(machine)
+
+    @staticmethod
+    async def probe(machine) -> bool:
+        """Any HTTP answer from the node counts; bypasses its circuit breaker and channel."""
+        from .NodeClient import NodeClient
+        url = str(machine.url_connect).rstrip("/") + WakeOnDemand.PROBE_ROUTE
+        try:
+            await NodeClient.async_client(url).get(url, timeout=NodeClient._timeout(WakeOnDemand.PROBE_TIMEOUT))
+            return True
+        except httpx.HTTPError:
+            return False
+
+    @staticmethod
+    async def _wake(machine) -> bool:
+        k = HealthRegistry.key(machine)
+        with WakeOnDemand._lock:
+            st = WakeOnDemand._get(machine)
+            st.state = "waking"
+            st.wakes += 1
+        t0 = time.perf_counter()
+        deadline = time.monotonic() + WakeOnDemand.DEADLINE
+        last_sent = 0.0
+        ok = False
+        try:
+            while time.monotonic() < deadline:
+                if time.monotonic() - last_sent >= WakeOnDemand.RESEND:
+                    last_sent = time.monotonic()
+                    if not await asyncio.to_thread(machine.wake_on_lan):
+                        break
+                    logger.info("Sent Wake-on-LAN packet to machine %s (%s)", getattr(machine, "name", None), k)
+                p0 = time.perf_counter()
+                if await WakeOnDemand.probe(machine):
+                    HealthRegistry.record_success(machine, (time.perf_counter() - p0) * 1000)
+                    ok = True
+                    break
+                await asyncio.sleep(WakeOnDemand.PROBE_INTERVAL)
+        finally:
+            with WakeOnDemand._lock:
+                st.last_wake_ms = (time.perf_counter() - t0) * 1000
+                if ok:
+                    st.state = "awake"
+                    st.successes += 1
+                    st.cooldown_until = None
+                else:
+                    st.state = "failed"
+                    st.failures += 1
+                    st.cooldown_until = time.time() + WakeOnDemand.COOLDOWN
+                WakeOnDemand._flights.pop(k, None)
+        if ok:
+            logger.info("Machine %s (%s) woke up after %.1fs", st.name, k, st.last_wake_ms / 1000)
+        else:
+            logger.warning("Machine %s (%s) did not wake within %.0fs", st.name, k, WakeOnDemand.DEADLINE)
+        return ok
+
+    @staticmethod
+    def stats() -> dict:
+        with WakeOnDemand._lock:
+            return {
+                "enabled": WakeOnDemand.ENABLED,
+                "deadline": WakeOnDemand.DEADLINE,
+                "cooldown": WakeOnDemand.COOLDOWN,
+                "blocking": WakeOnDemand._blocking,
+                "max_blocking": WakeOnDemand.MAX_BLOCKING,
+                "machines": {k: st.to_dict() for k, st in WakeOnDemand._states.items()},
+            }
@@ -0,0 +1,346 @@
+from pathlib import Path
+from dataclasses import dataclass
+from typing import ClassVar, Dict, Iterator, Optional, Tuple
+from Services.Files.AtomicWrite import PathLocks, WriteConflict, file_identity
+import hashlib
+import logging
+import math
+import os
+import struct
+import tempfile
+import zlib
+
+logger = logging.getLogger("server.services.sync.deltasync")
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ADLER_MOD = 65521
+
+# Delta stream layout (all integers big-endian):
+#   header  b"QDLT1" | u32 block_size
+#   copy    b"C" | u32 first_block | u32 count      -> blocks copied from the receiver's basis file
+#   data    b"D" | u32 length | bytes              -> literal bytes
+#   end     b"E" | u64 final_size | 32-byte sha256 -> integrity check of the rebuilt file
+MAGIC = b"QDLT1"
+
+
+@dataclass
+class DeltaSync:
+    """rsync-style delta transfer between Quitto nodes.
+
+    The receiver publishes per-block signatures of its copy (rolling Adler-32
+    plus a BLAKE2b strong hash). The sender rolls a window over its own file,
+    emits block references wherever a signature matches and literal data
+    everywhere else, so only changed regions cross the network.
+    """
+    MIN_BLOCK: ClassVar[int] = 2048
+    MAX_BLOCK: ClassVar[int] = 128 * 1024
+    READ_CHUNK: ClassVar[int] = 4 * 1024 * 1024
+    LITERAL_MAX: ClassVar[int] = 1024 * 1024
+    SCAN_SEGMENT: ClassVar[int] = 1024 * 1024
+
+    @staticmethod
+    def block_size_for(size: int) -> int:
+        """sqrt(size) rounded to 1 KiB and clamped, like rsync's heuristic."""
+        bs = int(math.sqrt(max(size, 1)))
+        bs = (bs + 1023) // 1024 * 1024
+        return max(DeltaSync.MIN_BLOCK, min(DeltaSync.MAX_BLOCK, bs))
+
+    @staticmethod
+    def strong_hash(block: bytes) -> str:
+        return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+    @staticmethod
+    def signatures(path: Path, block_size: Optional[int] = None) -> dict:
+        """Block signatures of `path`; a missing file yields an empty signature."""
+        path = Path(path)
+        if not path.is_file():
+            return {"block_size": block_size or DeltaSync.MIN_BLOCK, "size": 0, "blocks": []}
+        size = path.stat().st_size
+        block_size = int(block_size or DeltaSync.block_size_for(size))
+        blocks = []
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                blocks.append({"weak": zlib.adler32(block), "strong": DeltaSync.strong_hash(block), "len": len(block)})
+        return {"block_size": block_size, "size": size, "blocks": blocks}
+
+    @staticmethod
+    def _low_mask(weak_keys: set):
+        """numpy lookup of the low 16 bits of `weak_keys`: a cheap first filter for `_weak_hits`."""
+        if np is None:
+            return None
+        low = np.zeros(1 << 16, dtype=bool)
+        low[[k & 0xFFFF for k in weak_keys]] = True
+        return low
+
+    @staticmethod
+    def _weak_hits(buf: bytes, start: int, stop: int, L: int, weak_keys: set, low=None) -> Iterator[Tuple[int, int]]:
+        """(start, Adler-32) of the windows in [start, stop) whose weak hash is in `weak_keys`, in order.
+
+        Every window is hashed in bulk from prefix sums (numpy when available,
+        a tight rolling loop otherwise) instead of one step of the main delta
+        loop per byte; callers confirm each hit with the strong hash.
+        """
+        if stop <= start or not weak_keys:
+            return
+        weak = zlib.adler32(buf[start:start + L])
+        if weak in weak_keys:
+            yield start, weak
+        if low is None:
+            a, b = weak & 0xFFFF, weak >> 16
+            for p in range(start, stop - 1):
+                out_b, in_b = buf[p], buf[p + L]
+                a = (a - out_b + in_b) % ADLER_MOD
+                b = (b - L * out_b + a - 1) % ADLER_MOD
+                weak = (b << 16) | a
+                if weak in weak_keys:
+                    yield p + 1, weak
+            return
+        # the first window is checked directly because after a match the next
+        # block usually matches too; segments then start small and double, so
+        # a scan restarted right after a match only hashes a few blocks
+        s, seg = start + 1, 4 * L
+        while s < stop:
+            e = min(stop, s + seg)
+            seg = min(2 * seg, DeltaSync.SCAN_SEGMENT)
+            x = np.frombuffer(buf, dtype=np.uint8, offset=s, count=e - s + L - 1)
+            # c[i] = sum(x[:i]); c2[i] = sum(c[:i]); window p spans x[p:p+L]
+            c = np.zeros(len(x) + 1, dtype=np.int64)
+            np.cumsum(x, out=c[1:])
+            a = (c[L:] - c[:-L] + 1) % ADLER_MOD
+            cand = np.flatnonzero(low[a])
+            if not len(cand):
+                s = e
+                continue
+            c2 = np.zeros(len(c) + 1, dtype=np.int64)
+            np.cumsum(c, out=c2[1:])
+            b = (c2[cand + L + 1] - c2[cand + 1] - L * c[cand] + L) % ADLER_MOD
+            keys = (b << 16) | a[cand]
+            for p, key in zip(cand.tolist(), keys.tolist()):
+                if key in weak_keys:
+                    yield s + p, key
+            s = e
+
+    @staticmethod
+    def delta(path: Path, signature: dict) -> Iterator[bytes]:
+        """Yield the delta stream that turns the receiver's basis into `path`."""
+        L = int(signature["block_size"])
+        blocks = signature.get("blocks") or []
+        table: Dict[int, Dict[str, int]] = {}
+        tail_block = None
+        for i, blk in enumerate(blocks):
+            if blk.get("len", L) == L:
+                table.setdefault(blk["weak"], {}).setdefault(blk["strong"], i)
+            else:
+                tail_block = (i, blk)
+        weak_keys = set(table)
+        low = DeltaSync._low_mask(weak_keys)
+
+        digest = hashlib.sha256()
+        total = 0
+        yield MAGIC + struct.pack(">I", L)
+
+        pending = None  # (first_block, count) run waiting to be emitted
+
+        def copy_record(run):
+            return b"C" + struct.pack(">II", run[0], run[1])
+
+        def literal_records(chunk: bytes):
+            for i in range(0, len(chunk), DeltaSync.LITERAL_MAX):
+                part = chunk[i:i + DeltaSync.LITERAL_MAX]
+                yield b"D" + struct.pack(">I", len(part)) + part
+
+        with open(path, "rb") as f:
+            buf = b""
+            pos = 0
+            lit_start = 0
+            eof = False
+
+            while not eof:
+                chunk = f.read(DeltaSync.READ_CHUNK)
+                if chunk:
+                    digest.update(chunk)
+                    total += len(chunk)
+                    buf += chunk
+                else:
+                    eof = True
+
+                # scan every window that fits in `buf`; after a match the scan
+                # restarts past the copied block
+                hits = DeltaSync._weak_hits(buf, pos, len(buf) - L + 1, L, weak_keys, low)
+                while True:
+                    hit = next(hits, None)
+                    if hit is None:
+                        break
+                    p, weak = hit
+                    idx = table[weak].get(DeltaSync.strong_hash(buf[p:p + L]))
+                    if idx is None:
+                        continue
+                    if p > lit_start:
+                        if pending:
+                            yield copy_record(pending)
+                            pending = None
+                        yield from literal_records(buf[lit_start:p])
+                    if pending and pending[0] + pending[1] == idx:
+                        pending = (pending[0], pending[1] + 1)
+                    else:
+                        if pending:
+                            yield copy_record(pending)
+                        pending = (idx, 1)
+                    pos = p + L
+                    lit_start = pos
+                    hits.close()
+                    hits = DeltaSync._weak_hits(buf, pos, len(buf) - L + 1, L, weak_keys, low)
+
+                if eof:
+                    break
+                # windows starting before len(buf) - L + 1 are settled: flush
+                # them as literals and keep only the unscanned tail
+                pos = max(pos, len(buf) - L + 1)
+                if pos > lit_start:
+                    if pending:
+                        yield copy_record(pending)
+                        pending = None
+                    yield from literal_records(buf[lit_start:pos])
+                buf = buf[pos:]
+                pos = lit_start = 0
+
+            rest = buf[lit_start:]
+            if rest and tail_block is not None and tail_block[1].get("len") == len(rest) and tail_block[1]["strong"] == DeltaSync.strong_hash(rest):
+                run = tail_block[0]
+                if pending and pending[0] + pending[1] == run:
+                    pending = (pending[0], pending[1] + 1)
+                else:
+                    if pending:
+                        yield copy_record(pending)
+                    pending = (run, 1)
+                rest = b""
+            if pending:
+                yield copy_record(pending)
+            if rest:
+                yield from literal_records(rest)
+
+        yield b"E" + struct.pack(">Q", total) + digest.digest()
+
+
+class DeltaApplier:
+    """Incrementally rebuild a file from a delta stream.
+
+    Data is written to a temp file next to `target` and moved into place with
+    `os.replace` only after the trailing size and SHA-256 check out, so a
+    reader never sees a half-synced file. If `target` was replaced while
+    the delta was applied, `finish` raises `WriteConflict`.
+    """
+
+    def __init__(self, target: Path):
+        self.target = Path(target)
+        self.target.parent.mkdir(parents=True, exist_ok=True)
+        self.expected = file_identity(self.target)
+        self.basis = open(self.target, "rb") if self.target.is_file() else None
+        fd, tmp = tempfile.mkstemp(prefix=f".{self.target.name}.", suffix=".sync", dir=str(self.target.parent))
+        self.tmp_path = Path(tmp)
+        self.out = os.fdopen(fd, "wb")
+        self.digest = hashlib.sha256()
+        self.buf = bytearray()
+        self.block_size = None
+        self.written = 0
+        self.literal_bytes = 0
+        self.copied_bytes = 0
+        self.done = False
+
+    def _write(self, chunk: bytes):
+        self.out.write(chunk)
+        self.digest.update(chunk)
+        self.written += len(chunk)
+
+    def feed(self, chunk: bytes) -> None:
+        self.buf += chunk
+        while True:
+            if self.block_size is None:
+                if len(self.buf) < 9:
+                    return
+                if bytes(self.buf[:5]) != MAGIC:
+                    raise ValueError("invalid delta header")
+                self.block_size = struct.unpack(">I", self.buf[5:9])[0]
+                del self.buf[:9]
+                continue
+            if not self.buf:
+                return
+            op = self.buf[0:1]
+            if op == b"C":
+                if len(self.buf) < 9:
+                    return
+                first, count = struct.unpack(">II", self.buf[1:9])
+                del self.buf[:9]
+                if self.basis is None:
+                    raise ValueError("copy record without basis file")
+                self.basis.seek(first * self.block_size)
+                remaining = count * self.block_size
+                while remaining > 0:
+                    block = self.basis.read(min(remaining, 1024 * 1024))
+                    if not block:
+                        break
+                    self._write(block)
+                    self.copied_bytes += len(block)
+                    remaining -= len(block)
+            elif op == b"D":
+                if len(self.buf) < 5:
+                    return
+                length = struct.unpack(">I", self.buf[1:5])[0]
+                if len(self.buf) < 5 + length:
+                    return
+                self._write(bytes(self.buf[5:5 + length]))
+                self.literal_bytes += length
+                del self.buf[:5 + length]
+            elif op == b"E":
+                if len(self.buf) < 41:
+                    return
+                size = struct.unpack(">Q", self.buf[1:9])[0]
+                expected = bytes(self.buf[9:41])
+                del self.buf[:41]
+                if size != self.written or expected != self.digest.digest():
+                    raise ValueError("delta verification failed")
+                self.done = True
+                return
+            else:
+                raise ValueError(f"unknown delta record {op!r}")
+
+    def finish(self, mtime: Optional[float] = None) -> dict:
+        try:
+            if not self.done:
+                raise ValueError("delta stream ended before trailer")
+            self.out.flush()
+            os.fsync(self.out.fileno())
+            self.out.close()
+            if self.basis is not None:
+                st = os.fstat(self.basis.fileno())
+                os.chmod(self.tmp_path, st.st_mode & 0o7777)
+                self.basis.close()
+            with PathLocks.for_path(self.target):
+                if file_identity(self.target) != self.expected:
+                    raise WriteConflict(f"{self.target} changed while the delta was applied")
+                os.replace(self.tmp_path, self.target)
+            if mtime is not None:
+                os.utime(self.target, (mtime, mtime))
+            return {"path": str(self.target), "size": self.written, "literal_bytes": self.literal_bytes, "copied_bytes": self.copied_bytes}
+        except Exception:
+            self.abort()
+            raise
+
+    def abort(self) -> None:
+        for fh in (self.out, self.basis):
+            try:
+                if fh is not None:
+                    fh.close()
+            except Exception:
+                pass
+        try:
+            self.tmp_path.unlink()
+        except FileNotFoundError:
+            pass
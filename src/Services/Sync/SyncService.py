@@ -0,0 +1,154 @@
+from fastapi import APIRouter, HTTPException, Request, Query
+from pathlib import Path
+from typing import Optional
+from data import data
+from models.Machine import Machine
+from Services.Files.FilesTools import FilesTools
+from Services.Files.Trash import Trash
+from .DeltaSync import DeltaSync, DeltaApplier
+from Services.Files.AtomicWrite import WriteConflict
+from Services.Net.NodeClient import NodeClient
+import asyncio
+import logging
+
+# Logger specific to this service: server.services.sync.syncservice
+logger = logging.getLogger("server.services.sync.syncservice")
+
+# ═══════════════════════════════════════════════════════════════
+# SyncService - Sincronização delta entre nós Quitto
+# ═══════════════════════════════════════════════════════════════
+
+routerSync = APIRouter(prefix="/sync", tags=["Sync"])
+
+
+def _resolve_in_base(base: str, rel: str) -> Path:
+    """Resolve `rel` inside a local base, refusing paths that escape the base root."""
+    root = FilesTools.resolve_base_root(data.GLOBAL_PATHS.get(base))
+    if not root:
+        raise HTTPException(status_code=404, detail="base not found")
+    root = root.resolve()
+    target = (root / FilesTools.normalize_rel_path(rel)).resolve()
+    if target != root and root not in target.parents:
+        raise HTTPException(status_code=400, detail="path escapes base")
+    return target
+
+
+class SyncService:
+    """Receiver side of the delta protocol plus the sender helpers used by the CLI."""
+
+    @routerSync.get("/manifest/{base}")
+    def manifest(base: str, request: Request, path: str = ""):
+        """Lista arquivos (tamanho, mtime) de uma base para o remetente decidir o que enviar"""
+        if not NodeClient.token_ok(request.headers):
+            raise HTTPException(status_code=401, detail="invalid node token")
+        root = _resolve_in_base(base, path)
+        if not root.exists():
+            return {"base": base, "files": {}}
+        base_root = _resolve_in_base(base, "")
+        files = {}
+        walk = [root] if root.is_file() else (p for p in Trash.walk(root) if p.is_file())
+        for p in walk:
+            try:
+                st = p.stat()
+                files[str(p.relative_to(base_root))] = [st.st_size, int(st.st_mtime)]
+            except (PermissionError, OSError):
+                continue
+        return {"base": base, "files": files}
+
+    @routerSync.get("/signature/{base}")
+    def signature(base: str, request: Request, path: str, block_size: Optional[int] = Query(None)):
+        """Assinaturas de bloco (Adler-32 + BLAKE2b) da cópia local de um arquivo"""
+        if not NodeClient.token_ok(request.headers):
+            raise HTTPException(status_code=401, detail="invalid node token")
+        target = _resolve_in_base(base, path)
+        return DeltaSync.signatures(target, block_size)
+
+    @routerSync.post("/apply/{base}")
+    async def apply(base: str, request: Request, path: str, mtime: Optional[float] = None):
+        """Recebe um stream delta e reconstrói o arquivo atomicamente"""
+        if not NodeClient.token_ok(request.headers):
+            raise HTTPException(status_code=401, detail="invalid node token")
+        target = _resolve_in_base(base, path)
+        # the applier writes, fsyncs and renames: keep that off the event loop
+        applier = await asyncio.to_thread(DeltaApplier, target)
+        try:
+            async for chunk in request.stream():
+                await asyncio.to_thread(applier.feed, chunk)
+            result = await asyncio.to_thread(applier.finish, mtime)
+        except ValueError as e:
+            applier.abort()
+            raise HTTPException(status_code=400, detail=str(e))
+        except WriteConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except PermissionError:
+            applier.abort()
+            raise HTTPException(status_code=403, detail="permission denied")
+        except Exception as e:
+            applier.abort()
+            logger.error("[ERROR] Delta apply failed for %s: %s", target, e)
+            raise HTTPException(status_code=500, detail=str(e))
+        logger.info("Delta applied to %s: %d literal, %d copied bytes", target, result["literal_bytes"], result["copied_bytes"])
+        FilesTools.notify_change(target)
+        return result
+
+    @staticmethod
+    def push_file(machine: Machine, base: str, local_file: Path, rel: str, timeout: int = 60) -> dict:
+        """Send one file to `machine` as a delta against its current copy."""
+        remote = str(machine.url_connect).rstrip('/')
+        r = NodeClient.get(f"{remote}/sync/signature/{base}", params={"path": rel}, headers=NodeClient._headers(), timeout=timeout, machine=machine)
+        r.raise_for_status()
+        sig = r.json()
+        if not sig.get("blocks"):
+            # nothing to diff against: pick a block size suited to the source
+            sig["block_size"] = DeltaSync.block_size_for(local_file.stat().st_size)
+        mtime = local_file.stat().st_mtime
+        r = NodeClient.post(
+            f"{remote}/sync/apply/{base}",
+            params={"path": rel, "mtime": int(mtime)},
+            content=DeltaSync.delta(local_file, sig),
+            headers={**NodeClient._headers(), "Content-Type": "application/octet-stream"},
+            timeout=timeout,
+            machine=machine,
+        )
+        r.raise_for_status()
+        return r.json()
+
+    @staticmethod
+    def push_base(machine: Machine, base: str, path: str = "", dry_run: bool = False, timeout: int = 60) -> dict:
+        """Sync a local base (or a sub-path of it) to `machine`, sending only files whose size/mtime differ."""
+        if not machine or not getattr(machine, 'url_connect', None):
+            raise ValueError("machine has no url_connect")
+        root = FilesTools.resolve_base_root(data.GLOBAL_PATHS.get(base))
+        if not root:
+            raise ValueError(f"base not found locally: {base}")
+        start = root / FilesTools.normalize_rel_path(path) if path else root
+
+        remote = str(machine.url_connect).rstrip('/')
+        r = NodeClient.get(f"{remote}/sync/manifest/{base}", params={"path": path}, headers=NodeClient._headers(), timeout=timeout, machine=machine)
+        r.raise_for_status()
+        remote_files = r.json().get("files", {})
+
+        local_files = [start] if start.is_file() else [p for p in Trash.walk(start) if p.is_file()]
+        summary = {"base": base, "machine": machine.name, "checked": 0, "sent": [], "skipped": 0, "errors": [], "literal_bytes": 0, "copied_bytes": 0}
+        for p in local_files:
+            rel = str(p.relative_to(root))
+            summary["checked"] += 1
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            if remote_files.get(rel) == [st.st_size, int(st.st_mtime)]:
+                summary["skipped"] += 1
+                continue
+            if dry_run:
+                summary["sent"].append(rel)
+                continue
+            try:
+                res = SyncService.push_file(machine, base, p, rel, timeout=timeout)
+                summary["sent"].append(rel)
+                summary["literal_bytes"] += res.get("literal_bytes", 0)
+                summary["copied_bytes"] += res.get("copied_bytes", 0)
+            except Exception as E:
+                logger.error("[ERROR] Sync of %s to %s failed: %s", rel, machine.url_connect, E)
+                summary["errors"].append({"path": rel, "error": str(E)})
+        return summary
@@ -2,6 +2,7 @@ from fastapi import APIRouter
 from fastapi.responses import HTMLResponse
 from data import data
 from models.GlobalPaths import GlobalPaths
+from Services.Net.GlobalPathsRefresher import GlobalPathsRefresher
 import os
 import sys
 from pathlib import Path
@@ -102,9 +103,19 @@ class WebService:
     # ─── Utilitários ────────────────────────────────────────────
     
     @routerWeb.get("/global_paths")
-    def list_global_paths():
-        """Lista as global_paths (registered global paths) disponíveis"""
+    def list_global_paths(refresh: bool = False):
+        """Lista as global_paths (registered global paths) disponíveis.
+
+        Servido a partir do snapshot mantido em segundo plano (ver
+        `/api/global_paths/status`); `refresh=true` força uma nova consulta às máquinas,
+        no máximo uma a cada `GlobalPathsRefresher.MIN_REFRESH` segundos.
+        """
         try:
+            if refresh:
+                snap = GlobalPathsRefresher.refresh(min_age=GlobalPathsRefresher.MIN_REFRESH)
+            else:
+                snap = GlobalPathsRefresher.snapshot()
+
             # Primary: API-friendly flat view (uses remote machines)
             try:
                 flat = data.get_global_paths_for_api()
@@ -128,23 +139,39 @@ class WebService:
             except Exception:
                 legacy = {}
 
-            # Structured `entries` field: build from mapping when available
+            # Structured `entries` field, from the same snapshot
             try:
-                # ensure GLOBAL_PATHS mapping is populated for structured representation
-                try:
-                    data.load_global_paths()
-                except Exception:
-                    pass
-                gp = GlobalPaths.from_mapping(data.GLOBAL_PATHS or {})
+                gp = GlobalPaths.from_mapping(snap.as_lists())
                 entries = gp.to_primitive()
             except Exception:
                 entries = {}
 
-            return {"legacy": legacy, "entries": entries, "flat": flat}
+            age = snap.age()
+            return {
+                "legacy": legacy,
+                "entries": entries,
+                "flat": flat,
+                "snapshot": {"generation": snap.generation, "age_seconds": round(age, 2) if age is not None else None},
+            }
         except Exception as e:
             # Retorna JSON com erro para evitar resposta HTML que quebra o parse no frontend
             return {"error": f"failed to list global_paths: {str(e)}"}
 
+    @routerWeb.get("/global_paths/status")
+    def global_paths_status():
+        """Idade do snapshot de global_paths e resultado da última consulta a cada máquina"""
+        snap = GlobalPathsRefresher.snapshot()
+        return {
+            **snap.status(),
+            "interval": GlobalPathsRefresher.INTERVAL,
+            "jitter": GlobalPathsRefresher.JITTER,
+        }
+
+    @routerWeb.get("/global_paths/local")
+    def local_global_paths():
+        """Bases locais deste nó (usado pelas outras máquinas para montar o mapa global)"""
+        return GlobalPathsRefresher.local_bases()
+
     @routerWeb.get("/machines")
     def list_machines():
         """Lista as máquinas conhecidas (MAC, nome, interface, vendor, etc)"""
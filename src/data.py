@@ -5,7 +5,7 @@ from pathlib import Path
 from models.Machine import Machine
 from Repository.Machines.MachineRepository import MachineRepository
 from Services.AppsServices.AppService import AppService
-import requests
+from Services.Net.GlobalPathsRefresher import GlobalPathsRefresher
 import logging
 
 logger = logging.getLogger("server.data")
@@ -125,71 +125,17 @@ class data:
 
     @classmethod
     def load_global_paths(cls, timeout: int = 5) -> Dict[str, Any]:
-        """Populate `GLOBAL_PATHS` by merging local MACHINE_BASES/BASES with
-        bases reported by known machines (via their `/api/global_paths` endpoint).
-
-        Rules:
-        - Ensure machines are loaded first.
-        - Start from the local source (MachineService.MACHINE_BASES or `cls.BASES`).
-        - For each machine with `url_connect`, request `/api/global_paths` and
-          for any base key reported by the machine, add the `Machine` instance
-          to that base's entries (so remote bases are represented by the
-          corresponding `Machine` object in `GLOBAL_PATHS`).
-        - Return the merged mapping and set `cls.GLOBAL_PATHS`.
+        """Refresh `GLOBAL_PATHS` now by merging local MACHINE_BASES/BASES with
+        the bases reported by known machines, and return it.
+
+        The merge itself lives in `GlobalPathsRefresher`, which normally runs
+        it in the background; use this only when a caller really needs a
+        fresh view (it queries every machine). Readers should prefer
+        `GLOBAL_PATHS` or `get_global_paths_for_api()`, which serve the last
+        snapshot without touching the network. `timeout` is kept for
+        compatibility; the per-machine timeout is QUITTO_GLOBAL_PATHS_TIMEOUT.
         """
-        try:
-            cls.load_machines()
-        except Exception:
-            logger.debug("load_machines failed while loading global paths", exc_info=True)
-
-        # Start from existing SOURCE_BASES if available (like resolve_bases does)
-        try:
-            import Services.MachineService.MachineService as ms_mod
-            if hasattr(ms_mod, 'MACHINE_BASES'):
-                source = dict(getattr(ms_mod, 'MACHINE_BASES') or {})
-            elif hasattr(ms_mod, 'MachineService') and hasattr(ms_mod.MachineService, 'MACHINE_BASES'):
-                source = dict(ms_mod.MachineService.MACHINE_BASES or {})
-            else:
-                source = dict(cls.BASES or {})
-        except Exception:
-            source = dict(cls.BASES or {})
-
-        merged = {}
-        # Normalize source into lists
-        for k, v in source.items():
-            merged[k] = v if isinstance(v, list) else [v]
-
-        # Query each known machine for its reported global_paths and merge
-        for m in cls.MACHINES:
-            try:
-                url_connect = getattr(m, 'url_connect', None)
-                if not url_connect:
-                    continue
-                resp = requests.get(str(url_connect).rstrip('/') + '/files/global_paths', timeout=timeout)
-                if not resp.ok:
-                    continue
-                j = resp.json()
-                if not isinstance(j, dict):
-                    continue
-                for key in j.keys():
-                    # add machine object as an entry for this base
-                    if key not in merged:
-                        merged[key] = []
-                    # avoid duplicates
-                    if m not in merged[key]:
-                        merged[key].append(m)
-            except requests.RequestException as E:
-                logger.debug("Failed to fetch global_paths from %s: %s", getattr(m, 'url_connect', None), E)
-                continue
-            except Exception as E:
-                logger.exception("Unexpected error merging global_paths from machine %s", getattr(m, 'url_connect', None))
-
-        # store and return
-        try:
-            cls.GLOBAL_PATHS = merged or {}
-        except Exception:
-            cls.GLOBAL_PATHS = {}
-
+        GlobalPathsRefresher.refresh()
         return cls.GLOBAL_PATHS
 
     @classmethod
@@ -203,22 +149,18 @@ class data:
           references a remote `Machine`. For local `Path` entries `machine`
           will be a small stub with `id=1` and `name='local'`.
 
-        This method calls `load_global_paths()` (which already queries
-        known machines) and then normalizes the mixed-type entries into
-        plain dicts so API handlers can easily serialize the result.
+        Entries come from the current `GlobalPathsRefresher` snapshot (built
+        in the background), so this never blocks on remote machines except
+        for the very first call, which builds the initial snapshot. The
+        mixed-type entries are normalized into plain dicts so API handlers
+        can easily serialize the result.
         """
-        merged = cls.load_global_paths(timeout=timeout) or {}
-        # Ensure the class-level GLOBAL_PATHS reflects the merged mapping
-        try:
-            cls.GLOBAL_PATHS = merged or {}
-        except Exception:
-            # non-fatal: leave GLOBAL_PATHS as-is
-            pass
+        merged = GlobalPathsRefresher.snapshot().mapping
         out: List[Dict[str, Any]] = []
 
         for base_name, entries in merged.items():
-            # ensure list
-            if not isinstance(entries, list):
+            # ensure sequence
+            if not isinstance(entries, (list, tuple)):
                 entries = [entries]
 
             for entry in entries:
@@ -7,6 +7,7 @@ import asyncio
 import logging
 import os
 from starlette.middleware.sessions import SessionMiddleware
+from Services.Net.NodeCodec import NodeCodec
 # Rate limiter integration removed; no LimitService dependency
 
 data_local = data()
@@ -35,6 +36,9 @@ app.add_middleware(
     secret_key=os.getenv("SECRET_KEY")
 )
 
+# Compact msgpack/zstd answers for other Quitto nodes that ask for them (JSON for everyone else)
+app.middleware("http")(NodeCodec.middleware)
+
 @app.middleware("http")
 async def pass_through_middleware(request: Request, call_next):
     # Log requests and responses to help diagnose redirect loops
@@ -59,6 +63,16 @@ async def startup():
         await tool.add_path_modules(data_local)
         await tool.add_rotes(app)
 
+        # Resume persisted background jobs (handlers are registered by FileService imports)
+        from Services.Jobs.JobManager import JobManager
+        JobManager.start()
+        from Services.Files.Trash import Trash
+        Trash.start()
+        from Services.Net.GlobalPathsRefresher import GlobalPathsRefresher
+        GlobalPathsRefresher.start()
+        from Services.Files.ShadowIndex import ShadowIndex
+        ShadowIndex.start()
+
         if data_local.Debug:
             await tool.verify_modules()
     except Exception as E:
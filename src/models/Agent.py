@@ -225,6 +225,22 @@ class Agent:
         "safe": False,
         "example": "POST /mcp/tools/read_file_with_path {\"path\":\"/var/log/syslog\"}"
     },
+    {
+        "name": "read_files",
+        "description_en": "Read many files from registered bases in a single call. Reads run in parallel under a total byte budget; each item returns its own content or error.",
+        "access": {"endpoint": "/mcp/tools/read_files", "method": "POST", "content_type": "application/json", "auth": "session"},
+        "run_instructions_en": "POST JSON to /mcp/tools/read_files with {\"items\": [{\"base\": \"projects\", \"path\": \"app/main.py\", \"range\": {\"offset\": 0, \"length\": 4096}}], \"max_bytes\": 1048576}. 'range' is optional. Prefer this over many read_file calls when gathering context.",
+        "version": "1.0",
+        "parameters": [
+            {"name": "items", "type": "array", "description_en": "List of {base, path, range?} objects; range is {offset, length} or [start, end] in bytes"},
+            {"name": "max_bytes", "type": "int", "description_en": "Total byte budget for the whole batch (default and cap 16 MiB)"}
+        ],
+        "returns": {"type": "object", "schema": {"results": "array of {index, base, path, ok, content | error}", "bytes_read": "int"}},
+        "required_roles": ["executor", "memory"],
+        "side_effect": False,
+        "safe": True,
+        "example": "POST /mcp/tools/read_files {\"items\": [{\"base\": \"ai\", \"path\": \"log.txt\"}, {\"base\": \"projects\", \"path\": \"README.md\"}]}"
+    },
     {
         "name": "search_bases",
         "description_en": "Search for a filename across registered bases or inside a specific base using the MCP search endpoint.",
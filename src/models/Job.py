@@ -0,0 +1,61 @@
+from dataclasses import dataclass, field, asdict
+from typing import Optional, Dict, Any
+import time
+import uuid
+
+
+class JobCancelled(Exception):
+    """Raised inside a job handler when cancellation was requested."""
+
+
+@dataclass
+class Job:
+    kind: str                                   # "copy", "move", "rmtree", "archive", "hash", ...
+    params: Dict[str, Any] = field(default_factory=dict)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = "queued"                      # queued, running, done, failed, cancelled, interrupted
+    bytes_total: int = 0
+    bytes_done: int = 0
+    items_total: int = 0
+    items_done: int = 0
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    cancel_requested: bool = False
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    FINISHED = ("done", "failed", "cancelled", "interrupted")
+
+    def is_finished(self) -> bool:
+        return self.status in self.FINISHED
+
+    def check_cancelled(self) -> None:
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def add_bytes(self, n: int) -> None:
+        """Progress callback for handlers; doubles as a cancellation point."""
+        self.bytes_done += n
+        self.check_cancelled()
+
+    def add_items(self, n: int = 1) -> None:
+        self.items_done += n
+        self.check_cancelled()
+
+    def progress(self) -> float:
+        if self.bytes_total:
+            return round(min(1.0, self.bytes_done / self.bytes_total), 4)
+        if self.items_total:
+            return round(min(1.0, self.items_done / self.items_total), 4)
+        return 1.0 if self.status == "done" else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        d = asdict(self)
+        d["progress"] = self.progress()
+        return d
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any]) -> "Job":
+        known = {k: v for k, v in d.items() if k in cls.__dataclass_fields__}
+        return cls(**known)
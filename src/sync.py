@@ -0,0 +1,61 @@
+"""Trigger a delta sync of a local base to another Quitto node.
+
+Usage:
+    python sync.py --base obsidian --machine-id 2
+    python sync.py --base projects --path MyApp --machine-name desktop --dry-run
+    python sync.py --base projects --url http://100.64.0.2:3333
+"""
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.resolve()))
+
+from dotenv import load_dotenv
+from data import data
+from models.Machine import Machine
+from Services.Files.FilesTools import FilesTools
+from Services.Sync.SyncService import SyncService
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Delta-sync a base path to another Quitto node")
+    parser.add_argument("--base", required=True, help="Base key from GLOBAL_PATHS (e.g. obsidian)")
+    parser.add_argument("--path", default="", help="Optional sub-path inside the base")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--machine-id", type=int, help="Destination machine id")
+    target.add_argument("--machine-name", help="Destination machine name")
+    target.add_argument("--url", help="Destination url_connect (skips the machine lookup)")
+    parser.add_argument("--dry-run", action="store_true", help="Only list files that would be sent")
+    parser.add_argument("--timeout", type=int, default=60)
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+
+    data.load_machines()
+    if args.url:
+        machine = Machine(address="00:00:00:00:00:00", name=args.url, url_connect=args.url)
+    elif args.machine_id is not None:
+        machine = FilesTools.resolve_machine(machine_id=args.machine_id)
+    else:
+        machine = data.getMachineByName(args.machine_name)
+
+    if not machine or not getattr(machine, "url_connect", None):
+        print("Machine not found or without url_connect", file=sys.stderr)
+        return 2
+
+    try:
+        summary = SyncService.push_base(machine, args.base, args.path, dry_run=args.dry_run, timeout=args.timeout)
+    except ValueError as E:
+        print(f"Error: {E}", file=sys.stderr)
+        return 2
+
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
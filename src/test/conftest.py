@@ -0,0 +1,18 @@
+import sys
+from pathlib import Path
+
+# make project root importable so absolute imports like `from data import data` work
+sys.path.insert(0, str(Path(__file__).parent.parent.resolve()))
+
+import pytest
+
+
+@pytest.fixture
+def trash(tmp_path, monkeypatch):
+    """A trash inside `tmp_path`, without the purger thread or the on-disk registry."""
+    from Services.Files.Trash import Trash
+    t = tmp_path / Trash.DIRNAME
+    assert Trash._usable(t)
+    monkeypatch.setattr(Trash, "trash_for", staticmethod(lambda path: t))
+    monkeypatch.setattr(Trash, "start", staticmethod(lambda: None))
+    return t
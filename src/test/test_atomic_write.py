@@ -0,0 +1,107 @@
+import pytest
+
+from Services.Files.AtomicWrite import AtomicFile, WriteConflict
+
+
+def temp_files(directory):
+    return [p.name for p in directory.iterdir() if p.name.endswith(".part")]
+
+
+def test_sequential_writes_replace(tmp_path):
+    target = tmp_path / "f.txt"
+    AtomicFile.write_bytes(target, b"one")
+    AtomicFile.write_bytes(target, b"two")
+    assert target.read_bytes() == b"two"
+    assert temp_files(tmp_path) == []
+
+
+def test_overlapping_writer_gets_conflict(tmp_path):
+    target = tmp_path / "f.txt"
+    target.write_bytes(b"original")
+    first, second = AtomicFile(target), AtomicFile(target)
+    first.write(b"first")
+    second.write(b"second")
+    first.commit()
+    with pytest.raises(WriteConflict):
+        second.commit()
+    assert target.read_bytes() == b"first"
+    assert temp_files(tmp_path) == []
+
+
+def test_conflict_when_target_created_meanwhile(tmp_path):
+    target = tmp_path / "new.txt"
+    with pytest.raises(WriteConflict):
+        with AtomicFile(target) as f:
+            f.write(b"mine")
+            target.write_bytes(b"someone else")
+    assert target.read_bytes() == b"someone else"
+
+
+def test_unchecked_writer_wins(tmp_path):
+    target = tmp_path / "f.txt"
+    f = AtomicFile(target, check=False)
+    target.write_bytes(b"meanwhile")
+    f.write(b"last")
+    f.commit()
+    assert target.read_bytes() == b"last"
+
+
+def test_umask_is_read_without_changing_it(tmp_path, monkeypatch):
+    import os
+    from Services.Files import AtomicWrite as module
+    mask = os.umask(0o027)
+    os.umask(mask)
+    try:
+        os.umask(0o027)
+        if os.path.exists("/proc/self/status"):
+            monkeypatch.setattr(module.os, "umask", lambda m: pytest.fail("umask changed"))
+        assert module._current_umask() == 0o027
+        monkeypatch.undo()
+        monkeypatch.setattr(AtomicFile, "_UMASK", None)
+        AtomicFile.write_bytes(tmp_path / "new.txt", b"x")
+        assert (tmp_path / "new.txt").stat().st_mode & 0o777 == 0o640
+    finally:
+        os.umask(mask)
+
+
+def test_save_upload_commits_off_the_event_loop(tmp_path, monkeypatch):
+    import asyncio
+    import threading
+
+    class Upload:
+        def __init__(self, data):
+            self.data = data
+
+        async def read(self, n):
+            chunk, self.data = self.data[:n], self.data[n:]
+            return chunk
+
+    threads = []
+    real_commit = AtomicFile.commit
+
+    def commit(self):
+        threads.append(threading.get_ident())
+        return real_commit(self)
+    monkeypatch.setattr(AtomicFile, "commit", commit)
+
+    async def run():
+        loop_thread = threading.get_ident()
+        size = await AtomicFile.save_upload(Upload(b"abc" * 1000), tmp_path / "up.bin")
+        return size, loop_thread
+
+    size, loop_thread = asyncio.run(run())
+    assert size == 3000 and (tmp_path / "up.bin").read_bytes() == b"abc" * 1000
+    assert threads and threads[0] != loop_thread
+    assert temp_files(tmp_path) == []
+
+
+def test_failed_upload_leaves_no_temp_file(tmp_path):
+    import asyncio
+
+    class Broken:
+        async def read(self, n):
+            raise ConnectionResetError("client went away")
+
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(AtomicFile.save_upload(Broken(), tmp_path / "up.bin"))
+    assert temp_files(tmp_path) == [] and not (tmp_path / "up.bin").exists()
@@ -0,0 +1,94 @@
+import pytest
+
+from models.Job import Job
+from Services.Files.BatchOps import BatchOps
+from Services.Files.Trash import Trash
+
+
+def run(operations, atomic=False):
+    job = Job(kind="batch", params={"steps": BatchOps.plan(operations), "atomic": atomic})
+    return BatchOps.run(job)
+
+
+def trashed(trash):
+    return sorted(e["original_path"] for e in Trash._entries(trash))
+
+
+@pytest.mark.parametrize("atomic", [False, True])
+def test_delete_and_overwrite_go_to_trash(tmp_path, trash, atomic):
+    (tmp_path / "gone.txt").write_text("x")
+    (tmp_path / "src.txt").write_text("new")
+    (tmp_path / "dst.txt").write_text("old")
+    res = run([
+        {"op": "delete", "path": str(tmp_path / "gone.txt")},
+        {"op": "copy", "path": str(tmp_path / "src.txt"), "dest": str(tmp_path / "dst.txt"), "overwrite": True},
+    ], atomic)
+    assert res["ok"]
+    assert (tmp_path / "dst.txt").read_text() == "new" and not (tmp_path / "gone.txt").exists()
+    assert trashed(trash) == [str(tmp_path / "dst.txt"), str(tmp_path / "gone.txt")]
+    assert not any(p.name.startswith(BatchOps.STAGING_PREFIX) for p in tmp_path.iterdir())
+
+
+@pytest.mark.parametrize("atomic", [False, True])
+def test_permanent_steps_skip_the_trash(tmp_path, trash, atomic):
+    (tmp_path / "gone.txt").write_text("x")
+    assert run([{"op": "delete", "path": str(tmp_path / "gone.txt"), "permanent": True}], atomic)["ok"]
+    assert not (tmp_path / "gone.txt").exists() and trashed(trash) == []
+
+
+def test_atomic_failure_restores_deleted_item(tmp_path, trash):
+    (tmp_path / "keep.txt").write_text("x")
+    res = run([
+        {"op": "delete", "path": str(tmp_path / "keep.txt")},
+        {"op": "rename", "path": str(tmp_path / "missing.txt"), "new_name": "other.txt"},
+    ], atomic=True)
+    assert not res["ok"] and res["rolled_back"]
+    assert (tmp_path / "keep.txt").read_text() == "x" and trashed(trash) == []
+
+
+def _waves_by_scan(steps):
+    """Reference grouping: compare every pair of steps."""
+    def overlaps(a, b):
+        a_, b_ = a.rstrip("/") + "/", b.rstrip("/") + "/"
+        return a_.startswith(b_) or b_.startswith(a_)
+    level = []
+    for j, step in enumerate(steps):
+        lvl = 0
+        for i in range(j):
+            if any(overlaps(a, b) for a in (steps[i]["src"], steps[i]["dst"]) if a for b in (step["src"], step["dst"]) if b):
+                lvl = max(lvl, level[i] + 1)
+        level.append(lvl)
+    return level
+
+
+def test_waves_match_pairwise_overlap():
+    import random
+    rnd = random.Random(7)
+    names = ["/", "/a", "/a/b", "/a/b/c", "/a/bc", "/ab", "/x", "/x/y", "/x/y/z"]
+    steps = []
+    for i in range(400):
+        src = rnd.choice(names + [None])
+        dst = rnd.choice(names + [None]) if src else rnd.choice(names)
+        steps.append({"index": i, "src": src, "dst": dst})
+    level = {s["index"]: n for n, wave in enumerate(BatchOps.waves(steps)) for s in wave}
+    assert [level[i] for i in range(len(steps))] == _waves_by_scan(steps)
+
+
+def test_batch_wait_is_validated_and_capped(monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from Services.Files.FileService import routerFile
+    from Services.Jobs.JobManager import JobManager
+
+    app = FastAPI()
+    app.include_router(routerFile)
+    c = TestClient(app)
+    ops = [{"op": "mkdir", "path": "/nonexistent-quitto", "name": "x"}]
+    assert c.post("/files/batch", json={"operations": ops, "wait": -1}).status_code == 400
+    assert c.post("/files/batch", json={"operations": ops, "wait": "soon"}).status_code == 400
+
+    waits = []
+    monkeypatch.setattr(JobManager, "submit", staticmethod(lambda *a, **k: Job(kind="batch")))
+    monkeypatch.setattr(JobManager, "wait", staticmethod(lambda job, timeout: waits.append(timeout) or False))
+    assert c.post("/files/batch", json={"operations": ops, "wait": 3600}).status_code == 202
+    assert waits == [BatchOps.MAX_WAIT]
@@ -0,0 +1,59 @@
+import pytest
+
+from data import data
+from Services.Files.FilesTools import FilesTools
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    (tmp_path / "a.txt").write_text("a" * 100)
+    (tmp_path / "b.txt").write_text("b" * 100)
+    monkeypatch.setattr(data, "GLOBAL_PATHS", {"t": [tmp_path]})
+    return "t"
+
+
+@pytest.mark.parametrize("rng", [{"offset": 0, "length": -1}, {"offset": -5}, [-5, 10], [0, -1]])
+def test_parse_range_rejects_negatives(rng):
+    with pytest.raises(ValueError):
+        FilesTools._parse_range(rng)
+
+
+def test_parse_range_forms():
+    assert FilesTools._parse_range(None) == (0, None)
+    assert FilesTools._parse_range({"offset": 10, "length": 5}) == (10, 5)
+    assert FilesTools._parse_range([10, 25]) == (10, 15)
+    assert FilesTools._parse_range([10, 5]) == (10, 0)
+
+
+def test_negative_length_cannot_raise_budget(base):
+    res = FilesTools.read_files_batch([
+        {"base": base, "path": "a.txt", "range": {"offset": 0, "length": -1000000}},
+        {"base": base, "path": "a.txt"},
+        {"base": base, "path": "b.txt"},
+    ], max_total_bytes=150)
+    bad, first, second = res["results"]
+    assert not bad["ok"]
+    assert first["content"]["length"] == 100
+    assert second["content"]["length"] == 50
+    assert res["bytes_read"] == 150
+
+
+def test_budget_granted_in_request_order(base):
+    res = FilesTools.read_files_batch([{"base": base, "path": "a.txt"}, {"base": base, "path": "b.txt"}], max_total_bytes=100)
+    first, second = res["results"]
+    assert first["content"]["length"] == 100
+    assert not second["ok"] and second["error"] == "byte budget exhausted"
+
+
+def test_endpoint_rejects_negative_max_bytes(base):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from Services.MCP.MCPService import routerMCP
+    app = FastAPI()
+    app.include_router(routerMCP)
+    client = TestClient(app)
+    items = [{"base": base, "path": "a.txt"}]
+    r = client.post("/mcp/tools/read_files", json={"items": items, "max_bytes": -1})
+    assert r.status_code == 400 and "max_bytes" in r.json()["detail"]
+    r = client.post("/mcp/tools/read_files", json={"items": items, "max_bytes": 10})
+    assert r.status_code == 200 and r.json()["bytes_read"] == 10
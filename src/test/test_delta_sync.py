@@ -0,0 +1,119 @@
+import os
+import random
+
+import pytest
+
+from Services.Sync.DeltaSync import DeltaApplier, DeltaSync
+
+
+def _sync(src, dst, chunk=7777, mtime=None):
+    """Run one delta round trip from `src` onto `dst`, feeding the stream in odd-sized pieces."""
+    stream = b"".join(DeltaSync.delta(src, DeltaSync.signatures(dst, DeltaSync.block_size_for(src.stat().st_size))))
+    applier = DeltaApplier(dst)
+    for i in range(0, len(stream), chunk):
+        applier.feed(stream[i:i + chunk])
+    return applier.finish(mtime), len(stream)
+
+
+@pytest.fixture
+def rnd():
+    return random.Random(1234)
+
+
+def test_new_file_is_sent_as_literals(tmp_path, rnd):
+    src, dst = tmp_path / "src.bin", tmp_path / "dst.bin"
+    src.write_bytes(rnd.randbytes(100_000))
+    result, _ = _sync(src, dst, mtime=1_600_000_000)
+    assert dst.read_bytes() == src.read_bytes()
+    assert result["literal_bytes"] == 100_000 and result["copied_bytes"] == 0
+    assert int(dst.stat().st_mtime) == 1_600_000_000
+
+
+def test_small_edit_reuses_the_basis(tmp_path, rnd):
+    data = bytearray(rnd.randbytes(500_000))
+    dst = tmp_path / "dst.bin"
+    dst.write_bytes(bytes(data))
+    data[250_000:250_010] = b"X" * 10          # in-place edit
+    data[100_000:100_000] = b"inserted"        # shifts everything after it
+    del data[400_000:400_100]                  # and a removal
+    src = tmp_path / "src.bin"
+    src.write_bytes(bytes(data))
+    result, wire = _sync(src, dst)
+    assert dst.read_bytes() == bytes(data)
+    assert result["copied_bytes"] > 0.9 * len(data)
+    assert wire < 0.1 * len(data)
+
+
+def test_identical_and_empty_files(tmp_path, rnd):
+    src, dst = tmp_path / "src.bin", tmp_path / "dst.bin"
+    src.write_bytes(rnd.randbytes(10_001))     # a partial last block
+    dst.write_bytes(src.read_bytes())
+    result, _ = _sync(src, dst)
+    assert dst.read_bytes() == src.read_bytes() and result["literal_bytes"] == 0
+    src.write_bytes(b"")
+    _sync(src, dst)
+    assert dst.read_bytes() == b""
+
+
+def test_corrupt_stream_leaves_target_untouched(tmp_path, rnd):
+    src, dst = tmp_path / "src.bin", tmp_path / "dst.bin"
+    src.write_bytes(rnd.randbytes(50_000))
+    dst.write_bytes(b"old contents")
+    stream = bytearray(b"".join(DeltaSync.delta(src, DeltaSync.signatures(dst))))
+    stream[-1] ^= 0xFF                         # break the trailing SHA-256
+    applier = DeltaApplier(dst)
+    with pytest.raises(ValueError):
+        applier.feed(bytes(stream))
+    applier.abort()
+    assert dst.read_bytes() == b"old contents"
+    assert set(os.listdir(tmp_path)) == {"src.bin", "dst.bin"}
+
+
+def test_truncated_stream_is_rejected(tmp_path, rnd):
+    src, dst = tmp_path / "src.bin", tmp_path / "dst.bin"
+    src.write_bytes(rnd.randbytes(50_000))
+    stream = b"".join(DeltaSync.delta(src, DeltaSync.signatures(dst)))
+    applier = DeltaApplier(dst)
+    applier.feed(stream[:-41])
+    with pytest.raises(ValueError):
+        applier.finish()
+    assert not dst.exists()
+    assert set(os.listdir(tmp_path)) == {"src.bin"}
+
+
+@pytest.fixture(params=["numpy", "python"])
+def scan(request, monkeypatch):
+    """Run a test against both weak-hash scanners."""
+    import Services.Sync.DeltaSync as module
+    if request.param == "numpy":
+        if module.np is None:
+            pytest.skip("numpy not installed")
+    else:
+        monkeypatch.setattr(module, "np", None)
+    return request.param
+
+
+def test_weak_hits_match_adler32_of_every_window(scan, rnd):
+    import zlib
+    L = 64
+    buf = rnd.randbytes(20_000)
+    wanted = {zlib.adler32(buf[p:p + L]) for p in rnd.sample(range(len(buf) - L + 1), 40)}
+    wanted.add(zlib.adler32(buf[:L]))
+    expected = [(p, zlib.adler32(buf[p:p + L])) for p in range(100, len(buf) - L + 1) if zlib.adler32(buf[p:p + L]) in wanted]
+    hits = list(DeltaSync._weak_hits(buf, 100, len(buf) - L + 1, L, wanted, DeltaSync._low_mask(wanted)))
+    assert hits == expected
+
+
+def test_round_trip_across_buffer_refills(scan, tmp_path, rnd, monkeypatch):
+    monkeypatch.setattr(DeltaSync, "READ_CHUNK", 50_000)      # force refills mid-file
+    data = bytearray(rnd.randbytes(300_000))
+    dst = tmp_path / "dst.bin"
+    dst.write_bytes(bytes(data))
+    for at in range(10_000, 300_000, 37_000):
+        data[at:at + 3] = b"zzz"
+    data[123_456:123_456] = rnd.randbytes(999)
+    src = tmp_path / "src.bin"
+    src.write_bytes(bytes(data))
+    result, wire = _sync(src, dst)
+    assert dst.read_bytes() == bytes(data)
+    assert result["copied_bytes"] > 0.8 * len(data)
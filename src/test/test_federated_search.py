@@ -0,0 +1,81 @@
+import os
+from types import MappingProxyType
+
+import pytest
+
+from models.Machine import Machine
+from Services.Files.FederatedSearch import FederatedSearch
+from Services.Files.FilesTools import FilesTools
+from Services.Files.ShadowIndex import ShadowBase, ShadowIndex
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.NameFilter import NameFilter
+
+
+def _match(name, size=1, mtime=0.0):
+    return {"name": name, "path": name, "size_bytes": size, "modified_ts": mtime}
+
+
+def test_local_returns_the_best_matches_of_the_whole_tree(tmp_path):
+    # the largest files are not the first ones the walk meets
+    for i in range(40):
+        f = tmp_path / f"f{i:02d}.txt"
+        f.write_bytes(b"x" * i)
+        os.utime(f, (1000 + i, 1000 + i))
+    by_size = FederatedSearch.local(tmp_path, ext=".txt", sort="size", limit=3)
+    assert [m["size_bytes"] for m in by_size] == [39, 38, 37]
+    by_date = FederatedSearch.local(tmp_path, sort="date", limit=2)
+    assert [m["name"] for m in by_date] == ["f39.txt", "f38.txt"]
+    by_name = FederatedSearch.local(tmp_path, query="F0", limit=4)
+    assert [m["name"] for m in by_name] == ["f00.txt", "f01.txt", "f02.txt", "f03.txt"]
+
+
+def test_merge_interleaves_in_sort_order_and_dedupes_per_node():
+    per_node = {
+        "local": [_match("b", 30), _match("d", 10)],
+        "1": [_match("a", 40), _match("a", 40), _match("c", 20)],
+        "2": [_match("a", 40)],
+    }
+    by_name = FederatedSearch.merge(per_node, "name", 10)
+    assert [(m["node"], m["name"]) for m in by_name] == [("1", "a"), ("2", "a"), ("local", "b"), ("1", "c"), ("local", "d")]
+    by_size = FederatedSearch.merge(per_node, "size", 3)
+    assert [m["size_bytes"] for m in by_size] == [40, 40, 30]
+
+
+@pytest.fixture
+def nodes(tmp_path, monkeypatch):
+    """Three machines holding base "t": one answers, one is down with a shadow copy, one is down without."""
+    machines = [Machine(address=f"AA:BB:CC:DD:EE:4{i}", id=40 + i, name=f"m{i}", url_connect=f"http://m{i}") for i in range(3)]
+    monkeypatch.setattr(FilesTools, "base_machines", staticmethod(lambda base: machines))
+    monkeypatch.setattr(HealthRegistry, "is_available", staticmethod(lambda m: True))
+    monkeypatch.setattr(NameFilter, "_remote", {})
+    monkeypatch.setattr(ShadowIndex, "_bases", {})
+
+    def remote_json(m, route, params, timeout):
+        if m.name == "m0":
+            return {"matches": [_match("live.txt", 5)]}
+        raise OSError("host is down")
+    monkeypatch.setattr(FilesTools, "remote_json", staticmethod(remote_json))
+    key = HealthRegistry.key(machines[1])
+    ShadowIndex._bases[(key, "t")] = ShadowBase(key, "m1", "t", MappingProxyType({"old/shadow.txt": (7, 1000)}), 1234.0)
+    return machines
+
+
+def test_unreachable_nodes_fall_back_to_shadow_or_flag_partial(nodes):
+    res = FederatedSearch.search("t", None, {"query": "", "sort": "name", "limit": 10})
+    assert [m["name"] for m in res["matches"]] == ["live.txt", "shadow.txt"]
+    shadow = next(m for m in res["matches"] if m["name"] == "shadow.txt")
+    assert shadow["stale"] and shadow["snapshot_at"] == 1234.0
+    by_name = {n["name"]: n for n in res["nodes"]}
+    assert by_name["m0"]["ok"] and not by_name["m0"].get("stale")
+    assert by_name["m1"]["stale"] and by_name["m1"]["snapshot_at"] == 1234.0 and by_name["m1"]["count"] == 1
+    assert not by_name["m2"]["ok"] and not by_name["m2"].get("stale")
+    assert res["stale"] and res["partial"]
+
+
+def test_flags_follow_which_nodes_failed(nodes, monkeypatch):
+    monkeypatch.setattr(FilesTools, "base_machines", staticmethod(lambda base: nodes[:2]))
+    res = FederatedSearch.search("t", None, {"sort": "name", "limit": 10})
+    assert res["stale"] and not res["partial"]
+    monkeypatch.setattr(FilesTools, "base_machines", staticmethod(lambda base: nodes[:1]))
+    res = FederatedSearch.search("t", None, {"sort": "name", "limit": 10})
+    assert not res["stale"] and not res["partial"]
@@ -0,0 +1,42 @@
+import pytest
+
+from models.Job import Job, JobCancelled
+from Services.Files.FileJobs import FileJobs
+
+
+def _tree(root):
+    (root / "a" / "b").mkdir(parents=True)
+    (root / "a" / "b" / "f1").write_text("1")
+    (root / "a" / "f2").write_text("2")
+    (root / "f3").write_text("3")
+    return 5                                  # a, a/b, f1, f2, f3
+
+
+def test_rmtree_reports_items_total(tmp_path):
+    target = tmp_path / "t"
+    entries = _tree(target)
+    job = Job(kind="rmtree", params={"path": str(target)})
+    result = FileJobs.rmtree(job)
+    assert not target.exists()
+    assert job.items_total == job.items_done == entries + 1
+    assert result == {"deleted": str(target), "items": entries + 1}
+    assert job.progress() == 1.0
+
+
+def test_rmtree_total_is_known_before_deleting(tmp_path, monkeypatch):
+    target = tmp_path / "t"
+    entries = _tree(target)
+    job = Job(kind="rmtree", params={"path": str(target)})
+    seen = []
+    real = Job.add_items
+
+    def add_items(self, n=1):
+        seen.append(self.items_total)
+        if len(seen) == 2:
+            self.cancel_requested = True
+        real(self, n)
+    monkeypatch.setattr(Job, "add_items", add_items)
+    with pytest.raises(JobCancelled):
+        FileJobs.rmtree(job)
+    assert seen == [entries + 1, entries + 1]
+    assert 0 < job.progress() < 1
@@ -0,0 +1,77 @@
+import errno
+
+import pytest
+
+from Services.Files.FileOps import FileOps
+
+
+def leftovers(directory):
+    return sorted(p.name for p in directory.iterdir() if p.name.startswith("."))
+
+
+def test_replace_copy_swaps_in_new_file(tmp_path):
+    src, dst = tmp_path / "src.txt", tmp_path / "dst.txt"
+    src.write_text("new")
+    dst.write_text("old")
+    assert FileOps.replace("copy", src, dst) == "copy"
+    assert dst.read_text() == "new" and src.read_text() == "new"
+    assert leftovers(tmp_path) == []
+
+
+def test_replace_move_over_directory(tmp_path):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.mkdir()
+    (src / "a").write_text("new")
+    dst.mkdir()
+    (dst / "b").write_text("old")
+    FileOps.replace("move", src, dst)
+    assert not src.exists()
+    assert [p.name for p in dst.iterdir()] == ["a"]
+    assert leftovers(tmp_path) == []
+
+
+def test_failed_copy_keeps_destination(tmp_path, monkeypatch):
+    src, dst = tmp_path / "src", tmp_path / "dst"
+    src.mkdir()
+    (src / "a").write_text("1")
+    (src / "b").write_text("2")
+    dst.mkdir()
+    (dst / "keep").write_text("old")
+    calls = []
+
+    def copy_file(s, d, progress=None):
+        calls.append(s)
+        if len(calls) == 2:
+            raise OSError(errno.ENOSPC, "No space left on device")
+        d.write_bytes(s.read_bytes())
+
+    monkeypatch.setattr(FileOps, "copy_file", staticmethod(copy_file))
+    with pytest.raises(OSError):
+        FileOps.replace("copy", src, dst)
+    assert (dst / "keep").read_text() == "old"
+    assert leftovers(tmp_path) == []
+
+
+def test_retire_receives_old_destination(tmp_path):
+    src, dst = tmp_path / "src.txt", tmp_path / "dst.txt"
+    src.write_text("new")
+    dst.write_text("old")
+    retired = []
+    FileOps.replace("move", src, dst, retire=lambda p: retired.append(p.read_text()) or p.unlink())
+    assert retired == ["old"] and dst.read_text() == "new"
+
+
+def test_userspace_copy_handles_short_writes(tmp_path, monkeypatch):
+    import os
+    src, dst = tmp_path / "src.bin", tmp_path / "dst.bin"
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    src.write_bytes(data)
+    monkeypatch.delattr(os, "copy_file_range", raising=False)
+    monkeypatch.delattr(os, "sendfile", raising=False)
+    real_write = os.write
+    monkeypatch.setattr(os, "write", lambda fd, buf: real_write(fd, buf[:4096]))
+    progress = []
+    FileOps.copy_file(src, dst, progress.append)
+    monkeypatch.undo()
+    assert dst.read_bytes() == data
+    assert sum(progress) == len(data)
@@ -0,0 +1,66 @@
+import codecs
+from collections import OrderedDict
+
+import pytest
+
+from Services.Files.FileSniffer import FileSniffer
+
+
+def _verdict(head):
+    v = FileSniffer.sniff_bytes(head)
+    return v["kind"], v["encoding"], v["reason"]
+
+
+@pytest.mark.parametrize("bom,codec,encoding", [
+    (codecs.BOM_UTF8, "utf-8", "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16-le", "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16-be", "utf-16"),
+    (codecs.BOM_UTF32_LE, "utf-32-le", "utf-32"),   # starts with the UTF-16-LE BOM too
+])
+def test_bom_decides_the_encoding(bom, codec, encoding):
+    assert _verdict(bom + "olá".encode(codec)) == ("text", encoding, "bom")
+
+
+def test_utf16_without_bom():
+    assert _verdict("hello, world\n".encode("utf-16-le")) == ("text", "utf-16-le", "utf16-heuristic")
+    assert _verdict("hello, world\n".encode("utf-16-be")) == ("text", "utf-16-be", "utf16-heuristic")
+    assert _verdict(b"ab\x00\x00cd\x00\x01" * 8) == ("binary", None, "nul-bytes")
+
+
+def test_magic_wins_over_text_looking_bytes():
+    v = FileSniffer.sniff_bytes(b"%PDF-1.7\n%plain enough\n")
+    assert v["kind"] == "binary" and v["mime"] == "application/pdf"
+
+
+def test_control_byte_ratio():
+    text = b"line\twith\ttabs\r\n" * 10 + b"\x1b[31mred\x1b[0m\n"
+    assert _verdict(text) == ("text", "utf-8", "utf-8")
+    assert _verdict(b"abcdefgh\x01\x02") == ("binary", None, "control-bytes")
+    assert _verdict(b"abcdefghij\x01")[0] == "text"          # 1 in 11 is under the 10% limit
+
+
+def test_utf8_cut_at_the_sniff_boundary_is_still_utf8():
+    head = ("ação" * 10).encode("utf-8")[:-2]                  # ends in the first byte of "ã"
+    assert _verdict(head) == ("text", "utf-8", "utf-8")
+    assert _verdict(b"ok \xff ok")[1] != "utf-8"
+
+
+def test_latin1_accepts_accented_text_and_rejects_noise():
+    assert _verdict("Açúcar, pão e café com leite".encode("latin-1")) == ("text", "latin-1", "latin-1-heuristic")
+    assert _verdict(bytes(range(0x80, 0x100)) * 2) == ("binary", None, "undecodable")
+    assert _verdict(b"abc \x85\x86\x87\x88 def ghi jkl mno pqr") == ("binary", None, "undecodable")  # C1 range
+
+
+def test_sniff_caches_until_the_file_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(FileSniffer, "_cache", OrderedDict())
+    p = tmp_path / "f.txt"
+    p.write_text("plain text\n")
+    calls = []
+    real = FileSniffer.sniff_bytes
+    monkeypatch.setattr(FileSniffer, "sniff_bytes", staticmethod(lambda head: calls.append(head) or real(head)))
+    assert FileSniffer.sniff(p)["kind"] == "text"
+    assert FileSniffer.sniff(p)["kind"] == "text"
+    assert len(calls) == 1
+    p.write_bytes(b"\x00\x01\x02binary")
+    assert FileSniffer.sniff(p)["kind"] == "binary"
+    assert len(calls) == 2
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from data import data
+from models.Machine import Machine
+from Services.Files import FilesTools as tools_module
+from Services.Files.FilesTools import FilesTools
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.NodeClient import NodeClient
+from Services.Net.ReplicaSelector import ReplicaSelector
+
+ROUTE = "/files/browse"
+
+
+@pytest.fixture
+def nodes(monkeypatch):
+    """Three machines answering after `delays[name]` seconds (failing when listed in `fail`)."""
+    monkeypatch.setattr(ReplicaSelector, "_routes", {})
+    monkeypatch.setattr(HealthRegistry, "_machines", {})
+    machines = [Machine(address=f"AA:BB:CC:DD:EE:0{i}", id=i, name=n, url_connect=f"http://{n}")
+                for i, n in enumerate("abc", 1)]
+    monkeypatch.setattr(data, "MACHINES", machines, raising=False)
+    state = {"delays": dict.fromkeys("abc", 0.0), "fail": set(), "asked": [], "cancelled": []}
+
+    async def aget(url, params=None, **kwargs):
+        name = url.split("//")[1].split("/")[0]
+        state["asked"].append(name)
+        try:
+            await asyncio.sleep(state["delays"][name])
+        except asyncio.CancelledError:
+            state["cancelled"].append(name)
+            raise
+        if name in state["fail"]:
+            raise httpx.ConnectError(name)
+        return httpx.Response(200, json={"from": name})
+    monkeypatch.setattr(NodeClient, "aget", staticmethod(aget))
+    return machines, state
+
+
+def _forward(base="t", prefer=None):
+    return FilesTools.forward_to_machines(ROUTE, {}, timeout=5, prefer=prefer, cache=False, base=base)
+
+
+def test_unlisted_base_asks_every_machine_at_once(nodes, monkeypatch):
+    machines, state = nodes
+    monkeypatch.setattr(FilesTools, "base_machines", staticmethod(lambda base: []))
+    state["delays"].update(a=0.3, b=0.05, c=0.3)
+    t0 = time.perf_counter()
+    assert _forward() == {"from": "b"}
+    assert time.perf_counter() - t0 < 0.25
+    assert sorted(state["asked"]) == ["a", "b", "c"]
+    assert sorted(state["cancelled"]) == ["a", "c"]
+
+
+def test_listed_base_goes_through_the_replica_selector(nodes, monkeypatch):
+    machines, state = nodes
+    monkeypatch.setattr(FilesTools, "base_machines", staticmethod(lambda base: machines[:2]))
+    assert _forward()["from"] in ("a", "b")
+    assert len(state["asked"]) == 1
+
+
+def test_preferred_machine_within_the_grace_window_wins(nodes, monkeypatch):
+    machines, state = nodes
+    monkeypatch.setattr(FilesTools, "base_machines", staticmethod(lambda base: []))
+    monkeypatch.setattr(tools_module, "FORWARD_PREFER_GRACE", 0.3)
+    state["delays"].update(a=0.1, b=0.0, c=1.0)
+    assert _forward(prefer=machines[0]) == {"from": "a"}
+    assert state["cancelled"] == ["c"]
+
+
+def test_preferred_machine_past_the_grace_window_loses(nodes, monkeypatch):
+    machines, state = nodes
+    monkeypatch.setattr(FilesTools, "base_machines", staticmethod(lambda base: []))
+    monkeypatch.setattr(tools_module, "FORWARD_PREFER_GRACE", 0.05)
+    state["delays"].update(a=1.0, b=0.0, c=1.0)
+    t0 = time.perf_counter()
+    assert _forward(prefer=machines[0]) == {"from": "b"}
+    assert time.perf_counter() - t0 < 0.5
+    assert sorted(state["cancelled"]) == ["a", "c"]
+
+
+def test_failing_preferred_machine_hands_over_to_the_winner(nodes, monkeypatch):
+    machines, state = nodes
+    monkeypatch.setattr(FilesTools, "base_machines", staticmethod(lambda base: []))
+    monkeypatch.setattr(tools_module, "FORWARD_PREFER_GRACE", 5.0)
+    state["delays"].update(a=0.1, b=0.0, c=1.0)
+    state["fail"].add("a")
+    t0 = time.perf_counter()
+    assert _forward(prefer=machines[0]) == {"from": "b"}
+    assert time.perf_counter() - t0 < 0.5
+
+
+def test_every_machine_failing_returns_none(nodes, monkeypatch):
+    machines, state = nodes
+    monkeypatch.setattr(FilesTools, "base_machines", staticmethod(lambda base: []))
+    state["fail"].update("abc")
+    assert _forward(base=None) is None
+    assert sorted(state["asked"]) == ["a", "b", "c"]
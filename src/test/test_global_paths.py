@@ -0,0 +1,89 @@
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from data import data
+from models.Machine import Machine
+from Services.Net.GlobalPathsRefresher import GlobalPathsRefresher, GlobalPathsSnapshot
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.NodeClient import NodeClient
+from Services.WebService import routerWeb
+
+
+@pytest.fixture
+def cluster(monkeypatch, tmp_path):
+    """Two machines whose /api/global_paths/local answers come from `bases` (an Exception value is raised instead)."""
+    monkeypatch.setattr(GlobalPathsRefresher, "_snapshot", GlobalPathsSnapshot())
+    monkeypatch.setattr(GlobalPathsRefresher, "start", staticmethod(lambda: None))
+    monkeypatch.setattr(GlobalPathsRefresher, "local_source", staticmethod(lambda: {"home": [tmp_path]}))
+    monkeypatch.setattr(HealthRegistry, "_machines", {})
+    monkeypatch.setattr(data, "load_machines", lambda: None)
+    monkeypatch.setattr(data, "GLOBAL_PATHS", {})
+    a = Machine(address="AA:BB:CC:DD:EE:01", id=1, name="a", url_connect="http://a")
+    b = Machine(address="AA:BB:CC:DD:EE:02", id=2, name="b", url_connect="http://b")
+    monkeypatch.setattr(data, "MACHINES", [a, b])
+    bases = {"a": {"docs": ["/srv/docs"]}, "b": {"music": ["/srv/music"]}}
+    asked = []
+
+    async def aget(url, **kwargs):
+        name = url.split("//")[1].split("/")[0]
+        asked.append(name)
+        answer = bases[name]
+        if isinstance(answer, Exception):
+            raise answer
+        return httpx.Response(200, json=answer)
+    monkeypatch.setattr(NodeClient, "aget", staticmethod(aget))
+    return a, b, bases, asked
+
+
+def test_refresh_swaps_in_a_new_read_only_snapshot(cluster, tmp_path):
+    a, b, bases, asked = cluster
+    first = GlobalPathsRefresher.refresh()
+    assert first.generation == 1
+    assert dict(first.mapping) == {"home": (tmp_path,), "docs": (a,), "music": (b,)}
+    assert data.GLOBAL_PATHS == {"home": [tmp_path], "docs": [a], "music": [b]}
+    with pytest.raises(TypeError):
+        first.mapping["docs"] = ()
+
+    bases["b"] = {"music": [], "video": []}
+    second = GlobalPathsRefresher.refresh()
+    assert second.generation == 2 and GlobalPathsRefresher.snapshot() is second
+    assert second.mapping["video"] == (b,)
+    assert "video" not in first.mapping                           # readers of the old snapshot are unaffected
+
+
+def test_failed_machine_keeps_its_last_known_bases(cluster):
+    a, b, bases, asked = cluster
+    GlobalPathsRefresher.refresh()
+    bases["b"] = httpx.ConnectError("b is down")
+    snap = GlobalPathsRefresher.refresh()
+    assert snap.mapping["music"] == (b,)
+
+    status = snap.status()
+    assert status["generation"] == 2 and status["bases"] == 3
+    b_status = status["machines"][HealthRegistry.key(b)]
+    assert b_status["ok"] is False and b_status["bases"] == ["music"]
+    assert "b is down" in b_status["error"] and b_status["last_success_at"] is not None
+    assert status["machines"][HealthRegistry.key(a)]["ok"] is True
+
+
+def test_refresh_with_min_age_reuses_a_young_snapshot(cluster):
+    a, b, bases, asked = cluster
+    first = GlobalPathsRefresher.refresh()
+    asked.clear()
+    assert GlobalPathsRefresher.refresh(min_age=60) is first
+    assert asked == []
+    assert GlobalPathsRefresher.refresh(min_age=0).generation == 2
+    assert sorted(asked) == ["a", "b"]
+
+
+def test_refresh_query_param_is_rate_limited(cluster, monkeypatch):
+    a, b, bases, asked = cluster
+    monkeypatch.setattr(GlobalPathsRefresher, "MIN_REFRESH", 60.0)
+    app = FastAPI()
+    app.include_router(routerWeb)
+    client = TestClient(app)
+    for _ in range(3):
+        assert client.get("/api/global_paths", params={"refresh": "true"}).json()["snapshot"]["generation"] == 1
+    assert sorted(asked) == ["a", "b"]
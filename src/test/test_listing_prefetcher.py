@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from models.Machine import Machine
+from Services.Files.FilesTools import FilesTools
+from Services.Files.ListingPrefetcher import ListingPrefetcher
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.NodeClient import NodeClient
+from Services.Net.ResponseCache import ResponseCache
+
+ROUTE = "/files/browse/docs"
+
+
+@pytest.fixture
+def prefetcher(monkeypatch):
+    monkeypatch.setattr(ResponseCache, "_entries", OrderedDict())
+    monkeypatch.setattr(ResponseCache, "_bytes", 0)
+    monkeypatch.setattr(ResponseCache, "_stats", dict.fromkeys(ResponseCache._stats, 0))
+    monkeypatch.setattr(HealthRegistry, "_machines", {})
+    monkeypatch.setattr(ListingPrefetcher, "_buckets", {})
+    monkeypatch.setattr(ListingPrefetcher, "_pending", set())
+    monkeypatch.setattr(ListingPrefetcher, "_stats", dict.fromkeys(ListingPrefetcher._stats, 0))
+    monkeypatch.setattr(ListingPrefetcher, "DIRS", 3)
+    monkeypatch.setattr(ListingPrefetcher, "BUDGET", 2.0)
+    monkeypatch.setattr(ListingPrefetcher, "WINDOW", 60.0)
+    # run prefetches inline so the test can look at the cache right after schedule()
+    monkeypatch.setattr(ListingPrefetcher, "_pool", SimpleNamespace(submit=lambda fn, *args: fn(*args)))
+    machine = Machine(address="AA:BB:CC:DD:EE:01", id=1, name="peer", url_connect="http://peer")
+    fetched = []
+
+    def get(url, params=None, **kwargs):
+        fetched.append(params["path"])
+        return httpx.Response(200, json={"items": [], "path": params["path"]}, request=httpx.Request("GET", url))
+    monkeypatch.setattr(NodeClient, "get", staticmethod(get))
+    return machine, fetched
+
+
+def _listing(*dirs):
+    return {"items": [{"type": "dir", "path": d} for d in dirs] + [{"type": "file", "path": "readme.txt"}]}
+
+
+def test_budget_limits_prefetches_per_session(prefetcher):
+    machine, fetched = prefetcher
+    assert ListingPrefetcher.schedule("user:1", "docs", _listing("a", "b", "c"), machine) == 2
+    assert fetched == ["a", "b"]
+    assert ListingPrefetcher.stats()["over_budget"] == 1
+    # another session has a budget of its own
+    assert ListingPrefetcher.schedule("user:2", "docs", _listing("c"), machine) == 1
+
+    # the bucket refills at BUDGET per WINDOW
+    ListingPrefetcher._buckets["user:1"][1] -= 30
+    assert ListingPrefetcher.schedule("user:1", "docs", _listing("d", "e", "f"), machine) == 1
+
+
+def test_fresh_listings_are_skipped_without_spending_a_token(prefetcher):
+    machine, fetched = prefetcher
+    FilesTools.remote_json(machine, ROUTE, {"path": "a"})
+    FilesTools.remote_json(machine, ROUTE, {"path": "b"})
+    fetched.clear()
+    assert ListingPrefetcher.schedule("user:1", "docs", _listing("a", "b", "c"), machine) == 1
+    assert fetched == ["c"]
+    stats = ListingPrefetcher.stats()
+    assert stats["already_cached"] == 2 and stats["over_budget"] == 0
+    assert ListingPrefetcher._buckets["user:1"][0] == pytest.approx(1.0, abs=0.01)
+
+
+def test_prefetch_lands_under_the_key_of_the_next_click(prefetcher):
+    machine, fetched = prefetcher
+    ListingPrefetcher.schedule("user:1", "docs", _listing("a"), machine)
+    assert fetched == ["a"]
+    # browse_directory's call for the click on "a" is answered from the cache
+    assert FilesTools.remote_json(machine, ROUTE, {"path": "a"}) == {"items": [], "path": "a"}
+    assert fetched == ["a"]
+    assert ResponseCache.is_fresh(HealthRegistry.key(machine), ROUTE, {"path": "a"})
+    assert ListingPrefetcher.stats()["fetched"] == 1 and ListingPrefetcher.stats()["pending"] == 0
+
+
+def test_unavailable_machine_is_not_prefetched(prefetcher, monkeypatch):
+    machine, fetched = prefetcher
+    monkeypatch.setattr(HealthRegistry, "is_available", staticmethod(lambda m: False))
+    assert ListingPrefetcher.schedule("user:1", "docs", _listing("a"), machine) == 0
+    assert fetched == []
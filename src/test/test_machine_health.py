@@ -0,0 +1,97 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from Services.Net import MachineHealth as health_module
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.NodeClient import NodeClient
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fresh registry with a hand-driven clock (FAILURES=3, COOLDOWN=10, MAX_COOLDOWN=35)."""
+    now = SimpleNamespace(t=1000.0)
+    monkeypatch.setattr(health_module.time, "time", lambda: now.t)
+    monkeypatch.setattr(HealthRegistry, "_machines", {})
+    monkeypatch.setattr(HealthRegistry, "FAILURES", 3)
+    monkeypatch.setattr(HealthRegistry, "COOLDOWN", 10.0)
+    monkeypatch.setattr(HealthRegistry, "MAX_COOLDOWN", 35.0)
+    return now
+
+
+M = SimpleNamespace(id=1, name="box", url_connect="http://box")
+
+
+def _state():
+    return HealthRegistry.snapshot(M)["state"]
+
+
+def test_opens_after_consecutive_failures(clock):
+    HealthRegistry.record_failure(M, OSError("down"))
+    HealthRegistry.record_failure(M, OSError("down"))
+    HealthRegistry.record_success(M)                     # a success resets the streak
+    for _ in range(2):
+        HealthRegistry.record_failure(M, OSError("down"))
+    assert _state() == "closed" and HealthRegistry.allow(M)
+    HealthRegistry.record_failure(M, OSError("down"))
+    assert _state() == "open"
+    assert not HealthRegistry.allow(M) and not HealthRegistry.is_available(M)
+
+
+def test_exactly_one_half_open_probe(clock):
+    for _ in range(3):
+        HealthRegistry.record_failure(M)
+    clock.t += 10
+    assert HealthRegistry.is_available(M)
+    assert [HealthRegistry.allow(M) for _ in range(5)] == [True, False, False, False, False]
+    assert _state() == "half_open" and not HealthRegistry.is_available(M)
+    HealthRegistry.record_success(M, 12.0)
+    assert _state() == "closed" and HealthRegistry.allow(M)
+    assert HealthRegistry.latency(M) == 12.0
+
+
+def test_failed_probes_double_the_cooldown_up_to_the_cap(clock):
+    for _ in range(3):
+        HealthRegistry.record_failure(M)
+    cooldowns = []
+    for _ in range(4):
+        cooldowns.append(HealthRegistry.snapshot(M)["retry_at"] - clock.t)
+        clock.t += cooldowns[-1] - 0.1
+        assert not HealthRegistry.allow(M)
+        clock.t += 0.1
+        assert HealthRegistry.allow(M)
+        HealthRegistry.record_failure(M)                 # the probe fails: reopen
+    assert cooldowns == [10.0, 20.0, 35.0, 35.0]
+
+
+def test_cancelled_probe_releases_the_slot(clock, monkeypatch):
+    for _ in range(3):
+        HealthRegistry.record_failure(M)
+    clock.t += 10
+    started = asyncio.Event()
+
+    async def hang(request):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def no_channel(*args):
+        return None
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(hang))
+        monkeypatch.setattr(NodeClient, "async_client", staticmethod(lambda url: client))
+        task = asyncio.ensure_future(NodeClient.aget("http://box/x", machine=M))
+        await started.wait()
+        assert not HealthRegistry.allow(M)               # the probe is out
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.aclose()
+
+    monkeypatch.setattr(NodeClient, "_achannel", staticmethod(no_channel))
+    asyncio.run(scenario())
+    snap = HealthRegistry.snapshot(M)
+    assert snap["state"] == "half_open" and not snap["probe_in_flight"] and snap["failures"] == 3
+    assert HealthRegistry.allow(M)                       # the next call gets to probe
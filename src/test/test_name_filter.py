@@ -0,0 +1,138 @@
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from data import data
+from models.Machine import Machine
+from Services.Net.GlobalPathsRefresher import GlobalPathsRefresher
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.NameFilter import BloomFilter, NameFilter, PublishedFilter
+from Services.Net.NodeClient import NodeClient
+from Services.Sync.DeltaSync import DeltaSync
+from Services.Sync.SyncService import routerSync
+
+
+def test_bloom_has_no_false_negatives_and_meets_target():
+    bloom = BloomFilter.sized(5000, 0.01)
+    for i in range(5000):
+        bloom.add(f"n:file{i}.txt")
+    assert all(f"n:file{i}.txt" in bloom for i in range(5000))
+    fp = sum(f"n:other{i}.txt" in bloom for i in range(20000)) / 20000
+    assert fp < 0.02
+    assert bloom.fpr_estimate() < 0.02
+
+
+def test_bloom_round_trip():
+    bloom = BloomFilter.sized(100, 0.01)
+    bloom.add("n:a.txt")
+    copy = BloomFilter.from_dict(bloom.to_dict())
+    assert "n:a.txt" in copy and (copy.m, copy.k, copy.n) == (bloom.m, bloom.k, 1)
+    with pytest.raises(ValueError):
+        BloomFilter.from_dict({**bloom.to_dict(), "m": bloom.m + 8})
+
+
+@pytest.fixture
+def local_base(tmp_path, monkeypatch):
+    (tmp_path / "old.txt").write_text("x")
+    monkeypatch.setattr(GlobalPathsRefresher, "local_bases", staticmethod(lambda: {"t": [str(tmp_path)]}))
+    monkeypatch.setattr(data, "GLOBAL_PATHS", {"t": [tmp_path]})
+    monkeypatch.setattr(NameFilter, "_local", {})
+    monkeypatch.setattr(NameFilter, "_remote", {})
+    return tmp_path
+
+
+def test_versions_differ_across_restarts(local_base, monkeypatch):
+    first = NameFilter.build("t")
+    monkeypatch.setattr(NameFilter, "_local", {})
+    monkeypatch.setattr(NameFilter, "_EPOCH", "restarted")
+    second = NameFilter.build("t")
+    assert first.generation == second.generation == 1
+    assert first.version() != second.version()
+
+
+def test_hub_refetches_after_peer_restart(local_base, monkeypatch):
+    machine = Machine(address="AA:BB:CC:DD:EE:09", id=9, name="peer", url_connect="http://peer")
+    served = NameFilter.build("t")
+    # the hub holds generation 1 of an earlier process of that peer, with different contents
+    stale = PublishedFilter(BloomFilter.sized(10, 0.01), 1, 0.0, 0.0, epoch="earlier")
+    NameFilter._remote[(HealthRegistry.key(machine), "t")] = stale
+
+    async def aget(url, params=None, **kwargs):
+        if params and params["since"] == served.version():
+            return httpx.Response(200, json={"unchanged": True, "version": served.version()})
+        return httpx.Response(200, json={"epoch": served.epoch, "generation": served.generation,
+                                         "built_at": served.built_at, "filter": served.bloom.to_dict()})
+
+    monkeypatch.setattr(NodeClient, "aget", staticmethod(aget))
+    NodeClient.run(NameFilter._fetch(machine, "t"), 5)
+    assert NameFilter.candidates("t", [NameFilter.name_key("old.txt")], [machine], record=False) == [machine]
+    # a second fetch is answered "unchanged" and keeps the filter
+    NodeClient.run(NameFilter._fetch(machine, "t"), 5)
+    assert NameFilter._remote[(HealthRegistry.key(machine), "t")].version() == served.version()
+
+
+def test_delta_sync_apply_updates_filter(local_base, tmp_path_factory):
+    NameFilter.build("t")
+    src = tmp_path_factory.mktemp("src") / "pushed.bin"
+    src.write_bytes(b"hello" * 1000)
+    sig = DeltaSync.signatures(local_base / "pushed.bin")
+    app = FastAPI()
+    app.include_router(routerSync)
+    r = TestClient(app).post("/sync/apply/t", params={"path": "pushed.bin"}, content=b"".join(DeltaSync.delta(src, sig)))
+    assert r.status_code == 200, r.text
+    pub = NameFilter._local["t"]
+    assert NameFilter.name_key("pushed.bin") in pub.bloom and pub.generation == 2
+
+
+def _fresh_filter(*keys):
+    bloom = BloomFilter.sized(10, 0.01)
+    for k in keys:
+        bloom.add(k)
+    return PublishedFilter(bloom, 1, time.time(), time.time(), epoch="e")
+
+
+def test_skipped_machines_are_asked_after_a_miss(local_base, monkeypatch):
+    from Services.Files.FilesTools import FilesTools
+    a = Machine(address="AA:BB:CC:DD:EE:01", id=1, name="a", url_connect="http://a")
+    b = Machine(address="AA:BB:CC:DD:EE:02", id=2, name="b", url_connect="http://b")
+    # b created new.txt outside Quitto: neither published filter knows it yet
+    NameFilter._remote[(HealthRegistry.key(a), "t")] = _fresh_filter(NameFilter.name_key("other.txt"))
+    NameFilter._remote[(HealthRegistry.key(b), "t")] = _fresh_filter(NameFilter.name_key("old.txt"))
+    monkeypatch.setattr(NameFilter, "_stats", dict.fromkeys(NameFilter._stats, 0))
+    asked = []
+
+    async def aget(url, params=None, **kwargs):
+        asked.append(url)
+        matches = [{"path": "/b/new.txt"}] if url.startswith("http://b") else []
+        return httpx.Response(200, json={"count": len(matches), "matches": matches})
+    monkeypatch.setattr(NodeClient, "aget", staticmethod(aget))
+
+    keys = (NameFilter.name_key("new.txt"),)
+    found = FilesTools.forward_to_machines("/files/find", {"filename": "new.txt"}, machines=[a, b], base="t", keys=keys)
+    assert found["matches"] == [{"path": "/b/new.txt"}]
+    assert NameFilter.stats()["lookups"]["false_negatives"] == 1
+
+    # a name only a's filter holds: a is asked first, and b confirms the miss
+    asked.clear()
+    FilesTools.forward_to_machines("/files/find", {"filename": "other.txt"}, machines=[a, b], base="t",
+                                   keys=(NameFilter.name_key("other.txt"),))
+    assert asked == ["http://a/files/find", "http://b/files/find"]
+    asked.clear()
+    FilesTools.forward_to_machines("/files/find", {"filename": "old.txt"}, machines=[a, b], base="t",
+                                   keys=(NameFilter.name_key("old.txt"),))
+    assert asked == ["http://b/files/find"]                        # b has a match: a is never asked
+
+
+def test_federated_search_retries_filtered_nodes(local_base, monkeypatch):
+    from Services.Files.FederatedSearch import FederatedSearch
+    from Services.Files.FilesTools import FilesTools
+    b = Machine(address="AA:BB:CC:DD:EE:02", id=2, name="b", url_connect="http://b")
+    NameFilter._remote[(HealthRegistry.key(b), "t")] = _fresh_filter(NameFilter.name_key("old.txt"))
+    monkeypatch.setattr(FilesTools, "base_machines", staticmethod(lambda base: [b]))
+    monkeypatch.setattr(FilesTools, "remote_json", staticmethod(
+        lambda m, route, params, timeout: {"matches": [{"name": "new.pdf", "path": "new.pdf", "size_bytes": 1}]}))
+    res = FederatedSearch.search("t", None, {"ext": ".pdf", "sort": "name", "limit": 10})
+    assert [m["name"] for m in res["matches"]] == ["new.pdf"]
@@ -0,0 +1,204 @@
+import asyncio
+
+import pytest
+
+from Services.Net.NodeChannel import NodeChannel, _Channel, ChannelUnavailable
+from Services.Net.NodeClient import NodeClient
+
+
+class EchoSocket:
+    """Stands in for an open peer WebSocket: answers every request frame with its body."""
+
+    def __init__(self):
+        self.ch = None
+        self.frames = []
+
+    async def send(self, data):
+        frame = NodeChannel.unpack(data)
+        self.frames.append(frame)
+        if frame["type"] == "req":
+            self.ch.pending[frame["id"]].set_result({"type": "res", "id": frame["id"], "status": 200, "headers": [], "body": frame["body"]})
+
+
+@pytest.fixture
+def channel(monkeypatch):
+    ws = EchoSocket()
+    ch = _Channel(origin="http://peer", machine=None, ws=ws, state="open",
+                  window=asyncio.Semaphore(4), send_lock=asyncio.Lock())
+    ws.ch = ch
+    monkeypatch.setattr(NodeChannel, "channel_for", staticmethod(lambda machine, url: ch))
+    return ch
+
+
+def test_bytes_body_goes_over_channel(channel):
+    r = NodeClient._channel("POST", "http://peer/sync/push", 5, object(), {"content": b"abc"})
+    assert r is not None and r.content == b"abc"
+    assert len(channel.ws.frames) == 1
+
+
+def test_generator_body_falls_back_to_http(channel):
+    consumed = []
+
+    def body():
+        consumed.append(True)
+        yield b"chunk"
+
+    gen = body()
+    with pytest.raises(ChannelUnavailable):
+        NodeClient.run(NodeChannel.arequest(channel, "POST", "http://peer/sync/push", 5, content=gen), 5)
+    # NodeClient treats the refusal as "use HTTP", with the stream still unread
+    assert NodeClient._channel("POST", "http://peer/sync/push", 5, object(), {"content": gen}) is None
+    assert channel.ws.frames == [] and consumed == []
+    assert list(gen) == [b"chunk"]
+
+
+class HeldSocket:
+    """Peer WebSocket that records request frames and answers only when told to."""
+
+    def __init__(self, ch):
+        self.ch = ch
+        self.requests = []
+
+    async def send(self, data):
+        frame = NodeChannel.unpack(data)
+        if frame["type"] == "req":
+            self.requests.append(frame)
+
+    def answer(self, frame, **extra):
+        out = {"type": "res", "id": frame["id"], "status": 200, "headers": [], "body": frame["body"], **extra}
+        self.ch.pending[frame["id"]].set_result(out)
+
+
+def _held_channel(window):
+    ch = _Channel(origin="http://peer", machine=None, state="open",
+                  window=asyncio.Semaphore(window), send_lock=asyncio.Lock())
+    ch.ws = HeldSocket(ch)
+    return ch
+
+
+def test_out_of_order_answers_reach_their_callers():
+    ch = _held_channel(8)
+
+    async def scenario():
+        calls = [asyncio.ensure_future(NodeChannel.arequest(ch, "POST", "http://peer/x", 5, content=f"req{i}")) for i in range(5)]
+        while len(ch.ws.requests) < 5:
+            await asyncio.sleep(0.01)
+        for frame in reversed(ch.ws.requests):
+            ch.ws.answer(frame)
+        return [r.content for r in await asyncio.gather(*calls)]
+
+    assert NodeClient.run(scenario(), 5) == [b"req%d" % i for i in range(5)]
+    assert len({f["id"] for f in ch.ws.requests}) == 5
+    assert ch.pending == {}
+
+
+def test_window_holds_back_requests_until_answers_free_it():
+    ch = _held_channel(2)
+
+    async def scenario():
+        calls = [asyncio.ensure_future(NodeChannel.arequest(ch, "GET", "http://peer/x", 5)) for _ in range(5)]
+        await asyncio.sleep(0.1)
+        in_flight = len(ch.ws.requests)
+        while not all(c.done() for c in calls):
+            for frame in ch.ws.requests:
+                if frame["id"] in ch.pending and not ch.pending[frame["id"]].done():
+                    ch.ws.answer(frame)
+            await asyncio.sleep(0.01)
+        return in_flight
+
+    assert NodeClient.run(scenario(), 5) == 2
+    assert len(ch.ws.requests) == 5
+
+
+def test_too_large_answer_falls_back_to_http_for_any_method():
+    ch = _held_channel(2)
+
+    async def scenario(method):
+        call = asyncio.ensure_future(NodeChannel.arequest(ch, method, "http://peer/mcp/tools/read_file_with_path", 5, json={"path": "/x"}))
+        while not ch.pending:
+            await asyncio.sleep(0.01)
+        ch.pending[ch.ws.requests[-1]["id"]].set_result({"type": "res", "id": ch.ws.requests[-1]["id"], "error": "too_large"})
+        await call
+
+    for method in ("GET", "POST"):
+        with pytest.raises(ChannelUnavailable):
+            NodeClient.run(scenario(method), 5)
+    assert ch.fallbacks == 2
+
+
+def test_lost_heartbeat_drops_the_channel(monkeypatch):
+    from Services.Net.MachineHealth import HealthRegistry
+    failures = []
+    monkeypatch.setattr(NodeChannel, "HEARTBEAT", 0.01)
+    monkeypatch.setattr(HealthRegistry, "record_failure", staticmethod(lambda m, e: failures.append(e)))
+    ch = _held_channel(1)
+    ch.last_pong = 0.0
+    import httpx
+    with pytest.raises(httpx.ReadTimeout):
+        NodeClient.run(NodeChannel._heartbeat(ch), 5)
+    assert len(failures) == 1
+
+
+def test_dropped_session_fails_pending_requests_and_reconnects(monkeypatch):
+    import httpx
+    from Services.Net import NodeChannel as module
+    monkeypatch.setattr(module.random, "uniform", lambda a, b: 0.001)
+    monkeypatch.setattr(NodeChannel, "_channels", {})
+    ch = _Channel(origin="http://peer", machine=None)
+    NodeChannel._channels[ch.origin] = ch
+    sessions = []
+    orphan = []
+
+    async def session(ch):
+        sessions.append(ch.state)
+        if len(sessions) == 1:
+            orphan.append(asyncio.get_running_loop().create_future())
+            ch.pending[1] = orphan[0]
+            raise ConnectionResetError("peer went away")
+        ch.last_used = -NodeChannel.IDLE_CLOSE          # idle now: the loop ends after this session
+    monkeypatch.setattr(NodeChannel, "_session", staticmethod(session))
+
+    NodeClient.run(NodeChannel._run(ch), 5)
+    assert sessions == ["connecting", "connecting"]
+    assert ch.reconnects == 2 and "peer went away" in ch.last_error
+    assert isinstance(orphan[0].exception(), httpx.RemoteProtocolError)
+    assert ch.origin not in NodeChannel._channels
+
+
+def test_server_stops_answers_that_outgrow_a_frame(monkeypatch):
+    from fastapi import FastAPI, WebSocket
+    from fastapi.responses import StreamingResponse
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(NodeChannel, "MAX_FRAME", 1000)
+    monkeypatch.setattr(NodeChannel, "_asgi", {})
+    monkeypatch.delenv("QUITTO_NODE_TOKEN", raising=False)
+    produced = []
+    app = FastAPI()
+
+    @app.get("/big")
+    def big():
+        def chunks():
+            for _ in range(100):
+                produced.append(1)
+                yield b"x" * 100
+        return StreamingResponse(chunks())
+
+    @app.post("/small")
+    def small(payload: dict):
+        return payload
+
+    @app.websocket(NodeChannel.ROUTE)
+    async def channel(websocket: WebSocket):
+        await NodeChannel.serve(websocket)
+
+    with TestClient(app).websocket_connect(NodeChannel.ROUTE) as ws:
+        assert NodeChannel.unpack(ws.receive_text())["type"] == "hello"
+        ws.send_text(NodeChannel.pack({"type": "req", "id": 1, "method": "GET", "path": "/big", "headers": {}, "body": None}, "json"))
+        assert NodeChannel.unpack(ws.receive_text()) == {"type": "res", "id": 1, "error": "too_large"}
+        body = b'{"a": 1}'
+        ws.send_text(NodeChannel.pack({"type": "req", "id": 2, "method": "POST", "path": "/small",
+                                       "headers": {"content-type": "application/json"}, "body": body}, "json"))
+        res = NodeChannel.unpack(ws.receive_text())
+        assert res["id"] == 2 and res["status"] == 200 and res["body"] == body.replace(b" ", b"")
+    assert len(produced) < 100
@@ -0,0 +1,103 @@
+import asyncio
+import concurrent.futures
+import gc
+
+import httpx
+import pytest
+
+from Services.Net.NodeClient import NodeClient
+
+
+@pytest.fixture
+def fresh(monkeypatch):
+    monkeypatch.setattr(NodeClient, "_clients", {})
+    monkeypatch.setattr(NodeClient, "_stats", {})
+    monkeypatch.setattr(NodeClient, "_async_clients", type(NodeClient._async_clients)())
+    return NodeClient
+
+
+def test_one_pool_per_origin(fresh):
+    a = fresh.client("http://peer:8000/files/x")
+    assert fresh.client("http://peer:8000/other?q=1") is a
+    assert fresh.client("http://peer:9000/files/x") is not a
+    a.close()
+    assert fresh.client("http://peer:8000/files/x") is not a
+
+
+def test_async_pools_are_per_loop_and_go_away_with_it(fresh):
+    async def pools():
+        return fresh.async_client("http://peer/a"), fresh.async_client("http://peer/b"), fresh.async_client("http://other/a")
+
+    first = asyncio.run(pools())
+    assert first[0] is first[1] and first[0] is not first[2]
+    second = asyncio.run(pools())
+    assert second[0] is not first[0]
+    # asyncio.run closed both loops; the next lookup drops whatever is left of them
+    async def live():
+        fresh.async_client("http://peer/a")
+        return len(fresh._async_clients)
+    del first, second
+    gc.collect()
+    assert asyncio.run(live()) == 1
+
+
+def test_params_drop_none_values():
+    kwargs = NodeClient._params({"params": {"a": 1, "b": None, "c": ""}, "json": {"x": None}})
+    assert kwargs == {"params": {"a": 1, "c": ""}, "json": {"x": None}}
+    assert NodeClient._params({"params": [("a", None)]}) == {"params": [("a", None)]}
+
+
+def test_cancelled_call_leaves_no_request_in_flight(fresh, monkeypatch):
+    started = asyncio.Event()
+
+    async def slow(request):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(slow))
+        monkeypatch.setattr(NodeClient, "async_client", staticmethod(lambda url: client))
+        task = asyncio.ensure_future(NodeClient.aget("http://peer/slow"))
+        await started.wait()
+        assert fresh._stats["http://peer"].in_flight == 1
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await client.aclose()
+
+    asyncio.run(scenario())
+    st = fresh._stats["http://peer"]
+    assert (st.requests, st.in_flight, st.errors) == (1, 0, 0)
+
+
+def test_run_and_spawn_use_the_shared_loop():
+    async def where(value):
+        await asyncio.sleep(0)
+        return asyncio.get_running_loop(), value
+
+    loop, value = NodeClient.run(where(7), 5)
+    assert loop is NodeClient._background_loop() and value == 7
+    fut = NodeClient.spawn(where(8))
+    assert isinstance(fut, concurrent.futures.Future) and fut.result(5)[1] == 8
+
+    cancelled = []
+
+    async def forever():
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+    with pytest.raises(concurrent.futures.TimeoutError):
+        NodeClient.run(forever(), 0.1)
+    NodeClient.run(asyncio.sleep(0.05), 5)
+    assert cancelled == [True]
+
+
+def test_token_check(monkeypatch):
+    monkeypatch.delenv("QUITTO_NODE_TOKEN", raising=False)
+    assert NodeClient.token_ok({})
+    monkeypatch.setenv("QUITTO_NODE_TOKEN", "s3cret")
+    assert NodeClient.token_ok({"X-Quitto-Node-Token": "s3cret"})
+    assert not NodeClient.token_ok({"X-Quitto-Node-Token": "s3cre"})
+    assert not NodeClient.token_ok({})
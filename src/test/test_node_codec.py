@@ -0,0 +1,98 @@
+import json
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+from Services.Net.NodeCodec import NodeCodec, _format_size
+
+
+def _listing(n=50):
+    return {
+        "path": "/docs",
+        "items": [{"name": f"f{i}.txt", "size_bytes": i * 1500, "size_human": _format_size(i * 1500),
+                   "modified": f"2024-01-{i % 28 + 1:02d} 12:00:00", "tags": [{"k": "a", "v": i}, {"k": "b", "v": -i}]}
+                  for i in range(n)],
+        "summary": {"files": n},
+    }
+
+
+def test_compact_expand_round_trip():
+    doc = _listing()
+    packed = NodeCodec.compact(doc)
+    assert packed["items"][NodeCodec.COLS] == ["name", "size_bytes", "size_human", "modified", "tags"]
+    assert len(packed["items"][NodeCodec.DERIVED_SIZE]) == 50
+    assert all(isinstance(row[3], int) for row in packed["items"][NodeCodec.ROWS])
+    assert NodeCodec.expand(packed) == doc
+
+
+def test_values_that_cannot_be_derived_are_kept():
+    doc = {"items": [
+        {"size_bytes": 2048, "size_human": "2 KiB", "modified": "yesterday"},
+        {"size_bytes": "?", "size_human": "1.0 KB", "modified": "2024-02-30 00:00:00"},
+        {"size_bytes": 1, "size_human": "1 B", "modified": "2024-02-01 00:00:00"},
+    ]}
+    packed = NodeCodec.compact(doc)
+    assert packed["items"][NodeCodec.DERIVED_SIZE] == [2]
+    assert packed["items"][NodeCodec.DATE_ROWS] == [2]
+    assert NodeCodec.expand(packed) == doc
+
+
+def test_mixed_shapes_stay_lists():
+    doc = {"a": [{"x": 1}, {"y": 2}], "b": [{"x": 1, "y": 2}, {"y": 2, "x": 1}], "c": [{"x": 1}], "d": [1, {"x": 1}]}
+    assert NodeCodec.compact(doc) == doc
+    assert NodeCodec.expand(NodeCodec.compact(doc)) == doc
+
+
+@pytest.mark.parametrize("codec", ["msgpack", "msgpack+zstd"])
+def test_encode_decode(codec):
+    pytest.importorskip("msgpack")
+    if codec == "msgpack+zstd":
+        pytest.importorskip("zstandard")
+    doc = _listing(200)
+    wire = NodeCodec.encode(doc, codec)
+    assert NodeCodec.decode(wire, codec) == doc
+    assert len(wire) < len(json.dumps(doc))
+
+
+def test_middleware_negotiates_and_falls_back():
+    pytest.importorskip("msgpack")
+    app = FastAPI()
+    app.middleware("http")(NodeCodec.middleware)
+
+    @app.get("/list")
+    def listing():
+        return _listing()
+
+    @app.get("/missing")
+    def missing():
+        raise HTTPException(status_code=404, detail="nope")
+
+    c = TestClient(app)
+    r = c.get("/list", headers=NodeCodec.request_headers())
+    assert r.headers[NodeCodec.CODEC_HEADER] == NodeCodec.supported()[0]
+    assert NodeCodec.response_json(r) == _listing()
+    plain = c.get("/list")
+    assert NodeCodec.CODEC_HEADER not in plain.headers and plain.json() == _listing()
+    err = c.get("/missing", headers=NodeCodec.request_headers())
+    assert err.status_code == 404 and err.json() == {"detail": "nope"}
+
+
+def test_middleware_keeps_the_routes_vary_and_cookies():
+    pytest.importorskip("msgpack")
+    from fastapi.responses import JSONResponse
+    app = FastAPI()
+    app.middleware("http")(NodeCodec.middleware)
+
+    @app.get("/list")
+    def listing():
+        r = JSONResponse(_listing(), headers={"Vary": "Accept-Encoding"})
+        r.set_cookie("a", "1")
+        r.set_cookie("b", "2")
+        return r
+
+    r = TestClient(app).get("/list", headers=NodeCodec.request_headers())
+    assert r.headers[NodeCodec.CODEC_HEADER] == NodeCodec.supported()[0]
+    vary = [v.strip().lower() for v in r.headers["vary"].split(",")]
+    assert vary == ["accept-encoding", NodeCodec.ACCEPT_HEADER.lower()]
+    assert len(r.headers.get_list("set-cookie")) == 2
@@ -0,0 +1,38 @@
+from contextlib import contextmanager
+
+import httpx
+import pytest
+
+from models.Machine import Machine
+from Services.Files.RemoteFile import RemoteFile
+from Services.Net.NodeClient import NodeClient
+
+DATA = bytes(range(256)) * 40
+MACHINE = Machine(address="AA:BB:CC:DD:EE:07", id=7, name="peer", url_connect="http://peer")
+
+
+def serve(monkeypatch, honour_range: bool):
+    @contextmanager
+    def stream(method, url, headers=None, **kwargs):
+        rng = (headers or {}).get("Range")
+        if honour_range and rng:
+            start, _, end = rng[len("bytes="):].partition("-")
+            start, end = int(start), min(int(end) if end else len(DATA) - 1, len(DATA) - 1)
+            yield httpx.Response(206, content=DATA[start:end + 1],
+                                 headers={"content-range": f"bytes {start}-{end}/{len(DATA)}"})
+        else:
+            yield httpx.Response(200, content=DATA)
+
+    monkeypatch.setattr(NodeClient, "stream", staticmethod(stream))
+    monkeypatch.setattr(RemoteFile, "CHUNK", 1000)
+
+
+@pytest.mark.parametrize("honour_range", [True, False])
+@pytest.mark.parametrize("offset,length", [(0, 10), (1500, 3000), (9000, 5000), (2500, None)])
+def test_slices_match_with_or_without_range_support(monkeypatch, honour_range, offset, length):
+    serve(monkeypatch, honour_range)
+    expected = DATA[offset:] if length is None else DATA[offset:offset + length]
+    assert b"".join(RemoteFile.iter_range(MACHINE, "/f", offset, length)) == expected
+    if length is not None:
+        raw, size = RemoteFile._read(MACHINE, "/f", offset, length)
+        assert raw == expected and size == len(DATA)
@@ -0,0 +1,105 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.ReplicaSelector import ReplicaSelector
+
+ROUTE = "/files/browse"
+
+
+@pytest.fixture(autouse=True)
+def clean(monkeypatch):
+    monkeypatch.setattr(ReplicaSelector, "_routes", {})
+    monkeypatch.setattr(ReplicaSelector, "HEDGE_MIN_MS", 1.0)
+    monkeypatch.setattr(HealthRegistry, "_machines", {})
+
+
+def _machines(*names):
+    return [SimpleNamespace(id=i, name=n, url_connect=f"http://{n}:8000") for i, n in enumerate(names, 1)]
+
+
+def _seed(machine, ms, n=10):
+    for _ in range(n):
+        ReplicaSelector.record(machine, ROUTE, ms, True)
+
+
+def _attempt(delays, calls, fail=()):
+    async def attempt(m):
+        calls.append(m.name)
+        await asyncio.sleep(delays[m.name])
+        if m.name in fail:
+            raise ConnectionError(m.name)
+        return m.name
+    return attempt
+
+
+def test_rank_prefers_fast_and_healthy_replicas():
+    a, b, c = _machines("a", "b", "c")
+    _seed(a, 80)
+    _seed(b, 20)
+    _seed(c, 10)
+    for _ in range(5):
+        ReplicaSelector.record(c, ROUTE, 0, False)
+    assert ReplicaSelector.rank([a, b, c], ROUTE) == [b, a, c]
+    assert ReplicaSelector.rank([a, b, c], ROUTE, prefer=a)[0] is a
+
+
+def test_fast_primary_is_not_hedged():
+    a, b = _machines("a", "b")
+    _seed(a, 10)
+    _seed(b, 50)
+    calls = []
+    result = asyncio.run(ReplicaSelector.call([a, b], ROUTE, _attempt({"a": 0.0, "b": 0.0}, calls)))
+    assert result == "a" and calls == ["a"]
+
+
+def test_slow_primary_is_hedged_and_the_hedge_wins():
+    a, b = _machines("a", "b")
+    _seed(a, 10)                               # p95 10 ms, so the hedge starts after ~10 ms
+    _seed(b, 20)
+    calls = []
+    result = asyncio.run(ReplicaSelector.call([a, b], ROUTE, _attempt({"a": 1.0, "b": 0.0}, calls)))
+    assert result == "b" and calls == ["a", "b"]
+    st = ReplicaSelector.stats()["routes"][ROUTE]
+    assert st["2"]["hedged"] == 1 and st["2"]["hedge_wins"] == 1
+    assert st["1"]["errors"] == 0              # the cancelled primary is not counted as a failure
+
+
+def test_hedging_can_be_disabled():
+    a, b = _machines("a", "b")
+    _seed(a, 10)
+    _seed(b, 20)
+    calls = []
+    assert asyncio.run(ReplicaSelector.call([a, b], ROUTE, _attempt({"a": 0.1, "b": 0.0}, calls), hedge=False)) == "a"
+    assert calls == ["a"]
+
+
+def test_failure_fails_over_to_the_next_replica():
+    a, b, c = _machines("a", "b", "c")
+    _seed(a, 10)
+    _seed(b, 20)
+    _seed(c, 30)
+    calls = []
+    result = asyncio.run(ReplicaSelector.call([a, b, c], ROUTE, _attempt({"a": 0.0, "b": 0.0, "c": 0.0}, calls, fail={"a"}), hedge=False))
+    assert result == "b" and calls == ["a", "b"]
+    assert ReplicaSelector.stats()["routes"][ROUTE]["1"]["errors"] == 1
+
+
+def test_every_replica_failing_raises_the_last_error():
+    a, b = _machines("a", "b")
+    _seed(a, 10)
+    _seed(b, 20)
+    calls = []
+    with pytest.raises(ConnectionError, match="b"):
+        asyncio.run(ReplicaSelector.call([a, b], ROUTE, _attempt({"a": 0.0, "b": 0.0}, calls, fail={"a", "b"})))
+    assert calls == ["a", "b"]
+
+
+def test_no_available_replica(monkeypatch):
+    monkeypatch.setattr(HealthRegistry, "is_available", staticmethod(lambda m: False))
+    from Services.Net.WakeOnDemand import WakeOnDemand
+    monkeypatch.setattr(WakeOnDemand, "wakeable", staticmethod(lambda m: False))
+    with pytest.raises(LookupError):
+        asyncio.run(ReplicaSelector.call(_machines("a"), ROUTE, _attempt({"a": 0.0}, [])))
@@ -0,0 +1,135 @@
+import asyncio
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from data import data
+from Services.Files.FileService import routerFile
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.NodeClient import NodeClient
+from Services.Net.ResponseCache import ResponseCache
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    monkeypatch.setattr(ResponseCache, "_entries", OrderedDict())
+    monkeypatch.setattr(ResponseCache, "_bytes", 0)
+    monkeypatch.setattr(ResponseCache, "_refreshing", set())
+    monkeypatch.setattr(ResponseCache, "_stats", dict.fromkeys(ResponseCache._stats, 0))
+    monkeypatch.setattr(ResponseCache, "_pending", [])
+    monkeypatch.setattr(ResponseCache, "_flush_scheduled", False)
+    return ResponseCache
+
+
+def _fetcher(value="v"):
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {"value": value, "n": len(calls)}
+    return fetch, calls
+
+
+def _browse(path, fetch, machine="m1", base="docs"):
+    return ResponseCache.get_or_fetch(machine, f"/files/browse/{base}", {"path": path}, fetch)
+
+
+def test_hit_after_miss():
+    fetch, calls = _fetcher()
+    assert _browse("a", fetch) == _browse("a", fetch) == {"value": "v", "n": 1}
+    assert calls == [1]
+    st = ResponseCache.stats()
+    assert (st["hits"], st["misses"], st["entries"]) == (1, 1, 1)
+
+
+def test_errors_and_unknown_routes_are_not_cached():
+    calls = []
+    for _ in range(2):
+        ResponseCache.get_or_fetch("m1", "/files/browse/docs", {}, lambda: calls.append(1) or {"error": "down"})
+        ResponseCache.get_or_fetch("m1", "/files/upload", {}, lambda: calls.append(2) or {"ok": True})
+    assert calls == [1, 2, 1, 2]
+    assert ResponseCache.stats()["entries"] == 0
+
+
+def test_stale_entry_is_served_while_refreshing(monkeypatch):
+    monkeypatch.setitem(ResponseCache.ROUTE_TTLS, "/files/browse", (0.0, 60.0))
+    fetch, calls = _fetcher()
+    assert _browse("a", fetch)["n"] == 1
+    time.sleep(0.01)
+    assert _browse("a", fetch)["n"] == 1       # stale copy, refresh in the background
+    deadline = time.time() + 5
+    while ResponseCache.stats()["refreshing"] and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(calls) == 2
+    assert ResponseCache._entries[ResponseCache.key("m1", "/files/browse/docs", {"path": "a"})].value["n"] == 2
+
+
+@pytest.mark.parametrize("changed, dropped", [
+    ("a/b/c.txt", {"", "a", "a/b", "a/b/c.txt"}),   # the file, its ancestors and base-wide results
+    ("a", {"", "a", "a/b", "a/b/c.txt"}),           # a directory and everything below it
+    ("x", {""}),
+])
+def test_invalidate_matches_ancestors_and_descendants(changed, dropped):
+    paths = ["", "a", "a/b", "a/b/c.txt", "x2"]
+    for p in paths:
+        _browse(p, _fetcher()[0])
+    _browse("a", _fetcher()[0], base="other")
+    ResponseCache.invalidate("docs", changed)
+    kept = {e.path for e in ResponseCache._entries.values() if e.base == "docs"}
+    assert kept == set(paths) - dropped
+    assert any(e.base == "other" for e in ResponseCache._entries.values())
+
+
+def test_invalidate_everything_or_one_machine():
+    for m in ("m1", "m2"):
+        _browse("a", _fetcher()[0], machine=m)
+    assert ResponseCache.invalidate(machine="m1") == 1
+    assert ResponseCache.invalidate() == 1
+    assert ResponseCache.stats()["bytes"] == 0
+
+
+def test_lru_eviction(monkeypatch):
+    monkeypatch.setattr(ResponseCache, "MAX_BYTES", 400)    # room for four ~90-byte entries
+    for p in ("a", "b", "c", "d"):
+        ResponseCache.get_or_fetch("m1", "/files/browse/docs", {"path": p}, lambda: {"pad": "x" * 80})
+    _browse("a", lambda: pytest.fail("a should still be cached"))
+    ResponseCache.get_or_fetch("m1", "/files/browse/docs", {"path": "e"}, lambda: {"pad": "x" * 80})
+    assert {e.path for e in ResponseCache._entries.values()} == {"a", "c", "d", "e"}
+    assert ResponseCache.stats()["evictions"] == 1
+    assert ResponseCache.stats()["bytes"] <= 400
+
+
+def test_invalidate_endpoint():
+    app = FastAPI()
+    app.include_router(routerFile)
+    c = TestClient(app)
+    _browse("a/b", _fetcher()[0])
+    _browse("z", _fetcher()[0])
+    assert c.post("/files/cache/invalidate", json={"changes": [{"base": "docs", "path": "a"}]}).json() == {"removed": 1}
+    assert c.post("/files/cache/invalidate", json={"all": True}).json() == {"removed": 1}
+    assert c.post("/files/cache/invalidate", json={"changes": "a"}).status_code == 400
+
+
+def test_notifications_are_batched_per_peer(monkeypatch):
+    peers = [SimpleNamespace(id=i, name=f"p{i}", url_connect=f"http://p{i}:8000") for i in (1, 2)]
+    monkeypatch.setattr(data, "MACHINES", peers, raising=False)
+    monkeypatch.setattr(HealthRegistry, "is_available", staticmethod(lambda m: True))
+    monkeypatch.setattr(ResponseCache, "NOTIFY_DELAY", 0.0)
+    sent = []
+
+    async def apost(url, json=None, **kwargs):
+        sent.append((url, json))
+    monkeypatch.setattr(NodeClient, "apost", staticmethod(apost))
+    flushes = []
+    monkeypatch.setattr(NodeClient, "spawn", staticmethod(lambda coro: flushes.append(coro)))
+
+    ResponseCache.notify_peers("docs", "a.txt")
+    ResponseCache.notify_peers("docs", "b.txt")
+    assert len(flushes) == 1
+    asyncio.run(flushes[0])
+    body = {"changes": [{"base": "docs", "path": "a.txt"}, {"base": "docs", "path": "b.txt"}]}
+    assert sorted(sent) == [("http://p1:8000/files/cache/invalidate", body), ("http://p2:8000/files/cache/invalidate", body)]
@@ -0,0 +1,100 @@
+import json
+from types import MappingProxyType, SimpleNamespace
+
+import httpx
+import pytest
+
+from Services.Files import ShadowIndex as shadow_module
+from Services.Files.ShadowIndex import ShadowBase, ShadowIndex
+
+
+@pytest.fixture
+def shadow(tmp_path, monkeypatch):
+    monkeypatch.setattr(ShadowIndex, "DIR", tmp_path)
+    monkeypatch.setattr(ShadowIndex, "_bases", {})
+    return ShadowIndex
+
+
+def _copy(machine, base, files):
+    return ShadowBase(machine, "box", base, MappingProxyType(files), 1000.0)
+
+
+def test_save_round_trip(shadow):
+    shadow._bases[("m1", "docs")] = _copy("m1", "docs", {"a.txt": (3, 10), "b/c.txt": (5, 20)})
+    shadow._bases[("m2", "docs")] = _copy("m2", "docs", {"x.txt": (1, 1)})
+    shadow._save("m1")
+    shadow._bases.clear()
+    shadow._load()
+    assert list(shadow._bases) == [("m1", "docs")]
+    assert dict(shadow._bases[("m1", "docs")].files) == {"a.txt": (3, 10), "b/c.txt": (5, 20)}
+
+
+def test_sync_encodes_and_writes_outside_the_lock(shadow, monkeypatch):
+    files = {f"f{i}": [i, i] for i in range(100)}
+    monkeypatch.setattr(ShadowIndex, "_machine_bases", staticmethod(lambda machine: ("docs",)))
+    monkeypatch.setattr(shadow_module.NodeClient, "get",
+                        staticmethod(lambda url, **kw: httpx.Response(200, json={"files": files})))
+    held = []
+    real_dumps = json.dumps
+
+    def dumps(*args, **kwargs):
+        held.append(ShadowIndex._lock.locked())
+        return real_dumps(*args, **kwargs)
+    monkeypatch.setattr(shadow_module.json, "dumps", dumps)
+    machine = SimpleNamespace(id=7, name="box", url_connect="http://box:8000")
+    assert shadow.sync_machine(machine) == {"docs": 100}
+    assert held == [False]
+    assert json.loads((shadow.DIR / "7.json").read_text())["bases"]["docs"]["files"] == files
+
+
+@pytest.fixture
+def copies(shadow, monkeypatch):
+    from data import data
+    from models.Machine import Machine
+    box = Machine(address="AA:BB:CC:DD:EE:07", id=7, name="box", url_connect="http://box")
+    monkeypatch.setattr(data, "MACHINES", [box])
+    shadow._bases[("7", "docs")] = ShadowBase("7", "box", "docs", MappingProxyType(
+        {"notes/a.txt": (30, 100), "b.pdf": (10, 300), "deep/b.pdf": (20, 200)}), 1000.0)
+    shadow._bases[("gone", "docs")] = ShadowBase("gone", "old", "docs", MappingProxyType({"c.txt": (1, 1)}), 500.0)
+    return box
+
+
+def test_search_marks_matches_stale_and_names_the_machine(copies):
+    res = ShadowIndex.search("docs", ext=".pdf", sort="size", limit=1, machine="7")
+    assert [m["path"] for m in res["matches"]] == ["deep/b.pdf"]
+    m = res["matches"][0]
+    assert m["stale"] is True and m["snapshot_at"] == 1000.0
+    assert m["machine"] == {"id": 7, "key": "7", "name": "box"}
+    assert [s["machine"] for s in res["snapshots"]] == ["7"]
+    assert ShadowIndex.search("docs", machine="nobody") is None
+
+
+def test_lookup_by_name_and_by_relative_path(copies):
+    res = ShadowIndex.lookup("b.pdf")
+    assert sorted(m["path"] for m in res["matches"]) == ["b.pdf", "deep/b.pdf"]
+    assert all(m["stale"] and m["base"] == "docs" for m in res["matches"])
+    assert [m["path"] for m in ShadowIndex.lookup("/deep/b.pdf")["matches"]] == ["deep/b.pdf"]
+    assert len(ShadowIndex.lookup("b.pdf", limit=1)["matches"]) == 1
+    # a copy from a machine that is no longer known keeps its key but has no id
+    assert ShadowIndex.lookup("c.txt")["matches"][0]["machine"] == {"id": None, "key": "gone", "name": "old"}
+
+
+def test_where_and_find_answer_from_the_copies_when_machines_are_away(copies, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from data import data
+    from Services.Files.FileService import routerFile
+    from Services.Files.FilesTools import FilesTools
+    monkeypatch.setattr(data, "GLOBAL_PATHS", {"docs": [copies]})
+    monkeypatch.setattr(FilesTools, "forward_to_machines", staticmethod(lambda *a, **kw: None))
+    app = FastAPI()
+    app.include_router(routerFile)
+    client = TestClient(app)
+
+    where = client.get("/files/where", params={"name": "a.txt"}).json()
+    assert where["stale"] is True and where["count"] == 1
+    assert where["matches"][0]["snapshot_at"] == 1000.0
+
+    found = client.get("/files/find", params={"base": "docs", "filename": "b.pdf"}).json()
+    assert found["stale"] is True and found["count"] == 2
+    assert {s["machine"] for s in found["snapshots"]} == {"7", "gone"}
@@ -0,0 +1,93 @@
+import threading
+import time
+
+import pytest
+
+from Services.Net.SingleFlight import SingleFlight
+
+
+@pytest.fixture(autouse=True)
+def clean(monkeypatch):
+    monkeypatch.setattr(SingleFlight, "_flights", {})
+    monkeypatch.setattr(SingleFlight, "_stats", {})
+
+
+def _run_concurrently(n, fn):
+    results, errors = [None] * n, [None] * n
+
+    def call(i):
+        try:
+            results[i] = fn()
+        except Exception as E:
+            errors[i] = E
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results, errors
+
+
+def test_key_normalization():
+    assert SingleFlight.key("/files/browse/", {"b": 1, "a": "x", "c": None}) == SingleFlight.key("/files/browse", {"a": "x", "b": "1"})
+    assert SingleFlight.key("/files/browse", {"a": 1}) != SingleFlight.key("/files/browse", {"a": 2})
+
+
+def test_concurrent_calls_share_one_run():
+    release = threading.Event()
+    runs = []
+
+    def work():
+        runs.append(1)
+        release.wait(5)
+        return {"n": len(runs)}
+    key = SingleFlight.key("/r")
+    threads, results, _ = _run_concurrently(8, lambda: SingleFlight.do("g", key, work))
+    deadline = time.time() + 5
+    while SingleFlight.stats()["groups"].get("g", {}).get("calls", 0) < 8 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert runs == [1]
+    assert all(r is results[0] for r in results)
+    st = SingleFlight.stats()
+    assert st["in_flight"] == 0
+    assert st["groups"]["g"] == {"calls": 8, "executed": 1, "coalesced": 7, "errors": 0, "coalesced_ratio": 0.875}
+
+
+def test_waiters_get_the_leaders_exception():
+    release = threading.Event()
+
+    def work():
+        release.wait(5)
+        raise RuntimeError("boom")
+    key = SingleFlight.key("/r")
+    threads, _, errors = _run_concurrently(4, lambda: SingleFlight.do("g", key, work))
+    deadline = time.time() + 5
+    while SingleFlight.stats()["groups"].get("g", {}).get("calls", 0) < 4 and time.time() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join(5)
+    assert all(isinstance(e, RuntimeError) for e in errors)
+    assert SingleFlight.stats()["groups"]["g"]["errors"] == 1
+
+
+def test_nothing_is_cached_after_the_flight():
+    calls = []
+    key = SingleFlight.key("/r")
+    assert SingleFlight.do("g", key, lambda: calls.append(1) or 1) == 1
+    assert SingleFlight.do("g", key, lambda: calls.append(2) or 2) == 2
+    assert calls == [1, 2]
+
+
+def test_coalesce_decorator_ignores_arguments():
+    seen = []
+
+    @SingleFlight.coalesce("files", route="/files/x", ignore=("request",))
+    def endpoint(path: str, request=None):
+        seen.append((path, request))
+        return path
+    assert endpoint(path="a", request="r1") == "a"
+    assert endpoint.__name__ == "endpoint"
+    assert seen == [("a", "r1")]
+    assert SingleFlight.stats()["groups"]["files"]["executed"] == 1
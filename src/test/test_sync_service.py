@@ -0,0 +1,52 @@
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from data import data
+from models.Machine import Machine
+from Services.Net.NodeClient import NodeClient
+from Services.Sync.SyncService import SyncService, routerSync
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    root = tmp_path / "base"
+    root.mkdir()
+    monkeypatch.setattr(data, "GLOBAL_PATHS", {"t": [root]})
+    return root
+
+
+def test_node_token_is_required_when_set(base, monkeypatch):
+    (base / "a.txt").write_bytes(b"hello")
+    app = FastAPI()
+    app.include_router(routerSync)
+    c = TestClient(app)
+    monkeypatch.setenv("QUITTO_NODE_TOKEN", "s3cret")
+    assert c.get("/sync/signature/t", params={"path": "a.txt"}).status_code == 401
+    assert c.get("/sync/signature/t", params={"path": "a.txt"}, headers={"X-Quitto-Node-Token": "nope"}).status_code == 401
+    assert c.get("/sync/signature/t", params={"path": "a.txt"}, headers={"X-Quitto-Node-Token": "s3cret"}).status_code == 200
+    monkeypatch.delenv("QUITTO_NODE_TOKEN")
+    assert c.get("/sync/signature/t", params={"path": "a.txt"}).status_code == 200
+
+
+def test_push_sends_the_node_token(base, tmp_path, monkeypatch):
+    monkeypatch.setenv("QUITTO_NODE_TOKEN", "s3cret")
+    app = FastAPI()
+    app.include_router(routerSync)
+    node = TestClient(app)
+    seen = []
+
+    def request(method, url, headers=None, timeout=None, machine=None, **kwargs):
+        seen.append((headers or {}).get("X-Quitto-Node-Token"))
+        r = node.request(method, httpx.URL(url).raw_path.decode(), headers=headers, **kwargs)
+        return httpx.Response(r.status_code, content=r.content, headers=r.headers, request=httpx.Request(method, url))
+    monkeypatch.setattr(NodeClient, "request", staticmethod(request))
+
+    src = tmp_path / "src.bin"
+    src.write_bytes(b"x" * 5000)
+    SyncService.push_file(Machine(address="AA:BB:CC:DD:EE:FF", name="peer", url_connect="http://peer:8000"), "t", src, "pushed.bin")
+    assert seen == ["s3cret", "s3cret"]
+    assert (base / "pushed.bin").read_bytes() == b"x" * 5000
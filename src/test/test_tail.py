@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from Services.Files.FileService import routerFile
+from Services.Files.TailService import TailService
+
+
+def _client():
+    """TestClient plus an event set once the endpoint has returned (the client cancels it right after closing)."""
+    app = FastAPI()
+    app.include_router(routerFile)
+    finished = threading.Event()
+
+    async def asgi(scope, receive, send):
+        try:
+            await app(scope, receive, send)
+        finally:
+            finished.set()
+    return TestClient(asgi), finished
+
+
+def test_tail_lines_reads_only_the_end(tmp_path):
+    log = tmp_path / "app.log"
+    log.write_bytes(b"".join(b"line %d\n" % i for i in range(10000)))
+    head, offset = TailService.tail_lines(log, 3)
+    assert head == b"line 9997\nline 9998\nline 9999\n"
+    assert offset == log.stat().st_size
+
+
+def test_tail_ws_stops_following_when_client_leaves(tmp_path, monkeypatch):
+    log = tmp_path / "app.log"
+    log.write_text("one\ntwo\n")
+    stopped = threading.Event()
+
+    async def follow(path, offset, encoding="utf-8", is_closed=None):
+        # an idle log: nothing is ever appended and no heartbeat would be sent for a long time
+        try:
+            while True:
+                await asyncio.sleep(3600)
+                yield None
+        finally:
+            stopped.set()
+    monkeypatch.setattr(TailService, "follow", staticmethod(follow))
+
+    client, finished = _client()
+    with client.websocket_connect(f"/files/tail-ws?path={log}&lines=1") as ws:
+        assert ws.receive_json() == {"event": "lines", "path": str(log), "text": "two\n", "offset": 8}
+        ws.close()
+        assert stopped.wait(5)
+        assert finished.wait(5)
+
+
+def test_tail_ws_streams_appends(tmp_path, monkeypatch):
+    log = tmp_path / "app.log"
+    log.write_text("one\n")
+    monkeypatch.setattr(TailService, "POLL_SECONDS", 0.05)
+    monkeypatch.setattr(TailService, "BATCH_SECONDS", 0.05)
+
+    client, finished = _client()
+    with client.websocket_connect(f"/files/tail-ws?path={log}&lines=5") as ws:
+        assert ws.receive_json()["text"] == "one\n"
+        time.sleep(0.1)
+        with open(log, "a") as f:
+            f.write("two\n")
+        assert ws.receive_json() == {"event": "append", "text": "two\n"}
+        ws.close()
+        assert finished.wait(5)
+
+
+def test_follow_drains_a_rotated_file_in_batches_off_the_loop(tmp_path, monkeypatch):
+    import os
+    log = tmp_path / "app.log"
+    log.write_bytes(b"")
+    monkeypatch.setattr(TailService, "POLL_SECONDS", 0.01)
+    monkeypatch.setattr(TailService, "BATCH_SECONDS", 0.01)
+    monkeypatch.setattr(TailService, "BATCH_BYTES", 1000)
+    monkeypatch.setattr("Services.Files.TailService._Inotify.supported", classmethod(lambda cls: False))
+
+    async def run():
+        loop_thread = threading.get_ident()
+        reads = []
+
+        class Spy:
+            def __init__(self, f):
+                self.f = f
+
+            def read(self, n=-1):
+                reads.append((n, threading.get_ident() != loop_thread))
+                return self.f.read(n)
+
+            def __getattr__(self, name):
+                return getattr(self.f, name)
+
+        real_open = TailService._open
+
+        def spy_open(path, offset=0):
+            f, inode = real_open(path, offset)
+            return Spy(f), inode
+        monkeypatch.setattr(TailService, "_open", staticmethod(spy_open))
+        gen = TailService.follow(log, 0)
+        first = asyncio.ensure_future(gen.__anext__())
+        await asyncio.sleep(0.05)
+        with open(log, "ab") as f:
+            f.write(b"x" * 2500)            # written to the old file after the follower opened it
+        os.rename(log, tmp_path / "app.log.1")
+        log.write_bytes(b"new\n")
+        got = [await first]
+        while "".join(got).count("x") < 2500 or not "".join(got).endswith("new\n"):
+            got.append(await asyncio.wait_for(gen.__anext__(), 5))
+        await gen.aclose()
+        return got, reads
+
+    got, reads = asyncio.run(run())
+    assert "".join(got) == "x" * 2500 + "new\n"
+    assert reads and all(n != -1 and n <= 1000 for n, _ in reads)
+    assert all(off_loop for _, off_loop in reads)
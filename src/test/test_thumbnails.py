@@ -0,0 +1,93 @@
+import os
+
+import pytest
+
+pytest.importorskip("PIL")
+
+from Services.Files.ThumbnailService import _render_thumbnail
+
+
+def test_render_writes_thumbnail(tmp_path):
+    from PIL import Image
+    src = tmp_path / "a.png"
+    Image.new("RGB", (300, 200), "red").save(src)
+    dest = tmp_path / "a.thumb"
+    size = _render_thumbnail(str(src), str(dest), 64, "JPEG")
+    assert size == os.path.getsize(dest)
+    with Image.open(dest) as im:
+        assert max(im.size) == 64
+    assert not (tmp_path / "a.thumb.part").exists()
+
+
+def test_corrupt_image_leaves_no_part_file(tmp_path):
+    src = tmp_path / "broken.png"
+    src.write_bytes(b"\x89PNG\r\n\x1a\n" + b"not really a png")
+    dest = tmp_path / "broken.thumb"
+    with pytest.raises(Exception):
+        _render_thumbnail(str(src), str(dest), 64, "JPEG")
+    assert not dest.exists()
+    assert not (tmp_path / "broken.thumb.part").exists()
+
+
+def test_failed_save_removes_part_file(tmp_path, monkeypatch):
+    from PIL import Image
+    src = tmp_path / "a.png"
+    Image.new("RGB", (50, 50), "blue").save(src)
+    dest = tmp_path / "a.thumb"
+
+    def save(self, fp, *args, **kwargs):
+        with open(fp, "wb") as f:
+            f.write(b"partial")
+        raise OSError("disk full")
+    monkeypatch.setattr(Image.Image, "save", save)
+    with pytest.raises(OSError):
+        _render_thumbnail(str(src), str(dest), 32, "JPEG")
+    assert os.listdir(tmp_path) == ["a.png"]
+
+
+def test_concurrent_submits_share_one_render(tmp_path, monkeypatch):
+    import threading
+    import time
+    from concurrent.futures import Future
+    from PIL import Image
+    from Services.Files.ThumbnailService import ThumbnailService
+
+    src = tmp_path / "a.png"
+    Image.new("RGB", (64, 64), "green").save(src)
+    monkeypatch.setattr(ThumbnailService, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(ThumbnailService, "_pending", {})
+    renders = []
+    started = threading.Barrier(16)
+
+    class Pool:
+        def submit(self, fn, *args):
+            renders.append(args)
+            fut = Future()
+            fut.set_result(fn(*args))
+            return fut
+    monkeypatch.setattr(ThumbnailService, "_get_pool", staticmethod(lambda: Pool()))
+    real_exists = type(src).exists
+
+    def exists(self):
+        # every thread sees the cache miss before any of them renders
+        if self.suffix in (".jpg", ".webp"):
+            started.wait(5)
+        return real_exists(self)
+    monkeypatch.setattr(type(src), "exists", exists)
+    real_mkdir = type(src).mkdir
+
+    def mkdir(self, *args, **kwargs):
+        time.sleep(0.05)                         # widen any window between lookup and insert
+        return real_mkdir(self, *args, **kwargs)
+    monkeypatch.setattr(type(src), "mkdir", mkdir)
+
+    futures = []
+    threads = [threading.Thread(target=lambda: futures.append(ThumbnailService.submit(src, 64))) for _ in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert len(futures) == 16
+    assert len({f.result(5) for f in futures}) == 1
+    assert len(renders) == 1
+    assert ThumbnailService._pending == {}
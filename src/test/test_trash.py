@@ -0,0 +1,92 @@
+import errno
+import os
+
+import pytest
+
+from Services.Files.FileOps import FileOps
+from Services.Files.Trash import Trash
+
+
+def test_move_and_restore(tmp_path, trash):
+    f = tmp_path / "a.txt"
+    f.write_text("x")
+    entry = Trash.move_to_trash(f)
+    assert not f.exists() and (trash / "items" / entry["id"]).exists()
+    entry["trash"] = str(trash)
+    assert Trash.restore(entry) == f and f.read_text() == "x"
+
+
+def test_info_failure_leaves_item_in_place(tmp_path, trash, monkeypatch):
+    f = tmp_path / "a.txt"
+    f.write_text("x")
+
+    def broken(trash, entry):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(Trash, "_write_info", staticmethod(broken))
+    with pytest.raises(OSError):
+        Trash.move_to_trash(f)
+    assert f.exists() and list((trash / "items").iterdir()) == []
+
+
+def test_cross_device_rename_falls_back(tmp_path, trash, monkeypatch):
+    f = tmp_path / "a.txt"
+    f.write_text("x")
+    real_rename = os.rename
+
+    def rename(src, dst):
+        if str(trash) in str(dst):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        return real_rename(src, dst)
+
+    monkeypatch.setattr(os, "rename", rename)
+    assert Trash.move_to_trash(f) is None
+    assert f.exists() and list((trash / "info").iterdir()) == []
+    assert Trash.discard(f) is None and not f.exists()
+
+
+def test_replaced_destination_goes_to_trash(tmp_path, trash):
+    src, dst = tmp_path / "new.txt", tmp_path / "dst.txt"
+    src.write_text("new")
+    dst.write_text("old")
+    entries = []
+    FileOps.replace("copy", src, dst, retire=lambda old: entries.append(Trash.discard(old, original=dst)))
+    assert dst.read_text() == "new"
+    entry = {**entries[0], "trash": str(trash)}
+    assert entry["original_path"] == str(dst)
+    assert Trash.restore(entry, tmp_path / "restored.txt").read_text() == "old"
+
+
+def test_deleted_files_leave_listings_and_searches(tmp_path, trash, monkeypatch):
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from data import data
+    from Services.Files.FileService import routerFile
+    from Services.Net.GlobalPathsRefresher import GlobalPathsRefresher
+    from Services.Net.NameFilter import NameFilter
+    from Services.Sync.SyncService import routerSync
+
+    # the base is the filesystem root, so the trash lives inside it
+    monkeypatch.setattr(data, "GLOBAL_PATHS", {"b": [tmp_path]})
+    monkeypatch.setattr(data, "MACHINES", [], raising=False)
+    monkeypatch.setattr(GlobalPathsRefresher, "local_bases", staticmethod(lambda: {"b": [str(tmp_path)]}))
+    monkeypatch.setattr(NameFilter, "_local", {})
+    (tmp_path / "docs").mkdir()
+    (tmp_path / "docs" / "gone.txt").write_text("x")
+    (tmp_path / "kept.txt").write_text("y")
+    app = FastAPI()
+    app.include_router(routerFile)
+    app.include_router(routerSync)
+    c = TestClient(app)
+
+    assert c.delete("/files/delete/b", params={"path": "docs/gone.txt"}).json()["trash_id"]
+    assert (trash / "items").iterdir()
+
+    names = [i["name"] for i in c.get("/files/browse/b").json()["items"]]
+    assert Trash.DIRNAME not in names and "kept.txt" in names
+    assert c.get("/files/search/b", params={"query": "gone", "local": True}).json()["count"] == 0
+    assert c.get("/files/search/b", params={"query": "gone", "federated": True}).json()["matches"] == []
+    assert c.get("/files/find", params={"base": "b", "filename": "gone.txt"}).json()["count"] == 0
+    assert list(c.get("/sync/manifest/b").json()["files"]) == ["kept.txt"]
+    bloom = NameFilter.build("b").bloom
+    assert NameFilter.name_key("kept.txt") in bloom and NameFilter.name_key("gone.txt") not in bloom
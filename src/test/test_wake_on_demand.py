@@ -0,0 +1,89 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from Services.Net import WakeOnDemand as wake_module
+from Services.Net.MachineHealth import HealthRegistry
+from Services.Net.WakeOnDemand import WakeOnDemand
+
+
+class Sleeper(SimpleNamespace):
+    """A machine that answers probes once `up` is set."""
+
+    def __init__(self, id):
+        super().__init__(id=id, name=f"m{id}", url_connect=f"http://m{id}", packets=0, up=threading.Event())
+
+    def wake_on_lan(self):
+        self.packets += 1
+        return True
+
+    def is_valid(self):
+        return True
+
+
+@pytest.fixture
+def wake(monkeypatch):
+    monkeypatch.setattr(WakeOnDemand, "ENABLED", True)
+    monkeypatch.setattr(WakeOnDemand, "DEADLINE", 2.0)
+    monkeypatch.setattr(WakeOnDemand, "PROBE_INTERVAL", 0.02)
+    monkeypatch.setattr(WakeOnDemand, "_states", {})
+    monkeypatch.setattr(WakeOnDemand, "_flights", {})
+    monkeypatch.setattr(HealthRegistry, "_machines", {})
+
+    async def probe(machine):
+        return machine.up.is_set()
+    monkeypatch.setattr(WakeOnDemand, "probe", staticmethod(probe))
+    return WakeOnDemand
+
+
+def _callers(n, target):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(target())) for _ in range(n)]
+    for t in threads:
+        t.start()
+    return threads, results
+
+
+def test_concurrent_callers_share_one_wake(wake):
+    m = Sleeper(1)
+    threads, results = _callers(5, lambda: wake.ensure_awake(m))
+    time.sleep(0.1)
+    m.up.set()
+    for t in threads:
+        t.join(5)
+    st = wake.stats()["machines"]["1"]
+    assert results == [True] * 5
+    assert (st["wakes"], st["successes"], st["waiters"], st["state"]) == (1, 1, 0, "awake")
+    assert m.packets == 1
+    assert HealthRegistry.snapshot(m)["state"] == "closed"
+
+
+def test_missed_deadline_starts_a_cooldown(wake, monkeypatch):
+    monkeypatch.setattr(WakeOnDemand, "DEADLINE", 0.1)
+    m = Sleeper(2)
+    assert wake.wakeable(m)
+    assert wake.ensure_awake(m) is False
+    st = wake.stats()["machines"]["2"]
+    assert (st["state"], st["failures"]) == ("failed", 1)
+    assert not wake.wakeable(m)
+    later = st["cooldown_until"] + 1
+    monkeypatch.setattr(wake_module.time, "time", lambda: later)
+    assert wake.wakeable(m)
+
+
+def test_blocked_sync_callers_are_capped(wake, monkeypatch):
+    monkeypatch.setattr(WakeOnDemand, "MAX_BLOCKING", 2)
+    m = Sleeper(3)
+    threads, results = _callers(2, lambda: wake.ensure_awake(m))
+    while wake.stats()["blocking"] < 2:
+        time.sleep(0.01)
+    t0 = time.monotonic()
+    assert wake.ensure_awake(m) is False                 # over the cap: fails fast
+    assert time.monotonic() - t0 < 0.5
+    m.up.set()
+    for t in threads:
+        t.join(5)
+    assert results == [True, True] and wake.stats()["blocking"] == 0
+    assert wake.stats()["machines"]["3"]["wakes"] == 1
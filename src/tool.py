@@ -12,6 +12,8 @@ from Services.MCP.MCPService import routerMCP
 from Services.DockerService import routerDocker
 from Services.CalenderService import routerCalender
 from Services.MachineService.MachineService import routerMachine
+from Services.Sync.SyncService import routerSync
+from Services.Jobs.JobService import routerJobs
 import sys
 
 logger = logging.getLogger("mcp.tool")
@@ -56,6 +58,8 @@ class tool:
             app.include_router(router=routerProject)
             app.include_router(router=routerDocker)
             app.include_router(router=routerCalender)
+            app.include_router(router=routerSync)
+            app.include_router(router=routerJobs)
 
             # Adiciona rotas de autenticação/usuario (LoginService)
             from Services.UserServices.Login.LoginService import routerLogin
@@ -430,6 +430,7 @@ async function browseBase(path = '') {
             return;
         }
         
+        prewarmThumbs(path, data.items);
         renderBreadcrumbBase(data.current_path);
         renderBrowser(data.items);
         renderSummary(data.summary);
@@ -610,14 +611,33 @@ function renderListItem(item) {
     `;
 }
 
+function thumbUrl(item) {
+    if (browseMode !== 'base' || !currentBase || item.type !== 'file' || item.category !== 'img') return null;
+    if (item.ext && item.ext.toLowerCase() === '.svg') return null;
+    return `${API}/files/thumb/${currentBase}?path=${encodeURIComponent(item.path)}&size=128`;
+}
+
+function prewarmThumbs(path, items) {
+    // Pede ao servidor para gerar as miniaturas do diretório em lote (só a grade mostra miniaturas;
+    // ao trocar para a grade, setView recarrega o diretório e o pedido é feito então)
+    if (currentView !== 'grid' || !currentBase || !items || !items.some(i => thumbUrl(i))) return;
+    const params = new URLSearchParams({ size: '128' });
+    if (path) params.append('path', path);
+    fetch(`${API}/files/thumb-prewarm/${currentBase}?${params}`, { method: 'POST' }).catch(() => {});
+}
+
 function renderGridItem(item) {
     const icon = item.type === 'dir' ? ICONS.dir : (ICONS[item.category] || ICONS.other);
     const escapedPath = escapeAttr(item.path);
     const escapedName = escapeAttr(item.name);
+    const thumb = currentView === 'grid' ? thumbUrl(item) : null;
+    const visual = thumb
+        ? `<img class="fm-grid-thumb" loading="lazy" src="${thumb}" alt="" onerror="this.replaceWith(Object.assign(document.createElement('span'), {className: 'fm-grid-icon', textContent: '${icon}'}))">`
+        : `<span class="fm-grid-icon">${icon}</span>`;
     
     return `
         <div class="fm-grid-item" ondblclick="handleDblClick('${escapedPath}', '${item.type}', '${escapedName}')">
-            <span class="fm-grid-icon">${icon}</span>
+            ${visual}
             <span class="fm-grid-name" title="${item.path}">${item.name}</span>
             <span class="fm-grid-meta">${item.size_human || ''}</span>
             <div class="fm-grid-actions">
@@ -1009,7 +1029,14 @@ async function confirmDelete() {
         
         if (!res.ok) throw new Error(data.detail || 'Erro');
         
-        toast(`Deletado: ${actionTarget.name}`, 'success');
+        if (res.status === 202 && data.job) {
+            toast(`Removendo em segundo plano: ${actionTarget.name}`, 'success');
+            watchJob(data.job.id, () => refreshCurrent());
+        } else if (data.trash_id) {
+            toast(`Movido para a lixeira: ${actionTarget.name}`, 'success');
+        } else {
+            toast(`Deletado: ${actionTarget.name}`, 'success');
+        }
         closeModal('modal-delete');
         refreshCurrent();
     } catch (e) {
@@ -1017,6 +1044,24 @@ async function confirmDelete() {
     }
 }
 
+async function watchJob(jobId, onDone) {
+    // Acompanha uma tarefa em segundo plano até terminar
+    for (;;) {
+        await new Promise(r => setTimeout(r, 1000));
+        try {
+            const res = await fetch(`${API}/jobs/${jobId}/progress`);
+            if (!res.ok) return;
+            const job = await res.json();
+            if (job.status === 'queued' || job.status === 'running') continue;
+            if (job.status !== 'done') toast(`Tarefa ${jobId}: ${job.status}`, 'error');
+            if (onDone) onDone(job);
+            return;
+        } catch {
+            return;
+        }
+    }
+}
+
 /* ══════════════════════════════════════════════════════════
    Modals
    ══════════════════════════════════════════════════════════ */